@@ -0,0 +1,411 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Bandeja de salida persistente (SQLite) para autorizar facturas con WSFEv1"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2010-2019 Mariano Reingart"
+__license__ = "GPL 3.0"
+__version__ = "1.00a"
+
+# Las facturas se encolan (dict armado con WSFEv1.CrearFactura, AgregarIva,
+# etc.) y los trabajadores (hilos o procesos) las numeran y autorizan por
+# lotes con CAESolicitarX. El número se asigna y graba (estado "enviado")
+# antes de llamar a AFIP: si no hay respuesta (timeout, caída del proceso),
+# se reconcilia con CompUltimoAutorizado/CompConsultar antes de reintentar,
+# por lo que cada factura se autoriza una única vez.
+
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+
+from .comprobante import serializar
+
+
+ARCHIVO = "bandeja.db"
+ARRENDAMIENTO = 300     # segundos que un trabajador reserva un flujo (pto_vta/tipo)
+CANT_MAX = 250          # comprobantes por solicitud (ver CompTotXRequest)
+INTENTOS_MAX = 5        # reintentos (numeración o solicitud rechazada) antes de rechazar
+ESPERA = 5              # segundos sin enviar un flujo luego de una falla transitoria
+ESPERA_MAX = 300        # (se duplica en cada falla consecutiva hasta este máximo)
+DEBUG = False
+
+# errores de la solicitud que no dependen de los comprobantes: no cuentan
+# como intento (600-602: token/sign inválido o vencido, 500-502: error interno)
+ERRORES_AUTENTICACION = ('600', '601', '602')
+ERRORES_TRANSITORIOS = ('500', '501', '502')
+
+PENDIENTE = "pendiente"
+ENVIADO = "enviado"         # numerado y enviado a AFIP (resultado incierto)
+AUTORIZADO = "autorizado"
+RECHAZADO = "rechazado"
+CONFLICTO = "conflicto"     # número autorizado por AFIP con otros datos (revisar)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS facturas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo_cbte INTEGER NOT NULL,
+    punto_vta INTEGER NOT NULL,
+    cbte_nro INTEGER,
+    estado TEXT NOT NULL,
+    factura TEXT NOT NULL,
+    referencia TEXT,
+    cae TEXT,
+    fch_venc_cae TEXT,
+    resultado TEXT,
+    obs TEXT,
+    err_msg TEXT,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    creado REAL,
+    actualizado REAL
+);
+CREATE INDEX IF NOT EXISTS facturas_flujo ON facturas (tipo_cbte, punto_vta, estado, id);
+CREATE UNIQUE INDEX IF NOT EXISTS facturas_numero ON facturas (tipo_cbte, punto_vta, cbte_nro)
+    WHERE estado IN ('enviado', 'autorizado');
+CREATE TABLE IF NOT EXISTS flujos (
+    tipo_cbte INTEGER NOT NULL,
+    punto_vta INTEGER NOT NULL,
+    trabajador TEXT,
+    vence REAL,
+    PRIMARY KEY (tipo_cbte, punto_vta)
+);
+"""
+
+
+class BandejaSalida:
+    "Cola persistente de facturas a autorizar (numeración y CAE exactamente una vez)"
+
+    def __init__(self, archivo=ARCHIVO, arrendamiento=ARRENDAMIENTO):
+        self.archivo = archivo
+        self.arrendamiento = arrendamiento
+        self.errores = {}           # trabajador (hilo): último error al procesar
+        self._esperas = {}          # flujo: (no enviar hasta, fallas consecutivas)
+        self._local = threading.local()
+        self._db().executescript(ESQUEMA)
+
+    def _db(self):
+        "Devolver la conexión a la base de datos (una por hilo)"
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.archivo, timeout=60, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    @contextlib.contextmanager
+    def _transaccion(self):
+        "Ejecutar las operaciones en una transacción (bloqueo de escritura inmediato)"
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def Encolar(self, factura, referencia=None):
+        "Agregar la factura (WSFEv1.factura) a la bandeja, devuelve el id asignado"
+        ahora = time.time()
+        with self._transaccion() as db:
+            cur = db.execute(
+                "INSERT INTO facturas (tipo_cbte, punto_vta, estado, factura, "
+                "referencia, creado, actualizado) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (int(factura['tipo_cbte']), int(factura['punto_vta']), PENDIENTE,
+                 json.dumps(factura, default=serializar), referencia, ahora, ahora))
+            return cur.lastrowid
+
+    def Consultar(self, id=None, referencia=None):
+        "Devolver el estado y resultado de una factura encolada (o None)"
+        if id is not None:
+            fila = self._db().execute("SELECT * FROM facturas WHERE id=?", (id, )).fetchone()
+        else:
+            fila = self._db().execute("SELECT * FROM facturas WHERE referencia=? "
+                                      "ORDER BY id DESC", (referencia, )).fetchone()
+        if fila is None:
+            return None
+        dic = dict(fila)
+        dic['factura'] = json.loads(dic['factura'])
+        dic['obs'] = dic['obs'] and json.loads(dic['obs']) or []
+        return dic
+
+    def Resumen(self):
+        "Devolver la cantidad de facturas por estado"
+        return dict(self._db().execute(
+            "SELECT estado, COUNT(*) FROM facturas GROUP BY estado").fetchall())
+
+    def _reclamar_flujo(self, trabajador, excluidos):
+        "Reservar un flujo con facturas pendientes o inciertas (None si no hay)"
+        ahora = time.time()
+        with self._transaccion() as db:
+            flujos = db.execute("SELECT DISTINCT tipo_cbte, punto_vta FROM facturas "
+                                "WHERE estado IN (?, ?)", (PENDIENTE, ENVIADO)).fetchall()
+            for tipo_cbte, punto_vta in flujos:
+                if (tipo_cbte, punto_vta) in excluidos:
+                    continue
+                cur = db.execute(
+                    "INSERT INTO flujos (tipo_cbte, punto_vta, trabajador, vence) "
+                    "VALUES (?, ?, ?, ?) ON CONFLICT (tipo_cbte, punto_vta) DO UPDATE "
+                    "SET trabajador=excluded.trabajador, vence=excluded.vence "
+                    "WHERE flujos.vence < ? OR flujos.trabajador = excluded.trabajador",
+                    (tipo_cbte, punto_vta, trabajador, ahora + self.arrendamiento, ahora))
+                if cur.rowcount:
+                    return tipo_cbte, punto_vta
+        return None
+
+    def _renovar_flujo(self, trabajador, flujo, db=None):
+        "Extender la reserva del flujo (falla si otro trabajador lo tomó)"
+        if db is None:
+            with self._transaccion() as db:
+                return self._renovar_flujo(trabajador, flujo, db)
+        cur = db.execute("UPDATE flujos SET vence=? WHERE tipo_cbte=? AND punto_vta=? "
+                         "AND trabajador=?",
+                         (time.time() + self.arrendamiento, flujo[0], flujo[1], trabajador))
+        if not cur.rowcount:
+            raise RuntimeError("Reserva del flujo %s/%s vencida" % flujo)
+
+    def _liberar_flujo(self, trabajador, flujo):
+        with self._transaccion() as db:
+            db.execute("DELETE FROM flujos WHERE tipo_cbte=? AND punto_vta=? AND trabajador=?",
+                       (flujo[0], flujo[1], trabajador))
+
+    def _actualizar(self, db, id, estado, enviado=None, **campos):
+        "Grabar el nuevo estado y resultado de la factura (dentro de una transacción)"
+        campos['estado'] = estado
+        campos['actualizado'] = time.time()
+        if 'obs' in campos:
+            campos['obs'] = json.dumps(campos['obs'], default=serializar)
+        if 'factura' in campos:
+            campos['factura'] = json.dumps(campos['factura'], default=serializar)
+        sql = "UPDATE facturas SET %s WHERE id=?" % ", ".join(["%s=?" % k for k in campos])
+        params = list(campos.values()) + [id]
+        if enviado is not None:
+            # solo si sigue enviada con el número asignado (no la tomó otro trabajador)
+            sql += " AND estado=? AND cbte_nro=?"
+            params += [ENVIADO, enviado]
+        if not db.execute(sql, params).rowcount and enviado is not None:
+            raise RuntimeError("Factura %s modificada por otro trabajador" % id)
+
+    def Reconciliar(self, ws, tipo_cbte, punto_vta):
+        "Resolver las facturas enviadas sin respuesta (devuelve False si AFIP no responde)"
+        filas = self._db().execute(
+            "SELECT id, factura FROM facturas WHERE tipo_cbte=? AND punto_vta=? AND estado=? "
+            "ORDER BY cbte_nro", (tipo_cbte, punto_vta, ENVIADO)).fetchall()
+        if not filas:
+            return True
+        ultimo = ws.CompUltimoAutorizado(tipo_cbte, punto_vta)
+        if not ultimo:
+            return False
+        ultimo = int(ultimo)
+        for fila in filas:
+            f = json.loads(fila['factura'])
+            if int(f['cbt_desde']) > ultimo:
+                # no llegó a autorizarse: volver a numerar en el próximo lote
+                with self._transaccion() as db:
+                    self._actualizar(db, fila['id'], PENDIENTE, f['cbt_desde'], cbte_nro=None)
+                continue
+            # verificar que el comprobante autorizado corresponda a esta factura
+            ws.factura = f
+            cae = ws.CompConsultar(tipo_cbte, punto_vta, f['cbt_desde'], reproceso=True)
+            if not cae and (ws.Excepcion or not ws.CbteNro):
+                return False
+            with self._transaccion() as db:
+                if cae:
+                    f.update({'cae': cae, 'resultado': 'A', 'fch_venc_cae': ws.Vencimiento})
+                    self._actualizar(db, fila['id'], AUTORIZADO, f['cbt_desde'], cae=cae,
+                                     resultado='A', fch_venc_cae=ws.Vencimiento, factura=f)
+                else:
+                    self._actualizar(db, fila['id'], CONFLICTO, f['cbt_desde'],
+                                     err_msg="Numero %s autorizado con otros datos "
+                                     "(ver diferencias)" % f['cbt_desde'])
+        return True
+
+    def _esperar_flujo(self, flujo, ws, autenticar=None):
+        "Demorar el próximo envío del flujo (y renovar el TA si AFIP lo rechazó)"
+        # espera exponencial por fallas consecutivas (sin respuesta, error interno)
+        vence, fallas = self._esperas.get(flujo, (0, 0))
+        self._esperas[flujo] = (time.time() + min(ESPERA * 2 ** fallas, ESPERA_MAX), fallas + 1)
+        codigos = str(ws.ErrCode or "").split()
+        if autenticar and [c for c in codigos if c in ERRORES_AUTENTICACION]:
+            autenticar(ws)
+
+    def _flujos_en_espera(self):
+        ahora = time.time()
+        return set([flujo for flujo, (vence, fallas) in list(self._esperas.items())
+                    if vence > ahora])
+
+    def _procesar_flujo(self, ws, trabajador, flujo, cant_max, autenticar=None):
+        "Numerar y autorizar las facturas pendientes del flujo (por lotes)"
+        tipo_cbte, punto_vta = flujo
+        autorizados = 0
+        while True:
+            self._renovar_flujo(trabajador, flujo)
+            if not self.Reconciliar(ws, tipo_cbte, punto_vta):
+                self._esperar_flujo(flujo, ws, autenticar)
+                return autorizados
+            ultimo = ws.CompUltimoAutorizado(tipo_cbte, punto_vta)
+            if not ultimo:
+                self._esperar_flujo(flujo, ws, autenticar)
+                return autorizados
+            ultimo = int(ultimo)
+            # asignar la numeración y registrarla antes de enviar (write-ahead)
+            lote = []
+            with self._transaccion() as db:
+                self._renovar_flujo(trabajador, flujo, db)
+                filas = db.execute(
+                    "SELECT id, factura FROM facturas WHERE tipo_cbte=? AND punto_vta=? "
+                    "AND estado=? ORDER BY id LIMIT ?",
+                    (tipo_cbte, punto_vta, PENDIENTE, cant_max)).fetchall()
+                for fila in filas:
+                    f = json.loads(fila['factura'])
+                    cant = int(f.get('cbt_hasta') or 0) - int(f.get('cbt_desde') or 0)
+                    f['cbt_desde'] = ultimo + 1
+                    f['cbt_hasta'] = ultimo = ultimo + 1 + max(cant, 0)
+                    db.execute("UPDATE facturas SET estado=?, cbte_nro=?, factura=?, "
+                               "actualizado=? WHERE id=?",
+                               (ENVIADO, f['cbt_desde'], json.dumps(f, default=serializar),
+                                time.time(), fila['id']))
+                    lote.append((fila['id'], f))
+            if not lote:
+                return autorizados
+            ws.IniciarFacturasX()
+            for id, f in lote:
+                ws.factura = f
+                ws.AgregarFacturaX()
+            ws.CAESolicitarX()
+            if ws.Errores and not ws.Excepcion and not any([f.get('resultado') for id, f in lote]):
+                # AFIP rechazó la solicitud completa (solo Errors, sin FeCabResp):
+                # ningún comprobante fue procesado, volver a pendiente
+                transitorio = [c for c in str(ws.ErrCode).split()
+                               if c in ERRORES_AUTENTICACION + ERRORES_TRANSITORIOS]
+                with self._transaccion() as db:
+                    self._renovar_flujo(trabajador, flujo, db)
+                    for id, f in lote:
+                        intentos = db.execute("SELECT intentos FROM facturas WHERE id=?",
+                                              (id, )).fetchone()[0]
+                        if not transitorio:
+                            # error de los datos: contar el intento (rechazar si se agotan)
+                            intentos += 1
+                        if intentos < INTENTOS_MAX:
+                            self._actualizar(db, id, PENDIENTE, f['cbt_desde'], cbte_nro=None,
+                                             err_msg=ws.ErrMsg, intentos=intentos)
+                        else:
+                            self._actualizar(db, id, RECHAZADO, f['cbt_desde'], cbte_nro=None,
+                                             resultado='R', err_msg=ws.ErrMsg, intentos=intentos)
+                if DEBUG:
+                    print("Lote %s/%s rechazado: %s" % (tipo_cbte, punto_vta, ws.ErrMsg))
+                if transitorio:
+                    # token/sign o servicio no disponible: esperar antes de reenviar
+                    self._esperar_flujo(flujo, ws, autenticar)
+                return autorizados
+            if not all([f.get('resultado') for id, f in lote]):
+                # sin respuesta de AFIP: quedan "enviado", se reconcilian antes
+                # de reintentar en el próximo procesamiento (no reenviar ahora)
+                if DEBUG:
+                    print("Lote %s/%s sin respuesta: %s" % (tipo_cbte, punto_vta, ws.Excepcion))
+                self._esperar_flujo(flujo, ws)
+                return autorizados
+            self._esperas.pop(flujo, None)
+            # grabar los resultados del lote en una única transacción (si el
+            # flujo sigue reservado y las facturas enviadas no fueron modificadas)
+            with self._transaccion() as db:
+                self._renovar_flujo(trabajador, flujo, db)
+                for id, f in lote:
+                    if f['resultado'] == 'A':
+                        self._actualizar(db, id, AUTORIZADO, f['cbt_desde'], cae=f['cae'],
+                                         resultado='A', fch_venc_cae=f['fch_venc_cae'],
+                                         obs=f['obs'], factura=f)
+                        autorizados += 1
+                        continue
+                    # rechazo por numeración (ej. 10016 por un rechazo previo en
+                    # el lote): volver a numerar, salvo que se agoten los intentos
+                    codigos = [str(obs['code']) for obs in f['obs']] + \
+                              [str(err).split(":")[0] for err in ws.Errores]
+                    intentos = self._db().execute("SELECT intentos FROM facturas WHERE id=?",
+                                                  (id, )).fetchone()[0]
+                    if '10016' in codigos and intentos < INTENTOS_MAX:
+                        self._actualizar(db, id, PENDIENTE, f['cbt_desde'], cbte_nro=None,
+                                         obs=f['obs'], intentos=intentos + 1)
+                    else:
+                        self._actualizar(db, id, RECHAZADO, f['cbt_desde'], cbte_nro=None,
+                                         resultado='R', obs=f['obs'], err_msg=ws.ErrMsg)
+
+    def Procesar(self, ws, trabajador=None, cant_max=CANT_MAX, autenticar=None):
+        """Autorizar las facturas pendientes de los flujos disponibles (devuelve autorizados)
+
+           autenticar(ws) renueva el token y sign si AFIP los rechaza (600-602)"""
+        if not trabajador:
+            trabajador = "%s-%s-%s" % (socket.gethostname(), os.getpid(),
+                                       threading.current_thread().ident)
+        autorizados = 0
+        # no reclamar los flujos en espera luego de una falla transitoria
+        procesados = self._flujos_en_espera()
+        while True:
+            flujo = self._reclamar_flujo(trabajador, procesados)
+            if not flujo:
+                return autorizados
+            procesados.add(flujo)
+            try:
+                autorizados += self._procesar_flujo(ws, trabajador, flujo, cant_max, autenticar)
+            finally:
+                self._liberar_flujo(trabajador, flujo)
+
+    def Trabajar(self, crear_ws, hilos=1, intervalo=1, detener=None, autenticar=None):
+        """Procesar la bandeja con varios hilos hasta que se indique detener (Event)
+
+           Los errores de cada hilo quedan en errores (ver Procesar por autenticar)"""
+        detener = detener or threading.Event()
+
+        def renovar_ta(ws):
+            # por defecto, tomar el token y sign de un nuevo cliente
+            nuevo = crear_ws()
+            ws.Token, ws.Sign = nuevo.Token, nuevo.Sign
+
+        def trabajar():
+            nombre = threading.current_thread().name
+            ws = None
+            while not detener.is_set():
+                try:
+                    if ws is None:
+                        ws = crear_ws()
+                    autorizados = self.Procesar(ws, autenticar=autenticar or renovar_ta)
+                    self.errores.pop(nombre, None)
+                    if not autorizados:
+                        detener.wait(intervalo)
+                except Exception as e:
+                    # ej. base bloqueada o reserva vencida: reintentar luego
+                    self.errores[nombre] = str(e).strip()
+                    if DEBUG:
+                        print("Error procesando bandeja (%s):" % nombre, file=sys.stderr)
+                        traceback.print_exc()
+                    detener.wait(intervalo)
+
+        for i in range(hilos):
+            hilo = threading.Thread(target=trabajar, name="bandeja-%d" % i)
+            hilo.daemon = True
+            hilo.start()
+        return detener
+
+
+if __name__ == "__main__":
+    # mostrar el estado de la bandeja: bandeja.py [archivo.db]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    bandeja = BandejaSalida(args and args[0] or ARCHIVO)
+    for estado, cant in sorted(bandeja.Resumen().items()):
+        print("%-12s %d" % (estado, cant))
@@ -0,0 +1,246 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de rendimiento de punta a punta (WSFEv1 contra el simulador local)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2010-2019 Mariano Reingart"
+__license__ = "GPL 3.0"
+__version__ = "1.00a"
+
+# Escenarios: individual (CAESolicitar por comprobante), lote (CAESolicitarX
+# de hasta 250 comprobantes) y rece1 (archivo de entrada de texto, con hilos).
+# Cada escenario graba una línea JSON (comprobantes por segundo, latencia
+# p50/p99, memoria, parámetros y versión) para comparar entre versiones.
+# Uso: benchmark.py [--cantidad 1000] [--lote 250] [--hilos 4] [--latencia 0.05]
+#      [--variacion 0.02] [--rechazos 0.01] [--timeouts 0] [--perdidas 0]
+#      [--errores-http 0] [--escenarios individual,lote,rece1] [--url http://host:puerto]
+#      [--wsdl archivo] [--cache dir] [--salida resultados.jsonl]
+
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from . import wsfev1
+from . import rece1
+from . import lote
+from .simulador import SimuladorAFIP, opcion
+
+try:
+    import resource
+except ImportError:
+    resource = None     # Windows
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+ESCENARIOS = ("individual", "lote", "rece1")
+RUTA = "/wsfev1/service.asmx"
+CUIT = "20267565393"
+TIPO_CBTE = 1
+PUNTO_VTA = 4000        # los flujos de rece1 usan PUNTO_VTA + 1, + 2, etc.
+
+
+def memoria():
+    "Devolver el pico de memoria residente del proceso en KiB (o None)"
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # en Mac OS X se informa en bytes, en Linux en KiB
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def conectar(url, wsdl=None, cache=None, timeout=30):
+    "Devolver una función que crea un cliente WSFEv1 apuntando al servidor"
+    def crear_ws():
+        ws = wsfev1.WSFEv1()
+        ws.LanzarExcepciones = False
+        # por defecto usar el WSDL publicado por el servidor (ej. el simulador)
+        if not ws.Conectar(cache, wsdl or url + RUTA + "?WSDL", timeout=timeout):
+            raise RuntimeError("No se pudo conectar a %s: %s" % (url, ws.Excepcion))
+        # usar el servidor local en lugar del indicado en el WSDL
+        ws.client.location = url + RUTA
+        ws.Cuit, ws.Token, ws.Sign = CUIT, "token", "sign"
+        return ws
+    return crear_ws
+
+
+def factura(punto_vta, nro, fecha):
+    "Armar el encabezado de un comprobante de prueba (formato de rece1)"
+    return {'concepto': 1, 'tipo_doc': 80, 'nro_doc': "30500010912",
+            'tipo_cbte': TIPO_CBTE, 'punto_vta': punto_vta,
+            'cbt_desde': nro, 'cbt_hasta': nro, 'fecha_cbte': fecha,
+            'imp_total': "121.00", 'imp_tot_conc': "0.00", 'imp_neto': "100.00",
+            'imp_iva': "21.00", 'imp_trib': "0.00", 'imp_op_ex': "0.00",
+            'moneda_id': "PES", 'moneda_ctz': "1.000",
+            'fecha_venc_pago': None, 'fecha_serv_desde': None,
+            'fecha_serv_hasta': None,
+            'ivas': [{'iva_id': 5, 'base_imp': "100.00", 'importe': "21.00"}]}
+
+
+def proximo(ws, punto_vta):
+    ultimo = ws.CompUltimoAutorizado(TIPO_CBTE, punto_vta)
+    if not ultimo:
+        raise RuntimeError("CompUltimoAutorizado: %s" % (ws.Excepcion or ws.ErrMsg))
+    return int(ultimo) + 1
+
+
+def individual(crear_ws, cantidad, **kwargs):
+    "Autorizar los comprobantes de a uno (CAESolicitar)"
+    ws = crear_ws()
+    fecha = datetime.date.today().strftime("%Y%m%d")
+    estadisticas = lote.Estadisticas()
+    nro = None
+    for i in range(cantidad):
+        if nro is None:
+            nro = proximo(ws, PUNTO_VTA)
+        rece1.crear_factura(ws, factura(PUNTO_VTA, nro, fecha))
+        t0 = time.time()
+        ws.CAESolicitar()
+        resultado = ws.Resultado or lote.ERROR
+        estadisticas.registrar(time.time() - t0, resultado)
+        # si no fue aprobado, volver a consultar la numeración
+        nro = nro + 1 if resultado == 'A' else None
+    estadisticas.fin = time.time()
+    return estadisticas
+
+
+def lote_x(crear_ws, cantidad, tamanio=250, **kwargs):
+    "Autorizar los comprobantes en lotes (IniciarFacturasX / CAESolicitarX)"
+    ws = crear_ws()
+    fecha = datetime.date.today().strftime("%Y%m%d")
+    estadisticas = lote.Estadisticas()
+    nro = None
+    for i in range(0, cantidad, tamanio):
+        if nro is None:
+            nro = proximo(ws, PUNTO_VTA)
+        ws.IniciarFacturasX()
+        for j in range(min(tamanio, cantidad - i)):
+            rece1.crear_factura(ws, factura(PUNTO_VTA, nro + j, fecha))
+            ws.AgregarFacturaX()
+        t0 = time.time()
+        ws.CAESolicitarX()
+        latencia = time.time() - t0
+        aprobados = 0
+        for f in ws.facturas:
+            # la latencia de cada comprobante es la de su solicitud
+            estadisticas.registrar(latencia, f.get('resultado') or lote.ERROR)
+            aprobados += f.get('resultado') == 'A'
+        nro = nro + aprobados if aprobados == len(ws.facturas) else None
+    estadisticas.fin = time.time()
+    return estadisticas
+
+
+def archivo_rece1(crear_ws, cantidad, hilos=1, **kwargs):
+    "Autorizar un archivo de entrada de rece1 (un flujo por hilo)"
+    ws = crear_ws()
+    fecha = datetime.date.today().strftime("%Y%m%d")
+    flujos = [PUNTO_VTA + 1 + i for i in range(max(hilos, 1))]
+    nros = dict([(punto_vta, proximo(ws, punto_vta)) for punto_vta in flujos])
+    directorio = tempfile.mkdtemp(prefix="benchmark")
+    entrada = os.path.join(directorio, "entrada.txt")
+    salida = os.path.join(directorio, "salida.txt")
+    try:
+        with open(entrada, "w") as f:
+            for i in range(cantidad):
+                punto_vta = flujos[i % len(flujos)]
+                rece1.escribir_facturas([factura(punto_vta, nros[punto_vta], fecha)], f)
+                nros[punto_vta] += 1
+        with open(entrada) as f_entrada, open(salida, "w") as f_salida, \
+                open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+            return rece1.autorizar(ws, f_entrada, f_salida, False, hilos, None, crear_ws)
+    finally:
+        for archivo in (entrada, salida):
+            if os.path.exists(archivo):
+                os.unlink(archivo)
+        os.rmdir(directorio)
+
+
+FUNCIONES = {"individual": individual, "lote": lote_x, "rece1": archivo_rece1}
+
+
+def ejecutar(escenario, crear_ws, cantidad, **parametros):
+    "Ejecutar el escenario y devolver el resultado (dict serializable a JSON)"
+    if tracemalloc and tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    estadisticas = FUNCIONES[escenario](crear_ws, cantidad, **parametros)
+    ret = {"escenario": escenario, "cantidad": cantidad}
+    ret.update(estadisticas.resumen())
+    ret["memoria_max_kb"] = memoria()
+    if tracemalloc and tracemalloc.is_tracing():
+        ret["memoria_python_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+    return ret
+
+
+def metadatos(**parametros):
+    "Datos para identificar la ejecución al comparar resultados"
+    return {"fecha": datetime.datetime.now().isoformat(),
+            "version": __version__, "wsfev1": wsfev1.__version__,
+            "python": platform.python_version(), "plataforma": platform.platform(),
+            "parametros": parametros}
+
+
+def main():
+    escenarios = opcion("--escenarios", ",".join(ESCENARIOS)).split(",")
+    cantidad = opcion("--cantidad", 1000, int)
+    parametros = {"tamanio": opcion("--lote", 250, int), "hilos": opcion("--hilos", 4, int)}
+    simulacion = {"latencia": opcion("--latencia", 0.0, float),
+                  "variacion": opcion("--variacion", 0.0, float),
+                  "rechazos": opcion("--rechazos", 0.0, float),
+                  "timeouts": opcion("--timeouts", 0.0, float),
+                  "perdidas": opcion("--perdidas", 0.0, float),
+                  "errores_http": opcion("--errores-http", 0.0, float)}
+    timeout = opcion("--timeout", 30, int)
+    if "--tracemalloc" in sys.argv and tracemalloc:
+        tracemalloc.start()
+
+    simulador = None
+    url = opcion("--url")
+    if not url:
+        simulador = SimuladorAFIP(semilla=opcion("--semilla", None, int),
+                                  demora_timeout=timeout + 1, **simulacion)
+        url = simulador.Iniciar(opcion("--direccion", "http://localhost:0"))
+    # cache temporal: el WSDL del simulador cambia de URL (puerto) en cada ejecución
+    cache = opcion("--cache") or tempfile.mkdtemp(prefix="benchmark")
+    crear_ws = conectar(url, opcion("--wsdl"), cache, timeout)
+
+    salida = opcion("--salida")
+    f = open(salida, "a") if salida else sys.stdout
+    try:
+        for escenario in escenarios:
+            ret = metadatos(url=url, **dict(parametros, **simulacion))
+            ret.update(ejecutar(escenario, crear_ws, cantidad, **parametros))
+            if simulador:
+                ret["simulador"] = simulador.Estado()
+                simulador.Reiniciar()
+            f.write(json.dumps(ret) + "\n")
+            f.flush()
+    finally:
+        if salida:
+            f.close()
+        if simulador:
+            simulador.Detener()
+        if not opcion("--cache"):
+            shutil.rmtree(cache, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
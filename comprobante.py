@@ -0,0 +1,278 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Modelo compacto de comprobantes (WSFEv1, WSMTXCA, WSCT, WSBFEv1 y FEPDF)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2010-2019 Mariano Reingart"
+__license__ = "GPL 3.0"
+__version__ = "1.00a"
+
+# Cada registro guarda sus campos en __slots__ (sin un dict por instancia) y
+# los sub-registros en listas, pero se accede como antes: factura['iva'][0]
+# ['importe'], 'caea' in factura, factura.update(...), factura.get(...), etc.
+# Los campos no previstos (ej. los agregados por rece1 o EstablecerParametro)
+# se guardan aparte, por lo que sigue siendo compatible con un diccionario.
+
+import json
+import sys
+from collections.abc import Mapping, MutableMapping
+
+
+class Registro(MutableMapping):
+    "Registro con campos fijos (__slots__) y acceso como diccionario"
+
+    __slots__ = ('_extra', )
+    _campos = frozenset()
+    _orden = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = tuple(cls.__dict__.get('__slots__', ()))
+        cls._campos = cls._campos | frozenset(slots)
+        cls._orden = cls._orden + slots
+
+    def __init__(self, *args, **kwargs):
+        campos = self._campos
+        for clave, valor in dict(*args, **kwargs).items():
+            if clave in campos:
+                setattr(self, clave, valor)
+            else:
+                self[clave] = valor
+
+    def __getitem__(self, clave):
+        if clave in self._campos:
+            try:
+                return getattr(self, clave)
+            except AttributeError:
+                raise KeyError(clave)
+        try:
+            return self._extra[clave]
+        except AttributeError:
+            raise KeyError(clave)
+
+    def __setitem__(self, clave, valor):
+        if clave in self._campos:
+            setattr(self, clave, valor)
+        else:
+            try:
+                self._extra[clave] = valor
+            except AttributeError:
+                self._extra = {clave: valor}
+
+    def __delitem__(self, clave):
+        if clave in self._campos:
+            try:
+                delattr(self, clave)
+            except AttributeError:
+                raise KeyError(clave)
+        else:
+            try:
+                del self._extra[clave]
+            except AttributeError:
+                raise KeyError(clave)
+
+    def __contains__(self, clave):
+        if clave in self._campos:
+            return hasattr(self, clave)
+        return clave in getattr(self, '_extra', ())
+
+    def __iter__(self):
+        for clave in self._orden:
+            if hasattr(self, clave):
+                yield clave
+        for clave in list(getattr(self, '_extra', ())):
+            yield clave
+
+    def __len__(self):
+        return len([clave for clave in self])
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, dict(self.items()))
+
+    def get(self, clave, defecto=None):
+        if clave in self._campos:
+            return getattr(self, clave, defecto)
+        return getattr(self, '_extra', {}).get(clave, defecto)
+
+    def copy(self):
+        "Devolver una copia como diccionario (sub-registros incluidos)"
+        return a_dict(self)
+
+    def a_formato(self, formato):
+        "Devolver los campos del diseño de registro (formatos) con sus valores"
+        return dict([(fmt[0], self.get(fmt[0])) for fmt in formato])
+
+
+class CbteAsoc(Registro):
+    "Comprobante asociado (notas de crédito / débito)"
+    __slots__ = ('tipo', 'pto_vta', 'nro', 'cuit', 'fecha',
+                 'cbte_tipo', 'cbte_punto_vta', 'cbte_nro')
+
+
+class Tributo(Registro):
+    "Otros tributos (percepciones, impuestos internos, etc.)"
+    __slots__ = ('tributo_id', 'desc', 'base_imp', 'alic', 'importe')
+
+
+class Iva(Registro):
+    "Alícuota de IVA"
+    __slots__ = ('iva_id', 'base_imp', 'importe')
+
+
+class Opcional(Registro):
+    "Dato opcional / adicional"
+    __slots__ = ('opcional_id', 'valor', 'valor2', 'valor3', 'valor4',
+                 'valor5', 'valor6')
+
+
+class Comprador(Registro):
+    "Comprador (RG 4109-E bienes muebles)"
+    __slots__ = ('doc_tipo', 'doc_nro', 'porcentaje')
+
+
+class Item(Registro):
+    "Item (detalle) del comprobante"
+    __slots__ = ('u_mtx', 'cod_mtx', 'codigo', 'ds', 'qty', 'umed', 'precio',
+                 'bonif', 'iva_id', 'imp_iva', 'imp_subtotal', 'imp_total',
+                 'importe', 'despacho', 'tipo', 'cod_tur', 'ncm', 'sec',
+                 'dato_a', 'dato_b', 'dato_c', 'dato_d', 'dato_e')
+
+
+class Permiso(Registro):
+    "Permiso de embarque"
+    __slots__ = ('id_permiso', 'dst_merc')
+
+
+class DatoAdicional(Registro):
+    "Dato adicional (WSCT)"
+    __slots__ = ('t', 'c1', 'c2', 'c3', 'c4', 'c5', 'c6')
+
+
+class FormaPago(Registro):
+    "Forma de pago (WSCT)"
+    __slots__ = ('codigo', 'tipo_tarjeta', 'numero_tarjeta', 'swift_code',
+                 'tipo_cuenta', 'numero_cuenta')
+
+
+class Factura(Registro):
+    "Comprobante (encabezado, sub-registros y resultado de la autorización)"
+    __slots__ = (
+        # encabezado
+        'concepto', 'tipo_doc', 'nro_doc', 'tipo_cbte', 'punto_vta',
+        'cbt_desde', 'cbt_hasta', 'cbte_nro', 'fecha_cbte', 'fecha_hs_gen',
+        'fecha_venc_pago', 'fecha_serv_desde', 'fecha_serv_hasta',
+        'moneda_id', 'moneda_ctz', 'imp_moneda_id', 'imp_moneda_ctz',
+        'imp_total', 'imp_tot_conc', 'imp_neto', 'imp_iva', 'imp_trib',
+        'imp_op_ex', 'imp_subtotal', 'imp_reintegro', 'impto_liq',
+        'impto_liq_rni', 'imp_perc', 'imp_iibb', 'imp_perc_mun',
+        'imp_internos', 'zona', 'observaciones', 'id_impositivo', 'cod_pais',
+        'domicilio', 'cod_relacion', 'caea', 'descuento',
+        # datos adicionales para el PDF
+        'nombre_cliente', 'domicilio_cliente', 'pais_dst_cmp',
+        'obs_comerciales', 'obs_generales', 'forma_pago', 'incoterms',
+        'fecha_vto',
+        # sub-registros
+        'cbtes_asoc', 'tributos', 'iva', 'ivas', 'opcionales', 'compradores',
+        'detalles', 'permisos', 'adicionales', 'formas_pago',
+        # resultado
+        'resultado', 'cae', 'fch_venc_cae', 'emision_tipo', 'obs',
+        'motivos_obs', 'reproceso', 'err_code', 'err_msg',
+    )
+
+
+def a_dict(valor):
+    "Convertir recursivamente los registros en diccionarios (ej. para json.dump)"
+    if isinstance(valor, Mapping):
+        return dict([(k, a_dict(v)) for k, v in valor.items()])
+    elif isinstance(valor, list):
+        return [a_dict(v) for v in valor]
+    return valor
+
+
+def serializar(valor):
+    "Convertir valores no soportados por json (usar con default=serializar)"
+    if isinstance(valor, Mapping):
+        return dict(valor.items())
+    return str(valor)
+
+
+def convertir(registro, mapa):
+    """Armar la estructura a convertir en XML (SOAP) según el mapa de campos
+
+       mapa: secuencia de (etiqueta, campo) o, para los sub-registros,
+       (etiqueta, (campo, etiqueta_item, submapa)); las listas vacías van None"""
+    ret = {}
+    for etiqueta, campo in mapa:
+        if isinstance(campo, tuple):
+            campo, etiqueta_item, submapa = campo
+            ret[etiqueta] = [{etiqueta_item: convertir(item, submapa)}
+                             for item in registro.get(campo) or ()] or None
+        else:
+            ret[etiqueta] = registro.get(campo)
+    return ret
+
+
+def _crear(cantidad, modelo):
+    "Armar facturas de prueba como dict o con el modelo (como CrearFactura, etc.)"
+    facturas = []
+    for i in range(cantidad):
+        encabezado = {
+            'concepto': 1, 'tipo_doc': 80, 'nro_doc': "30500010912",
+            'tipo_cbte': 1, 'punto_vta': 4000, 'cbt_desde': i, 'cbt_hasta': i,
+            'imp_total': "179.25", 'imp_tot_conc': "2.00", 'imp_neto': "150.00",
+            'imp_iva': "26.25", 'imp_trib': "1.00", 'imp_op_ex': "0.00",
+            'fecha_cbte': "20190101", 'fecha_venc_pago': None,
+            'moneda_id': "PES", 'moneda_ctz': "1.000", 'fecha_hs_gen': None,
+        }
+        tributo = {'tributo_id': 99, 'desc': "Impuesto Municipal",
+                   'base_imp': "100.00", 'alic': "1.00", 'importe': "1.00"}
+        ivas = [{'iva_id': 5, 'base_imp': "100.00", 'importe': "21.00"},
+                {'iva_id': 4, 'base_imp': "50.00", 'importe': "5.25"}]
+        if modelo:
+            f = Factura(encabezado, cbtes_asoc=[], tributos=[Tributo(tributo)],
+                        iva=[Iva(iva) for iva in ivas], opcionales=[],
+                        compradores=[])
+        else:
+            f = dict(encabezado, cbtes_asoc=[], tributos=[dict(tributo)],
+                     iva=[dict(iva) for iva in ivas], opcionales=[],
+                     compradores=[])
+        facturas.append(f)
+    return facturas
+
+
+def benchmark(cantidad=10000):
+    "Comparar memoria y asignaciones del modelo contra los diccionarios"
+    import time
+    import tracemalloc
+    ret = {"facturas": cantidad}
+    for nombre, modelo in (("dict", False), ("modelo", True)):
+        tracemalloc.start()
+        t0 = time.time()
+        facturas = _crear(cantidad, modelo)
+        t1 = time.time()
+        memoria, pico = tracemalloc.get_traced_memory()
+        bloques = sum([stat.count for stat in
+                       tracemalloc.take_snapshot().statistics("filename")])
+        tracemalloc.stop()
+        ret[nombre] = {"bytes": memoria, "bytes_por_factura": memoria / cantidad,
+                       "bloques": bloques, "segundos": t1 - t0}
+        del facturas
+    ret["reduccion"] = 1 - ret["modelo"]["bytes"] / float(ret["dict"]["bytes"])
+    return ret
+
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        i = sys.argv.index("--benchmark")
+        cantidad = int(sys.argv[i + 1]) if len(sys.argv) > i + 1 and sys.argv[i + 1].isdigit() else 10000
+        print(json.dumps(benchmark(cantidad)))
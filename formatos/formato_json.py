@@ -36,8 +36,16 @@ def leer(fn="entrada.json"):
 
 
 def escribir(filas, fn="salida.json"):
-    "Dado una lista de comprobantes (diccionarios), escribe JSON"
+    "Dado una lista o iterador de comprobantes (diccionarios), escribe JSON"
     import codecs
-    jsonfile = codecs.open(fn, "w")
-    json.dump(filas, jsonfile, sort_keys=True, indent=4, encoding="utf-8",)
-    jsonfile.close()
+    jsonfile = codecs.open(fn, "w", encoding="utf-8")
+    try:
+        # se serializa de a un comprobante (misma salida que json.dump)
+        sep = "[\n"
+        for fila in filas:
+            texto = json.dumps(fila, sort_keys=True, indent=4)
+            jsonfile.write(sep + "    " + texto.replace("\n", "\n    "))
+            sep = ",\n"
+        jsonfile.write("[]" if sep == "[\n" else "\n]")
+    finally:
+        jsonfile.close()
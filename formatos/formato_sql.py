@@ -16,9 +16,11 @@ __author__ = "Mariano Reingart (reingart@gmail.com)"
 __copyright__ = "Copyright (C) 2014 Mariano Reingart"
 __license__ = "GPL 3.0"
 
+import itertools
 from decimal import Decimal
 
 DEBUG = False
+LOTE = 500  # comprobantes por lote (ids por consulta, menor al limite de sqlite)
 CAE_NULL = None
 FECHA_VTO_NULL = None
 RESULTADO_NULL = None
@@ -112,13 +114,13 @@ def redondear(formato, clave, valor):
     # corregir redondeo (aparentemente sqlite no guarda correctamente los decimal)
     import decimal
     try:
-        long = [fmt[1] for fmt in formato if fmt[0] == clave]
+        longitud = [fmt[1] for fmt in formato if fmt[0] == clave]
         tipo = [fmt[2] for fmt in formato if fmt[0] == clave]
         if not tipo:
             return valor
         tipo = tipo[0]
         if DEBUG:
-            print("tipo", tipo, clave, valor, int)
+            print("tipo", tipo, clave, valor, longitud)
         if valor is None:
             return None
         if valor == "":
@@ -131,8 +133,8 @@ def redondear(formato, clave, valor):
             valor = str(valor)
         if isinstance(valor, str):
             valor = Decimal(valor)
-        if int and isinstance(int[0], (tuple, list)):
-            decimales = Decimal('1') / Decimal(10**(int[0][1]))
+        if longitud and isinstance(longitud[0], (tuple, list)):
+            decimales = Decimal('1') / Decimal(10**(longitud[0][1]))
         else:
             decimales = Decimal('.01')
         valor1 = valor.quantize(decimales, rounding=decimal.ROUND_DOWN)
@@ -143,63 +145,69 @@ def redondear(formato, clave, valor):
         print("IMPOSIBLE REDONDEAR:", clave, valor, e)
 
 
-def escribir(facts, db, schema={}, commit=True):
+def _agrupar(grupos, tabla, formato, item, id=None):
+    "Acumula los valores de una fila, agrupando por tabla y campos presentes"
+    claves = tuple([k for k, t, n in formato if k in item])
+    valores = [item[k] for k in claves]
+    if id is not None:
+        valores.insert(0, id)
+    grupos.setdefault((tabla, claves), []).append(valores)
+
+
+def escribir(facts, db, schema={}, commit=True, lote=LOTE):
     from .formato_txt import ENCABEZADO, DETALLE, TRIBUTO, IVA, CMP_ASOC, PERMISO, DATO
     tablas, campos, campos_rev = configurar(schema)
     cur = db.cursor()
+    prox_id = None
+    facts = iter(facts)
     try:
-        for dic in facts:
-            if not 'id' in dic:
-                dic['id'] = max_id(db, schema={}) + 1
-            query = "INSERT INTO %(encabezado)s (%%s) VALUES (%%s)" % tablas
-            fields = ','.join([campos["encabezado"].get(k, k) for k, t, n in ENCABEZADO if k in dic])
-            values = ','.join(['?' for k, t, n in ENCABEZADO if k in dic])
-            if DEBUG:
-                print("Ejecutando2: %s %s" % (query % (fields, values), [dic[k] for k, t, n in ENCABEZADO if k in dic]))
-            ejecutar(cur, query % (fields, values), [dic[k] for k, t, n in ENCABEZADO if k in dic])
-            query = ("INSERT INTO %(detalle)s (%%(id)s, %%%%s) VALUES (?, %%%%s)" % tablas) % campos["detalle"]
-            for item in dic['detalles']:
-                fields = ','.join([campos["detalle"].get(k, k) for k, t, n in DETALLE if k in item])
-                values = ','.join(['?' for k, t, n in DETALLE if k in item])
+        while True:
+            bloque = list(itertools.islice(facts, lote))
+            if not bloque:
+                break
+            # reservar los ids faltantes de todo el lote con una sola consulta
+            if prox_id is None and [dic for dic in bloque if 'id' not in dic]:
+                prox_id = max_id(db, schema={}) + 1
+            if prox_id is not None:
+                for dic in bloque:
+                    if 'id' in dic:
+                        try:
+                            prox_id = max(prox_id, int(dic['id']) + 1)
+                        except (TypeError, ValueError):
+                            pass
+                for dic in bloque:
+                    if 'id' not in dic:
+                        dic['id'] = prox_id
+                        prox_id += 1
+            # agrupar las filas por tabla (primero encabezados por las fk)
+            grupos = {}
+            for dic in bloque:
+                _agrupar(grupos, "encabezado", ENCABEZADO, dic)
+            for dic in bloque:
+                for item in dic['detalles']:
+                    _agrupar(grupos, "detalle", DETALLE, item, dic['id'])
+                if 'cbtes_asoc' in dic and tablas["cmp_asoc"]:
+                    for item in dic['cbtes_asoc']:
+                        _agrupar(grupos, "cmp_asoc", CMP_ASOC, item, dic['id'])
+                for item in dic.get('permisos', []):
+                    _agrupar(grupos, "permiso", PERMISO, item, dic['id'])
+                for item in dic.get('tributos', []):
+                    _agrupar(grupos, "tributo", TRIBUTO, item, dic['id'])
+                for item in dic.get('ivas', []):
+                    _agrupar(grupos, "iva", IVA, item, dic['id'])
+            for (tabla, claves), filas in list(grupos.items()):
+                fields = [campos[tabla].get(k, k) for k in claves]
+                if tabla != "encabezado":
+                    fields.insert(0, campos[tabla]["id"])
+                query = "INSERT INTO %s (%s) VALUES (%s)" % (
+                    tablas[tabla], ','.join(fields), ','.join(['?'] * len(fields)))
                 if DEBUG:
-                    print("Ejecutando: %s %s" % (query % (fields, values), [dic['id']] + [item[k] for k, t, n in DETALLE if k in item]))
-                ejecutar(cur, query % (fields, values), [dic['id']] + [item[k] for k, t, n in DETALLE if k in item])
-            if 'cbtes_asoc' in dic and tablas["cmp_asoc"]:
-                query = ("INSERT INTO %(cmp_asoc)s (%%(id)s, %%%%s) VALUES (?, %%%%s)" % tablas) % campos["cmp_asoc"]
-                for item in dic['cbtes_asoc']:
-                    fields = ','.join([campos["cmp_asoc"].get(k, k) for k, t, n in CMP_ASOC if k in item])
-                    values = ','.join(['?' for k, t, n in CMP_ASOC if k in item])
-                    if DEBUG:
-                        print("Ejecutando: %s %s" % (query % (fields, values), [dic['id']] + [item[k] for k, t, n in CMP_ASOC if k in item]))
-                    ejecutar(cur, query % (fields, values), [dic['id']] + [item[k] for k, t, n in CMP_ASOC if k in item])
-            if 'permisos' in dic:
-                query = ("INSERT INTO %(permiso)s (%%(id)s, %%%%s) VALUES (?, %%%%s)" % tablas) % campos["permiso"]
-                for item in dic['permisos']:
-                    fields = ','.join([campos["permiso"].get(k, k) for k, t, n in PERMISO if k in item])
-                    values = ','.join(['?' for k, t, n in PERMISO if k in item])
-                    if DEBUG:
-                        print("Ejecutando: %s %s" % (query % (fields, values), [dic['id']] + [item[k] for k, t, n in PERMISO if k in item]))
-                    ejecutar(cur, query % (fields, values), [dic['id']] + [item[k] for k, t, n in PERMISO if k in item])
-            if 'tributos' in dic:
-                query = ("INSERT INTO %(tributo)s (%%(id)s, %%%%s) VALUES (?, %%%%s)" % tablas) % campos["tributo"]
-                for item in dic['tributos']:
-                    fields = ','.join([campos["tributo"].get(k, k) for k, t, n in TRIBUTO if k in item])
-                    values = ','.join(['?' for k, t, n in TRIBUTO if k in item])
-                    if DEBUG:
-                        print("Ejecutando: %s %s" % (query % (fields, values), [dic['id']] + [item[k] for k, t, n in TRIBUTO if k in item]))
-                    ejecutar(cur, query % (fields, values), [dic['id']] + [item[k] for k, t, n in TRIBUTO if k in item])
-            if 'ivas' in dic:
-                query = ("INSERT INTO %(iva)s (%%(id)s, %%%%s) VALUES (?, %%%%s)" % tablas) % campos["iva"]
-                for item in dic['ivas']:
-                    fields = ','.join([campos["iva"].get(k, k) for k, t, n in IVA if k in item])
-                    values = ','.join(['?' for k, t, n in IVA if k in item])
-                    if DEBUG:
-                        print("Ejecutando: %s %s" % (query % (fields, values), [dic['id']] + [item[k] for k, t, n in IVA if k in item]))
-                    ejecutar(cur, query % (fields, values), [dic['id']] + [item[k] for k, t, n in IVA if k in item])
+                    print("Ejecutando: %s (%d filas)" % (query, len(filas)))
+                cur.executemany(query, filas)
         if commit:
             db.commit()
     finally:
-        pass
+        cur.close()
 
 
 def modificar(fact, db, schema={}, webservice="wsfev1", ids=None, conf_db={}):
@@ -232,14 +240,42 @@ def modificar(fact, db, schema={}, webservice="wsfev1", ids=None, conf_db={}):
         pass
 
 
-def leer(db, schema={}, webservice="wsfev1", ids=None, **kwargs):
+def leer_hijos(cur, tabla, campos, campos_rev, ids, formato=None):
+    "Consulta las filas de una tabla hija para varios ids (devuelve id: filas)"
+    query = "SELECT * FROM %s WHERE %s IN (%s)" % (
+        tabla, campos["id"], ','.join(['?'] * len(ids)))
+    if DEBUG:
+        print("ejecutando", query, ids)
+    ejecutar(cur, query, ids)
+    claves = [campos_rev.get(k[0], k[0].lower()) for k in cur.description]
+    hijos = {}
+    for it in cur.fetchall():
+        item = {}
+        for key, val in zip(claves, it):
+            if formato:
+                val = redondear(formato, key, val)
+            item[key] = val
+        hijos.setdefault(item['id'], []).append(item)
+    return hijos
+
+
+def leer(db, schema={}, webservice="wsfev1", ids=None, lote=LOTE, **kwargs):
     from .formato_txt import ENCABEZADO, DETALLE, TRIBUTO, IVA, CMP_ASOC, PERMISO, DATO
     tablas, campos, campos_rev = configurar(schema)
+    # tablas hijas: (tabla, clave en el encabezado, formato para redondear)
+    hijas = [("detalle", "detalles", DETALLE),
+             ("cmp_asoc", "cbtes_asoc", None),
+             ("permiso", "permisos", None),
+             ("iva", "ivas", IVA),
+             ("tributo", "tributos", TRIBUTO),
+             ]
+    # columnas del encabezado (las no configuradas en el esquema con el mismo nombre)
+    columnas = dict([(fmt[0], fmt[0]) for fmt in ENCABEZADO], **campos["encabezado"])
     cur = db.cursor()
     if kwargs:
         query = ("SELECT * FROM %(encabezado)s" % tablas)
     elif not ids:
-        query = ("SELECT * FROM %(encabezado)s WHERE (%%(resultado)s IS NULL OR %%(resultado)s='' OR %%(resultado)s=' ') AND (%%(id)s IS NOT NULL) AND %%(webservice)s=? ORDER BY %%(tipo_cbte)s, %%(punto_vta)s, %%(cbte_nro)s" % tablas) % campos["encabezado"]
+        query = ("SELECT * FROM %(encabezado)s WHERE (%%(resultado)s IS NULL OR %%(resultado)s='' OR %%(resultado)s=' ') AND (%%(id)s IS NOT NULL) AND %%(webservice)s=? ORDER BY %%(tipo_cbte)s, %%(punto_vta)s, %%(cbte_nro)s" % tablas) % columnas
         ids = [webservice]
     else:
         query = ("SELECT * FROM %(encabezado)s WHERE " % tablas) + " OR ".join(["%(id)s=?" % campos["encabezado"] for id in ids])
@@ -248,95 +284,28 @@ def leer(db, schema={}, webservice="wsfev1", ids=None, **kwargs):
     try:
         ejecutar(cur, query, ids)
         rows = cur.fetchall()
-        description = cur.description
-        for row in rows:
-            detalles = []
-            encabezado = {}
-            for i, k in enumerate(description):
-                val = row[i]
-                if isinstance(val, str):
-                    val = val.decode(CHARSET)
-                if isinstance(val, str):
-                    val = val.strip()
-                key = campos_rev["encabezado"].get(k[0], k[0].lower())
-                val = redondear(ENCABEZADO, key, val)
-                encabezado[key] = val
-            # print encabezado
-            detalles = []
-            if DEBUG:
-                print(("SELECT * FROM %(detalle)s WHERE %%(id)s = ?" % tablas) % campos["detalle"], [encabezado['id']])
-            ejecutar(cur, ("SELECT * FROM %(detalle)s WHERE %%(id)s = ?" % tablas) % campos["detalle"], [encabezado['id']])
-            for it in cur.fetchall():
-                detalle = {}
-                for i, k in enumerate(cur.description):
-                    val = it[i]
+        claves = [campos_rev["encabezado"].get(k[0], k[0].lower())
+                  for k in cur.description]
+        for i in range(0, len(rows), lote):
+            encabezados = []
+            for row in rows[i:i + lote]:
+                encabezado = {}
+                for key, val in zip(claves, row):
                     if isinstance(val, str):
-                        val = val.decode(CHARSET)
-                    key = campos_rev["detalle"].get(k[0], k[0].lower())
-                    val = redondear(DETALLE, key, val)
-                    detalle[key] = val
-                detalles.append(detalle)
-            encabezado['detalles'] = detalles
-
-            cmps_asoc = []
-            if DEBUG:
-                print(("SELECT * FROM %(cmp_asoc)s WHERE %%(id)s = ?" % tablas) % campos["cmp_asoc"], [encabezado['id']])
-            ejecutar(cur, ("SELECT * FROM %(cmp_asoc)s WHERE %%(id)s = ?" % tablas) % campos["cmp_asoc"], [encabezado['id']])
-            for it in cur.fetchall():
-                cmp_asoc = {}
-                for i, k in enumerate(cur.description):
-                    val = it[i]
-                    key = campos_rev["cmp_asoc"].get(k[0], k[0].lower())
-                    cmp_asoc[key] = val
-                cmps_asoc.append(cmp_asoc)
-            if cmps_asoc:
-                encabezado['cbtes_asoc'] = cmps_asoc
-
-            permisos = []
-            if DEBUG:
-                print(("SELECT * FROM %(permiso)s WHERE %%(id)s = ?" % tablas) % campos["permiso"], [encabezado['id']])
-            ejecutar(cur, ("SELECT * FROM %(permiso)s WHERE %%(id)s = ?" % tablas) % campos["permiso"], [encabezado['id']])
-            for it in cur.fetchall():
-                permiso = {}
-                for i, k in enumerate(cur.description):
-                    val = it[i]
-                    key = campos_rev["permiso"].get(k[0], k[0].lower())
-                    permiso[key] = val
-                permisos.append(permiso)
-            if permisos:
-                encabezado['permisos'] = permisos
-
-            ivas = []
-            if DEBUG:
-                print(("SELECT * FROM %(iva)s WHERE %%(id)s = ?" % tablas) % campos["iva"], [encabezado['id']])
-            ejecutar(cur, ("SELECT * FROM %(iva)s WHERE %%(id)s = ?" % tablas) % campos["iva"], [encabezado['id']])
-            for it in cur.fetchall():
-                iva = {}
-                for i, k in enumerate(cur.description):
-                    val = it[i]
-                    key = campos_rev["iva"].get(k[0], k[0].lower())
-                    val = redondear(IVA, key, val)
-                    iva[key] = val
-                ivas.append(iva)
-            if ivas:
-                encabezado['ivas'] = ivas
-
-            tributos = []
-            if DEBUG:
-                print(("SELECT * FROM %(tributo)s WHERE %%(id)s = ?" % tablas) % campos["tributo"], [encabezado['id']])
-            ejecutar(cur, ("SELECT * FROM %(tributo)s WHERE %%(id)s = ?" % tablas) % campos["tributo"], [encabezado['id']])
-            for it in cur.fetchall():
-                tributo = {}
-                for i, k in enumerate(cur.description):
-                    val = it[i]
-                    key = campos_rev["tributo"].get(k[0], k[0].lower())
-                    val = redondear(TRIBUTO, key, val)
-                    tributo[key] = val
-                tributos.append(tributo)
-            if tributos:
-                encabezado['tributos'] = tributos
-
-            yield encabezado
+                        val = val.strip()
+                    encabezado[key] = redondear(ENCABEZADO, key, val)
+                encabezados.append(encabezado)
+            # una consulta por tabla hija para todo el lote de encabezados
+            ids_lote = [encabezado['id'] for encabezado in encabezados]
+            for tabla, clave, formato in hijas:
+                hijos = leer_hijos(cur, tablas[tabla], campos[tabla],
+                                   campos_rev[tabla], ids_lote, formato)
+                for encabezado in encabezados:
+                    items = hijos.get(encabezado['id'], [])
+                    if items or clave == "detalles":
+                        encabezado[clave] = items
+            for encabezado in encabezados:
+                yield encabezado
         db.commit()
     finally:
         cur.close()
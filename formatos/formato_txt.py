@@ -16,6 +16,9 @@ __author__ = "Mariano Reingart (reingart@gmail.com)"
 __copyright__ = "Copyright (C) 2011 Mariano Reingart"
 __license__ = "GPL 3.0"
 
+import os
+import sys
+import time
 from decimal import Decimal
 
 CHARSET = 'latin1'
@@ -148,15 +151,31 @@ DATO = [
 ]
 
 
+_compilados = {}
+
+
+def compilar(formato):
+    "Precalcular posiciones y decimales de cada campo (solo la primera vez)"
+    formato_ant, campos = _compilados.get(id(formato), (None, None))
+    if formato_ant is not formato or len(campos) != len(formato):
+        campos = []
+        comienzo = 0
+        for (clave, longitud, tipo) in formato:
+            if isinstance(longitud, tuple):
+                longitud, decimales = longitud
+            else:
+                decimales = 2
+            campos.append((clave, comienzo, comienzo + longitud, longitud, tipo,
+                           decimales, clave.capitalize()))
+            comienzo += longitud
+        _compilados[id(formato)] = (formato, campos)
+    return campos
+
+
 def leer_linea_txt(linea, formato):
     dic = {}
-    comienzo = 1
-    for (clave, longitud, tipo) in formato:
-        if isinstance(longitud, tuple):
-            longitud, decimales = longitud
-        else:
-            decimales = 2
-        valor = linea[comienzo - 1:comienzo - 1 + longitud].strip()
+    for (clave, inicio, fin, longitud, tipo, decimales, capitalizada) in compilar(formato):
+        valor = linea[inicio:fin].strip()
         try:
             if tipo == N:
                 if valor:
@@ -166,11 +185,10 @@ def leer_linea_txt(linea, formato):
             elif tipo == I:
                 if valor:
                     try:
-                        valor = valor.strip(" ")
                         if '.' in valor:
                             valor = float(valor)
                         else:
-                            valor = float(("%%s.%%0%sd" % decimales) % (int(valor[:-decimales] or '0'), int(valor[-decimales:] or '0')))
+                            valor = float("%s.%0*d" % (int(valor[:-decimales] or '0'), decimales, int(valor[-decimales:] or '0')))
                     except ValueError:
                         raise ValueError("Campo invalido: %s = '%s'" % (clave, valor))
                 else:
@@ -178,59 +196,78 @@ def leer_linea_txt(linea, formato):
             elif tipo == A:
                 valor = valor.replace("\v", "\n")  # reemplazo salto de linea
             dic[clave] = valor
-            comienzo += longitud
         except Exception as e:
             raise ValueError("Error al leer campo %s pos %s val '%s': %s" % (
-                clave, comienzo, valor, str(e)))
+                clave, inicio + 1, valor, str(e)))
     return dic
 
 
 def escribir_linea_txt(dic, formato):
-    linea = " " * 335
-    comienzo = 1
-    for (clave, longitud, tipo) in formato:
-        if isinstance(longitud, tuple):
-            longitud, decimales = longitud
-        else:
-            decimales = 2
+    partes = []
+    exacto = True
+    campos = compilar(formato)
+    for (clave, inicio, fin, longitud, tipo, decimales, capitalizada) in campos:
+        valor = ""
         try:
-            if clave.capitalize() in dic:
-                clave = clave.capitalize()
+            if capitalizada in dic:
+                clave = capitalizada
             valor = dic.get(clave, "")
-            if not isinstance(valor, str):
+            if isinstance(valor, bytes):
+                valor = valor.decode(CHARSET, "replace")
+            elif not isinstance(valor, str):
                 valor = str(valor)
-            if isinstance(valor, str):
-                valor = valor.encode(CHARSET, "replace")
             if valor == 'None':
                 valor = ''
             if tipo == N and valor and valor != "NULL":
-                valor = ("%%0%dd" % longitud) % int(valor)
+                valor = "%0*d" % (longitud, int(valor))
             elif tipo == I and valor:
-                valor = ("%%0%d.%df" % (longitud + 1, decimales) % float(valor)).replace(".", "")
-                print("valor", valor)
+                valor = ("%0*.*f" % (longitud + 1, decimales, float(valor))).replace(".", "")
             else:
-                valor = ("%%-%ds" % longitud) % valor.replace("\n", "\v")  # reemplazo salto de linea
-            # reemplazo saltos de linea por tabulaci{on vertical
+                valor = "%-*s" % (longitud, valor.replace("\n", "\v"))  # reemplazo salto de linea
+            # reemplazo saltos de linea por tabulacin vertical
             valor = valor.replace("\n\r", "\v").replace("\n", "\v").replace("\r", "\v")
-            linea = linea[:comienzo - 1] + valor + linea[comienzo - 1 + longitud:]
-            comienzo += longitud
         except Exception as e:
             raise ValueError("Error al escribir campo %s val '%s': %s" % (
                 clave, valor, str(e)))
+        exacto = exacto and len(valor) == longitud
+        partes.append(valor)
+    if exacto:
+        return "".join(partes).ljust(335) + "\n"
+    # valores que exceden el campo: reemplazar secuencialmente (compatibilidad)
+    linea = " " * 335
+    for campo, valor in zip(campos, partes):
+        linea = linea[:campo[1]] + valor + linea[campo[1] + campo[3]:]
     return linea + "\n"
 
 
-def leer(fn="entrada.txt"):
-    "Analiza un archivo TXT y devuelve un diccionario"
-    f_entrada = open(fn, "r")
+# sub-registros de cada comprobante: tipo_reg -> (formato, clave)
+SUBREGISTROS = {
+    '1': (DETALLE, 'detalles'),
+    '2': (PERMISO, 'permisos'),
+    '3': (CMP_ASOC, 'cbtes_asoc'),
+    '4': (IVA, 'ivas'),
+    '5': (TRIBUTO, 'tributos'),
+    '9': (DATO, 'datos'),
+}
+
+
+def iterar(fn="entrada.txt"):
+    "Analiza un archivo TXT y devuelve cada comprobante a medida que se completa"
+    if hasattr(fn, "read"):
+        f_entrada = fn
+    else:
+        f_entrada = open(fn, "r", encoding=CHARSET)
     try:
-        regs = []
         reg = None
         for linea in f_entrada:
-            linea = str(linea, CHARSET)
-            if str(linea[0]) == '0':
-                encabezado = leer_linea_txt(linea, ENCABEZADO)
-                reg = encabezado
+            if isinstance(linea, bytes):
+                linea = linea.decode(CHARSET)
+            tipo_reg = linea[:1]
+            if tipo_reg == '0':
+                if reg is not None:
+                    # el comprobante anterior ya esta completo
+                    yield reg
+                reg = leer_linea_txt(linea, ENCABEZADO)
                 if not reg.get('cbt_numero'):
                     # por compatibilidad con pyrece:
                     reg['cbt_numero'] = reg['cbte_nro']
@@ -242,69 +279,61 @@ def leer(fn="entrada.txt"):
                     'detalles': [],
                     'datos': [],
                 })
-                regs.append(reg)
-            elif str(linea[0]) == '1':
-                detalle = leer_linea_txt(linea, DETALLE)
-                detalle['id'] = encabezado['id']
-                reg['detalles'].append(detalle)
-            elif str(linea[0]) == '2':
-                permiso = leer_linea_txt(linea, PERMISO)
-                permiso['id'] = encabezado['id']
-                reg['permisos'].append(permiso)
-            elif str(linea[0]) == '3':
-                cbtasoc = leer_linea_txt(linea, CMP_ASOC)
-                cbtasoc['id'] = encabezado['id']
-                reg['cbtes_asoc'].append(cbtasoc)
-            elif str(linea[0]) == '4':
-                iva = leer_linea_txt(linea, IVA)
-                iva['id'] = encabezado['id']
-                reg['ivas'].append(iva)
-            elif str(linea[0]) == '5':
-                tributo = leer_linea_txt(linea, TRIBUTO)
-                tributo['id'] = encabezado['id']
-                reg['tributos'].append(tributo)
-            elif str(linea[0]) == '9':
-                dato = leer_linea_txt(linea, DATO)
-                dato['id'] = encabezado['id']
-                reg['datos'].append(dato)
-                print(dato)
-            else:
-                print("Tipo de registro incorrecto:", linea[0])
+            elif tipo_reg in SUBREGISTROS and reg is not None:
+                formato, clave = SUBREGISTROS[tipo_reg]
+                item = leer_linea_txt(linea, formato)
+                item['id'] = reg['id']
+                reg[clave].append(item)
+            elif linea.strip():
+                print("Tipo de registro incorrecto:", tipo_reg)
+        if reg is not None:
+            yield reg
     finally:
-        f_entrada.close()
+        if f_entrada is not fn:
+            f_entrada.close()
 
-    return regs
+
+def leer(fn="entrada.txt"):
+    "Analiza un archivo TXT y devuelve un diccionario"
+    return list(iterar(fn))
 
 
 def escribir(regs, archivo):
-    f_salida = open(archivo, "a")
-
-    for reg in regs:
-        reg['tipo_reg'] = 0
-        if not reg.get('cbte_nro'):
-            # por compatibilidad con pyrece:
-            reg['cbte_nro'] = reg['cbt_numero']
-        f_salida.write(escribir_linea_txt(reg, ENCABEZADO))
-        for it in reg['detalles']:
-            it['tipo_reg'] = 1
-            f_salida.write(escribir_linea_txt(it, DETALLE))
-        for it in reg.get('permisos', []):
-            it['tipo_reg'] = 2
-            f_salida.write(escribir_linea_txt(it, PERMISO))
-        for it in reg.get('cbtasocs', reg.get('cbtes_asoc', [])):
-            it['tipo_reg'] = 3
-            f_salida.write(escribir_linea_txt(it, CMP_ASOC))
-        for it in reg.get('ivas', []):
-            it['tipo_reg'] = 4
-            f_salida.write(escribir_linea_txt(it, IVA))
-        for it in reg.get('tributos', []):
-            it['tipo_reg'] = 5
-            f_salida.write(escribir_linea_txt(it, TRIBUTO))
-        for it in reg.get('datos', []):
-            it['tipo_reg'] = 9
-            f_salida.write(escribir_linea_txt(it, DATO))
-
-    f_salida.close()
+    "Escribe los comprobantes (lista o iterador, ej. iterar) en un archivo TXT"
+    if hasattr(archivo, "write"):
+        f_salida = archivo
+    else:
+        f_salida = open(archivo, "a", encoding=CHARSET)
+
+    try:
+        for reg in regs:
+            reg['tipo_reg'] = 0
+            if not reg.get('cbte_nro'):
+                # por compatibilidad con pyrece:
+                reg['cbte_nro'] = reg['cbt_numero']
+            lineas = [escribir_linea_txt(reg, ENCABEZADO)]
+            for it in reg['detalles']:
+                it['tipo_reg'] = 1
+                lineas.append(escribir_linea_txt(it, DETALLE))
+            for it in reg.get('permisos', []):
+                it['tipo_reg'] = 2
+                lineas.append(escribir_linea_txt(it, PERMISO))
+            for it in reg.get('cbtasocs', reg.get('cbtes_asoc', [])):
+                it['tipo_reg'] = 3
+                lineas.append(escribir_linea_txt(it, CMP_ASOC))
+            for it in reg.get('ivas', []):
+                it['tipo_reg'] = 4
+                lineas.append(escribir_linea_txt(it, IVA))
+            for it in reg.get('tributos', []):
+                it['tipo_reg'] = 5
+                lineas.append(escribir_linea_txt(it, TRIBUTO))
+            for it in reg.get('datos', []):
+                it['tipo_reg'] = 9
+                lineas.append(escribir_linea_txt(it, DATO))
+            f_salida.write("".join(lineas))
+    finally:
+        if f_salida is not archivo:
+            f_salida.close()
 
 
 def ayuda():
@@ -332,5 +361,30 @@ def ayuda():
             comienzo += longitud
 
 
+def benchmark(fn=None, repeticiones=100):
+    "Medir lineas por segundo al leer y escribir un archivo (por defecto el de ejemplo)"
+    if not fn:
+        fn = os.path.join(os.path.dirname(__file__), "..", "datos", "facturas.txt")
+    formatos = {'0': ENCABEZADO, '1': DETALLE, '2': PERMISO, '3': CMP_ASOC,
+                '4': IVA, '5': TRIBUTO, '9': DATO}
+    with open(fn, "r", encoding=CHARSET) as f:
+        lineas = [(formatos[linea[0]], linea) for linea in f if linea[:1] in formatos]
+    t0 = time.time()
+    for i in range(repeticiones):
+        regs = [(formato, leer_linea_txt(linea, formato)) for formato, linea in lineas]
+    t1 = time.time()
+    for i in range(repeticiones):
+        salida = "".join([escribir_linea_txt(reg, formato) for formato, reg in regs])
+    t2 = time.time()
+    cant = len(lineas) * repeticiones
+    return {"archivo": fn, "lineas": cant,
+            "leer_lineas_por_segundo": cant / (t1 - t0),
+            "escribir_lineas_por_segundo": cant / (t2 - t1)}
+
+
 if __name__ == "__main__":
-    ayuda()
+    if "--benchmark" in sys.argv:
+        args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+        print(benchmark(*args[:1]))
+    else:
+        ayuda()
@@ -0,0 +1,284 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Motor para autorizar lotes de comprobantes en paralelo y reanudables (rece1, etc.)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2010-2019 Mariano Reingart"
+__license__ = "GPL 3.0"
+__version__ = "1.00a"
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+
+from .comprobante import serializar
+
+
+HILOS = 4           # flujos (punto de venta / tipo de comprobante) en paralelo
+COLA_MAX = 100      # comprobantes leídos por adelantado para cada hilo
+PENDIENTE = "P"     # estado en el diario: enviado a AFIP sin respuesta registrada
+ERROR = "E"         # estado en el diario: excepción (sin resultado de AFIP)
+DEBUG = False
+
+
+def flujo_cbte(factura):
+    "Flujo de numeración del comprobante (solo debe ser secuencial dentro de él)"
+    return (factura.get('tipo_cbte'), factura.get('punto_vta'))
+
+
+def clave_cbte(factura):
+    "Identificación del comprobante en el diario (tipo, punto de venta y número)"
+    return "%s-%s-%s" % (factura.get('tipo_cbte'), factura.get('punto_vta'),
+                         factura.get('cbt_desde', factura.get('cbte_nro')))
+
+
+class Diario:
+    "Registro local del avance del lote (una línea JSON por cambio de estado)"
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        # en memoria solo el último estado y la posición de su línea en el
+        # archivo (los datos de cada comprobante se leen al consultarlo)
+        self.entradas = {}      # clave: (estado, posición)
+        self._f = open(archivo, "ab+")
+        self._f.seek(0)
+        posicion = 0
+        linea = b""
+        for linea in self._f:
+            try:
+                entrada = json.loads(linea)
+            except ValueError:
+                # línea truncada (interrupción mientras se grababa)
+                entrada = None
+            if entrada:
+                self.entradas[entrada['clave']] = (entrada['estado'], posicion)
+            posicion += len(linea)
+        if linea and not linea.endswith(b"\n"):
+            # completar la línea truncada para no unirla con la siguiente
+            self._f.write(b"\n")
+            posicion += 1
+        self._posicion = posicion
+        self._lock = threading.Lock()
+
+    def estado(self, clave):
+        "Devolver el último estado registrado para el comprobante (o None)"
+        indice = self.entradas.get(clave)
+        return indice and indice[0]
+
+    def obtener(self, clave):
+        "Devolver la última entrada registrada para el comprobante (o None)"
+        indice = self.entradas.get(clave)
+        if indice is None:
+            return None
+        with self._lock:
+            self._f.seek(indice[1])
+            return json.loads(self._f.readline())
+
+    def registrar(self, clave, estado, factura=None):
+        "Grabar el estado del comprobante (forzando la escritura a disco)"
+        entrada = {'clave': clave, 'estado': estado, 'fecha': time.time(),
+                   'factura': factura}
+        linea = (json.dumps(entrada, default=serializar) + "\n").encode("utf8")
+        with self._lock:
+            # en modo "a" la escritura siempre se agrega al final del archivo
+            self._f.write(linea)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self.entradas[clave] = (estado, self._posicion)
+            self._posicion += len(linea)
+
+    def cerrar(self):
+        self._f.close()
+
+
+class Estadisticas:
+    "Cantidades, rendimiento y latencia de las llamadas al webservice"
+
+    def __init__(self):
+        self.inicio = time.time()
+        self.fin = None
+        self.latencias = []
+        self.leidos = 0
+        self.autorizados = self.rechazados = self.errores = self.omitidos = 0
+        self._lock = threading.Lock()
+
+    def contador(self, resultado):
+        "Nombre del atributo que acumula el resultado"
+        return {'A': 'autorizados', 'R': 'rechazados', 'O': 'omitidos'}.get(resultado, 'errores')
+
+    def registrar(self, latencia, resultado, anterior=None):
+        "Acumular el resultado (anterior: ya registrado con otro resultado)"
+        with self._lock:
+            if latencia is not None:
+                self.latencias.append(latencia)
+            if anterior is not None:
+                setattr(self, self.contador(anterior), getattr(self, self.contador(anterior)) - 1)
+            setattr(self, self.contador(resultado), getattr(self, self.contador(resultado)) + 1)
+
+    def resumen(self):
+        "Devolver un diccionario con los totales (tiempos en segundos)"
+        duracion = (self.fin or time.time()) - self.inicio
+        latencias = sorted(self.latencias)
+        cant = len(latencias)
+        percentil = lambda p: latencias[min(cant - 1, int(cant * p))] if cant else 0
+        return {'autorizados': self.autorizados, 'rechazados': self.rechazados,
+                'errores': self.errores, 'omitidos': self.omitidos,
+                'llamadas': cant, 'duracion': duracion,
+                'cbtes_por_segundo': cant / duracion if duracion else 0,
+                'latencia_media': sum(latencias) / cant if cant else 0,
+                'latencia_p50': percentil(.5), 'latencia_p95': percentil(.95),
+                'latencia_p99': percentil(.99),
+                'latencia_max': latencias and latencias[-1] or 0,
+                }
+
+    def __str__(self):
+        return ("Autorizados: %(autorizados)d Rechazados: %(rechazados)d "
+                "Errores: %(errores)d Omitidos: %(omitidos)d "
+                "en %(duracion).1f s (%(cbtes_por_segundo).2f cbtes/s) - Latencia: "
+                "media %(latencia_media).3f s, p50 %(latencia_p50).3f s, "
+                "p95 %(latencia_p95).3f s, p99 %(latencia_p99).3f s, max %(latencia_max).3f s") % self.resumen()
+
+
+def procesar(ws, facturas, autorizar, consultar=None, escribir=None, diario=None,
+             hilos=1, crear_ws=None, flujo=flujo_cbte, clave=clave_cbte):
+    """Autorizar las facturas (secuencialmente dentro de cada flujo, los flujos
+       en paralelo) y devolver las estadísticas del proceso
+
+       autorizar(ws, factura) y consultar(ws, factura) devuelven el dict a
+       grabar (consultar devuelve None si el comprobante no fue autorizado)"""
+    estadisticas = Estadisticas()
+    lock = threading.Lock()
+
+    def procesar_factura(ws, factura):
+        # devuelve el dict a grabar y el resultado contabilizado en las estadísticas
+        k = clave(factura)
+        estado = diario and diario.estado(k)
+        if estado == 'A':
+            # autorizado en una ejecución anterior: no volver a enviarlo
+            estadisticas.registrar(None, 'O')
+            return diario.obtener(k)['factura'], 'O'
+        if estado in (PENDIENTE, ERROR) and consultar:
+            # interrumpido o sin respuesta (ej. timeout): verificar si AFIP lo
+            # autorizó antes de volver a enviarlo
+            dic = consultar(ws, factura)
+            if dic:
+                diario.registrar(k, 'A', dic)
+                estadisticas.registrar(None, 'O')
+                return dic, 'O'
+        if diario:
+            diario.registrar(k, PENDIENTE)
+        t0 = time.time()
+        try:
+            dic = autorizar(ws, factura)
+        except Exception as e:
+            latencia = time.time() - t0
+            if diario:
+                diario.registrar(k, ERROR)
+            estadisticas.registrar(latencia, ERROR)
+            if DEBUG:
+                traceback.print_exc()
+            return dict(factura, err_msg=str(e)), ERROR
+        if dic is None:
+            # no procesado (ej. cancelado por el usuario en modo depuración)
+            if diario:
+                diario.registrar(k, ERROR)
+            return None, None
+        latencia = time.time() - t0
+        if diario:
+            diario.registrar(k, dic.get('resultado') or ERROR, dic)
+        # contabilizar luego de registrar en el diario (ver procesar_y_grabar)
+        estadisticas.registrar(latencia, dic.get('resultado'))
+        return dic, dic.get('resultado') or ERROR
+
+    def grabar(dic):
+        if escribir and dic:
+            with lock:
+                escribir(dic)
+
+    def procesar_y_grabar(ws, factura):
+        # una falla (consultar, diario, escribir) no debe detener el lote
+        contabilizado = None
+        try:
+            dic, contabilizado = procesar_factura(ws, factura)
+            grabar(dic)
+        except Exception:
+            # si ya fue contabilizado (falló al grabar) pasarlo a errores
+            estadisticas.registrar(None, ERROR, contabilizado)
+            sys.stderr.write("Error al procesar el comprobante %s:\n" % clave(factura))
+            traceback.print_exc()
+            if diario:
+                try:
+                    diario.registrar(clave(factura), ERROR)
+                except Exception:
+                    traceback.print_exc()
+
+    if hilos <= 1 or not crear_ws:
+        for factura in facturas:
+            estadisticas.leidos += 1
+            procesar_y_grabar(ws, factura)
+        estadisticas.fin = time.time()
+        return estadisticas
+
+    # cada flujo se asigna a un único hilo (con su propia instancia del
+    # webservice, el cliente SOAP no es thread-safe) para preservar el orden
+    colas = [queue.Queue(COLA_MAX) for i in range(hilos)]
+    flujos = [set() for i in range(hilos)]
+    asignados = {}
+    fin = object()
+
+    def trabajar(ws, cola):
+        while True:
+            factura = cola.get()
+            if factura is fin:
+                break
+            procesar_y_grabar(ws, factura)
+
+    def poner(i, item):
+        # no esperar indefinidamente si el hilo terminó (ej. excepción grave)
+        while True:
+            try:
+                colas[i].put(item, timeout=1)
+                return True
+            except queue.Full:
+                if not hilos_[i].is_alive():
+                    return False
+
+    hilos_ = []
+    for i, cola in enumerate(colas):
+        hilo = threading.Thread(target=trabajar, args=(ws if i == 0 else crear_ws(), cola),
+                                name="lote-%d" % i)
+        hilo.daemon = True
+        hilo.start()
+        hilos_.append(hilo)
+    try:
+        for factura in facturas:
+            estadisticas.leidos += 1
+            f = flujo(factura)
+            i = asignados.get(f)
+            if i is None:
+                # nuevo flujo: asignarlo al hilo con menos flujos
+                i = asignados[f] = min(range(hilos), key=lambda j: len(flujos[j]))
+                flujos[i].add(f)
+            if not poner(i, factura):
+                raise RuntimeError("Hilo %s finalizado inesperadamente" % hilos_[i].name)
+    finally:
+        for i in range(len(hilos_)):
+            poner(i, fin)
+        for hilo in hilos_:
+            hilo.join()
+    estadisticas.fin = time.time()
+    return estadisticas
@@ -22,11 +22,19 @@ __version__ = "1.07e"
 
 
 import csv
+import heapq
+import itertools
 import json
+import mmap
 import os
+import queue
 import shelve
 import socket
 import sqlite3
+import struct
+import tempfile
+import threading
+import time
 import urllib.request
 import urllib.error
 import urllib.parse
@@ -55,6 +63,9 @@ FORMATO = [
     ("email", 250, A, ""),
 ]
 
+# campos provistos por AFIP (el resto se completa localmente con Guardar)
+CAMPOS_AFIP = [k for k, l, t, d in FORMATO[:9]]
+
 # Mapeos constantes:
 
 PROVINCIAS = {0: 'CIUDAD AUTONOMA BUENOS AIRES', 1: 'BUENOS AIRES',
@@ -68,6 +79,58 @@ TIPO_CLAVE = {'CUIT': 80, 'CUIL': 86, 'CDI': 86, 'DNI': 96, 'Otro': 99}
 
 DEBUG = True
 
+LOTE = 10000            # registros por executemany al procesar el padrón
+CACHE_SIZE = -65536     # cache sqlite durante la importación (en KiB, 64 MB)
+LOTE_INDICE = 1000000   # registros ordenados en memoria al crear el índice binario
+
+HILOS = 4              # consultas a AFIP en curso (ConsultarLote)
+DIA = 24 * 60 * 60
+# vigencia (en segundos) de los datos consultados a AFIP, por grupo de campos
+TTL = {'cat_iva': 7 * DIA, 'monotributo': 7 * DIA, 'domicilio': 30 * DIA}
+TTL_INEXISTENTE = DIA   # caché negativa (CUIT inexistentes)
+NO_EXISTE = "no existe persona"     # mensaje de AFIP (el resto de los errores se reintenta)
+
+# tablas de la base local (consulta: fecha de la última consulta por campo)
+TABLA_PADRON = ("padron ("
+                "nro_doc INTEGER, "
+                "denominacion VARCHAR(30), "
+                "imp_ganancias VARCHAR(2), "
+                "imp_iva VARCHAR(2), "
+                "monotributo VARCHAR(1), "
+                "integrante_soc VARCHAR(1), "
+                "empleador VARCHAR(1), "
+                "actividad_monotributo VARCHAR(2), "
+                "tipo_doc INTEGER, "
+                "cat_iva INTEGER DEFAULT NULL, "
+                "email VARCHAR(250) "
+                ");")
+TABLA_DOMICILIO = ("domicilio ("
+                   "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                   "tipo_doc INTEGER, "
+                   "nro_doc INTEGER, "
+                   "direccion TEXT, "
+                   "FOREIGN KEY (tipo_doc, nro_doc) REFERENCES padron "
+                   ");")
+TABLA_CONSULTA = ("consulta ("
+                  "tipo_doc INTEGER, "
+                  "nro_doc INTEGER, "
+                  "campo VARCHAR(20), "
+                  "fecha REAL, "
+                  "PRIMARY KEY (tipo_doc, nro_doc, campo)"
+                  ");")
+
+# índice binario de solo lectura (ver crear_indice e IndicePadron): cabecera y
+# registros de largo fijo ordenados por CUIT (entero de 8 bytes big-endian, por
+# lo que el orden de los bytes coincide con el numérico) y los campos de AFIP
+MAGICO = b"PADRONX1"
+CABECERA = struct.Struct("<8sII")       # mágico, largo del registro, cantidad
+CLAVE = struct.Struct(">Q")
+POSICIONES = [(fmt[0], fin - fmt[1], fin)     # campo, inicio, fin (en los datos)
+              for fmt, fin in zip(FORMATO[1:8], itertools.accumulate(
+                  [fmt[1] for fmt in FORMATO[1:8]]))]
+LARGO_DATOS = POSICIONES[-1][2]         # 40 bytes (sin el CUIT)
+LARGO_REGISTRO = CLAVE.size + LARGO_DATOS
+
 URL = "http://www.afip.gob.ar/genericos/cInscripcion/archivos/apellidoNombreDenominacion.zip"
 URL_API = "https://soa.afip.gob.ar/"
 
@@ -75,10 +138,11 @@ URL_API = "https://soa.afip.gob.ar/"
 class PadronAFIP():
     "Interfaz para consultar situación tributaria (Constancia de Inscripcion)"
 
-    _public_methods_ = ['Buscar', 'Descargar', 'Procesar', 'Guardar',
+    _public_methods_ = ['Buscar', 'Descargar', 'Procesar', 'Actualizar', 'Guardar',
                         'ConsultarDomicilios', 'Consultar', 'Conectar',
                         'DescargarConstancia', 'MostrarPDF',
-                        "ObtenerTablaParametros",
+                        "ObtenerTablaParametros", 'ConsultarLote',
+                        'Indexar', 'AbrirIndice',
                         ]
     _public_attrs_ = ['InstallDir', 'Traceback', 'Excepcion', 'Version',
                       'cuit', 'dni', 'denominacion', 'imp_ganancias', 'imp_iva',
@@ -87,6 +151,8 @@ class PadronAFIP():
                       'tipo_doc', 'nro_doc', 'LanzarExcepciones',
                       'tipo_persona', 'estado', 'impuestos', 'actividades',
                       'direccion', 'localidad', 'provincia', 'cod_postal',
+                      'altas', 'bajas', 'modificaciones',
+                      'en_cache', 'consultas', 'inexistentes', 'fallidos',
                       'data', 'response',
                       ]
     _readonly_attrs_ = _public_attrs_[3:-1]
@@ -95,6 +161,8 @@ class PadronAFIP():
 
     def __init__(self):
         self.db_path = os.path.join(self.InstallDir, "padron.db")
+        self.indice_path = os.path.join(self.InstallDir, "padron.idx")
+        self.indice = None              # IndicePadron (ver AbrirIndice)
         self.Version = __version__
         # Abrir la base de datos
         self.db = sqlite3.connect(self.db_path)
@@ -103,6 +171,8 @@ class PadronAFIP():
         self.LanzarExcepciones = False
         self.inicializar()
         self.client = None
+        self.resultados = []
+        self.en_cache = self.consultas = self.inexistentes = self.fallidos = 0
 
     def inicializar(self):
         self.Excepcion = self.Traceback = ""
@@ -119,6 +189,7 @@ class PadronAFIP():
         self.monotributo = self.actividad_monotributo = ""
         self.data = {}
         self.response = ""
+        self.altas = self.bajas = self.modificaciones = 0
 
     @inicializar_y_capturar_excepciones_simple
     def Conectar(self, url=URL_API, proxy="", wrapper=None, cacert=None, trace=False):
@@ -181,78 +252,124 @@ class PadronAFIP():
         return 200
 
     @inicializar_y_capturar_excepciones_simple
-    def Procesar(self, filename="padron.txt", borrar=False):
+    def Procesar(self, filename="padron.txt", borrar=False, lote=LOTE, progreso=None):
         "Analiza y crea la base de datos interna sqlite para consultas"
-        f = open(filename, "r")
         keys = [k for k, l, t, d in FORMATO]
-        # conversion a planilla csv (no usado)
-        if False and not os.path.exists("padron.csv"):
-            csvfile = open('padron.csv', 'wb')
-            import csv
-            wr = csv.writer(csvfile, delimiter=',',
-                            quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            for i, l in enumerate(f):
-                if i % 100000 == 0:
-                    print("Progreso: %d registros" % i)
-                r = leer(l, FORMATO)
-                row = [r[k] for k in keys]
-                wr.writerow(row)
-            csvfile.close()
-        f.seek(0)
         if os.path.exists(self.db_path) and borrar:
+            # cerrar la conexión para no seguir consultando la base anterior
+            self.db.close()
             os.remove(self.db_path)
-        if True:
-            db = db = sqlite3.connect(self.db_path)
-            c = db.cursor()
-            c.execute("CREATE TABLE padron ("
-                      "nro_doc INTEGER, "
-                      "denominacion VARCHAR(30), "
-                      "imp_ganancias VARCHAR(2), "
-                      "imp_iva VARCHAR(2), "
-                      "monotributo VARCHAR(1), "
-                      "integrante_soc VARCHAR(1), "
-                      "empleador VARCHAR(1), "
-                      "actividad_monotributo VARCHAR(2), "
-                      "tipo_doc INTEGER, "
-                      "cat_iva INTEGER DEFAULT NULL, "
-                      "email VARCHAR(250), "
-                      "PRIMARY KEY (tipo_doc, nro_doc)"
-                      ");")
-            c.execute("CREATE TABLE domicilio ("
-                      "id INTEGER PRIMARY KEY AUTOINCREMENT, "
-                      "tipo_doc INTEGER, "
-                      "nro_doc INTEGER, "
-                      "direccion TEXT, "
-                      "FOREIGN KEY (tipo_doc, nro_doc) REFERENCES padron "
-                      ");")
-            # importar los datos a la base sqlite
-            for i, l in enumerate(f):
-                if i % 10000 == 0:
-                    print(i)
-                l = l.strip("\x00")
-                r = leer(l, FORMATO)
-                params = [r[k] for k in keys]
-                params[8] = 80          # agrego tipo_doc = CUIT
-                params[9] = None        # cat_iva no viene de AFIP
-                placeholders = ", ".join(["?"] * len(params))
-                c.execute("INSERT INTO padron VALUES (%s)" % placeholders,
-                          params)
-            db.commit()
+        db = sqlite3.connect(self.db_path)
+        c = db.cursor()
+        # ajustes para carga masiva (sin journal, no esperar escritura a disco)
+        c.execute("PRAGMA journal_mode=OFF")
+        c.execute("PRAGMA synchronous=OFF")
+        c.execute("PRAGMA cache_size=%d" % CACHE_SIZE)
+        c.execute("PRAGMA temp_store=MEMORY")
+        c.execute("CREATE TABLE " + TABLA_PADRON)
+        c.execute("CREATE TABLE " + TABLA_DOMICILIO)
+        # importar los datos a la base sqlite (en lotes, única transacción)
+        sql = "INSERT INTO padron VALUES (%s)" % ", ".join(["?"] * len(keys))
+        i = 0
+        for filas in leer_lotes(filename, lote):
+            c.executemany(sql, filas)
+            i += len(filas)
+            if progreso:
+                progreso(i)
+        # crear los índices luego de insertar los datos (más eficiente)
+        c.execute("CREATE UNIQUE INDEX padron_pk ON padron (tipo_doc, nro_doc)")
+        c.execute("CREATE INDEX domicilio_doc ON domicilio (tipo_doc, nro_doc)")
+        db.commit()
+        c.execute("PRAGMA journal_mode=DELETE")
+        c.close()
+        db.close()
+        if borrar:
+            # reabrir la base de datos para las consultas posteriores
+            self.db = sqlite3.connect(self.db_path)
+            self.db.row_factory = sqlite3.Row
+            self.cursor = self.db.cursor()
+        return i
+
+    @inicializar_y_capturar_excepciones_simple
+    def Actualizar(self, filename="padron.txt", lote=LOTE, progreso=None):
+        "Aplica solo las diferencias del archivo (sin reconstruir la base)"
+        c = self.db.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='padron'")
+        if not c.fetchone():
+            # no hay base previa: importar el padrón completo
             c.close()
-            db.close()
+            self.altas = self.Procesar(filename, borrar=True, lote=lote, progreso=progreso)
+            self.bajas = self.modificaciones = 0
+            return True
+        # cargar el nuevo padrón en una tabla temporal (solo campos de AFIP)
+        campos = CAMPOS_AFIP
+        try:
+            c.execute("CREATE TEMP TABLE padron_nuevo (%s)" % ", ".join(campos))
+            sql = "INSERT INTO padron_nuevo VALUES (%s)" % ", ".join(["?"] * len(campos))
+            i = 0
+            for filas in leer_lotes(filename, lote):
+                c.executemany(sql, [fila[:len(campos)] for fila in filas])
+                i += len(filas)
+                if progreso:
+                    progreso(i)
+            c.execute("CREATE UNIQUE INDEX padron_nuevo_pk ON padron_nuevo (tipo_doc, nro_doc)")
+            clave = "n.tipo_doc=padron.tipo_doc AND n.nro_doc=padron.nro_doc"
+            # modificaciones: actualizar solo los campos provenientes de AFIP
+            # (conservando cat_iva, email y domicilios agregados con Guardar)
+            c.execute("UPDATE padron SET (%s) = (SELECT %s FROM padron_nuevo n WHERE %s) "
+                      "WHERE EXISTS (SELECT 1 FROM padron_nuevo n WHERE %s AND (%s))" % (
+                          ", ".join(campos), ", ".join(campos), clave, clave,
+                          " OR ".join(["n.%s IS NOT padron.%s" % (k, k) for k in campos])))
+            self.modificaciones = c.rowcount
+            # altas: contribuyentes nuevos
+            c.execute("INSERT INTO padron (%s) SELECT %s FROM padron_nuevo n "
+                      "WHERE NOT EXISTS (SELECT 1 FROM padron WHERE %s)" % (
+                          ", ".join(campos), ", ".join(campos), clave))
+            self.altas = c.rowcount
+            # bajas: CUIT que ya no figuran en el padrón y sin datos locales
+            c.execute("DELETE FROM padron WHERE tipo_doc=80 "
+                      "AND NOT EXISTS (SELECT 1 FROM padron_nuevo n WHERE %s) "
+                      "AND cat_iva IS NULL AND COALESCE(email, '')='' "
+                      "AND NOT EXISTS (SELECT 1 FROM domicilio d "
+                      "WHERE d.tipo_doc=padron.tipo_doc AND d.nro_doc=padron.nro_doc)" % clave)
+            self.bajas = c.rowcount
+            self.db.commit()
+        except BaseException:
+            # descartar los cambios parciales (la base queda como estaba)
+            self.db.rollback()
+            raise
+        finally:
+            # la tabla temporal persiste en la conexión: eliminarla siempre
+            c.execute("DROP TABLE IF EXISTS padron_nuevo")
+            c.close()
+        return True
 
     @inicializar_y_capturar_excepciones_simple
     def Buscar(self, nro_doc, tipo_doc=80):
         "Devuelve True si fue encontrado y establece atributos con datos"
         # cuit: codigo único de identificación tributaria del contribuyente
         #       (sin guiones)
+        if self.indice and int(tipo_doc) == 80:
+            # índice binario: solo datos de AFIP (no incluye los de Guardar)
+            row = self.indice.buscar(nro_doc)
+        else:
+            row = self._buscar_db(nro_doc, tipo_doc)
+        return self._asignar(row)
+
+    def _buscar_db(self, nro_doc, tipo_doc=80):
+        "Devolver el registro de la base sqlite (Guardar y ConsultarLote no usan el índice)"
         self.cursor.execute("SELECT * FROM padron WHERE "
                             " tipo_doc=? AND nro_doc=?", [tipo_doc, nro_doc])
-        row = self.cursor.fetchone()
+        return self.cursor.fetchone()
+
+    def _asignar(self, row):
+        "Establecer los atributos con los datos del registro (True si existe)"
         for key in [k for k, l, t, d in FORMATO]:
             if row:
                 val = row[key]
-                if not isinstance(val, str):
+                if val is None:
+                    val = ''
+                elif not isinstance(val, str):
                     val = str(row[key])
                 setattr(self, key, val)
             else:
@@ -278,6 +395,21 @@ class PadronAFIP():
             self.cat_iva = 5  # CF
         return True if row else False
 
+    @inicializar_y_capturar_excepciones_simple
+    def Indexar(self, filename="padron.txt", indice=None, lote=LOTE_INDICE):
+        "Crea el índice binario de solo lectura (alternativa a Procesar)"
+        indice = indice or self.indice_path
+        if self.indice and self.indice.archivo == indice:
+            self.indice.cerrar()
+            self.indice = None
+        return crear_indice(filename, indice, lote)
+
+    @inicializar_y_capturar_excepciones_simple
+    def AbrirIndice(self, indice=None):
+        "Usar el índice binario en Buscar (CUIT) en lugar de la base sqlite"
+        self.indice = IndicePadron(indice or self.indice_path)
+        return True
+
     @inicializar_y_capturar_excepciones_simple
     def ConsultarDomicilios(self, nro_doc, tipo_doc=80, cat_iva=None):
         "Busca los domicilios, devuelve la cantidad y establece la lista"
@@ -293,7 +425,7 @@ class PadronAFIP():
                 email, imp_ganancias='NI', imp_iva='NI', monotributo='NI',
                 integrante_soc='N', empleador='N'):
         "Agregar o actualizar los datos del cliente"
-        if self.Buscar(nro_doc, tipo_doc):
+        if self._buscar_db(nro_doc, tipo_doc):
             sql = ("UPDATE padron SET denominacion=?, cat_iva=?, email=?, "
                    "imp_ganancias=?, imp_iva=?, monotributo=?, "
                    "integrante_soc=?, empleador=? "
@@ -315,7 +447,7 @@ class PadronAFIP():
             self.cursor.execute("SELECT * FROM domicilio WHERE direccion=? "
                                 "AND tipo_doc=? AND nro_doc=?",
                                 [direccion, tipo_doc, nro_doc])
-            if self.cursor.rowcount < 0:
+            if not self.cursor.fetchone():
                 sql = ("INSERT INTO domicilio (nro_doc, tipo_doc, direccion)"
                        "VALUES (?, ?, ?)")
                 self.cursor.execute(sql, [nro_doc, tipo_doc, direccion])
@@ -395,6 +527,94 @@ class PadronAFIP():
             self.Excepcion = error['mensaje']
         return True
 
+    @inicializar_y_capturar_excepciones_simple
+    def ConsultarLote(self, cuits, hilos=HILOS, campos=None, ttl=None,
+                      crear_cliente=None, consultar=None):
+        """Consultar varios contribuyentes: los vigentes en la base local y el
+           resto a AFIP en paralelo (guardándolos), devuelve la cantidad
+
+           consultar(cliente, nro_doc) devuelve los datos (ver datos_consulta)
+           o None si no existe; por defecto usa la API pública (Consultar)"""
+        if bool(crear_cliente) != bool(consultar):
+            raise ValueError("Indicar crear_cliente y consultar (o ninguno)")
+        ttl = dict(TTL, **(ttl or {}))
+        campos = campos or list(TTL)
+        c = self.db.cursor()
+        for tabla in TABLA_PADRON, TABLA_DOMICILIO, TABLA_CONSULTA:
+            c.execute("CREATE TABLE IF NOT EXISTS " + tabla)
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS padron_pk ON padron (tipo_doc, nro_doc)")
+        c.execute("CREATE INDEX IF NOT EXISTS domicilio_doc ON domicilio (tipo_doc, nro_doc)")
+        ahora = time.time()
+        resultados = {}
+        orden = []
+        pendientes = []
+        for nro_doc in cuits:
+            nro_doc = int(str(nro_doc).replace("-", ""))
+            orden.append(nro_doc)
+            if nro_doc in resultados:
+                continue
+            c.execute("SELECT campo, fecha FROM consulta WHERE tipo_doc=80 AND nro_doc=?",
+                      [nro_doc])
+            fechas = dict([(fila[0], fila[1]) for fila in c.fetchall()])
+            if fechas.get('inexistente', 0) + TTL_INEXISTENTE > ahora:
+                resultados[nro_doc] = {'nro_doc': nro_doc, 'encontrado': False,
+                                       'origen': "cache"}
+            elif all([fechas.get(campo, 0) + ttl[campo] > ahora for campo in campos]):
+                # datos de la base local (no del índice, ver AbrirIndice)
+                self.ConsultarDomicilios(nro_doc)
+                domicilios = self.domicilios
+                self.inicializar()
+                self._asignar(self._buscar_db(nro_doc))
+                self.domicilios = domicilios
+                resultados[nro_doc] = dict(datos_consulta(self), nro_doc=nro_doc,
+                                           origen="cache")
+            else:
+                resultados[nro_doc] = None      # pendiente
+                pendientes.append(nro_doc)
+        self.en_cache = len(resultados) - len(pendientes)
+        self.consultas = len(pendientes)
+        self.inexistentes = self.fallidos = 0
+        if not crear_cliente:
+            crear_cliente, consultar = PadronAFIP, consultar_api
+        # las consultas se hacen en paralelo, la base se actualiza en este hilo
+        # (la conexión sqlite no se comparte entre hilos)
+        for nro_doc, datos, error in consultar_paralelo(pendientes, crear_cliente,
+                                                        consultar, hilos):
+            fecha = time.time()
+            if error:
+                self.fallidos += 1
+                resultados[nro_doc] = {'nro_doc': nro_doc, 'encontrado': None,
+                                       'origen': "afip", 'error': error}
+                continue
+            if datos is None:
+                self.inexistentes += 1
+                c.execute("INSERT OR REPLACE INTO consulta VALUES (80, ?, ?, ?)",
+                          [nro_doc, 'inexistente', fecha])
+                self.db.commit()
+                resultados[nro_doc] = {'nro_doc': nro_doc, 'encontrado': False,
+                                       'origen': "afip"}
+                continue
+            # conservar los datos cargados localmente que AFIP no informa
+            fila = self._buscar_db(nro_doc)
+            if not self.Guardar(80, nro_doc, datos['denominacion'], datos['cat_iva'],
+                                datos['direccion'], fila and fila['email'] or "",
+                                fila and fila['imp_ganancias'] or 'NI', datos['imp_iva'],
+                                datos['monotributo'], datos['integrante_soc'],
+                                datos['empleador']):
+                self.fallidos += 1
+                resultados[nro_doc] = dict(datos, nro_doc=nro_doc, origen="afip",
+                                           error=self.Excepcion)
+                continue
+            c.execute("DELETE FROM consulta WHERE tipo_doc=80 AND nro_doc=? "
+                      "AND campo='inexistente'", [nro_doc])
+            c.executemany("INSERT OR REPLACE INTO consulta VALUES (80, ?, ?, ?)",
+                          [(nro_doc, campo, fecha) for campo in TTL])
+            self.db.commit()
+            resultados[nro_doc] = dict(datos, nro_doc=nro_doc, origen="afip")
+        c.close()
+        self.resultados = [resultados[nro_doc] for nro_doc in orden]
+        return len(self.resultados)
+
     @inicializar_y_capturar_excepciones_simple
     def DescargarConstancia(self, nro_doc, filename="constancia.pdf"):
         "Llama a la API para descargar una constancia de inscripcion (PDF)"
@@ -445,6 +665,341 @@ class PadronAFIP():
             return ret
 
 
+def datos_consulta(padron):
+    "Extraer los datos del contribuyente (de Buscar, Consultar o WS-SR-PADRON)"
+    try:
+        cat_iva = int(padron.cat_iva)
+    except (TypeError, ValueError):
+        cat_iva = None
+    if cat_iva:
+        pass
+    elif padron.imp_iva in ('AC', 'S'):
+        cat_iva = 1  # RI
+    elif padron.imp_iva == 'EX':
+        cat_iva = 4  # EX
+    elif padron.monotributo not in ('', 'N', 'NI'):
+        cat_iva = 6  # MT
+    else:
+        cat_iva = 5  # CF
+    if padron.direccion:
+        direccion = "%s - %s (%s) - %s" % (padron.direccion, padron.localidad,
+                                           padron.cod_postal, padron.provincia)
+    else:
+        # datos de la base local (Buscar / ConsultarDomicilios)
+        direccion = padron.domicilios[-1] if padron.domicilios else ""
+    return {'encontrado': True, 'denominacion': padron.denominacion,
+            'cat_iva': cat_iva, 'imp_iva': padron.imp_iva,
+            'monotributo': padron.monotributo,
+            'actividad_monotributo': padron.actividad_monotributo,
+            'integrante_soc': padron.integrante_soc,
+            'empleador': padron.empleador, 'direccion': direccion}
+
+
+def consultar_api(padron, nro_doc):
+    "Consultar un contribuyente en la API pública (None si no existe)"
+    if not padron.Consultar(nro_doc):
+        raise RuntimeError(padron.Excepcion or "no se pudo consultar %s" % nro_doc)
+    if not padron.cuit:
+        if NO_EXISTE in padron.Excepcion.lower():
+            return None
+        # error temporal (ej. servicio no disponible): no guardarlo como inexistente
+        raise RuntimeError(padron.Excepcion or "no se pudo consultar %s" % nro_doc)
+    return datos_consulta(padron)
+
+
+def consultar_paralelo(nros_doc, crear_cliente, consultar, hilos=HILOS):
+    """Consultar los contribuyentes en paralelo (cada hilo con su propio cliente)
+       y devolver (nro_doc, datos, error) a medida que se completan"""
+    pendientes = queue.Queue()
+    completados = queue.Queue()
+    fin = object()
+
+    def trabajar(cliente):
+        while True:
+            nro_doc = pendientes.get()
+            if nro_doc is fin:
+                break
+            try:
+                completados.put((nro_doc, consultar(cliente, nro_doc), None))
+            except Exception as e:
+                completados.put((nro_doc, None, str(e) or e.__class__.__name__))
+
+    # crear los clientes antes de iniciar los hilos (si falla no queda ninguno en curso)
+    clientes = [crear_cliente() for i in range(min(max(hilos, 1), len(nros_doc)))]
+    for nro_doc in nros_doc:
+        pendientes.put(nro_doc)
+    hilos_ = []
+    for i, cliente in enumerate(clientes):
+        pendientes.put(fin)
+        hilo = threading.Thread(target=trabajar, args=(cliente, ), name="padron-%d" % i)
+        hilo.daemon = True
+        hilo.start()
+        hilos_.append(hilo)
+    try:
+        for i in range(len(nros_doc)):
+            yield completados.get()
+    finally:
+        # si se dejó de consumir, descartar las consultas pendientes
+        while True:
+            try:
+                pendientes.get_nowait()
+            except queue.Empty:
+                break
+        for hilo in hilos_:
+            pendientes.put(fin)
+        for hilo in hilos_:
+            hilo.join()
+
+
+def escribir_resultados(resultados, filename):
+    "Grabar los resultados de ConsultarLote en un archivo CSV"
+    columnas = ["nro_doc", "encontrado", "origen", "denominacion", "cat_iva",
+                "imp_iva", "monotributo", "actividad_monotributo",
+                "empleador", "direccion", "error"]
+    with open(filename, "w", newline="") as f:
+        csv_writer = csv.writer(f, dialect='excel', delimiter=",")
+        csv_writer.writerow(columnas)
+        for dic in resultados:
+            csv_writer.writerow([dic.get(campo, "") for campo in columnas])
+
+
+class IndicePadron():
+    "Consulta del padrón en el índice binario (mmap y búsqueda binaria, sin sqlite)"
+
+    def __init__(self, archivo="padron.idx"):
+        self.archivo = archivo
+        self._f = open(archivo, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, largo, self.cantidad = CABECERA.unpack_from(self._mm, 0)
+        if magico != MAGICO or largo != LARGO_REGISTRO or \
+                len(self._mm) < CABECERA.size + self.cantidad * largo:
+            self.cerrar()
+            raise ValueError("Indice de padron invalido: %s" % archivo)
+
+    def __len__(self):
+        return self.cantidad
+
+    def posicion(self, nro_doc, desde=0):
+        "Devolver la posición del primer registro con CUIT mayor o igual"
+        mm, unpack_from, inicio = self._mm, CLAVE.unpack_from, CABECERA.size
+        hasta = self.cantidad
+        while desde < hasta:
+            medio = (desde + hasta) // 2
+            if unpack_from(mm, inicio + medio * LARGO_REGISTRO)[0] < nro_doc:
+                desde = medio + 1
+            else:
+                hasta = medio
+        return desde
+
+    def registro(self, i, nro_doc):
+        "Devolver los datos del registro i si corresponde al CUIT (o None)"
+        if i >= self.cantidad:
+            return None
+        inicio = CABECERA.size + i * LARGO_REGISTRO
+        if CLAVE.unpack_from(self._mm, inicio)[0] != nro_doc:
+            return None
+        datos = self._mm[inicio + CLAVE.size:inicio + LARGO_REGISTRO].decode("latin1")
+        ret = dict([(k, datos[desde:hasta].strip()) for k, desde, hasta in POSICIONES])
+        ret.update(nro_doc=nro_doc, tipo_doc=80, cat_iva=None, email=None)
+        return ret
+
+    def buscar(self, nro_doc):
+        "Devolver los datos del contribuyente (o None si no figura)"
+        nro_doc = int(nro_doc)
+        return self.registro(self.posicion(nro_doc), nro_doc)
+
+    def buscar_lote(self, nros_doc):
+        "Devolver (nro_doc, datos o None) para cada CUIT, con memoria constante"
+        desde = anterior = 0
+        for nro_doc in nros_doc:
+            nro_doc = int(nro_doc)
+            if nro_doc < anterior:
+                desde = 0       # fuera de orden: buscar en todo el índice
+            # ordenados: continuar la búsqueda desde el CUIT anterior
+            desde = self.posicion(nro_doc, desde)
+            anterior = nro_doc
+            yield nro_doc, self.registro(desde, nro_doc)
+
+    def cerrar(self):
+        self._mm.close()
+        self._f.close()
+
+
+def leer_registros(f, bloque=4096):
+    "Leer los registros de largo fijo del índice (o de una corrida ordenada)"
+    while True:
+        datos = f.read(LARGO_REGISTRO * bloque)
+        if not datos:
+            break
+        for i in range(0, len(datos), LARGO_REGISTRO):
+            yield datos[i:i + LARGO_REGISTRO]
+
+
+def crear_indice(filename="padron.txt", indice="padron.idx", lote=LOTE_INDICE):
+    """Crear el índice binario para IndicePadron a partir del archivo de AFIP,
+       devuelve la cantidad de registros
+
+       Se ordenan corridas de hasta lote registros en memoria y se intercalan
+       (heapq.merge); el índice se reemplaza al final (los lectores abiertos
+       siguen usando el anterior)"""
+    corridas = []
+    try:
+        with open(filename, "rb") as f:
+            while True:
+                registros = []
+                for linea in itertools.islice(f, lote):
+                    linea = linea.strip(b"\x00\r\n")
+                    if not linea[:11].isdigit():
+                        continue
+                    registros.append(CLAVE.pack(int(linea[:11])) +
+                                     linea[11:11 + LARGO_DATOS].ljust(LARGO_DATOS))
+                if not registros:
+                    break
+                registros.sort()
+                corrida = tempfile.TemporaryFile()
+                corrida.write(b"".join(registros))
+                corrida.seek(0)
+                corridas.append(corrida)
+                del registros
+        cantidad = 0
+        with open(indice + ".tmp", "wb") as salida:
+            salida.write(CABECERA.pack(MAGICO, LARGO_REGISTRO, 0))
+            anterior = None
+            for registro in heapq.merge(*[leer_registros(c) for c in corridas]):
+                if registro[:CLAVE.size] == anterior:
+                    continue    # CUIT repetido
+                anterior = registro[:CLAVE.size]
+                salida.write(registro)
+                cantidad += 1
+            salida.seek(0)
+            salida.write(CABECERA.pack(MAGICO, LARGO_REGISTRO, cantidad))
+        os.replace(indice + ".tmp", indice)
+    finally:
+        for corrida in corridas:
+            corrida.close()
+    return cantidad
+
+
+def leer_lotes(filename, lote=LOTE):
+    "Analizar el archivo de AFIP devolviendo listas de registros (por lote)"
+    keys = [k for k, l, t, d in FORMATO]
+    with open(filename, "r") as f:
+        while True:
+            filas = []
+            for l in itertools.islice(f, lote):
+                r = leer(l.strip("\x00"), FORMATO)
+                params = [r[k] for k in keys]
+                params[8] = 80          # agrego tipo_doc = CUIT
+                params[9] = None        # cat_iva no viene de AFIP
+                filas.append(params)
+            if not filas:
+                break
+            yield filas
+
+
+def generar_padron_prueba(filename, cantidad, desordenado=False):
+    "Crear un archivo de padrón sintético (mismo formato que el de AFIP)"
+    import random
+    rnd = random.Random(cantidad)
+    orden = list(range(cantidad))
+    if desordenado:
+        rnd.shuffle(orden)
+    with open(filename, "w") as f:
+        for i in orden:
+            nro_doc = 20000000000 + i * 7
+            f.write("%011d%-30s%-2s%-2s%-2s%1s%1s%-2s\n" % (
+                nro_doc, "CONTRIBUYENTE %d" % i,
+                rnd.choice(("NI", "AC", "EX", "NC")),
+                rnd.choice(("NI", "AC", "EX", "NA", "XN", "AN")),
+                rnd.choice(("NI", "A", "B", "C")),
+                rnd.choice("NS"), rnd.choice("NS"), "%02d" % rnd.randint(0, 99)))
+
+
+def benchmark(cantidad=100000, lote=LOTE):
+    "Medir registros por segundo al procesar un padrón sintético"
+    import tempfile
+    import time
+    tmp = tempfile.mkdtemp()
+    filename = os.path.join(tmp, "padron.txt")
+    generar_padron_prueba(filename, cantidad)
+    padron = PadronAFIP()
+    padron.LanzarExcepciones = True
+    padron.db_path = os.path.join(tmp, "padron.db")
+    t0 = time.time()
+    padron.Procesar(filename, borrar=True, lote=lote)
+    t1 = time.time()
+    padron.db.close()
+    for fn in os.listdir(tmp):
+        os.remove(os.path.join(tmp, fn))
+    os.rmdir(tmp)
+    return {"registros": cantidad, "segundos": t1 - t0,
+            "registros_por_segundo": cantidad / (t1 - t0)}
+
+
+def benchmark_indice(cantidad=100000, consultas=10000, lote=LOTE):
+    "Comparar el índice binario (mmap) contra la base sqlite para las búsquedas"
+    import random
+    tmp = tempfile.mkdtemp()
+    filename = os.path.join(tmp, "padron.txt")
+    generar_padron_prueba(filename, cantidad, desordenado=True)
+    # la mitad de los CUIT consultados no figuran en el padrón
+    rnd = random.Random(consultas)
+    cuits = [20000000000 + rnd.randrange(cantidad * 2) * 7 for i in range(consultas)]
+    padron = PadronAFIP()
+    padron.LanzarExcepciones = True
+    padron.db_path = os.path.join(tmp, "padron.db")
+    padron.indice_path = os.path.join(tmp, "padron.idx")
+    ret = {"registros": cantidad, "consultas": consultas}
+    try:
+        t0 = time.time()
+        padron.Procesar(filename, borrar=True, lote=lote)
+        t1 = time.time()
+        padron.Indexar(filename)
+        t2 = time.time()
+        ret["crear"] = {"sqlite": t1 - t0, "indice": t2 - t1}
+        ret["bytes"] = {"sqlite": os.path.getsize(padron.db_path),
+                        "indice": os.path.getsize(padron.indice_path)}
+        # arranque: abrir la base / índice y buscar el primer CUIT
+        t0 = time.time()
+        db = sqlite3.connect(padron.db_path)
+        db.execute("SELECT * FROM padron WHERE tipo_doc=80 AND nro_doc=?", [cuits[0]]).fetchall()
+        t1 = time.time()
+        indice = IndicePadron(padron.indice_path)
+        indice.buscar(cuits[0])
+        t2 = time.time()
+        db.close()
+        ret["abrir"] = {"sqlite": t1 - t0, "indice": t2 - t1}
+        # búsquedas individuales con Buscar (sqlite y con el índice abierto)
+        pruebas = {}
+        t0 = time.time()
+        encontrados = sum([padron.Buscar(cuit) for cuit in cuits])
+        pruebas["buscar_sqlite"] = time.time() - t0
+        padron.AbrirIndice()
+        t0 = time.time()
+        assert encontrados == sum([padron.Buscar(cuit) for cuit in cuits])
+        pruebas["buscar_indice"] = time.time() - t0
+        padron.indice.cerrar()
+        padron.indice = None
+        # búsquedas directas (sin copiar los atributos) y por lote (ordenados)
+        t0 = time.time()
+        assert encontrados == len([r for r in map(indice.buscar, cuits) if r])
+        pruebas["indice"] = time.time() - t0
+        t0 = time.time()
+        assert encontrados == len([r for c, r in indice.buscar_lote(sorted(cuits)) if r])
+        pruebas["indice_lote"] = time.time() - t0
+        indice.cerrar()
+        ret["encontrados"] = encontrados
+        ret["segundos"] = pruebas
+        ret["consultas_por_segundo"] = dict([(k, consultas / v if v else None)
+                                             for k, v in pruebas.items()])
+    finally:
+        padron.db.close()
+        for fn in os.listdir(tmp):
+            os.remove(os.path.join(tmp, fn))
+        os.rmdir(tmp)
+    return ret
+
+
 # busco el directorio de instalación (global para que no cambie si usan otra dll)
 INSTALL_DIR = PadronAFIP.InstallDir = get_install_dir()
 
@@ -463,7 +1018,26 @@ if __name__ == "__main__":
         if "--descargar" in sys.argv:
             padron.Descargar()
         if "--procesar" in sys.argv:
-            padron.Procesar(borrar='--borrar' in sys.argv)
+            padron.Procesar(borrar='--borrar' in sys.argv,
+                            progreso=lambda i: print("Procesados:", i))
+        if "--actualizar" in sys.argv:
+            padron.Actualizar(progreso=lambda i: print("Procesados:", i))
+            print("Altas:", padron.altas, "Bajas:", padron.bajas,
+                  "Modificaciones:", padron.modificaciones)
+        if "--indexar" in sys.argv:
+            print("Registros:", padron.Indexar())
+        if "--indice" in sys.argv:
+            padron.AbrirIndice()
+        if "--benchmark-indice" in sys.argv:
+            i = sys.argv.index("--benchmark-indice")
+            cantidad = int(sys.argv[i + 1]) if len(sys.argv) > i + 1 and sys.argv[i + 1].isdigit() else 100000
+            print(json.dumps(benchmark_indice(cantidad)))
+            sys.exit(0)
+        if "--benchmark" in sys.argv:
+            i = sys.argv.index("--benchmark")
+            cantidad = int(sys.argv[i + 1]) if len(sys.argv) > i + 1 and sys.argv[i + 1].isdigit() else 100000
+            print(json.dumps(benchmark(cantidad)))
+            sys.exit(0)
         if "--parametros" in sys.argv:
             import codecs
             import locale
@@ -484,7 +1058,19 @@ if __name__ == "__main__":
             print("=== Categorias Autonomos ===")
             print('\n'.join(padron.ObtenerTablaParametros("categoriasAutonomo")))
 
-        if '--csv' in sys.argv:
+        if '--lote' in sys.argv:
+            # consultar todos los CUIT (caché local y API pública en paralelo)
+            hilos = HILOS
+            if '--hilos' in sys.argv:
+                hilos = int(sys.argv[sys.argv.index("--hilos") + 1])
+            with open("entrada.csv") as f:
+                cuits = [fila[0].replace("-", "") for fila in csv.reader(f)
+                         if fila and fila[0].replace("-", "").isdigit()]
+            padron.ConsultarLote(cuits, hilos)
+            escribir_resultados(padron.resultados, "salida.csv")
+            print("En cache:", padron.en_cache, "Consultas:", padron.consultas,
+                  "Inexistentes:", padron.inexistentes, "Fallidos:", padron.fallidos)
+        elif '--csv' in sys.argv:
             csv_reader = csv.reader(open("entrada.csv", "rU"),
                                     dialect='excel', delimiter=",")
             csv_writer = csv.writer(open("salida.csv", "w"),
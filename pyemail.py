@@ -17,10 +17,20 @@ __copyright__ = "Copyright (C) 2011 Mariano Reingart"
 __license__ = "GPL 3.0"
 __version__ = "1.06f"
 
+import base64
+import email.policy
 import os
+import queue
+import re
+import socket
+import socketserver
 import sys
+import threading
+import time
 import traceback
 
+from email.header import Header
+from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
@@ -31,17 +41,454 @@ from configparser import SafeConfigParser
 
 
 DEBUG = False
+HILOS = 2           # generacin de adjuntos (PDF) en paralelo
+CONEXIONES = 2      # conexiones SMTP persistentes del envo masivo
+REINTENTOS = 3      # reintentos ante fallas transitorias (4xx, desconexin)
+COLA_MAX = 50       # mensajes preparados por adelantado para el envo
+BLOQUE = 57 * 1024  # bytes de los adjuntos ledos por vez (lneas base64 completas)
+CRLF = email.policy.compat32.clone(linesep="\r\n")
+
+
+def conectar_smtp(servidor, usuario=None, clave=None, puerto=25, tls=None):
+    "Abrir una conexin SMTP (SSL en el puerto 465, TLS en el 587 o si se indica)"
+    puerto = int(puerto)
+    if puerto != 465:
+        smtp = smtplib.SMTP(servidor, puerto)
+    else:
+        smtp = smtplib.SMTP_SSL(servidor, puerto)
+    if DEBUG:
+        smtp.set_debuglevel(1)
+    smtp.ehlo()
+    if tls or tls is None and puerto == 587:
+        smtp.starttls()
+        smtp.ehlo()
+    if usuario and clave:
+        smtp.login(usuario, clave)
+    return smtp
+
+
+def armar_mensaje(remitente, destinatarios, motivo, texto, html=None, adjuntos=(),
+                  responder_a=None, cc=()):
+    "Generar un correo multiparte (texto y html alternativos, con adjuntos)"
+    msg = MIMEMultipart('related')
+    try:
+        motivo.encode("ascii")
+    except UnicodeError:
+        # codificar acentos y ees (RFC 2047)
+        motivo = Header(motivo, "utf-8")
+    msg['Subject'] = motivo
+    msg['From'] = remitente
+    msg['Reply-to'] = responder_a or remitente
+    msg['To'] = ', '.join(destinatarios)
+    if cc:
+        msg['CC'] = ", ".join(cc)
+    msg.preamble = 'Mensaje de multiples partes.\n'
+    if html:
+        alt = MIMEMultipart('alternative')
+        msg.attach(alt)
+        alt.attach(MIMEText(texto or ""))
+        alt.attach(MIMEText(html, 'html'))
+    else:
+        msg.attach(MIMEText(texto or ""))
+    for archivo in adjuntos:
+        with open(archivo, "rb") as f:
+            part = MIMEApplication(f.read())
+        part.add_header('Content-Disposition', 'attachment',
+                        filename=os.path.basename(archivo))
+        msg.attach(part)
+    return msg
+
+
+def partes_mensaje(remitente, destinatarios, motivo, texto, html=None, adjuntos=(),
+                   responder_a=None, cc=()):
+    "Generar el correo por partes (bytes), leyendo y codificando los adjuntos por bloques"
+    msg = armar_mensaje(remitente, destinatarios, motivo, texto, html, (), responder_a, cc)
+    cuerpo = msg.as_bytes(policy=CRLF)
+    if not adjuntos:
+        yield cuerpo
+        return
+    # agregar los adjuntos antes del delimitador final del mensaje multiparte
+    limite = ("--%s" % msg.get_boundary()).encode("ascii")
+    cierre = cuerpo.rindex(limite + b"--")
+    yield cuerpo[:cierre]
+    for archivo in adjuntos:
+        part = MIMEBase('application', 'octet-stream')
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header('Content-Disposition', 'attachment',
+                        filename=os.path.basename(archivo))
+        yield limite + b"\r\n" + part.as_bytes(policy=CRLF)
+        with open(archivo, "rb") as f:
+            while True:
+                bloque = f.read(BLOQUE)
+                if not bloque:
+                    break
+                codificado = base64.b64encode(bloque)
+                yield b"".join([codificado[i:i + 76] + b"\r\n"
+                                for i in range(0, len(codificado), 76)])
+    yield limite + b"--\r\n"
+
+
+class EnvioInterrumpido(smtplib.SMTPException):
+    "Conexin perdida durante el envo del mensaje (DATA): el servidor lo descarta"
+
+
+class EnvioIncierto(EnvioInterrumpido):
+    "Conexin perdida luego del punto final: el servidor pudo haber aceptado el mensaje"
+
+
+def enviar_partes(smtp, remitente, destinatarios, partes):
+    """Enviar el correo por partes (como sendmail, sin armarlo en memoria)
+
+       Devuelve los destinatarios rechazados (si algunos fueron aceptados);
+       si la conexin se pierde luego de iniciar DATA lanza EnvioInterrumpido
+       (o EnvioIncierto si ya se envi el punto final)"""
+
+    def rechazar(codigo):
+        # ante 421 el servidor cierra la sesin (ver smtplib.sendmail)
+        if codigo == 421:
+            smtp.close()
+        else:
+            smtp.rset()
+
+    smtp.ehlo_or_helo_if_needed()
+    try:
+        # enviar cada parte sin esperar el ACK de la anterior (algoritmo de Nagle)
+        smtp.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (AttributeError, OSError):
+        pass
+    codigo, respuesta = smtp.mail(remitente)
+    if codigo != 250:
+        rechazar(codigo)
+        raise smtplib.SMTPSenderRefused(codigo, respuesta, remitente)
+    rechazados = {}
+    for destinatario in destinatarios:
+        codigo, respuesta = smtp.rcpt(destinatario)
+        if codigo not in (250, 251):
+            rechazados[destinatario] = (codigo, respuesta)
+        if codigo == 421:
+            rechazar(codigo)
+            raise smtplib.SMTPRecipientsRefused(rechazados)
+    if len(rechazados) == len(destinatarios):
+        rechazar(0)
+        raise smtplib.SMTPRecipientsRefused(rechazados)
+    smtp.putcmd("data")
+    codigo, respuesta = smtp.getreply()
+    if codigo != 354:
+        rechazar(codigo)
+        raise smtplib.SMTPDataError(codigo, respuesta)
+    anterior = b""
+    try:
+        for parte in partes:
+            if anterior:
+                smtp.send(anterior)
+            # cada parte comienza al inicio de una lnea: duplicar los puntos iniciales
+            anterior = re.sub(br"(?m)^\.", b"..", parte)
+        if not anterior.endswith(b"\r\n"):
+            anterior += b"\r\n"
+    except (smtplib.SMTPServerDisconnected, OSError) as e:
+        # sin el punto final el servidor descarta el mensaje: se puede reenviar
+        # por otra conexin (la sesin qued dentro de DATA, ver transitorio)
+        smtp.close()
+        raise EnvioInterrumpido("Conexion perdida durante DATA: %s" % e)
+    try:
+        smtp.send(anterior + b".\r\n")
+        codigo, respuesta = smtp.getreply()
+    except (smtplib.SMTPServerDisconnected, OSError) as e:
+        smtp.close()
+        raise EnvioIncierto("Resultado desconocido (conexion perdida luego de enviar "
+                            "el mensaje, verificar antes de reenviar): %s" % e)
+    if codigo != 250:
+        rechazar(codigo)
+        raise smtplib.SMTPDataError(codigo, respuesta)
+    return rechazados
+
+
+def transitorio(error):
+    "Determinar si conviene reintentar el envo (cdigos 4xx, desconexin o red)"
+    if isinstance(error, EnvioIncierto):
+        return False        # el servidor pudo haber recibido el mensaje
+    if isinstance(error, EnvioInterrumpido):
+        return True         # mensaje incompleto (descartado por el servidor)
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all([400 <= codigo < 500 for codigo, msg in error.recipients.values()])
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, (OSError, socket.timeout))
+
+
+class ConexionesSMTP:
+    "Conexiones SMTP persistentes compartidas entre hilos (con reintentos)"
+
+    def __init__(self, servidor, usuario=None, clave=None, puerto=25, tls=None,
+                 cantidad=CONEXIONES, reintentos=REINTENTOS, espera=1.0,
+                 max_mensajes=None):
+        self.parametros = (servidor, usuario, clave, puerto, tls)
+        self.cantidad = cantidad
+        self.max_mensajes = max_mensajes    # reconectar antes del lmite del servidor
+        self.reintentos = reintentos
+        self.espera = espera                # segundos (se duplica en cada reintento)
+        self.libres = queue.LifoQueue()
+        self.disponibles = threading.Semaphore(cantidad)
+        self.conexiones = self.reintentados = 0
+        self._lock = threading.Lock()
+
+    def conectar(self):
+        smtp = conectar_smtp(*self.parametros)
+        with self._lock:
+            self.conexiones += 1
+        return smtp
+
+    def descartar(self, smtp):
+        "Cerrar una conexin con fallas (sin esperar la respuesta del servidor)"
+        try:
+            smtp.close()
+        except Exception:
+            pass
+
+    def enviar(self, remitente, destinatarios, mensaje):
+        """Enviar el mensaje reutilizando una conexin libre
+
+           mensaje puede ser texto, un email.message o una funcin que devuelva
+           las partes a enviar (ver partes_mensaje, se vuelve a llamar al reintentar).
+           No se reintenta si la conexin se perdi luego del punto final
+           (EnvioIncierto) ni ante respuestas 5xx"""
+        if not callable(mensaje):
+            if isinstance(mensaje, str):
+                mensaje = mensaje.encode("utf8")
+            elif not isinstance(mensaje, bytes):
+                mensaje = mensaje.as_bytes(policy=CRLF)
+            datos = re.sub(br"\r\n|\r|\n", b"\r\n", mensaje)
+
+            def mensaje():
+                return [datos]
+        with self.disponibles:
+            try:
+                smtp = self.libres.get_nowait()
+            except queue.Empty:
+                smtp = None
+            try:
+                for intento in range(self.reintentos + 1):
+                    try:
+                        if smtp is None:
+                            smtp = self.conectar()
+                        ret = enviar_partes(smtp, remitente, destinatarios, mensaje())
+                        smtp.enviados = getattr(smtp, "enviados", 0) + 1
+                        return ret
+                    except Exception as e:
+                        if isinstance(e, EnvioInterrumpido):
+                            # conexin cerrada en enviar_partes: no volver a usarla
+                            smtp = None
+                        if not transitorio(e):
+                            raise
+                        # reconectar (ej. lmite de mensajes por sesin o 421)
+                        if smtp is not None:
+                            self.descartar(smtp)
+                            smtp = None
+                        if intento >= self.reintentos:
+                            raise
+                        with self._lock:
+                            self.reintentados += 1
+                        time.sleep(self.espera * 2 ** intento)
+            finally:
+                if smtp is None:
+                    pass
+                elif self.max_mensajes and getattr(smtp, "enviados", 0) >= self.max_mensajes:
+                    self.terminar(smtp)
+                else:
+                    self.libres.put(smtp)
+
+    def terminar(self, smtp):
+        try:
+            smtp.quit()
+        except Exception:
+            self.descartar(smtp)
+
+    def cerrar(self):
+        "Terminar las conexiones abiertas"
+        while True:
+            try:
+                smtp = self.libres.get_nowait()
+            except queue.Empty:
+                break
+            self.terminar(smtp)
+
+
+class Etapa:
+    "Cantidad, errores y tiempos de una etapa del envo masivo"
+
+    def __init__(self):
+        self.cantidad = self.errores = 0
+        self.segundos = 0.0
+        self.inicio = self.fin = None
+        self._lock = threading.Lock()
+
+    def registrar(self, t0, t1, error=False):
+        with self._lock:
+            self.cantidad += 1
+            self.errores += bool(error)
+            self.segundos += t1 - t0
+            self.inicio = min(t0, self.inicio or t0)
+            self.fin = max(t1, self.fin or t1)
+
+    def resumen(self):
+        "Devolver los totales (por_segundo segn la duracin de la etapa)"
+        duracion = (self.fin - self.inicio) if self.cantidad else 0
+        return {'cantidad': self.cantidad, 'errores': self.errores,
+                'segundos': self.segundos, 'duracion': duracion,
+                'por_segundo': self.cantidad / duracion if duracion else 0}
+
+
+class Despacho:
+    """Envo masivo en etapas simultneas: generacin de adjuntos (hilos) y
+       envo por conexiones SMTP persistentes
+
+       generar(item) devuelve el archivo a adjuntar (opcional) y
+       armar(item, archivo) devuelve (remitente, destinatarios, mensaje)"""
+
+    def __init__(self, conexiones, armar, generar=None, hilos=HILOS, cola_max=COLA_MAX):
+        self.conexiones = conexiones
+        self.armar = armar
+        self.generar = generar
+        self.hilos = max(hilos, 1)
+        self.cola_max = cola_max
+        self.etapas = {'generar': Etapa(), 'enviar': Etapa()}
+        self.inicio = self.fin = None
+
+    def procesar(self, items):
+        """Procesar los items, devolviendo (item, archivo, excepcin) al finalizar cada uno
+
+           Si se deja de consumir antes del final (break, close) los hilos se
+           detienen; una excepcin al leer los items se relanza al finalizar"""
+        self.inicio = time.time()
+        fin = object()
+        pendientes = queue.Queue(self.cola_max)
+        preparados = queue.Queue(self.cola_max)
+        resultados = queue.Queue()
+        detener = threading.Event()
+        errores = []
+
+        def poner(cola, valor):
+            # no esperar indefinidamente si se dej de consumir
+            while not detener.is_set():
+                try:
+                    cola.put(valor, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def tomar(cola):
+            while not detener.is_set():
+                try:
+                    return cola.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return fin
+
+        def leer():
+            try:
+                for item in items:
+                    if not poner(pendientes, item):
+                        break
+            except Exception as e:
+                errores.append(e)
+            finally:
+                for i in range(self.hilos):
+                    poner(pendientes, fin)
+
+        def generar():
+            while True:
+                item = tomar(pendientes)
+                if item is fin:
+                    break
+                t0 = time.time()
+                try:
+                    archivo = self.generar(item) if self.generar else None
+                except Exception as e:
+                    self.etapas['generar'].registrar(t0, time.time(), True)
+                    resultados.put((item, None, e))
+                    continue
+                self.etapas['generar'].registrar(t0, time.time())
+                if not poner(preparados, (item, archivo)):
+                    break
+
+        def enviar():
+            while True:
+                preparado = tomar(preparados)
+                if preparado is fin:
+                    break
+                item, archivo = preparado
+                t0 = time.time()
+                error = None
+                try:
+                    self.conexiones.enviar(*self.armar(item, archivo))
+                except Exception as e:
+                    error = e
+                self.etapas['enviar'].registrar(t0, time.time(), error)
+                resultados.put((item, archivo, error))
+
+        def coordinar():
+            # al terminar cada etapa, avisar a la siguiente
+            for hilo in generadores:
+                hilo.join()
+            for i in range(len(envios)):
+                poner(preparados, fin)
+            for hilo in envios:
+                hilo.join()
+            resultados.put(fin)
+
+        generadores = [threading.Thread(target=generar, name="generar-%d" % i)
+                       for i in range(self.hilos)]
+        envios = [threading.Thread(target=enviar, name="enviar-%d" % i)
+                  for i in range(self.conexiones.cantidad)]
+        hilos = [threading.Thread(target=leer), threading.Thread(target=coordinar)]
+        for hilo in generadores + envios + hilos:
+            hilo.daemon = True
+            hilo.start()
+        try:
+            while True:
+                resultado = resultados.get()
+                if resultado is fin:
+                    break
+                yield resultado
+        finally:
+            # detener las etapas (ej. el consumidor dej de iterar) y esperar
+            # los envos en curso (la lectura de items puede estar bloqueada)
+            detener.set()
+            for hilo in generadores + envios + hilos[1:]:
+                hilo.join()
+            self.fin = time.time()
+        if errores:
+            raise errores[0]
+
+    def resumen(self):
+        "Devolver el rendimiento de cada etapa y del total (mensajes por segundo)"
+        duracion = ((self.fin or time.time()) - self.inicio) if self.inicio else 0
+        enviados = self.etapas['enviar'].cantidad - self.etapas['enviar'].errores
+        return {'generar': self.etapas['generar'].resumen(),
+                'enviar': self.etapas['enviar'].resumen(),
+                'enviados': enviados, 'duracion': duracion,
+                'por_segundo': enviados / duracion if duracion else 0,
+                'conexiones': self.conexiones.conexiones,
+                'reintentos': self.conexiones.reintentados}
 
 
 class PyEmail:
     "Interfaz para enviar correos de Factura Electrnica"
     _public_methods_ = ['Conectar', 'Crear', 'Enviar',
                         'AgregarDestinatario', 'Adjuntar',
-                        'AgregarCC', 'AgregarBCC',
+                        'AgregarCC', 'AgregarBCC', 'Salir',
+                        'IniciarLote', 'AgregarMensaje', 'EnviarLote',
+                        'LeerResultado',
                         ]
     _public_attrs_ = [
         'Motivo', 'Remitente', 'Destinatarios', 'ResponderA',
         'MensajeHTML', 'MensajeTexto',
+        'Destinatario', 'Enviado', 'ErrMsg',
         'Version', 'Excepcion', 'Traceback',
     ]
 
@@ -52,16 +499,23 @@ class PyEmail:
         self.Version = __version__
         self.Excepcion = self.Traceback = ""
         self.Motivo = self.Destinatario = self.ResponderA = ""
-        self.MensajeHTML = MensajeTexto = None
+        self.MensajeHTML = self.MensajeTexto = None
         self.adjuntos = []
         self.BCC = []
         self.CC = []
+        self.parametros_smtp = None
+        self.Resumen = {}
+        self.lote = []
+        self.Resultados = []
+        self.Enviado = False
+        self.ErrMsg = ""
 
     def Conectar(self, servidor, usuario=None, clave=None, puerto=25):
         "Iniciar conexin al servidor de correo electronico"
         try:
             # convertir el nro de puerto a entero porque puede ser string:
             puerto = int(puerto)
+            self.parametros_smtp = (servidor, usuario, clave, puerto)
             if puerto != 465:
                 self.smtp = smtplib.SMTP(servidor, puerto)
             else:
@@ -121,19 +575,6 @@ class PyEmail:
             to = ([destinatario] if destinatario
                   else self.Destinatarios)
 
-            msg = MIMEMultipart('related')
-            msg['Subject'] = motivo or self.Motivo
-            msg['From'] = remitente or self.Remitente
-            msg['Reply-to'] = remitente or self.ResponderA
-            msg['To'] = ', '.join(to)
-            if self.CC:
-                msg['CC'] = ", ".join(self.CC)
-                to += self.CC
-            if self.BCC:
-                to += self.BCC
-
-            msg.preamble = 'Mensaje de multiples partes.\n'
-
             if mensaje:
                 text = mensaje
                 html = None
@@ -141,28 +582,32 @@ class PyEmail:
                 text = self.MensajeTexto
                 html = self.MensajeHTML
 
-            if html:
-                alt = MIMEMultipart('alternative')
-                msg.attach(alt)
-                part = MIMEText(text, 'text')
-                alt.attach(part)
-                part = MIMEText(html, 'html')
-                alt.attach(part)
-            else:
-                part = MIMEText(text)
-                msg.attach(part)
-
             if archivo:
                 self.adjuntos.append(archivo)
 
-            for archivo in self.adjuntos:
-                part = MIMEApplication(open(archivo, "rb").read())
-                part.add_header('Content-Disposition', 'attachment',
-                                filename=os.path.basename(archivo))
-                msg.attach(part)
-
-            # print "Enviando email: %s a %s" % (msg['Subject'], msg['To'])
-            self.smtp.sendmail(msg['From'], to, msg.as_string())
+            de = remitente or self.Remitente
+            responder_a = remitente or self.ResponderA
+            motivo = motivo or self.Motivo
+            adjuntos = list(self.adjuntos)
+
+            def partes():
+                # los encabezados solo incluyen los destinatarios visibles
+                return partes_mensaje(de, to, motivo, text, html, adjuntos,
+                                      responder_a, self.CC)
+
+            destinatarios = to + self.CC + self.BCC
+
+            # enviar por partes (los adjuntos no se cargan completos en memoria)
+            try:
+                enviar_partes(self.smtp, de, destinatarios, partes())
+            except (smtplib.SMTPServerDisconnected, EnvioInterrumpido) as e:
+                # sesin cerrada por el servidor (inactividad o lmites) antes
+                # del punto final: reconectar; luego del punto final
+                # enviar_partes lanza EnvioIncierto y no se reenva
+                if isinstance(e, EnvioIncierto) or not self.parametros_smtp:
+                    raise
+                self.smtp = conectar_smtp(*self.parametros_smtp)
+                enviar_partes(self.smtp, de, destinatarios, partes())
 
             return True
         except Exception as e:
@@ -171,6 +616,135 @@ class PyEmail:
             self.Excepcion = traceback.format_exception_only(sys.exc_info()[0], sys.exc_info()[1])[0]
             return False
 
+    def Despachar(self, items, generar=None, hilos=HILOS, conexiones=CONEXIONES):
+        """Enviar un correo por item usando conexiones persistentes (ver Conectar)
+
+           Cada item es un dict con destinatario (o email) y opcionalmente
+           motivo, mensaje y archivo; generar(item) puede crear el adjunto
+           (ej. el PDF de la factura) mientras se envan los anteriores.
+           Devuelve la lista de resultados (enviado, error) de cada item"""
+        if not self.parametros_smtp:
+            raise RuntimeError("Llamar a Conectar!")
+        servidor, usuario, clave, puerto = self.parametros_smtp
+        pool = ConexionesSMTP(servidor, usuario, clave, puerto, cantidad=conexiones)
+
+        def armar(item, archivo):
+            destinatarios = [item.get('destinatario') or item['email']]
+            archivo = archivo or item.get('archivo')
+            mensaje = item.get('mensaje')
+
+            def partes():
+                return partes_mensaje(self.Remitente, destinatarios,
+                                      item.get('motivo') or self.Motivo,
+                                      mensaje or self.MensajeTexto,
+                                      None if mensaje else self.MensajeHTML,
+                                      [archivo] if archivo else [],
+                                      self.ResponderA, self.CC)
+            return self.Remitente, destinatarios + self.CC + self.BCC, partes
+
+        despacho = Despacho(pool, armar, generar, hilos)
+        resultados = []
+        try:
+            for item, archivo, error in despacho.procesar(items):
+                # enviado None: resultado desconocido (no reenviar sin verificar)
+                enviado = None if isinstance(error, EnvioIncierto) else error is None
+                resultados.append(dict(item, archivo=archivo or item.get('archivo'),
+                                       enviado=enviado,
+                                       error=error and str(error) or ""))
+        finally:
+            pool.cerrar()
+        self.Resumen = despacho.resumen()
+        return resultados
+
+    def IniciarLote(self):
+        "Inicializa la lista de mensajes a enviar en una nica sesin SMTP"
+        self.lote = []
+        self.Resultados = []
+        return True
+
+    def AgregarMensaje(self, destinatario, motivo="", mensaje="", archivo=None):
+        "Agrega un mensaje al lote (con los adjuntos, CC y BCC actuales)"
+        adjuntos = list(self.adjuntos) + ([archivo] if archivo else [])
+        self.lote.append({'destinatario': destinatario, 'motivo': motivo or self.Motivo,
+                          'mensaje': mensaje, 'adjuntos': adjuntos,
+                          'cc': list(self.CC), 'bcc': list(self.BCC)})
+        return True
+
+    def EnviarLote(self, max_mensajes=0, reintentos=REINTENTOS):
+        """Enviar los mensajes del lote manteniendo abierta la sesin SMTP
+
+           Reconecta automticamente ante lmites del servidor (421, desconexin)
+           o cada max_mensajes; devuelve la cantidad de mensajes enviados
+           (ver LeerResultado para el resultado de cada uno)"""
+        try:
+            if not self.parametros_smtp:
+                raise RuntimeError("Llamar a Conectar!")
+            servidor, usuario, clave, puerto = self.parametros_smtp
+            pool = ConexionesSMTP(servidor, usuario, clave, puerto, cantidad=1,
+                                  reintentos=int(reintentos),
+                                  max_mensajes=int(max_mensajes or 0) or None)
+            # reutilizar la sesin abierta por Conectar (y conservarla al finalizar)
+            if getattr(self, "smtp", None):
+                pool.libres.put(self.smtp)
+                self.smtp = None
+            self.Resultados = []
+            t0 = time.time()
+            try:
+                for m in self.lote:
+                    if m['mensaje']:
+                        texto, html = m['mensaje'], None
+                    else:
+                        texto, html = self.MensajeTexto, self.MensajeHTML
+
+                    def partes(m=m, texto=texto, html=html):
+                        return partes_mensaje(self.Remitente, [m['destinatario']],
+                                              m['motivo'], texto, html, m['adjuntos'],
+                                              self.ResponderA, m['cc'])
+                    t1 = time.time()
+                    try:
+                        pool.enviar(self.Remitente, [m['destinatario']] + m['cc'] + m['bcc'],
+                                    partes)
+                        error, enviado = "", True
+                    except Exception as e:
+                        error = traceback.format_exception_only(type(e), e)[0].strip()
+                        # None: resultado desconocido (no reenviar sin verificar)
+                        enviado = None if isinstance(e, EnvioIncierto) else False
+                    self.Resultados.append({'destinatario': m['destinatario'],
+                                            'motivo': m['motivo'], 'enviado': enviado,
+                                            'error': error, 'segundos': time.time() - t1})
+            finally:
+                try:
+                    self.smtp = pool.libres.get_nowait()
+                except queue.Empty:
+                    pass
+                pool.cerrar()
+            enviados = len([r for r in self.Resultados if r['enviado']])
+            duracion = time.time() - t0
+            inciertos = len([r for r in self.Resultados if r['enviado'] is None])
+            self.Resumen = {'mensajes': len(self.Resultados), 'enviados': enviados,
+                            'inciertos': inciertos,
+                            'duracion': duracion,
+                            'por_segundo': enviados / duracion if duracion else 0,
+                            'conexiones': pool.conexiones, 'reintentos': pool.reintentados}
+            self.lote = []
+            return enviados
+        except Exception as e:
+            ex = traceback.format_exception(sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2])
+            self.Traceback = ''.join(ex)
+            self.Excepcion = traceback.format_exception_only(sys.exc_info()[0], sys.exc_info()[1])[0]
+            return 0
+
+    def LeerResultado(self, i):
+        "Activa el resultado del mensaje i del lote (Destinatario, Enviado, ErrMsg)"
+        try:
+            resultado = self.Resultados[i]
+        except IndexError:
+            return False
+        self.Destinatario = resultado['destinatario']
+        self.Enviado = resultado['enviado']
+        self.ErrMsg = resultado['error']
+        return True
+
     def Salir(self):
         "Termino la conexin al servidor de correo electronico"
         try:
@@ -183,6 +757,127 @@ class PyEmail:
             return False
 
 
+class ManejadorSumidero(socketserver.StreamRequestHandler):
+    "Sesin SMTP mnima que acepta y descarta los mensajes"
+
+    def responder(self, linea):
+        self.wfile.write(linea + b"\r\n")
+
+    def handle(self):
+        sumidero = self.server
+        if sumidero.demora:
+            # simular el costo de conexin (TLS, autenticacin, relay con lmites)
+            time.sleep(sumidero.demora)
+        with sumidero.lock:
+            sumidero.conexiones += 1
+        self.responder(b"220 sumidero ESMTP")
+        mensajes = 0
+        for linea in self.rfile:
+            comando = linea.strip().upper()
+            if comando.startswith((b"EHLO", b"HELO")):
+                self.responder(b"250 sumidero")
+            elif comando.startswith(b"MAIL") and sumidero.limite and mensajes >= sumidero.limite:
+                self.responder(b"421 demasiados mensajes en la sesion")
+                break
+            elif comando == b"DATA":
+                self.responder(b"354 terminar con .")
+                # leer por bloques hasta la lnea con el punto final
+                anterior = b"\r\n"
+                while True:
+                    datos = self.rfile.read1(65536)
+                    if not datos:
+                        return      # conexin perdida: se descarta el mensaje incompleto
+                    if b"\r\n.\r\n" in anterior[-4:] + datos:
+                        break
+                    anterior = datos
+                mensajes += 1
+                with sumidero.lock:
+                    sumidero.mensajes += 1
+                self.responder(b"250 OK")
+            elif comando == b"QUIT":
+                self.responder(b"221 chau")
+                break
+            else:
+                self.responder(b"250 OK")
+
+
+class SumideroSMTP(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    "Servidor SMTP local para pruebas de rendimiento (no entrega los mensajes)"
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, direccion=("localhost", 0), demora=0.0, limite=0):
+        socketserver.TCPServer.__init__(self, direccion, ManejadorSumidero)
+        self.demora = demora        # segundos hasta el saludo de cada conexin
+        self.limite = limite        # mensajes por sesin (luego responde 421)
+        self.conexiones = self.mensajes = 0
+        self.lock = threading.Lock()
+
+    def iniciar(self):
+        "Atender en segundo plano y devolver el puerto"
+        hilo = threading.Thread(target=self.serve_forever, name="SumideroSMTP")
+        hilo.daemon = True
+        hilo.start()
+        return self.server_address[1]
+
+
+def benchmark(cantidad=200, tamanio=64 * 1024, demora=0.05, limite=100):
+    "Comparar una sesin por correo (mensaje en memoria) contra el envo en lote"
+    import tempfile
+    import tracemalloc
+    sumidero = SumideroSMTP(demora=demora, limite=limite)
+    puerto = sumidero.iniciar()
+    fd, adjunto = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(os.urandom(tamanio))
+    destinatarios = ["cliente%d@example.com" % i for i in range(cantidad)]
+    ret = {"mensajes": cantidad, "adjunto_bytes": tamanio, "demora_conexion": demora,
+           "limite_sesion": limite}
+    try:
+        # como antes: Conectar / Enviar / Salir por cada factura, armando
+        # el mensaje completo en memoria (as_string)
+        tracemalloc.start()
+        conexiones = sumidero.conexiones
+        t0 = time.time()
+        for destinatario in destinatarios:
+            smtp = conectar_smtp("localhost", puerto=puerto)
+            msg = armar_mensaje("facturas@example.com", [destinatario], "Factura",
+                                "Se adjunta la factura", None, [adjunto])
+            smtp.sendmail(msg['From'], [destinatario], msg.as_string())
+            smtp.quit()
+        segundos = time.time() - t0
+        ret["reconectando"] = {"segundos": segundos,
+                               "mensajes_por_segundo": cantidad / segundos,
+                               "conexiones": sumidero.conexiones - conexiones,
+                               "memoria_pico": tracemalloc.get_traced_memory()[1]}
+        tracemalloc.stop()
+        # lote: una sesin persistente, adjuntos por partes
+        tracemalloc.start()
+        conexiones = sumidero.conexiones
+        t0 = time.time()
+        pyemail = PyEmail()
+        pyemail.Conectar("localhost", puerto=puerto)
+        pyemail.Crear("facturas@example.com", "Factura")
+        pyemail.MensajeTexto = "Se adjunta la factura"
+        pyemail.IniciarLote()
+        for destinatario in destinatarios:
+            pyemail.AgregarMensaje(destinatario, archivo=adjunto)
+        enviados = pyemail.EnviarLote(max_mensajes=limite)
+        pyemail.Salir()
+        segundos = time.time() - t0
+        ret["lote"] = {"segundos": segundos, "mensajes_por_segundo": enviados / segundos,
+                       "enviados": enviados, "conexiones": sumidero.conexiones - conexiones,
+                       "memoria_pico": tracemalloc.get_traced_memory()[1]}
+        tracemalloc.stop()
+        ret["aceleracion"] = (ret["lote"]["mensajes_por_segundo"] /
+                              ret["reconectando"]["mensajes_por_segundo"])
+    finally:
+        os.unlink(adjunto)
+        sumidero.shutdown()
+        sumidero.server_close()
+    return ret
+
+
 if __name__ == '__main__':
 
     if "--register" in sys.argv or "--unregister" in sys.argv:
@@ -219,6 +914,11 @@ if __name__ == '__main__':
         # win32com.server.localserver.main()
         # start the server.
         win32com.server.localserver.serve([PyEmail._reg_clsid_])
+    elif "--benchmark" in sys.argv:
+        import json
+        i = sys.argv.index("--benchmark")
+        cantidad = int(sys.argv[i + 1]) if len(sys.argv) > i + 1 and sys.argv[i + 1].isdigit() else 200
+        print(json.dumps(benchmark(cantidad)))
     elif "/prueba" in sys.argv:
         pyemail = PyEmail()
         import getpass
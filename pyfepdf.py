@@ -11,6 +11,7 @@
 # for more details.
 
 import utils
+from comprobante import Factura, CbteAsoc, Tributo, Iva, Item, Permiso
 from fpdf import Template
 from decimal import Decimal
 from io import StringIO
@@ -20,6 +21,7 @@ import sys
 import os
 import decimal
 import datetime
+import time
 "M�dulo para generar PDF de facturas electr�nicas"
 
 __author__ = "Mariano Reingart <reingart@gmail.com>"
@@ -56,6 +58,7 @@ Opciones:
   --pdf: genera la im�gen de factura en PDF
   --dbf: utiliza tablas DBF en lugar del archivo de entrada TXT
   --json: utiliza el formato JSON para el archivo de entrada
+  --benchmark [N]: mide PDFs por segundo generando N facturas de ejemplo
 
 Ver rece.ini para par�metros de configuraci�n "
 """
@@ -178,32 +181,32 @@ class FEPDF:
                      **kwargs
                      ):
         "Creo un objeto factura (internamente)"
-        fact = {'tipo_doc': tipo_doc, 'nro_doc': nro_doc,
-                'tipo_cbte': tipo_cbte, 'punto_vta': punto_vta,
-                'cbte_nro': cbte_nro,
-                'imp_total': imp_total, 'imp_tot_conc': imp_tot_conc,
-                'imp_neto': imp_neto, 'imp_iva': imp_iva,
-                'imp_trib': imp_trib, 'imp_op_ex': imp_op_ex,
-                'fecha_cbte': fecha_cbte,
-                'fecha_venc_pago': fecha_venc_pago,
-                'moneda_id': moneda_id, 'moneda_ctz': moneda_ctz,
-                'concepto': concepto,
-                'nombre_cliente': nombre_cliente,
-                'domicilio_cliente': domicilio_cliente,
-                'pais_dst_cmp': pais_dst_cmp,
-                'obs_comerciales': obs_comerciales,
-                'obs_generales': obs_generales,
-                'id_impositivo': id_impositivo,
-                'forma_pago': forma_pago, 'incoterms': incoterms,
-                'cae': cae, 'fecha_vto': fch_venc_cae,
-                'motivos_obs': motivos_obs,
-                'descuento': descuento,
-                'cbtes_asoc': [],
-                'tributos': [],
-                'ivas': [],
-                'permisos': [],
-                'detalles': [],
-                }
+        fact = Factura(tipo_doc=tipo_doc, nro_doc=nro_doc,
+                       tipo_cbte=tipo_cbte, punto_vta=punto_vta,
+                       cbte_nro=cbte_nro,
+                       imp_total=imp_total, imp_tot_conc=imp_tot_conc,
+                       imp_neto=imp_neto, imp_iva=imp_iva,
+                       imp_trib=imp_trib, imp_op_ex=imp_op_ex,
+                       fecha_cbte=fecha_cbte,
+                       fecha_venc_pago=fecha_venc_pago,
+                       moneda_id=moneda_id, moneda_ctz=moneda_ctz,
+                       concepto=concepto,
+                       nombre_cliente=nombre_cliente,
+                       domicilio_cliente=domicilio_cliente,
+                       pais_dst_cmp=pais_dst_cmp,
+                       obs_comerciales=obs_comerciales,
+                       obs_generales=obs_generales,
+                       id_impositivo=id_impositivo,
+                       forma_pago=forma_pago, incoterms=incoterms,
+                       cae=cae, fecha_vto=fch_venc_cae,
+                       motivos_obs=motivos_obs,
+                       descuento=descuento,
+                       cbtes_asoc=[],
+                       tributos=[],
+                       ivas=[],
+                       permisos=[],
+                       detalles=[],
+                       )
         if fecha_serv_desde:
             fact['fecha_serv_desde'] = fecha_serv_desde
         if fecha_serv_hasta:
@@ -228,53 +231,53 @@ class FEPDF:
         "Agrego un item a una factura (internamente)"
         # ds = unicode(ds, "latin1") # convierto a latin1
         # Nota: no se calcula neto, iva, etc (deben venir calculados!)
-        item = {
-            'u_mtx': u_mtx,
-            'cod_mtx': cod_mtx,
-            'codigo': codigo,
-            'ds': ds,
-            'qty': qty,
-            'umed': umed,
-            'precio': precio,
-            'bonif': bonif,
-            'iva_id': iva_id,
-            'imp_iva': imp_iva,
-            'importe': importe,
-            'despacho': despacho,
-            'dato_a': dato_a,
-            'dato_b': dato_b,
-            'dato_c': dato_c,
-            'dato_d': dato_d,
-            'dato_e': dato_e,
-        }
+        item = Item(
+            u_mtx=u_mtx,
+            cod_mtx=cod_mtx,
+            codigo=codigo,
+            ds=ds,
+            qty=qty,
+            umed=umed,
+            precio=precio,
+            bonif=bonif,
+            iva_id=iva_id,
+            imp_iva=imp_iva,
+            importe=importe,
+            despacho=despacho,
+            dato_a=dato_a,
+            dato_b=dato_b,
+            dato_c=dato_c,
+            dato_d=dato_d,
+            dato_e=dato_e,
+        )
         self.factura['detalles'].append(item)
         return True
 
     def AgregarCmpAsoc(self, tipo=1, pto_vta=0, nro=0, **kwarg):
         "Agrego un comprobante asociado a una factura (interna)"
-        cmp_asoc = {'cbte_tipo': tipo, 'cbte_punto_vta': pto_vta, 'cbte_nro': nro}
+        cmp_asoc = CbteAsoc(cbte_tipo=tipo, cbte_punto_vta=pto_vta, cbte_nro=nro)
         self.factura['cbtes_asoc'].append(cmp_asoc)
         return True
 
     def AgregarTributo(self, tributo_id=0, desc="", base_imp=0.00, alic=0, importe=0.00, **kwarg):
         "Agrego un tributo a una factura (interna)"
-        tributo = {'tributo_id': tributo_id, 'desc': desc, 'base_imp': base_imp,
-                   'alic': alic, 'importe': importe}
+        tributo = Tributo(tributo_id=tributo_id, desc=desc, base_imp=base_imp,
+                          alic=alic, importe=importe)
         self.factura['tributos'].append(tributo)
         return True
 
     def AgregarIva(self, iva_id=0, base_imp=0.0, importe=0.0, **kwarg):
         "Agrego un tributo a una factura (interna)"
-        iva = {'iva_id': iva_id, 'base_imp': base_imp, 'importe': importe}
+        iva = Iva(iva_id=iva_id, base_imp=base_imp, importe=importe)
         self.factura['ivas'].append(iva)
         return True
 
     def AgregarPermiso(self, id_permiso, dst_merc, **kwargs):
         "Agrego un permiso a una factura (interna)"
-        self.factura['permisos'].append({
-            'id_permiso': id_permiso,
-            'dst_merc': dst_merc,
-        })
+        self.factura['permisos'].append(Permiso(
+            id_permiso=id_permiso,
+            dst_merc=dst_merc,
+        ))
         return True
 
     # funciones de formateo de strings:
@@ -361,9 +364,18 @@ class FEPDF:
         if not os.path.exists(archivo):
             archivo = os.path.join(self.InstallDir, "plantillas", os.path.basename(archivo))
 
+        # reutilizo los campos si la planilla ya fue analizada (y no cambio)
+        ruta = os.path.abspath(archivo)
+        mtime = os.path.getmtime(archivo)
+        mtime_ant, campos = _formatos.get(ruta, (None, None))
+        if mtime_ant == mtime:
+            self.elements.extend(campos)
+            return True
+
         if DEBUG:
             print("abriendo archivo ", archivo)
 
+        n = len(self.elements)
         for lno, linea in enumerate(open(archivo.encode('latin1')).readlines()):
             if DEBUG:
                 print("procesando linea ", lno, linea)
@@ -379,6 +391,7 @@ class FEPDF:
                     v = eval(v.strip())
                 args.append(v)
             self.AgregarCampo(*args)
+        _formatos[ruta] = (mtime, self.elements[n:])
         return True
 
     @utils.inicializar_y_capturar_excepciones_simple
@@ -413,7 +426,7 @@ class FEPDF:
         fact = self.factura
         tipo, letra, nro = self.fmt_fact(fact['tipo_cbte'], fact['punto_vta'], fact['cbte_nro'])
 
-        if HOMO:
+        if HOMO and "homo" not in [field['name'] for field in self.elements]:
             self.AgregarCampo("homo", 'T', 100, 250, 0, 0,
                               size=70, rotate=45, foreground=0x808080, priority=-1)
 
@@ -433,7 +446,7 @@ class FEPDF:
         # genero el renderizador con propiedades del PDF
         t = Template(elements=self.elements,
                      format=papel, orientation=orientacion,
-                     title="%s %s %s" % (tipo.encode("latin1", "ignore"), letra, nro),
+                     title="%s %s %s" % (tipo, letra, nro),
                      author="CUIT %s" % self.CUIT,
                      subject="CAE %s" % fact['cae'],
                      keywords="AFIP Factura Electr�nica",
@@ -916,6 +929,44 @@ class FEPDF:
             dest = "F"  # guardar en archivo
         return self.template.render(archivo, dest)
 
+    def GenerarLote(self, facturas, archivo="", num_copias=1, lineas_max=24,
+                    qty_pos='izq', papel="A4", orientacion="portrait"):
+        "Generar varias facturas: un PDF c/u (archivo con %(campo)s) o uno solo"
+        # los datos fijos (AgregarDato previos) se repiten en cada factura
+        datos = list(self.datos)
+        n = len(self.elements)
+        individual = "%(" in archivo
+        ok = True
+        generados = []
+        cant = 0
+        try:
+            for i, factura in enumerate(facturas):
+                cant += 1
+                self.factura = factura
+                self.datos = datos + list(factura.get('datos', []))
+                if individual or not i:
+                    # en un unico PDF, la plantilla (imagenes y fuentes) se
+                    # crea una sola vez y cada factura agrega sus paginas
+                    if not self.CrearPlantilla(papel, orientacion):
+                        return False
+                if not self.ProcesarPlantilla(num_copias, lineas_max, qty_pos):
+                    ok = False
+                if individual:
+                    salida = archivo % factura
+                    self.GenerarPDF(salida)
+                    generados.append(salida)
+                    # descartar campos agregados por errores de esta factura
+                    del self.elements[n:]
+            if not individual and cant:
+                if archivo:
+                    self.GenerarPDF(archivo)
+                    generados.append(archivo)
+                else:
+                    return self.GenerarPDF()
+        finally:
+            self.datos = datos
+        return ok and generados
+
     @utils.inicializar_y_capturar_excepciones_simple
     def MostrarPDF(self, archivo, imprimir=False):
         if sys.platform.startswith(("linux", 'java')):
@@ -926,6 +977,60 @@ class FEPDF:
         return True
 
 
+# planillas CSV ya analizadas: ruta -> (fecha de modificacion, campos)
+_formatos = {}
+
+
+def limpiar_cache_formatos():
+    "Descartar las planillas analizadas (se volveran a leer del disco)"
+    _formatos.clear()
+
+
+def benchmark(cantidad=100, formato="factura.csv", fn=None, directorio=None):
+    "Medir PDFs por segundo: sin cache, con cache (individuales) y en lote"
+    from formatos import formato_txt
+    if not fn:
+        fn = os.path.join(INSTALL_DIR, "datos", "facturas.txt")
+    if not directorio:
+        directorio = tempfile.mkdtemp()
+    muestras = formato_txt.leer(fn)
+
+    def facturas():
+        for i in range(cantidad):
+            factura = dict(muestras[i % len(muestras)])
+            factura['detalles'] = [dict(it) for it in factura['detalles']]
+            factura['fecha_venc_pago'] = factura.get('fecha_venc_pago') or factura['fecha_cbte']
+            factura['id'] = i
+            yield factura
+
+    ret = {"cantidad": cantidad, "formato": formato, "directorio": directorio}
+    # sin cache: analizar la planilla y crear la plantilla por cada factura
+    t0 = time.time()
+    for factura in facturas():
+        limpiar_cache_formatos()
+        fepdf = FEPDF()
+        fepdf.CargarFormato(formato)
+        fepdf.factura = factura
+        fepdf.CrearPlantilla()
+        fepdf.ProcesarPlantilla(num_copias=1)
+        fepdf.GenerarPDF(os.path.join(directorio, "sin_cache_%s.pdf" % factura['id']))
+    t1 = time.time()
+    ret["sin_cache_pdfs_por_segundo"] = cantidad / (t1 - t0)
+    # con cache: un archivo por factura reutilizando la planilla compilada
+    fepdf = FEPDF()
+    fepdf.CargarFormato(formato)
+    fepdf.GenerarLote(facturas(), os.path.join(directorio, "factura_%(id)s.pdf"))
+    t2 = time.time()
+    ret["individual_pdfs_por_segundo"] = cantidad / (t2 - t1)
+    # lote: todas las facturas en un unico PDF
+    fepdf = FEPDF()
+    fepdf.CargarFormato(formato)
+    fepdf.GenerarLote(facturas(), os.path.join(directorio, "lote.pdf"))
+    t3 = time.time()
+    ret["lote_pdfs_por_segundo"] = cantidad / (t3 - t2)
+    return ret
+
+
 # busco el directorio de instalaci�n (global para que no cambie si usan otra dll)
 if not hasattr(sys, "frozen"):
     basepath = __file__
@@ -973,6 +1078,12 @@ if __name__ == '__main__':
             print(LICENCIA)
             sys.exit(0)
 
+        if '--benchmark' in sys.argv:
+            i = sys.argv.index("--benchmark")
+            cantidad = int(sys.argv[i + 1]) if len(sys.argv) > i + 1 and sys.argv[i + 1].isdigit() else 100
+            print(benchmark(cantidad, conf_fact.get("formato", "factura.csv")))
+            sys.exit(0)
+
         if '--formato' in sys.argv:
             if '--dbf' in sys.argv:
                 from .formatos import formato_dbf
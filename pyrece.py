@@ -28,10 +28,7 @@ import traceback
 from configparser import SafeConfigParser
 from . import wsaa, wsfev1, wsfexv1
 from .utils import SimpleXMLElement, SoapClient, SoapFault, date
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
-from smtplib import SMTP
+from .pyemail import ConexionesSMTP, Despacho, partes_mensaje, HILOS, CONEXIONES
 
 #from PyFPDF.ejemplos.form import Form
 from .pyfepdf import FEPDF
@@ -890,19 +887,31 @@ class PyRece(gui.Controller):
         try:
             ok = no = 0
             self.progreso(0)
+            pendientes = []
             for i, item in self.get_selected_items():
-                if not item['cae'] in ("", "NULL"):
-                    archivo = self.generar_factura(item)
-                    if item.get('email'):
-                        self.enviar_mail(item, archivo)
-                        ok += 1
-                    else:
-                        no += 1
-                        self.log("No se envia factura %s por no tener EMAIL" % item['cbt_numero'])
-                else:
+                if item['cae'] in ("", "NULL"):
                     self.log("No se envia factura %s por no tener CAE" % item['cbt_numero'])
                     no += 1
-                self.progreso(i)
+                elif not item.get('email'):
+                    no += 1
+                    self.log("No se envia factura %s por no tener EMAIL" % item['cbt_numero'])
+                else:
+                    pendientes.append(item)
+            # generar los PDF en paralelo mientras se envían los ya generados
+            despacho = Despacho(self.conexiones_smtp(), self.armar_mail, self.generar_factura,
+                                int(conf_mail.get('hilos', HILOS)))
+            for j, (item, archivo, error) in enumerate(despacho.procesar(pendientes)):
+                if error:
+                    no += 1
+                    self.log("No se envia factura %s: %s" % (item['cbt_numero'], error))
+                else:
+                    ok += 1
+                    self.log("Enviado email factura %s a %s" % (item['cbt_numero'], item['email']))
+                self.progreso(no + j)
+            resumen = despacho.resumen()
+            self.log("PDF: %.2f/s, Email: %.2f/s, Total: %.2f/s (%d reintentos)" % (
+                resumen['generar']['por_segundo'], resumen['enviar']['por_segundo'],
+                resumen['por_segundo'], resumen['reintentos']))
             self.progreso(len(self.items))
             gui.alert('Proceso finalizado OK!\n\nEnviados: %d\nNo enviados: %d' % (ok, no), 'Envio de Email')
         except Exception as e:
@@ -957,20 +966,21 @@ class PyRece(gui.Controller):
             d = conf_fact.get('directorio', ".")
             clave_subdir = conf_fact.get('subdirectorio', 'fecha_cbte')
             if clave_subdir:
-                d = os.path.join(d, item[clave_subdir])
+                d = os.path.join(d, fila[clave_subdir])
             if not os.path.isdir(d):
-                os.mkdir(d)
+                # puede ser creado a la vez por otro hilo (ver on_btnEnviar_click)
+                os.makedirs(d, exist_ok=True)
             fs = conf_fact.get('archivo', 'numero').split(",")
-            it = item.copy()
+            it = fila.copy()
             tipo_fact, letra_fact, numero_fact = fact['_fmt_fact']
             it['tipo'] = tipo_fact.replace(" ", "_")
             it['letra'] = letra_fact
             it['numero'] = numero_fact
-            it['mes'] = item['fecha_cbte'][4:6]
-            it['año'] = item['fecha_cbte'][0:4]
+            it['mes'] = fila['fecha_cbte'][4:6]
+            it['año'] = fila['fecha_cbte'][0:4]
             # remover acentos, ñ del nombre de archivo (vía unicode):
             fn = ''.join([str(it.get(ff, ff)) for ff in fs])
-            fn = unicodedata.normalize('NFKD', fn).encode('ASCII', 'ignore')
+            fn = unicodedata.normalize('NFKD', fn).encode('ASCII', 'ignore').decode('ASCII')
             salida = os.path.join(d, "%s.pdf" % fn)
         fepdf.GenerarPDF(archivo=salida)
         if mostrar:
@@ -978,46 +988,32 @@ class PyRece(gui.Controller):
 
         return salida
 
+    def conexiones_smtp(self):
+        "Conexiones SMTP persistentes (reutilizadas entre envíos, con reintentos)"
+        if not self.smtp:
+            self.smtp = ConexionesSMTP(conf_mail['servidor'], conf_mail.get('usuario'),
+                                       conf_mail.get('clave'), conf_mail.get('puerto', 25),
+                                       conf_mail.get('tls', False),
+                                       int(conf_mail.get('conexiones', CONEXIONES)))
+        return self.smtp
+
+    def armar_mail(self, item, archivo):
+        "Devolver el remitente, los destinatarios y el correo (por partes) con la factura"
+        motivo = conf_mail['motivo'].replace("NUMERO", str(item['cbt_numero']))
+        partes = lambda: partes_mensaje(conf_mail['remitente'], [item['email']], motivo,
+                                        conf_mail['cuerpo'], conf_mail.get('html'), [archivo])
+        to = [item['email']]
+        bcc = conf_mail.get('bcc', None)
+        if bcc:
+            to.append(bcc)
+        return conf_mail['remitente'], to, partes
+
     def enviar_mail(self, item, archivo):
-        archivo = self.generar_factura(item)
         if item['email']:
-            msg = MIMEMultipart()
-            msg['Subject'] = conf_mail['motivo'].replace("NUMERO", str(item['cbt_numero']))
-            msg['From'] = conf_mail['remitente']
-            msg['Reply-to'] = msg['From']
-            msg['To'] = item['email']
-            msg.preamble = 'Mensaje de multiples partes.\n'
-            if not 'html' in conf_mail:
-                part = MIMEText(conf_mail['cuerpo'])
-                msg.attach(part)
-            else:
-                alt = MIMEMultipart('alternative')
-                msg.attach(alt)
-                text = MIMEText(conf_mail['cuerpo'])
-                alt.attach(text)
-                # We reference the image in the IMG SRC attribute by the ID we give it below
-                html = MIMEText(conf_mail['html'], 'html')
-                alt.attach(html)
-            part = MIMEApplication(open(archivo, "rb").read())
-            part.add_header('Content-Disposition', 'attachment', filename=os.path.basename(archivo))
-            msg.attach(part)
-
+            remitente, to, partes = self.armar_mail(item, archivo)
             try:
-                self.log("Enviando email: %s a %s" % (msg['Subject'], msg['To']))
-                if not self.smtp:
-                    self.smtp = SMTP(conf_mail['servidor'], conf_mail.get('puerto', 25))
-                    if conf_mail['usuario'] and conf_mail['clave']:
-                        self.smtp.ehlo()
-                        if conf_mail.get('tls', False):
-                            self.log("Iniciando TLS...")
-                            self.smtp.starttls()
-                            self.smtp.ehlo()
-                        self.smtp.login(conf_mail['usuario'], conf_mail['clave'])
-                to = [msg['To']]
-                bcc = conf_mail.get('bcc', None)
-                if bcc:
-                    to.append(bcc)
-                self.smtp.sendmail(msg['From'], to, msg.as_string())
+                self.log("Enviando email: factura %s a %s" % (item['cbt_numero'], item['email']))
+                self.conexiones_smtp().enviar(remitente, to, partes)
             except Exception as e:
                 self.error('Excepción', str(e))
 
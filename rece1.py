@@ -26,6 +26,7 @@ import warnings
 
 # revisar la instalacin de pyafip.ws:
 from . import wsfev1
+from . import lote
 from .utils import SimpleXMLElement, SoapClient, SoapFault, date
 from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, abrir_conf
 
@@ -140,7 +141,7 @@ TIPO_CBTE = {1: "FAC A", 2: "N/D A", 3: "N/C A", 6: "FAC B", 7: "N/D B",
 TIPO_DOC = {80: 'CUIT', 86: 'CUIL', 96: 'DNI', 99: '', 87: "CDI"}
 
 
-def autorizar(ws, entrada, salida, informar_caea=False):
+def autorizar(ws, entrada, salida, informar_caea=False, hilos=1, diario=None, crear_ws=None):
     encabezados = []
     if '/dbf' in sys.argv:
         tributos = []
@@ -187,34 +188,55 @@ def autorizar(ws, entrada, salida, informar_caea=False):
         import json
         encabezados = json.load(entrada)
     else:
-        # la estructura est implcita en el rden de los registros (lneas)
-        for linea in entrada:
-            if str(linea[0]) == '0':
-                encabezado = leer(linea, ENCABEZADO)
-                encabezados.append(encabezado)
-                if DEBUG:
-                    print(len(encabezados), "Leida factura %(cbt_desde)s" % encabezado)
-            elif str(linea[0]) == '1':
-                tributo = leer(linea, TRIBUTO)
-                encabezado.setdefault("tributos", []).append(tributo)
-            elif str(linea[0]) == '2':
-                iva = leer(linea, IVA)
-                encabezado.setdefault("ivas", []).append(iva)
-            elif str(linea[0]) == '3':
-                cbtasoc = leer(linea, CMP_ASOC)
-                encabezado.setdefault("cbtasocs", []).append(cbtasoc)
-            elif str(linea[0]) == '6':
-                opcional = leer(linea, OPCIONAL)
-                encabezado.setdefault("opcionales", []).append(opcional)
-            elif str(linea[0]) == '7':
-                comprador = leer(linea, COMPRADOR)
-                encabezado.setdefault("compradores", []).append(comprador)
-            else:
-                print("Tipo de registro incorrecto:", linea[0])
+        # procesar cada factura apenas se lee (sin cargar todo el archivo)
+        encabezados = leer_facturas(entrada)
 
-    if not encabezados:
+    # en formato texto, grabar cada factura procesada (memoria constante)
+    streaming = '/json' not in sys.argv and '/dbf' not in sys.argv
+    dicts = []
+    if streaming:
+        def grabar(dic):
+            escribir_facturas([dic], salida)
+    else:
+        grabar = dicts.append
+
+    # recorrer los registros para obtener CAE (en paralelo por punto de venta
+    # y tipo de comprobante si se indican hilos, reanudando segn el diario)
+    estadisticas = lote.procesar(
+        ws, encabezados,
+        lambda ws, encabezado: autorizar_factura(ws, encabezado, informar_caea),
+        consultar_factura, grabar, diario, hilos, crear_ws)
+    if not estadisticas.leidos:
         raise RuntimeError("No se pudieron leer los registros de la entrada")
-
+    if dicts:
+        escribir_facturas(dicts, salida)
+    return estadisticas
+
+
+def crear_factura(ws, encabezado):
+    "Cargar la factura (con sus sub-registros) en el webservice"
+    # extraer sub-registros:
+    ivas = encabezado.get('ivas', encabezado.get('iva', []))
+    tributos = encabezado.get('tributos', [])
+    cbtasocs = encabezado.get('cbtasocs', [])
+    opcionales = encabezado.get('opcionales', [])
+    compradores = encabezado.get('compradores', [])
+
+    ws.CrearFactura(**encabezado)
+    for tributo in tributos:
+        ws.AgregarTributo(**tributo)
+    for iva in ivas:
+        ws.AgregarIva(**iva)
+    for cbtasoc in cbtasocs:
+        ws.AgregarCmpAsoc(**cbtasoc)
+    for opcional in opcionales:
+        ws.AgregarOpcional(**opcional)
+    for comprador in compradores:
+        ws.AgregarComprador(**comprador)
+
+
+def autorizar_factura(ws, encabezado, informar_caea=False):
+    "Solicitar el CAE (o informar el CAEA) y devolver el registro a grabar"
     # ajusto datos para pruebas en depuracin (nro de cbte. / fecha)
     if '--testing' in sys.argv and DEBUG:
         encabezado['punto_vta'] = 9998
@@ -223,66 +245,100 @@ def autorizar(ws, entrada, salida, informar_caea=False):
         encabezado['cbt_desde'] = cbte_nro
         encabezado['cbt_hasta'] = cbte_nro
         encabezado['fecha_cbte'] = datetime.datetime.now().strftime("%Y%m%d")
+    if informar_caea:
+        if '/testing' in sys.argv:
+            encabezado['cae'] = '21073372218437'
+        encabezado['caea'] = encabezado['cae']
 
-    # recorrer los registros para obtener CAE (dicts tendr los procesados)
-    dicts = []
-    for encabezado in encabezados:
-        if informar_caea:
-            if '/testing' in sys.argv:
-                encabezado['cae'] = '21073372218437'
-            encabezado['caea'] = encabezado['cae']
-        # extraer sub-registros:
-        ivas = encabezado.get('ivas', encabezado.get('iva', []))
-        tributos = encabezado.get('tributos', [])
-        cbtasocs = encabezado.get('cbtasocs', [])
-        opcionales = encabezado.get('opcionales', [])
-        compradores = encabezado.get('compradores', [])
-
-        ws.CrearFactura(**encabezado)
-        for tributo in tributos:
-            ws.AgregarTributo(**tributo)
-        for iva in ivas:
-            ws.AgregarIva(**iva)
-        for cbtasoc in cbtasocs:
-            ws.AgregarCmpAsoc(**cbtasoc)
-        for opcional in opcionales:
-            ws.AgregarOpcional(**opcional)
-        for comprador in compradores:
-            ws.AgregarComprador(**comprador)
+    crear_factura(ws, encabezado)
 
-        if DEBUG:
-            print('\n'.join(["%s='%s'" % (k, str(v)) for k, v in list(ws.factura.items())]))
-        if not DEBUG or input("Facturar (S/n)?") == "S":
-            if not informar_caea:
-                cae = ws.CAESolicitar()
-                dic = ws.factura
-            else:
-                cae = ws.CAEARegInformativo()
-                dic = ws.factura
-            print("Procesando %s %04d %08d %08d %s %s $ %0.2f IVA: $ %0.2f" % (
-                TIPO_CBTE.get(dic['tipo_cbte'], dic['tipo_cbte']),
-                dic['punto_vta'], dic['cbt_desde'], dic['cbt_hasta'],
-                TIPO_DOC.get(dic['tipo_doc'], dic['tipo_doc']), dic['nro_doc'],
-                float(dic['imp_total']),
-                float(dic['imp_iva'] if dic['imp_iva'] is not None else 'NaN')))
-            dic.update(encabezado)         # preservar la estructura leida
-            dic.update({
-                'cae': cae and str(cae) or '',
-                'fch_venc_cae': ws.Vencimiento and str(ws.Vencimiento) or '',
-                'resultado': ws.Resultado,
-                'motivos_obs': ws.Obs,
-                'err_code': str(ws.ErrCode),
-                'err_msg': ws.ErrMsg,
-                'cbt_desde': ws.CbtDesde,
-                'cbt_hasta': ws.CbtHasta,
-                'fecha_cbte': ws.FechaCbte,
-                'reproceso': ws.Reproceso,
-                'emision_tipo': ws.EmisionTipo,
-            })
-            dicts.append(dic)
-            print("NRO:", dic['cbt_desde'], "Resultado:", dic['resultado'], "%s:" % ws.EmisionTipo, dic['cae'], "Obs:", dic['motivos_obs'].encode("ascii", "ignore"), "Err:", dic['err_msg'].encode("ascii", "ignore"), "Reproceso:", dic['reproceso'])
-    if dicts:
-        escribir_facturas(dicts, salida)
+    if DEBUG:
+        print('\n'.join(["%s='%s'" % (k, str(v)) for k, v in list(ws.factura.items())]))
+    if DEBUG and input("Facturar (S/n)?") != "S":
+        return None
+    if not informar_caea:
+        cae = ws.CAESolicitar()
+        dic = ws.factura
+    else:
+        cae = ws.CAEARegInformativo()
+        dic = ws.factura
+    print("Procesando %s %04d %08d %08d %s %s $ %0.2f IVA: $ %0.2f" % (
+        TIPO_CBTE.get(dic['tipo_cbte'], dic['tipo_cbte']),
+        dic['punto_vta'], dic['cbt_desde'], dic['cbt_hasta'],
+        TIPO_DOC.get(dic['tipo_doc'], dic['tipo_doc']), dic['nro_doc'],
+        float(dic['imp_total']),
+        float(dic['imp_iva'] if dic['imp_iva'] is not None else 'NaN')))
+    dic.update(encabezado)         # preservar la estructura leida
+    actualizar_factura(ws, dic, cae)
+    print("NRO:", dic['cbt_desde'], "Resultado:", dic['resultado'], "%s:" % ws.EmisionTipo, dic['cae'], "Obs:", dic['motivos_obs'].encode("ascii", "ignore"), "Err:", dic['err_msg'].encode("ascii", "ignore"), "Reproceso:", dic['reproceso'])
+    return dic
+
+
+def actualizar_factura(ws, dic, cae):
+    "Completar el registro con la respuesta del webservice"
+    dic.update({
+        'cae': cae and str(cae) or '',
+        'fch_venc_cae': ws.Vencimiento and str(ws.Vencimiento) or '',
+        'resultado': ws.Resultado,
+        'motivos_obs': ws.Obs,
+        'err_code': str(ws.ErrCode),
+        'err_msg': ws.ErrMsg,
+        'cbt_desde': ws.CbtDesde,
+        'cbt_hasta': ws.CbtHasta,
+        'fecha_cbte': ws.FechaCbte,
+        'reproceso': ws.Reproceso,
+        'emision_tipo': ws.EmisionTipo,
+    })
+
+
+def consultar_factura(ws, encabezado):
+    "Verificar si el comprobante ya fue autorizado (reanudacin del lote)"
+    crear_factura(ws, encabezado)
+    # CompConsultar compara los datos registrados en AFIP con los enviados
+    cae = ws.CompConsultar(encabezado['tipo_cbte'], encabezado['punto_vta'],
+                           encabezado['cbt_desde'], reproceso=True)
+    if not cae:
+        return None
+    dic = ws.factura
+    dic.update(encabezado)
+    actualizar_factura(ws, dic, cae)
+    dic['resultado'] = 'A'
+    print("NRO:", dic['cbt_desde'], "autorizado previamente %s:" % ws.EmisionTipo, dic['cae'])
+    return dic
+
+
+def leer_facturas(entrada):
+    "Devolver cada factura del archivo de texto a medida que se completa"
+    # la estructura est implcita en el rden de los registros (lneas)
+    encabezado = None
+    cant = 0
+    for linea in entrada:
+        if str(linea[0]) == '0':
+            if encabezado is not None:
+                yield encabezado
+            encabezado = leer(linea, ENCABEZADO)
+            cant += 1
+            if DEBUG:
+                print(cant, "Leida factura %(cbt_desde)s" % encabezado)
+        elif str(linea[0]) == '1':
+            tributo = leer(linea, TRIBUTO)
+            encabezado.setdefault("tributos", []).append(tributo)
+        elif str(linea[0]) == '2':
+            iva = leer(linea, IVA)
+            encabezado.setdefault("ivas", []).append(iva)
+        elif str(linea[0]) == '3':
+            cbtasoc = leer(linea, CMP_ASOC)
+            encabezado.setdefault("cbtasocs", []).append(cbtasoc)
+        elif str(linea[0]) == '6':
+            opcional = leer(linea, OPCIONAL)
+            encabezado.setdefault("opcionales", []).append(opcional)
+        elif str(linea[0]) == '7':
+            comprador = leer(linea, COMPRADOR)
+            encabezado.setdefault("compradores", []).append(comprador)
+        else:
+            print("Tipo de registro incorrecto:", linea[0])
+    if encabezado is not None:
+        yield encabezado
 
 
 def escribir_facturas(encabezados, archivo, agrega=False):
@@ -359,6 +415,8 @@ if __name__ == "__main__":
         print(" /get: recupera datos de un comprobante autorizado previamente (verificacin)")
         print(" /xml: almacena los requerimientos y respuestas XML (depuracin)")
         print(" /dbf: lee y almacena la informacin en tablas DBF")
+        print(" /hilos N: autoriza en paralelo (por punto de venta y tipo de cbte.)")
+        print(" /diario ARCHIVO: registra el avance para reanudar el lote si se interrumpe")
         print()
         print("Ver rece.ini para parmetros de configuracin (URL, certificados, etc.)")
         sys.exit(0)
@@ -474,13 +532,16 @@ if __name__ == "__main__":
                         print(" * Campo: %s" % (campo,))
             sys.exit(0)
 
-        # obteniendo el TA
-        from .wsaa import WSAA
-        wsaa = WSAA()
-        ta = wsaa.Autenticar("wsfe", cert, privatekey, wsaa_url, proxy=proxy_dict, cacert=CACERT, wrapper=WRAPPER)
-        if not ta:
-            sys.exit("Imposible autenticar con WSAA: %s" % wsaa.Excepcion)
-        ws.SetTicketAcceso(ta)
+        # obteniendo el TA (del servicio local de TA si est configurado)
+        if config.has_option('WSAA', 'BROKER'):
+            ws.SetTicketAcceso(config.get('WSAA', 'BROKER'), "wsfe", cuit)
+        else:
+            from .wsaa import WSAA
+            wsaa = WSAA()
+            ta = wsaa.Autenticar("wsfe", cert, privatekey, wsaa_url, proxy=proxy_dict, cacert=CACERT, wrapper=WRAPPER)
+            if not ta:
+                sys.exit("Imposible autenticar con WSAA: %s" % wsaa.Excepcion)
+            ws.SetTicketAcceso(ta)
 
         if '/prueba' in sys.argv:
             # generar el archivo de prueba para la prxima factura
@@ -736,6 +797,26 @@ if __name__ == "__main__":
             sys.exit(0)
 
         ws.LanzarExcepciones = False
+        hilos = 1
+        if '/hilos' in sys.argv and not DEBUG:
+            hilos = int(sys.argv[sys.argv.index("/hilos") + 1])
+        elif config.has_option('WSFEv1', 'HILOS') and not DEBUG:
+            hilos = int(config.get('WSFEv1', 'HILOS'))
+
+        def crear_ws():
+            # una instancia por hilo (reutiliza el WSDL y el ticket de acceso)
+            nuevo = wsfev1.WSFEv1()
+            nuevo.LanzarExcepciones = False
+            nuevo.Conectar("", wsfev1_url, proxy=proxy_dict, cacert=CACERT, wrapper=WRAPPER, timeout=TIMEOUT)
+            nuevo.Cuit, nuevo.Token, nuevo.Sign = ws.Cuit, ws.Token, ws.Sign
+            nuevo.Reprocesar = ws.Reprocesar
+            return nuevo
+
+        diario = None
+        if '/diario' in sys.argv:
+            diario = lote.Diario(sys.argv[sys.argv.index("/diario") + 1])
+        elif config.has_option('WSFEv1', 'DIARIO'):
+            diario = lote.Diario(config.get('WSFEv1', 'DIARIO'))
         f_entrada = f_salida = None
         try:
             f_entrada = open(entrada, "r")
@@ -743,7 +824,9 @@ if __name__ == "__main__":
             try:
                 if DEBUG:
                     print("Autorizando usando entrada:", entrada)
-                autorizar(ws, f_entrada, f_salida, '/informarcaea' in sys.argv)
+                estadisticas = autorizar(ws, f_entrada, f_salida, '/informarcaea' in sys.argv,
+                                         hilos, diario, crear_ws)
+                print(estadisticas)
             except SoapFault:
                 XML = True
                 raise
@@ -752,6 +835,8 @@ if __name__ == "__main__":
                 f_entrada.close()
             if f_salida is not None:
                 f_salida.close()
+            if diario is not None:
+                diario.cerrar()
             if XML:
                 depurar_xml(ws.client, RUTA_XML)
         sys.exit(0)
@@ -28,6 +28,7 @@ import traceback
 from . import wsct
 from .utils import SimpleXMLElement, SoapClient, SoapFault, date
 from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, abrir_conf
+from .comprobante import serializar
 
 
 HOMO = wsct.HOMO
@@ -243,7 +244,7 @@ def escribir_factura(dic, archivo, agrega=False):
                     ]
         guardar_dbf(formatos, agrega, conf_dbf)
     elif '/json' in sys.argv:
-        json.dump(dic, archivo, sort_keys=True, indent=4)
+        json.dump(dic, archivo, sort_keys=True, indent=4, default=serializar)
     else:
         dic['tipo_reg'] = TIPOS_REG[0]
         archivo.write(escribir(dic, ENCABEZADO, contraer_fechas=True))
@@ -0,0 +1,507 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Servidor local que simula WSAA, WSFEv1, WSMTXCA y WSLPG (pruebas de carga)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2010-2019 Mariano Reingart"
+__license__ = "GPL 3.0"
+__version__ = "1.00a"
+
+# Responde las operaciones principales llevando la numeración por CUIT, tipo
+# y punto de venta (como AFIP), o reproduce respuestas grabadas: si existe
+# RESPUESTAS/<operacion>.xml se devuelve tal cual. Permite agregar demora y
+# simular rechazos por numeración (10016 / 102), timeouts, errores HTTP 5xx y
+# respuestas perdidas (la solicitud se procesa pero el cliente no recibe nada).
+# Uso: simulador.py [--direccion http://localhost:9051] [--latencia 0.05]
+#      [--variacion 0.02] [--rechazos 0.01] [--timeouts 0.001]
+#      [--perdidas 0.001] [--errores-http 0.001] [--respuestas directorio]
+#      [--semilla N]
+
+import collections
+import datetime
+import hashlib
+import http.server
+import itertools
+import json
+import os
+import random
+import re
+import socketserver
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+from xml.sax.saxutils import escape
+
+
+DEBUG = False
+DIRECCION = "http://localhost:9051"
+DEMORA_TIMEOUT = 60     # segundos sin responder al simular un timeout
+
+# ruta del servicio (como en los WSDL de homologación): servicio
+RUTAS = {
+    '/ws/services/LoginCms': 'wsaa',
+    '/wsfev1/service.asmx': 'wsfev1',
+    '/wsmtxca/services/MTXCAService': 'wsmtxca',
+    '/wslpg/LpgService': 'wslpg',
+}
+
+NAMESPACES = {
+    'wsaa': "http://wsaa.view.sua.dvadac.desein.afip.gov",
+    'wsfev1': "http://ar.gov.afip.dif.FEV1/",
+    'wsmtxca': "http://impl.service.wsmtxca.afip.gov.ar/service/",
+    'wslpg': "http://serviciosjava.afip.gob.ar/wslpg/",
+}
+
+# WSDL de homologación de cada servicio: si fue incluido en la cache de la
+# instalación (archivo md5 de la URL, como lo graba pysimplesoap) se sirve
+# por defecto, sin necesidad de acceder a los servidores de AFIP
+WSDLS = {
+    'wsaa': "https://wsaahomo.afip.gov.ar/ws/services/LoginCms?wsdl",
+    'wsfev1': "https://wswhomo.afip.gov.ar/wsfev1/service.asmx?WSDL",
+    'wsmtxca': "https://fwshomo.afip.gov.ar/wsmtxca/services/MTXCAService?wsdl",
+    'wslpg': "https://fwshomo.afip.gov.ar/wslpg/LpgService?wsdl",
+}
+
+# sufijo de los elementos de respuesta (document/literal, según el WSDL)
+SUFIJOS = {'wsaa': "Response", 'wsfev1': "Response", 'wsmtxca': "Response",
+           'wslpg': "Resp"}
+
+SOBRE = ('<?xml version="1.0" encoding="utf-8"?>'
+         '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+         '<soap:Body>%s</soap:Body></soap:Envelope>')
+
+FALLA = ('<soap:Fault><faultcode>soap:Server</faultcode>'
+         '<faultstring>%s</faultstring></soap:Fault>')
+
+
+def wsdls_incluidos(directorio=None):
+    "Devolver los archivos WSDL disponibles en la cache de la instalación"
+    if not directorio:
+        directorio = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+    wsdls = {}
+    for servicio, url in WSDLS.items():
+        archivo = os.path.join(directorio, "%s.xml" % hashlib.md5(url.encode("utf8")).hexdigest())
+        if os.path.exists(archivo):
+            wsdls[servicio] = archivo
+    return wsdls
+
+
+def nombre_local(elemento):
+    return elemento.tag.rpartition("}")[2]
+
+
+def buscar(elemento, nombre):
+    "Devolver el primer sub-elemento con el nombre local indicado (o None)"
+    for hijo in elemento.iter():
+        if nombre_local(hijo) == nombre:
+            return hijo
+
+
+def texto(elemento, nombre, defecto=None):
+    "Devolver el texto del primer sub-elemento con el nombre indicado"
+    hijo = buscar(elemento, nombre)
+    return hijo.text if hijo is not None and hijo.text is not None else defecto
+
+
+def armar(etiqueta, campos):
+    "Armar los elementos XML simples (los valores None se omiten)"
+    return "".join(["<%s>%s</%s>" % (k, escape(str(v)), k)
+                    for k, v in campos if v is not None]) if etiqueta is None else \
+        "<%s>%s</%s>" % (etiqueta, armar(None, campos), etiqueta)
+
+
+class SimuladorAFIP:
+    "Simulador de los webservices (estado en memoria, compartido por los hilos)"
+
+    def __init__(self, latencia=0.0, variacion=0.0, rechazos=0.0, timeouts=0.0,
+                 errores_http=0.0, respuestas=None, wsdls=None, semilla=None,
+                 demora_timeout=DEMORA_TIMEOUT, perdidas=0.0):
+        self.latencia = latencia            # demora fija (segundos)
+        self.variacion = variacion          # demora adicional aleatoria (0 a N seg.)
+        self.rechazos = rechazos            # probabilidad de rechazo por numeración
+        self.timeouts = timeouts            # probabilidad de no responder
+        self.perdidas = perdidas            # probabilidad de procesar sin responder
+        self.errores_http = errores_http    # probabilidad de error HTTP 5xx
+        self.demora_timeout = demora_timeout
+        self.respuestas = respuestas        # directorio con respuestas grabadas
+        # servicio: archivo WSDL (GET ?wsdl), por defecto los incluidos
+        self.wsdls = wsdls_incluidos()
+        self.wsdls.update([(k, v) for k, v in (wsdls or {}).items() if v])
+        self.random = random.Random(semilla)
+        self.servidor = self.url = None
+        self.estadisticas = collections.Counter()
+        self.ultimos = {}                   # (servicio, cuit, tipo, pto_vta): número
+        self.comprobantes = {}              # (servicio, cuit, tipo, pto_vta, nro): datos
+        self.cae = itertools.count(70000000000001)
+        self.programadas = {}               # operación: fallas a simular (pruebas)
+        self._lock = threading.Lock()
+        self._grabadas = {}
+
+    def Iniciar(self, direccion=DIRECCION):
+        "Atender las solicitudes en segundo plano (puerto 0: elegir uno libre)"
+        url = urlparse(direccion)
+        servidor = ServidorSimulador((url.hostname or "localhost", url.port or 0),
+                                     ManejadorSimulador)
+        servidor.simulador = self
+        self.servidor = servidor
+        self.url = "http://%s:%s" % (url.hostname or "localhost", servidor.server_address[1])
+        hilo = threading.Thread(target=servidor.serve_forever, name="SimuladorAFIP")
+        hilo.daemon = True
+        hilo.start()
+        return self.url
+
+    def Detener(self):
+        if self.servidor:
+            self.servidor.shutdown()
+            self.servidor.server_close()
+            self.servidor = None
+
+    def Estado(self):
+        "Devolver las cantidades de solicitudes atendidas y errores simulados"
+        with self._lock:
+            return dict(self.estadisticas)
+
+    def Reiniciar(self):
+        "Descartar la numeración y los comprobantes registrados"
+        with self._lock:
+            self.ultimos.clear()
+            self.comprobantes.clear()
+            self.estadisticas.clear()
+
+    def Demorar(self):
+        if self.latencia or self.variacion:
+            time.sleep(self.latencia + self.random.uniform(0, self.variacion))
+
+    def Programar(self, operacion, *fallas):
+        "Simular las fallas indicadas en las próximas solicitudes de la operación"
+        with self._lock:
+            self.programadas.setdefault(operacion, collections.deque()).extend(fallas)
+
+    def Falla(self, xml=b""):
+        "Sortear la falla a simular: 'timeout', 'perdida', 'http', 'error:código' o None"
+        with self._lock:
+            for operacion, fallas in self.programadas.items():
+                if fallas and re.search(rb"<(\w+:)?%s[\s>]" % operacion.encode("ascii"), xml):
+                    return fallas.popleft()
+            sorteo = self.random.random()
+        if sorteo < self.timeouts:
+            return "timeout"
+        sorteo -= self.timeouts
+        if sorteo < self.perdidas:
+            return "perdida"
+        if sorteo < self.perdidas + self.errores_http:
+            return "http"
+        return None
+
+    def Rechazar(self):
+        with self._lock:
+            return self.random.random() < self.rechazos
+
+    def Responder(self, servicio, xml, error=None):
+        "Procesar la solicitud SOAP y devolver el estado HTTP y el XML de respuesta"
+        try:
+            solicitud = ET.fromstring(xml)
+            body = buscar(solicitud, "Body")
+            operacion = nombre_local(body[0])
+            # los elementos de WSMTXCA y WSLPG terminan en Request / Req
+            operacion = re.sub("(Request|Req)$", "", operacion)
+        except Exception as e:
+            return 500, SOBRE % (FALLA % escape("Solicitud invalida: %s" % e))
+        with self._lock:
+            self.estadisticas[operacion] += 1
+        grabada = self.Grabada(operacion)
+        if grabada is not None:
+            return 200, grabada
+        metodo = getattr(self, "%s_%s" % (servicio, operacion), None)
+        if metodo is None:
+            return 500, SOBRE % (FALLA % escape("Operacion no simulada: %s" % operacion))
+        if error:
+            # rechazo de la solicitud completa (ej. 600 token vencido, 501 error interno)
+            respuesta = "<%sResult><Errors>%s</Errors></%sResult>" % (
+                operacion, armar("Err", [('Code', error), ('Msg', "Error simulado")]), operacion)
+        else:
+            respuesta = metodo(body[0])
+        elemento = operacion + SUFIJOS[servicio]
+        return 200, SOBRE % ('<%s xmlns="%s">%s</%s>' % (
+            elemento, NAMESPACES[servicio], respuesta, elemento))
+
+    def Grabada(self, operacion):
+        "Devolver la respuesta grabada para la operación (si existe el archivo)"
+        if not self.respuestas:
+            return None
+        if operacion not in self._grabadas:
+            archivo = os.path.join(self.respuestas, "%s.xml" % operacion)
+            contenido = None
+            if os.path.exists(archivo):
+                with open(archivo, "rb") as f:
+                    contenido = f.read()
+            self._grabadas[operacion] = contenido
+        return self._grabadas[operacion]
+
+    def Numerar(self, servicio, cuit, tipo, pto_vta, nro, datos):
+        "Registrar el comprobante si es el próximo a autorizar (devuelve el CAE)"
+        clave = (servicio, cuit, tipo, pto_vta)
+        with self._lock:
+            if nro != self.ultimos.get(clave, 0) + 1:
+                return None
+            self.ultimos[clave] = nro
+            datos['cae'] = str(next(self.cae))
+            self.comprobantes[clave + (nro, )] = datos
+            return datos['cae']
+
+    def Ultimo(self, servicio, cuit, tipo, pto_vta):
+        with self._lock:
+            return self.ultimos.get((servicio, cuit, tipo, pto_vta), 0)
+
+    def Consultar(self, servicio, cuit, tipo, pto_vta, nro):
+        with self._lock:
+            return self.comprobantes.get((servicio, cuit, tipo, pto_vta, nro))
+
+    @staticmethod
+    def Vencimiento(fecha, formato="%Y%m%d"):
+        fecha = datetime.datetime.strptime(fecha, formato) if fecha else datetime.datetime.now()
+        return (fecha + datetime.timedelta(days=10)).strftime(formato)
+
+    # WSAA
+
+    def wsaa_loginCms(self, solicitud):
+        ahora = datetime.datetime.now()
+        ta = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+              '<loginTicketResponse version="1.0"><header>'
+              '<source>CN=wsaahomo, O=AFIP, C=AR, SERIALNUMBER=CUIT 33693450239</source>'
+              '<destination>SERIALNUMBER=CUIT 20267565393</destination>'
+              '<uniqueId>%d</uniqueId><generationTime>%s</generationTime>'
+              '<expirationTime>%s</expirationTime></header><credentials>'
+              '<token>%s</token><sign>%s</sign></credentials></loginTicketResponse>') % (
+            int(time.time()), ahora.strftime("%Y-%m-%dT%H:%M:%S.000-03:00"),
+            (ahora + datetime.timedelta(hours=12)).strftime("%Y-%m-%dT%H:%M:%S.000-03:00"),
+            "T%032x" % self.random.getrandbits(128), "S%032x" % self.random.getrandbits(128))
+        return "<loginCmsReturn>%s</loginCmsReturn>" % escape(ta)
+
+    # WSFEv1
+
+    def wsfev1_FEDummy(self, solicitud):
+        return armar("FEDummyResult", [('AppServer', "OK"), ('DbServer', "OK"),
+                                       ('AuthServer', "OK")])
+
+    def wsfev1_FECompTotXRequest(self, solicitud):
+        return armar("FECompTotXRequestResult", [('RegXReq', 250)])
+
+    def wsfev1_FECompUltimoAutorizado(self, solicitud):
+        cuit, tipo, pto_vta = (texto(solicitud, "Cuit"), int(texto(solicitud, "CbteTipo")),
+                               int(texto(solicitud, "PtoVta")))
+        return armar("FECompUltimoAutorizadoResult", [
+            ('PtoVta', pto_vta), ('CbteTipo', tipo),
+            ('CbteNro', self.Ultimo('wsfev1', cuit, tipo, pto_vta))])
+
+    def wsfev1_FECAESolicitar(self, solicitud):
+        cuit = texto(solicitud, "Cuit")
+        tipo, pto_vta = int(texto(solicitud, "CbteTipo")), int(texto(solicitud, "PtoVta"))
+        detalles = []
+        resultados = set()
+        for det in solicitud.iter():
+            if nombre_local(det) != "FECAEDetRequest":
+                continue
+            nro, fecha = int(texto(det, "CbteDesde")), texto(det, "CbteFch")
+            datos = dict([(nombre_local(campo), campo.text) for campo in det
+                          if not len(campo)])
+            # guardar el detalle enviado (sin espacios de nombres) para FECompConsultar
+            for campo in det.iter():
+                campo.tag = nombre_local(campo)
+            datos['xml'] = "".join([ET.tostring(campo, encoding="unicode") for campo in det])
+            cae = None if self.Rechazar() else \
+                self.Numerar('wsfev1', cuit, tipo, pto_vta, nro, datos)
+            if cae:
+                obs, resultado, vto = "", "A", self.Vencimiento(fecha)
+            else:
+                obs = "<Observaciones>%s</Observaciones>" % armar("Obs", [
+                    ('Code', 10016), ('Msg', "El numero o fecha del comprobante no se "
+                                             "corresponde con el proximo a autorizar. "
+                                             "Consultar metodo FECompUltimoAutorizado.")])
+                resultado, vto = "R", None
+            resultados.add(resultado)
+            detalles.append("<FECAEDetResponse>%s%s%s</FECAEDetResponse>" % (
+                armar(None, [('Concepto', datos.get('Concepto')),
+                             ('DocTipo', datos.get('DocTipo')),
+                             ('DocNro', datos.get('DocNro')), ('CbteDesde', nro),
+                             ('CbteHasta', datos.get('CbteHasta')), ('CbteFch', fecha),
+                             ('Resultado', resultado)]),
+                obs, armar(None, [('CAE', cae or ""), ('CAEFchVto', vto or "")])))
+        resultado = "P" if len(resultados) > 1 else resultados.pop() if resultados else "R"
+        cabecera = armar("FeCabResp", [
+            ('Cuit', cuit), ('PtoVta', pto_vta), ('CbteTipo', tipo),
+            ('FchProceso', datetime.datetime.now().strftime("%Y%m%d%H%M%S")),
+            ('CantReg', len(detalles)), ('Resultado', resultado), ('Reproceso', "N")])
+        return "<FECAESolicitarResult>%s<FeDetResp>%s</FeDetResp></FECAESolicitarResult>" % (
+            cabecera, "".join(detalles))
+
+    def wsfev1_FECompConsultar(self, solicitud):
+        cuit, tipo = texto(solicitud, "Cuit"), int(texto(solicitud, "CbteTipo"))
+        pto_vta, nro = int(texto(solicitud, "PtoVta")), int(texto(solicitud, "CbteNro"))
+        datos = self.Consultar('wsfev1', cuit, tipo, pto_vta, nro)
+        if datos is None:
+            return "<FECompConsultarResult><Errors>%s</Errors></FECompConsultarResult>" % \
+                armar("Err", [('Code', 602), ('Msg', "No existen datos en nuestros "
+                                                     "registros para los parametros ingresados.")])
+        # devolver lo registrado (incluye Iva, Tributos, CbtesAsoc, etc.)
+        return "<FECompConsultarResult><ResultGet>%s%s</ResultGet></FECompConsultarResult>" % (
+            datos['xml'], armar(None, [
+                ('Resultado', "A"), ('CodAutorizacion', datos['cae']), ('EmisionTipo', "CAE"),
+                ('FchVto', self.Vencimiento(datos.get('CbteFch'))),
+                ('FchProceso', datetime.datetime.now().strftime("%Y%m%d%H%M%S")),
+                ('PtoVta', pto_vta), ('CbteTipo', tipo)]))
+
+    # WSMTXCA
+
+    def wsmtxca_dummy(self, solicitud):
+        return armar(None, [('appserver', "OK"), ('authserver', "OK"), ('dbserver', "OK")])
+
+    def wsmtxca_consultarUltimoComprobanteAutorizado(self, solicitud):
+        return armar(None, [('numeroComprobante', self.Ultimo(
+            'wsmtxca', texto(solicitud, "cuitRepresentada"),
+            int(texto(solicitud, "codigoTipoComprobante")),
+            int(texto(solicitud, "numeroPuntoVenta"))))])
+
+    def wsmtxca_autorizarComprobante(self, solicitud):
+        cuit = texto(solicitud, "cuitRepresentada")
+        tipo, pto_vta = (int(texto(solicitud, "codigoTipoComprobante")),
+                         int(texto(solicitud, "numeroPuntoVenta")))
+        nro, fecha = int(texto(solicitud, "numeroComprobante")), texto(solicitud, "fechaEmision")
+        cae = None if self.Rechazar() else \
+            self.Numerar('wsmtxca', cuit, tipo, pto_vta, nro, {'fechaEmision': fecha})
+        if not cae:
+            return "<resultado>R</resultado><arrayErrores>%s</arrayErrores>" % armar(
+                "codigoDescripcion", [('codigo', 102), ('descripcion', "El numero de "
+                                      "comprobante no se corresponde con el proximo a autorizar")])
+        return "<resultado>A</resultado>" + armar("comprobanteResponse", [
+            ('cuit', cuit), ('codigoTipoComprobante', tipo), ('numeroPuntoVenta', pto_vta),
+            ('numeroComprobante', nro), ('fechaEmision', fecha), ('CAE', cae),
+            ('fechaVencimientoCAE', self.Vencimiento(fecha, "%Y-%m-%d"))])
+
+    # WSLPG
+
+    def wslpg_dummy(self, solicitud):
+        return armar("return", [('appserver', "OK"), ('authserver', "OK"), ('dbserver', "OK")])
+
+    def wslpg_liquidacionUltimoNroOrdenConsultar(self, solicitud):
+        return armar("liqUltNroOrdenReturn", [('nroOrden', self.Ultimo(
+            'wslpg', texto(solicitud, "cuit"), 0, int(texto(solicitud, "ptoEmision", 1))))])
+
+    def wslpg_liquidacionAutorizar(self, solicitud):
+        cuit, pto_emision = texto(solicitud, "cuit"), int(texto(solicitud, "ptoEmision", 1))
+        nro_orden = int(texto(solicitud, "nroOrden"))
+        coe = None if self.Rechazar() else \
+            self.Numerar('wslpg', cuit, 0, pto_emision, nro_orden, {})
+        if not coe:
+            return "<liqReturn><errores>%s</errores></liqReturn>" % armar("error", [
+                ('codigo', 1802), ('descripcion', "El numero de orden no se corresponde "
+                                                  "con el proximo a autorizar")])
+        return "<liqReturn>%s</liqReturn>" % armar("autorizacion", [
+            ('tipoCbte', 33), ('ptoEmision', pto_emision), ('nroOrden', nro_orden),
+            ('coe', "3300%08d" % int(coe[-8:])), ('fechaLiquidacion', datetime.date.today()),
+            ('estado', "AC"), ('totalDeduccion', "0.00"), ('totalRetencion', "0.00"),
+            ('totalRetencionAfip', "0.00"), ('totalOtrasRetenciones', "0.00"),
+            ('totalNetoAPagar', texto(solicitud, "precioOperacion", "0.00")),
+            ('totalIvaRg4310_18', "0.00"), ('totalPagoSegunCondicion', "0.00")])
+
+
+class ManejadorSimulador(http.server.BaseHTTPRequestHandler):
+    "Atender POST (SOAP) y GET ?wsdl en las rutas de cada servicio (ver RUTAS)"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        simulador = self.server.simulador
+        url = urlparse(self.path)
+        servicio = RUTAS.get(url.path)
+        archivo = simulador.wsdls.get(servicio)
+        if not archivo or not os.path.exists(archivo):
+            return self.enviar(404, b"WSDL no disponible", "text/plain")
+        with open(archivo, "rb") as f:
+            wsdl = f.read()
+        # apuntar el servicio (soap:address) a este servidor
+        wsdl = re.sub(rb'location="https?://[^"]*"',
+                      ('location="%s%s"' % (simulador.url, url.path)).encode("utf8"), wsdl)
+        self.enviar(200, wsdl)
+
+    def do_POST(self):
+        simulador = self.server.simulador
+        xml = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        servicio = RUTAS.get(urlparse(self.path).path)
+        if servicio is None:
+            return self.enviar(404, b"Servicio desconocido", "text/plain")
+        simulador.Demorar()
+        falla = simulador.Falla(xml)
+        with simulador._lock:
+            simulador.estadisticas[falla or "respuestas"] += 1
+        if falla in ("timeout", "perdida"):
+            if falla == "perdida":
+                # procesar la solicitud (ej. autorizar) pero no responder
+                simulador.Responder(servicio, xml)
+            # no responder (el cliente debe abandonar por timeout)
+            time.sleep(simulador.demora_timeout)
+            self.close_connection = True
+            return
+        if falla == "http":
+            return self.enviar(simulador.random.choice((500, 502, 503)),
+                               b"<html><body>Service Unavailable</body></html>", "text/html")
+        error = falla[6:] if falla and falla.startswith("error:") else None
+        status, respuesta = simulador.Responder(servicio, xml, error)
+        if isinstance(respuesta, str):
+            respuesta = respuesta.encode("utf8")
+        self.enviar(status, respuesta)
+
+    def enviar(self, status, body, tipo='text/xml; charset="utf-8"'):
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if DEBUG:
+            http.server.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ServidorSimulador(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def opcion(nombre, defecto=None, tipo=str):
+    "Devolver el valor del parámetro de línea de comandos (--nombre valor)"
+    if nombre in sys.argv:
+        return tipo(sys.argv[sys.argv.index(nombre) + 1])
+    return defecto
+
+
+if __name__ == "__main__":
+    DEBUG = "--debug" in sys.argv
+    simulador = SimuladorAFIP(latencia=opcion("--latencia", 0.0, float),
+                              variacion=opcion("--variacion", 0.0, float),
+                              rechazos=opcion("--rechazos", 0.0, float),
+                              timeouts=opcion("--timeouts", 0.0, float),
+                              perdidas=opcion("--perdidas", 0.0, float),
+                              errores_http=opcion("--errores-http", 0.0, float),
+                              respuestas=opcion("--respuestas"),
+                              semilla=opcion("--semilla", None, int),
+                              wsdls=dict([(servicio, opcion("--wsdl-%s" % servicio))
+                                          for servicio in NAMESPACES]))
+    print("Simulador AFIP en %s" % simulador.Iniciar(opcion("--direccion", DIRECCION)),
+          file=sys.stderr)
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps(simulador.Estado()), file=sys.stderr)
+    except KeyboardInterrupt:
+        simulador.Detener()
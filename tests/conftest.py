@@ -0,0 +1,39 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Configuración común de las pruebas (simulador local de AFIP)"
+
+import os
+import sys
+
+import pytest
+
+# los módulos heredados importan utils, wsaa, etc. sin el paquete (como scripts)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyafipws import benchmark
+from pyafipws.simulador import SimuladorAFIP
+
+
+@pytest.fixture
+def simulador():
+    "Simulador de AFIP en un puerto libre (sin demoras ni fallas sorteadas)"
+    simulador = SimuladorAFIP(semilla=1, demora_timeout=1.5)
+    simulador.Iniciar("http://localhost:0")
+    yield simulador
+    simulador.Detener()
+
+
+@pytest.fixture
+def crear_ws(simulador, tmp_path):
+    "Función que crea un cliente WSFEv1 conectado al simulador (timeout 1 seg.)"
+    return benchmark.conectar(simulador.url, cache=str(tmp_path), timeout=1)
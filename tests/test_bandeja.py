@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la bandeja de salida (reintentos, reserva de flujos y reconciliación)"
+
+import datetime
+
+import pytest
+
+from pyafipws import bandeja, benchmark
+from pyafipws.benchmark import TIPO_CBTE, PUNTO_VTA
+
+FLUJO = (TIPO_CBTE, PUNTO_VTA)
+
+
+@pytest.fixture
+def salida(tmp_path):
+    return bandeja.BandejaSalida(str(tmp_path / "bandeja.db"))
+
+
+def encolar(salida, ws, cantidad):
+    fecha = datetime.date.today().strftime("%Y%m%d")
+    for i in range(cantidad):
+        benchmark.rece1.crear_factura(ws, benchmark.factura(PUNTO_VTA, 0, fecha))
+        salida.Encolar(ws.factura)
+
+
+def test_procesar(simulador, crear_ws, salida):
+    ws = crear_ws()
+    encolar(salida, ws, 3)
+    assert salida.Procesar(ws, "t1") == 3
+    assert salida.Resumen() == {bandeja.AUTORIZADO: 3}
+
+
+def test_token_vencido_no_cuenta_intentos(simulador, crear_ws, salida):
+    "Un error de autenticación renueva el TA y espera, sin agotar los intentos"
+    ws = crear_ws()
+    encolar(salida, ws, 3)
+    renovados = []
+    simulador.Programar("FECAESolicitar", *["error:600"] * (bandeja.INTENTOS_MAX + 1))
+    for i in range(bandeja.INTENTOS_MAX + 1):
+        assert salida.Procesar(ws, "t1", autenticar=renovados.append) == 0
+        assert FLUJO in salida._flujos_en_espera()
+        salida._esperas[FLUJO] = (0, 1)    # vencer la espera
+    assert len(renovados) == bandeja.INTENTOS_MAX + 1
+    assert salida.Resumen() == {bandeja.PENDIENTE: 3}
+    assert salida.Consultar(1)['intentos'] == 0
+    assert salida.Procesar(ws, "t1") == 3
+
+
+def test_espera_luego_de_error_transitorio(simulador, crear_ws, salida):
+    ws = crear_ws()
+    encolar(salida, ws, 1)
+    simulador.Programar("FECAESolicitar", "error:501")
+    assert salida.Procesar(ws, "t1") == 0
+    # el flujo no se vuelve a enviar hasta que venza la espera
+    assert salida.Procesar(ws, "t1") == 0
+    assert simulador.Estado()["FECAESolicitar"] == 1
+
+
+def test_rechazo_solicitud_cuenta_intentos(simulador, crear_ws, salida):
+    ws = crear_ws()
+    encolar(salida, ws, 2)
+    simulador.Programar("FECAESolicitar", *["error:10015"] * bandeja.INTENTOS_MAX)
+    for i in range(bandeja.INTENTOS_MAX):
+        assert salida.Procesar(ws, "t1") == 0
+    assert salida.Resumen() == {bandeja.RECHAZADO: 2}
+    assert salida.Consultar(1)['intentos'] == bandeja.INTENTOS_MAX
+
+
+def test_reserva_perdida_no_graba_resultado(simulador, crear_ws, salida):
+    "Si otro trabajador tomó el flujo durante la solicitud, el resultado no se graba"
+    ws = crear_ws()
+    encolar(salida, ws, 2)
+    solicitar = ws.CAESolicitarX
+
+    def CAESolicitarX():
+        with salida._transaccion() as db:
+            db.execute("UPDATE flujos SET trabajador='t2'")
+        return solicitar()
+
+    ws.CAESolicitarX = CAESolicitarX
+    with pytest.raises(RuntimeError):
+        salida.Procesar(ws, "t1")
+    assert salida.Resumen() == {bandeja.ENVIADO: 2}
+    # el otro trabajador reconcilia las facturas enviadas (ya autorizadas por AFIP)
+    del ws.CAESolicitarX
+    assert salida.Procesar(ws, "t2") == 0
+    assert salida.Resumen() == {bandeja.AUTORIZADO: 2}
+    assert simulador.Estado()["FECAESolicitar"] == 1
+
+
+def test_trabajar_registra_errores(salida):
+    "Los errores de los hilos quedan registrados (no se pierden en stderr)"
+    def crear_ws():
+        raise RuntimeError("sin conexión")
+
+    detener = salida.Trabajar(crear_ws, intervalo=0.1)
+    try:
+        for i in range(50):
+            if salida.errores:
+                break
+            detener.wait(0.1)
+    finally:
+        detener.set()
+    assert list(salida.errores.values()) == ["sin conexión"]
@@ -0,0 +1,39 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del simulador local y de los escenarios de rendimiento"
+
+from pyafipws import benchmark
+from pyafipws.simulador import wsdls_incluidos
+
+
+def test_wsdl_incluido(simulador):
+    "El simulador publica el WSDL de la instalación (sin acceder a AFIP)"
+    assert "wsfev1" in wsdls_incluidos()
+    assert simulador.wsdls["wsfev1"] == wsdls_incluidos()["wsfev1"]
+
+
+def test_escenario_lote(simulador, crear_ws):
+    ret = benchmark.ejecutar("lote", crear_ws, 30, tamanio=10)
+    assert ret["autorizados"] == 30
+    assert ret["errores"] == 0
+    assert simulador.Estado()["FECAESolicitar"] == 3
+
+
+def test_respuesta_perdida(simulador, crear_ws):
+    "Una respuesta perdida se procesa en el simulador aunque el cliente no la recibe"
+    ws = crear_ws()
+    simulador.Programar("FECAESolicitar", "perdida")
+    benchmark.rece1.crear_factura(ws, benchmark.factura(benchmark.PUNTO_VTA, 1, "20261018"))
+    ws.CAESolicitar()
+    assert not ws.Resultado and ws.Excepcion
+    assert ws.CompUltimoAutorizado(benchmark.TIPO_CBTE, benchmark.PUNTO_VTA) == "1"
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del modelo compacto de comprobantes (registros con acceso como diccionario)"
+
+import json
+
+import pytest
+
+from pyafipws import benchmark, comprobante
+from pyafipws.formatos import formato_txt
+
+
+def test_registro_como_diccionario():
+    "Los campos fijos van en __slots__ y los no previstos aparte, como en un dict"
+    iva = comprobante.Iva(iva_id=5, base_imp="100.00")
+    assert not hasattr(iva, "__dict__")
+    assert list(iva) == ["iva_id", "base_imp"] and len(iva) == 2
+    assert "importe" not in iva and iva.get("importe", 0) == 0
+    with pytest.raises(KeyError):
+        iva["importe"]
+    iva.update(importe="21.00", tipo_reg=2)
+    assert iva["importe"] == "21.00" and iva["tipo_reg"] == 2 and "tipo_reg" in iva
+    assert dict(iva) == {'iva_id': 5, 'base_imp': "100.00", 'importe': "21.00", 'tipo_reg': 2}
+    del iva["tipo_reg"], iva["base_imp"]
+    assert list(iva) == ["iva_id", "importe"]
+    with pytest.raises(KeyError):
+        del iva["tipo_reg"]
+    assert iva == {'iva_id': 5, 'importe': "21.00"}
+
+
+def test_factura_copia_y_serializacion():
+    "copy() y serializar devuelven diccionarios comunes (sub-registros incluidos)"
+    [modelo] = comprobante._crear(1, True)
+    [original] = comprobante._crear(1, False)
+    modelo['id'] = original['id'] = 7
+    copia = modelo.copy()
+    assert copia == original and type(copia) is dict
+    assert type(copia['iva'][0]) is dict and copia['iva'] is not modelo['iva']
+    assert json.loads(json.dumps(modelo, default=comprobante.serializar)) == original
+    campos = modelo.a_formato(formato_txt.ENCABEZADO)
+    assert set(campos) == set([fmt[0] for fmt in formato_txt.ENCABEZADO])
+    assert campos['imp_total'] == "179.25" and campos['cae'] is None
+
+
+def test_convertir_fecaedet(crear_ws):
+    "La estructura SOAP se arma del registro creado por WSFEv1 según el mapa"
+    ws = crear_ws()
+    wsfev1 = benchmark.wsfev1
+    ws.CrearFactura(1, 80, "30500010912", 1, 4000, 5, 5, "121.00", "0.00", "100.00",
+                    "21.00", "0.00", "0.00", "20190101", None, None, None, "PES", "1.000")
+    ws.AgregarIva(5, "100.00", "21.00")
+    assert type(ws.factura) is wsfev1.Factura and type(ws.factura['iva'][0]) is wsfev1.Iva
+    det = wsfev1.convertir(ws.factura, wsfev1.FECAEDET)
+    assert [etiqueta for etiqueta, campo in wsfev1.FECAEDET] == list(det)
+    assert det['CbteDesde'] == det['CbteHasta'] == 5 and det['ImpTotal'] == "121.00"
+    assert det['Iva'] == [{'AlicIva': {'Id': 5, 'BaseImp': "100.00", 'Importe': "21.00"}}]
+    assert det['Tributos'] is None and det['CbtesAsoc'] is None
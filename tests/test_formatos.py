@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de los formatos de intercambio (lectura y escritura por comprobante)"
+
+import io
+import json
+import sqlite3
+from decimal import Decimal
+
+from pyafipws import rece1
+from pyafipws.formatos import formato_json, formato_sql, formato_txt
+
+
+def factura(nro):
+    return {'webservice': "wsfev1", 'fecha_cbte': "20261018", 'tipo_cbte': 1,
+            'punto_vta': 4, 'cbte_nro': nro, 'imp_total': 121.0, 'id': nro,
+            'detalles': [{'codigo': "P%d" % nro, 'qty': 1, 'precio': 100.0,
+                          'importe': 100.0, 'ds': "Producto\nen dos lineas"}],
+            'ivas': [{'iva_id': 5, 'base_imp': 100.0, 'importe': 21.0}],
+            'tributos': [], 'cbtes_asoc': [], 'permisos': [], 'datos': []}
+
+
+def test_txt_por_comprobante(tmp_path):
+    "Cada comprobante se devuelve al completarse (sin leer el resto del archivo)"
+    entrada, salida = str(tmp_path / "entrada.txt"), str(tmp_path / "salida.txt")
+    formato_txt.escribir((factura(nro) for nro in (1, 2, 3)), entrada)
+    with open(entrada, encoding=formato_txt.CHARSET) as f:
+        texto = f.read()
+    lineas = [linea + "\n" for linea in texto.split("\n")[:-1]]
+    assert [linea[0] for linea in lineas] == ["0", "1", "4"] * 3
+    archivo = io.StringIO(texto)
+    facturas = formato_txt.iterar(archivo)
+    primera = next(facturas)
+    # leído hasta el encabezado del comprobante siguiente
+    assert archivo.tell() == len("".join(lineas[:4]))
+    assert primera['cbte_nro'] == 1 and primera['ivas'][0]['importe'] == 21.0
+    assert primera['detalles'][0]['ds'] == "Producto\nen dos lineas"
+    assert [f['cbte_nro'] for f in facturas] == [2, 3]
+    assert formato_txt.leer(entrada) == list(formato_txt.iterar(entrada))
+    # de un archivo a otro, de a un comprobante
+    formato_txt.escribir(formato_txt.iterar(entrada), salida)
+    with open(salida, encoding=formato_txt.CHARSET) as f:
+        assert f.read() == texto
+
+
+def test_json_por_comprobante(tmp_path):
+    "La salida JSON por comprobante es idéntica a json.dump de la lista"
+    salida = str(tmp_path / "salida.json")
+    facturas = [factura(nro) for nro in (1, 2)]
+    formato_json.escribir(iter(facturas), salida)
+    with open(salida, encoding="utf-8") as f:
+        assert f.read() == json.dumps(facturas, sort_keys=True, indent=4)
+    formato_json.escribir(iter([]), salida)
+    assert formato_json.leer(salida) == []
+
+
+def test_rece1_leer_facturas():
+    "rece1 procesa cada factura apenas se lee (las líneas siguientes no se consumen)"
+    lineas = []
+    for nro in (1, 2):
+        lineas.append(rece1.escribir({'tipo_reg': 0, 'cbt_desde': nro, 'cbt_hasta': nro,
+                                      'imp_total': 121.0}, rece1.ENCABEZADO))
+        lineas.append(rece1.escribir({'tipo_reg': 2, 'iva_id': 5, 'base_imp': 100.0,
+                                      'importe': 21.0}, rece1.IVA))
+    leidas = []
+
+    def entrada():
+        for linea in lineas:
+            leidas.append(linea)
+            yield linea
+
+    facturas = rece1.leer_facturas(entrada())
+    primera = next(facturas)
+    assert len(leidas) == 3
+    assert primera['cbt_desde'] == 1 and primera['ivas'][0]['importe'] == 21.0
+    assert [f['cbt_desde'] for f in facturas] == [2]
+
+
+def test_sql_por_lotes():
+    "Las facturas se graban y leen por lotes (una consulta por tabla hija y lote)"
+    db = sqlite3.connect(":memory:")
+    tablas = [('encabezado', formato_txt.ENCABEZADO), ('detalle', formato_txt.DETALLE),
+              ('tributo', formato_txt.TRIBUTO), ('iva', formato_txt.IVA),
+              ('cmp_asoc', formato_txt.CMP_ASOC), ('permiso', formato_txt.PERMISO)]
+    for sql in formato_sql.esquema_sql(tablas):
+        db.execute(sql)
+    facturas = [factura(nro) for nro in range(1, 6)]
+    for f in facturas:
+        if f['cbte_nro'] == 2:
+            f['id'] = 10        # id explícito solo en la segunda
+        else:
+            del f['id']
+    formato_sql.escribir(iter(facturas), db, lote=2)
+    # ids reservados por lote (teniendo en cuenta los explícitos)
+    assert [f['id'] for f in facturas] == [11, 10, 12, 13, 14]
+    consultas = []
+    db.set_trace_callback(consultas.append)
+    leidas = list(formato_sql.leer(db, ids=[10, 11, 12, 13, 14], lote=2))
+    db.set_trace_callback(None)
+    assert sorted([f['id'] for f in leidas]) == [10, 11, 12, 13, 14]
+    assert len([c for c in consultas if c.startswith("SELECT * FROM iva")]) == 3
+    leida = [f for f in leidas if f['id'] == 12][0]
+    assert leida['cbte_nro'] == 3 and leida['imp_total'] == Decimal("121")
+    assert leida['ivas'] == [{'id': 12, 'tipo_reg': None, 'iva_id': 5,
+                              'base_imp': Decimal("100"), 'importe': Decimal("21")}]
+    assert [d['codigo'] for d in leida['detalles']] == ["P3"]
+    assert 'tributos' not in leida
+    # pendientes: sin resultado (luego de modificar solo quedan las demás)
+    formato_sql.modificar(dict(leida, cae="12345678901234", resultado="A", reproceso="N",
+                               motivo_obs="", err_code="", err_msg=""), db)
+    pendientes = [f['id'] for f in formato_sql.leer(db, lote=2)]
+    assert sorted(pendientes) == [10, 11, 13, 14]
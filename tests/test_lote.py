@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del motor de lotes reanudables (diario y reconciliación con AFIP)"
+
+import datetime
+
+from pyafipws import benchmark, lote
+from pyafipws.benchmark import PUNTO_VTA
+
+
+def test_diario_solo_indice(tmp_path):
+    "El diario conserva en memoria solo el estado (los datos se leen del archivo)"
+    archivo = str(tmp_path / "diario.jsonl")
+    diario = lote.Diario(archivo)
+    diario.registrar("1-1-1", lote.PENDIENTE)
+    diario.registrar("1-1-1", "A", {'cae': "123", 'cbt_desde': 1})
+    diario.registrar("1-1-2", lote.ERROR)
+    assert diario.entradas["1-1-1"][0] == "A" and "123" not in repr(diario.entradas)
+    assert diario.obtener("1-1-1")['factura'] == {'cae': "123", 'cbt_desde': 1}
+    diario.cerrar()
+    with open(archivo, "a") as f:
+        f.write('{"clave": "1-1-3", "esta')     # interrumpido al grabar
+    diario = lote.Diario(archivo)
+    assert diario.estado("1-1-1") == "A" and diario.estado("1-1-2") == lote.ERROR
+    assert diario.estado("1-1-3") is None
+    diario.registrar("1-1-3", "R", {'cae': ""})
+    assert diario.obtener("1-1-3")['estado'] == "R"
+    assert diario.obtener("1-1-1")['factura']['cae'] == "123"
+    diario.cerrar()
+    assert lote.Diario(archivo).estado("1-1-3") == "R"
+
+
+def test_reanudar_error_consulta(simulador, crear_ws, tmp_path):
+    "Un comprobante sin respuesta (timeout) se verifica en AFIP antes de reenviarlo"
+    ws = crear_ws()
+    fecha = datetime.date.today().strftime("%Y%m%d")
+    facturas = [benchmark.factura(PUNTO_VTA, nro, fecha) for nro in (1, 2)]
+    autorizar = benchmark.rece1.autorizar_factura
+    consultar = benchmark.rece1.consultar_factura
+    diario = lote.Diario(str(tmp_path / "diario.jsonl"))
+    simulador.Programar("FECAESolicitar", "perdida")
+    estadisticas = lote.procesar(ws, [dict(f) for f in facturas], autorizar, consultar,
+                                 diario=diario)
+    assert (estadisticas.errores, estadisticas.autorizados) == (1, 1)
+    assert diario.estado("1-%d-1" % PUNTO_VTA) == lote.ERROR
+    grabados = []
+    estadisticas = lote.procesar(ws, [dict(f) for f in facturas], autorizar, consultar,
+                                 grabados.append, diario)
+    assert (estadisticas.omitidos, estadisticas.errores) == (2, 0)
+    assert [d['resultado'] for d in grabados] == ['A', 'A'] and grabados[0]['cae']
+    assert simulador.Estado()["FECAESolicitar"] == 2
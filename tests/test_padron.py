@@ -0,0 +1,185 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de las consultas en paralelo al padrón (clientes por hilo)"
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from pyafipws import padron
+
+
+@pytest.fixture
+def padron_afip(tmp_path, monkeypatch):
+    "Padrón con la base (y el índice) en un directorio temporal"
+    monkeypatch.setattr(padron.PadronAFIP, "InstallDir", str(tmp_path))
+    p = padron.PadronAFIP()
+    p.LanzarExcepciones = True
+    yield p
+    if p.indice:
+        p.indice.cerrar()
+    p.db.close()
+
+
+def cuit(i):
+    return 20000000000 + i * 7
+
+
+def hilos_activos():
+    return [h for h in threading.enumerate() if h.name.startswith("padron-")]
+
+
+def consultar(cliente, nro_doc):
+    if nro_doc % 3 == 0:
+        raise ValueError("CUIT invalido")
+    return {'nro_doc': nro_doc, 'cliente': cliente}
+
+
+def test_consultar_paralelo():
+    "Cada hilo usa su cliente y los errores se devuelven con el número consultado"
+    resultados = list(padron.consultar_paralelo(list(range(1, 11)), object, consultar, 3))
+    assert sorted([r[0] for r in resultados]) == list(range(1, 11))
+    assert sorted([r[0] for r in resultados if r[2] == "CUIT invalido"]) == [3, 6, 9]
+    assert len(set([id(r[1]['cliente']) for r in resultados if r[1]])) <= 3
+    assert hilos_activos() == []
+
+
+def test_consultar_paralelo_falla_cliente():
+    "Si no se puede crear un cliente no se inicia ningún hilo ni consulta"
+    clientes, consultados = [], []
+
+    def crear_cliente():
+        if len(clientes) == 2:
+            raise ConnectionError("sin conexion")
+        clientes.append(object())
+        return clientes[-1]
+
+    def registrar(cliente, nro_doc):
+        consultados.append(nro_doc)
+
+    with pytest.raises(ConnectionError):
+        list(padron.consultar_paralelo(list(range(1, 11)), crear_cliente, registrar, 3))
+    assert consultados == [] and hilos_activos() == []
+
+
+def test_consultar_paralelo_detener():
+    "Si se deja de consumir los resultados se descartan las consultas pendientes"
+    consultados = []
+
+    def demorar(cliente, nro_doc):
+        time.sleep(0.01)
+        consultados.append(nro_doc)
+
+    resultados = padron.consultar_paralelo(list(range(1, 201)), object, demorar, 2)
+    for i in range(3):
+        next(resultados)
+    resultados.close()
+    assert hilos_activos() == [] and len(consultados) < 10
+
+
+def test_procesar_por_lotes(padron_afip, tmp_path):
+    "El padrón se importa en lotes y luego se crean los índices (base consultable)"
+    archivo = str(tmp_path / "padron.txt")
+    padron.generar_padron_prueba(archivo, 250)
+    avance = []
+    assert padron_afip.Procesar(archivo, borrar=True, lote=100, progreso=avance.append) == 250
+    assert avance == [100, 200, 250]
+    assert padron_afip.Buscar(cuit(10)) and padron_afip.denominacion == "CONTRIBUYENTE 10"
+    assert not padron_afip.Buscar(cuit(10) + 1)
+    db = sqlite3.connect(padron_afip.db_path)
+    indices = [fila[0] for fila in db.execute("SELECT name FROM sqlite_master "
+                                              "WHERE type='index' ORDER BY name")]
+    assert indices == ["domicilio_doc", "padron_pk"]
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert db.execute("SELECT COUNT(*) FROM padron").fetchone()[0] == 250
+    db.close()
+
+
+def test_actualizar_diferencias(padron_afip, tmp_path):
+    "Solo se aplican las altas, bajas y modificaciones (conservando los datos locales)"
+    archivo = str(tmp_path / "padron.txt")
+    padron.generar_padron_prueba(archivo, 50)
+    assert padron_afip.Actualizar(archivo)
+    assert [padron_afip.altas, padron_afip.bajas, padron_afip.modificaciones] == [50, 0, 0]
+    padron_afip.Guardar(80, cuit(2), "CONTRIBUYENTE 2", 1, "Calle 2", "c2@example.com")
+    with open(archivo) as f:
+        lineas = f.readlines()
+    # baja del 1 y del 2 (con datos locales), cambio de nombre del 3 y alta del 99
+    lineas[3] = lineas[3].replace("CONTRIBUYENTE 3 ", "CONTRIBUYENTE 3B")
+    lineas = [lineas[0]] + lineas[3:] + [lineas[1].replace("%011d" % cuit(1), "%011d" % cuit(99))]
+    with open(archivo, "w") as f:
+        f.writelines(lineas)
+    assert padron_afip.Actualizar(archivo)
+    assert [padron_afip.altas, padron_afip.bajas, padron_afip.modificaciones] == [1, 1, 1]
+    assert not padron_afip.Buscar(cuit(1)) and padron_afip.Buscar(cuit(99))
+    assert padron_afip.Buscar(cuit(3)) and padron_afip.denominacion == "CONTRIBUYENTE 3B"
+    assert padron_afip.Buscar(cuit(2)) and padron_afip.email == "c2@example.com"
+    assert padron_afip.ConsultarDomicilios(cuit(2)) == 1
+    # sin cambios en el archivo no se modifica ningún registro
+    assert padron_afip.Actualizar(archivo)
+    assert [padron_afip.altas, padron_afip.bajas, padron_afip.modificaciones] == [0, 0, 0]
+
+
+def test_indice_igual_sqlite(padron_afip, tmp_path):
+    "El índice binario (ordenado por corridas) encuentra lo mismo que la base sqlite"
+    archivo = str(tmp_path / "padron.txt")
+    padron.generar_padron_prueba(archivo, 300, desordenado=True)
+    padron_afip.Procesar(archivo, borrar=True)
+    assert padron_afip.Indexar(archivo, lote=64) == 300
+    cuits = [cuit(i) + (i % 2) for i in range(0, 400, 3)]
+    campos = [k for k, l, t, d in padron.FORMATO]
+    esperado = [padron_afip.Buscar(c) and [getattr(padron_afip, k) for k in campos]
+                for c in cuits]
+    assert padron_afip.AbrirIndice()
+    assert [padron_afip.Buscar(c) and [getattr(padron_afip, k) for k in campos]
+            for c in cuits] == esperado
+    # búsqueda por lote (ordenada o no) y datos locales solo en sqlite
+    indice = padron_afip.indice
+    encontrados = [c for c, datos in indice.buscar_lote(sorted(cuits)) if datos]
+    assert encontrados == sorted([c for c, e in zip(cuits, esperado) if e])
+    assert [c for c, d in indice.buscar_lote(reversed(cuits)) if d] == encontrados[::-1]
+    padron_afip.Guardar(80, cuit(3), "CONTRIBUYENTE 3", 1, "Calle 3", "c3@example.com")
+    assert padron_afip._buscar_db(cuit(3))['email'] == "c3@example.com"
+    assert padron_afip.Buscar(cuit(3)) and padron_afip.email == ""
+
+
+def test_consultar_lote_cache(padron_afip):
+    "Los contribuyentes vigentes (e inexistentes) en la base local no se vuelven a consultar"
+    consultados = []
+
+    def consultar_afip(cliente, nro_doc):
+        consultados.append(nro_doc)
+        if nro_doc == cuit(2):
+            return None
+        if nro_doc == cuit(3):
+            raise RuntimeError("servicio no disponible")
+        return {'encontrado': True, 'denominacion': "CONTRIBUYENTE %d" % nro_doc,
+                'cat_iva': 1, 'imp_iva': "AC", 'monotributo': "NI",
+                'actividad_monotributo': "", 'integrante_soc': "N",
+                'empleador': "N", 'direccion': "Calle %d" % nro_doc}
+
+    cuits = [cuit(1), cuit(2), cuit(3), cuit(1)]
+    assert padron_afip.ConsultarLote(cuits, 2, crear_cliente=object,
+                                     consultar=consultar_afip) == 4
+    assert [r['origen'] for r in padron_afip.resultados] == ["afip"] * 4
+    assert [r['encontrado'] for r in padron_afip.resultados] == [True, False, None, True]
+    assert sorted(consultados) == [cuit(1), cuit(2), cuit(3)]
+    assert [padron_afip.consultas, padron_afip.inexistentes, padron_afip.fallidos] == [3, 1, 1]
+    del consultados[:]
+    assert padron_afip.ConsultarLote(cuits, 2, crear_cliente=object,
+                                     consultar=consultar_afip) == 4
+    assert consultados == [cuit(3)] and padron_afip.en_cache == 2
+    assert [r['origen'] for r in padron_afip.resultados] == ["cache", "cache", "afip", "cache"]
+    assert padron_afip.resultados[0]['direccion'] == "Calle %d" % cuit(1)
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del envío de correos por conexiones persistentes (sumidero SMTP local)"
+
+import email
+import email.header
+import os
+import threading
+
+import pytest
+
+from pyafipws import pyemail
+
+
+@pytest.fixture
+def sumidero():
+    sumidero = pyemail.SumideroSMTP()
+    sumidero.puerto = sumidero.iniciar()
+    yield sumidero
+    sumidero.shutdown()
+    sumidero.server_close()
+
+
+def armar(item, archivo):
+    return ("facturas@example.com", ["cliente%d@example.com" % item],
+            "Subject: Factura %d\r\n\r\nSe adjunta la factura\r\n" % item)
+
+
+def test_transitorio():
+    "Sin el punto final el servidor descarta el mensaje: solo EnvioIncierto no se reintenta"
+    assert pyemail.transitorio(pyemail.EnvioInterrumpido("conexion perdida"))
+    assert not pyemail.transitorio(pyemail.EnvioIncierto("resultado desconocido"))
+
+
+def test_envio_interrumpido_reintenta(sumidero):
+    "Si la conexión se pierde durante DATA se reenvía el mensaje por otra conexión"
+    conexiones = pyemail.ConexionesSMTP("localhost", puerto=sumidero.puerto, espera=0)
+    llamadas = []
+
+    def partes():
+        llamadas.append(len(llamadas))
+        yield b"Subject: Factura\r\n\r\n"
+        if len(llamadas) == 1:
+            raise ConnectionResetError("conexion perdida")
+        yield b"Se adjunta la factura\r\n"
+
+    conexiones.enviar("facturas@example.com", ["cliente@example.com"], partes)
+    conexiones.cerrar()
+    assert len(llamadas) == 2 and conexiones.reintentados == 1
+    assert conexiones.conexiones == 2 and sumidero.mensajes == 1
+
+
+def hilos_activos():
+    return [h for h in threading.enumerate() if h.name.startswith(("generar-", "enviar-"))]
+
+
+def test_despacho_detener(sumidero):
+    "Si se deja de consumir los resultados, las etapas terminan (no quedan hilos bloqueados)"
+    conexiones = pyemail.ConexionesSMTP("localhost", puerto=sumidero.puerto, cantidad=2)
+
+    def items():
+        i = 0
+        while True:
+            i += 1
+            yield i
+
+    despacho = pyemail.Despacho(conexiones, armar, hilos=2, cola_max=2)
+    resultados = despacho.procesar(items())
+    for i in range(3):
+        item, archivo, error = next(resultados)
+        assert error is None
+    resultados.close()
+    conexiones.cerrar()
+    assert hilos_activos() == [] and despacho.fin
+
+
+def test_despacho_error_al_leer(sumidero):
+    "La excepción al leer los items se relanza luego de procesar los anteriores"
+    conexiones = pyemail.ConexionesSMTP("localhost", puerto=sumidero.puerto)
+
+    def items():
+        yield 1
+        yield 2
+        raise ValueError("item invalido")
+
+    despacho = pyemail.Despacho(conexiones, armar)
+    procesados = []
+    with pytest.raises(ValueError):
+        for item, archivo, error in despacho.procesar(items()):
+            procesados.append(item)
+    conexiones.cerrar()
+    assert sorted(procesados) == [1, 2] and sumidero.mensajes == 2
+    assert hilos_activos() == []
+
+
+def lote(sumidero, cantidad):
+    correo = pyemail.PyEmail()
+    assert correo.Conectar("localhost", puerto=sumidero.puerto)
+    correo.Crear("facturas@example.com", "Factura")
+    correo.IniciarLote()
+    for i in range(cantidad):
+        correo.AgregarMensaje("cliente%d@example.com" % i, mensaje="Se adjunta la factura %d" % i)
+    return correo
+
+
+def test_enviar_lote_sesion_persistente(sumidero):
+    "El lote usa la sesión de Conectar y reconecta ante el límite del servidor (421)"
+    sumidero.limite = 3
+    correo = lote(sumidero, 5)
+    assert correo.EnviarLote() == 5
+    assert sumidero.mensajes == 5 and sumidero.conexiones == 2
+    assert correo.Resumen['conexiones'] == 1 and correo.Resumen['reintentos'] == 1
+    assert correo.LeerResultado(4) and correo.Destinatario == "cliente4@example.com"
+    assert correo.Enviado is True and correo.ErrMsg == ""
+    assert not correo.LeerResultado(5)
+    # la sesión queda abierta para los siguientes envíos
+    assert correo.Enviar(destinatario="otro@example.com", mensaje="Aviso")
+    assert sumidero.mensajes == 6 and sumidero.conexiones == 2
+    assert correo.Salir()
+
+
+def test_enviar_lote_max_mensajes(sumidero):
+    "Con max_mensajes se reconecta antes del límite del servidor (sin rechazos)"
+    correo = lote(sumidero, 5)
+    assert correo.EnviarLote(max_mensajes=2) == 5
+    assert sumidero.mensajes == 5 and sumidero.conexiones == 3
+    assert correo.Resumen['reintentos'] == 0
+    correo.Salir()
+
+
+def test_enviar_lote_errores(sumidero):
+    "Sin reintentos, los mensajes rechazados quedan informados en su resultado"
+    sumidero.limite = 2
+    correo = lote(sumidero, 3)
+    assert correo.EnviarLote(reintentos=0) == 2
+    assert correo.LeerResultado(2) and correo.Enviado is False and "421" in correo.ErrMsg
+    assert correo.Resumen['mensajes'] == 3 and correo.Resumen['enviados'] == 2
+
+
+def test_partes_mensaje_adjunto(tmp_path):
+    "El adjunto se codifica por bloques y el correo resultante es equivalente"
+    adjunto = tmp_path / "factura.pdf"
+    datos = os.urandom(pyemail.BLOQUE * 2 + 1000)
+    adjunto.write_bytes(datos)
+    partes = list(pyemail.partes_mensaje("facturas@example.com", ["cliente@example.com"],
+                                         "Factura electrónica", "Se adjunta la factura",
+                                         adjuntos=[str(adjunto)]))
+    assert max([len(parte) for parte in partes]) < len(datos)
+    msg = email.message_from_bytes(b"".join(partes))
+    asunto = email.header.decode_header(msg['Subject'])
+    assert "".join([texto.decode(cs or "ascii") for texto, cs in asunto]) == "Factura electrónica"
+    texto, archivo = msg.get_payload()
+    assert texto.get_payload(decode=True) == b"Se adjunta la factura"
+    assert archivo.get_filename() == "factura.pdf"
+    assert archivo.get_payload(decode=True) == datos
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la generación de PDF (planillas en cache y facturas en lote)"
+
+import os
+import re
+import shutil
+
+from pyafipws import pyfepdf
+from pyafipws.formatos import formato_txt
+
+
+def facturas(cantidad):
+    muestras = formato_txt.leer(os.path.join(pyfepdf.INSTALL_DIR, "datos", "facturas.txt"))
+    for i in range(cantidad):
+        factura = dict(muestras[i % len(muestras)])
+        factura['detalles'] = [dict(it) for it in factura['detalles']]
+        factura['fecha_venc_pago'] = factura.get('fecha_venc_pago') or factura['fecha_cbte']
+        factura['id'] = i
+        yield factura
+
+
+def paginas(pdf):
+    return len(re.findall(rb"/Type /Page\b(?!s)", pdf))
+
+
+def test_planilla_en_cache(tmp_path):
+    "La planilla se analiza una vez y se vuelve a leer si cambia el archivo"
+    pyfepdf.limpiar_cache_formatos()
+    planilla = str(tmp_path / "factura.csv")
+    shutil.copy(os.path.join(pyfepdf.INSTALL_DIR, "plantillas", "factura.csv"), planilla)
+    primera, segunda, tercera = pyfepdf.FEPDF(), pyfepdf.FEPDF(), pyfepdf.FEPDF()
+    assert primera.CargarFormato(planilla) and segunda.CargarFormato(planilla)
+    assert segunda.elements == primera.elements and segunda.elements[0] is primera.elements[0]
+    with open(planilla, "a") as f:
+        f.write("'prueba';'T';10;10;0;0;'Arial';8;0;0;0;0;0;'L';'texto';0\n")
+    os.utime(planilla, (0, os.path.getmtime(planilla) + 10))
+    assert tercera.CargarFormato(planilla)
+    assert len(tercera.elements) == len(primera.elements) + 1
+    assert tercera.elements[-1]['name'] == "prueba" and tercera.elements[0] is not primera.elements[0]
+
+
+def test_generar_lote(tmp_path):
+    "Un PDF por factura (nombre con campos) o todas en un único PDF (imágenes una vez)"
+    fepdf = pyfepdf.FEPDF()
+    fepdf.CargarFormato("factura.csv")
+    generados = fepdf.GenerarLote(facturas(3), str(tmp_path / "factura_%(id)s.pdf"))
+    assert generados == [str(tmp_path / ("factura_%d.pdf" % i)) for i in range(3)]
+    for archivo in generados:
+        with open(archivo, "rb") as f:
+            pdf = f.read()
+        assert pdf.startswith(b"%PDF") and paginas(pdf) == 1
+    imagenes = len(re.findall(rb"/Subtype /Image", pdf))
+    assert imagenes > 0
+    fepdf = pyfepdf.FEPDF()
+    fepdf.CargarFormato("factura.csv")
+    assert fepdf.GenerarLote(facturas(3), str(tmp_path / "lote.pdf")) == [str(tmp_path / "lote.pdf")]
+    with open(str(tmp_path / "lote.pdf"), "rb") as f:
+        pdf = f.read()
+    assert paginas(pdf) == 3 and len(re.findall(rb"/Subtype /Image", pdf)) == imagenes
+    # sin archivo se devuelve el contenido del PDF
+    fepdf = pyfepdf.FEPDF()
+    fepdf.CargarFormato("factura.csv")
+    pdf = fepdf.GenerarLote(facturas(2))
+    assert paginas(pdf.encode("latin1") if isinstance(pdf, str) else pdf) == 2
@@ -0,0 +1,334 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de utils (transportes HTTP, plantillas y respuestas SOAP, WSDL y formatos fijos)"
+
+import asyncio
+import datetime
+import os
+import time
+
+import pytest
+
+from pyafipws import benchmark, utils
+from pyafipws.benchmark import RUTA, TIPO_CBTE, PUNTO_VTA
+
+
+def conexiones_pool():
+    return [(c[0], c[2]) for lista in utils._http_pool.values() for c in lista]
+
+
+def test_pool_cerrar_solo_propias(simulador):
+    "close() libera solo las conexiones del transporte, no las de otros clientes"
+    utils.limpiar_pool_http()
+    url = simulador.url + RUTA + "?WSDL"
+    propio, otro = utils.PoolHTTPTransport(timeout=5), utils.PoolHTTPTransport(timeout=5)
+    respuesta, contenido = propio.request(url)
+    assert respuesta.status == 200 and contenido
+    [(conn, dueño)] = conexiones_pool()
+    assert dueño is propio
+    otro.close()
+    assert conexiones_pool() == [(conn, propio)] and conn.sock is not None
+    # la conexión inactiva se reutiliza y pasa al último que la devolvió
+    respuesta, contenido = otro.request(url)
+    assert respuesta.status == 200
+    assert conexiones_pool() == [(conn, otro)]
+    propio.close()
+    assert conexiones_pool() == [(conn, otro)] and conn.sock is not None
+    otro.close()
+    assert conexiones_pool() == [] and conn.sock is None
+
+
+def test_limpiar_pool_http(simulador):
+    "limpiar_pool_http cierra las conexiones inactivas de todos los clientes"
+    url = simulador.url + RUTA + "?WSDL"
+    utils.PoolHTTPTransport(timeout=5).request(url)
+    [(conn, dueño)] = conexiones_pool()
+    utils.limpiar_pool_http()
+    assert not utils._http_pool and conn.sock is None
+
+
+def crear_factura(ws, nro):
+    fecha = datetime.date.today().strftime("%Y%m%d")
+    benchmark.rece1.crear_factura(ws, benchmark.factura(PUNTO_VTA, nro, fecha))
+    return ws.factura
+
+
+def test_async_estado_local(simulador, tmp_path):
+    "Las llamadas concurrentes usan su propia copia del estado (la instancia no cambia)"
+    ws = benchmark.conectar(simulador.url, cache=str(tmp_path), timeout=5)()
+    facturas = [crear_factura(ws, nro) for nro in (1, 2)]
+    http = ws.client.http
+
+    async def autorizar():
+        return await asyncio.gather(*[ws.cae_solicitar(f) for f in facturas])
+
+    resultados = asyncio.run(autorizar())
+    assert [r.Valor for r in resultados] != ["", ""]
+    assert len(set([r.Valor for r in resultados])) == 2
+    assert [f.get('cae') for f in facturas] == [None, None]
+    assert ws.factura is facturas[1] and ws.client.http is http and not ws.CAE
+    assert simulador.Estado()["FECAESolicitar"] == 2
+
+
+def test_async_respuesta_perdida_no_reenvia(simulador, tmp_path):
+    "Si la conexión se corta al leer la respuesta, el requerimiento no se reenvía"
+    ws = benchmark.conectar(simulador.url, cache=str(tmp_path), timeout=5)()
+    crear_factura(ws, 1)
+
+    async def autorizar():
+        # conexión persistente (se reutiliza para el requerimiento siguiente)
+        assert (await ws.comp_ultimo_autorizado(TIPO_CBTE, PUNTO_VTA)).Valor == "0"
+        simulador.Programar("FECAESolicitar", "perdida")
+        with pytest.raises(ConnectionError):
+            await ws.cae_solicitar()
+
+    asyncio.run(autorizar())
+    assert simulador.Estado()["FECAESolicitar"] == 1
+    assert simulador.Ultimo('wsfev1', benchmark.CUIT, TIPO_CBTE, PUNTO_VTA) == 1
+
+
+class Enviado(BaseException):
+    "Requerimiento armado (interrumpe la llamada antes de enviarlo)"
+
+
+class Captura:
+    def request(self, location, method="POST", body=None, headers={}):
+        raise Enviado(body)
+
+
+def sobre(ws, plantillas, **kwargs):
+    "Devolver el XML armado para FECAESolicitar (plantilla o camino genérico)"
+    ws.client.plantillas, ws.client.http = plantillas, Captura()
+    with pytest.raises(Enviado) as enviado:
+        ws.client.FECAESolicitar(**kwargs)
+    return enviado.value.args[0]
+
+
+def test_plantilla_igual_generico(simulador, crear_ws):
+    "La plantilla arma el mismo XML que el camino genérico para cada estructura"
+    ws = crear_ws()
+    http = ws.client.http
+    utils_ws = __import__(type(ws.client).__module__)
+    utils_ws.limpiar_plantillas_soap()
+    auth = {'Token': "t", 'Sign': "s", 'Cuit': benchmark.CUIT}
+    cab = {'CantReg': 1, 'PtoVta': PUNTO_VTA, 'CbteTipo': TIPO_CBTE}
+    det = {'Concepto': 1, 'DocTipo': 80, 'DocNro': "30500010912", 'CbteDesde': 1,
+           'CbteHasta': 1, 'CbteFch': "20261018", 'ImpTotal': 121.0, 'ImpTotConc': 0,
+           'ImpNeto': 100.0, 'ImpOpEx': 0, 'ImpTrib': 0, 'ImpIVA': 21.0,
+           'MonId': "PES", 'MonCotiz': 1,
+           'Iva': [{'AlicIva': {'Id': 5, 'BaseImp': 100.0, 'Importe': 21.0}}]}
+    reordenado = dict(reversed(list(det.items())))
+    sin_iva = dict([(k, v) for k, v in det.items() if k != 'Iva'])
+    dos_ivas = dict(det, Iva=det['Iva'] * 2)
+    try:
+        for detalle in (det, det, reordenado, sin_iva, dos_ivas, reordenado):
+            parametros = {'Auth': auth, 'FeCAEReq': {
+                'FeCabReq': cab, 'FeDetReq': [{'FECAEDetRequest': detalle}]}}
+            plantilla = sobre(ws, ('FECAESolicitar', ), **parametros)
+            assert plantilla == sobre(ws, (), **parametros)
+        plantilla = utils_ws.obtener_plantilla(ws.client, "FECAESolicitar")
+        assert plantilla.formas and all(plantilla.formas.values())
+        # una estructura no verificada no se arma con la plantilla (camino genérico)
+        parametros = (('Auth', auth), )
+        assert plantilla.armar(parametros, utils_ws.forma_soap(dict(parametros))) is None
+    finally:
+        ws.client.http = http
+
+
+def grabar_respuestas(simulador, ws):
+    "Grabar respuestas del simulador: aprobada, rechazada, con observaciones y errores"
+    grabadas = []
+    for nro, error in ((1, None), (5, None), (2, "error:10015")):
+        crear_factura(ws, nro)
+        if error:
+            simulador.Programar("FECAESolicitar", error)
+        ws.CAESolicitar()
+        grabadas.append(("FECAESolicitar", nro, ws.XmlResponse))
+    assert [ws.Resultado, ws.ErrCode] == ["", "10015"]
+    # aprobada con observaciones (mismo formato que el rechazo)
+    aprobada, rechazada = grabadas[0][2], grabadas[1][2]
+    observaciones = rechazada[rechazada.index(b"<Observaciones>"):
+                              rechazada.index(b"</Observaciones>") + len(b"</Observaciones>")]
+    grabadas.append(("FECAESolicitar", 1, aprobada.replace(b"<CAE>", observaciones + b"<CAE>")))
+    for nro in (1, 99):
+        ws.CompConsultar(TIPO_CBTE, PUNTO_VTA, nro)
+        grabadas.append(("FECompConsultar", nro, ws.XmlResponse))
+    return grabadas
+
+
+def procesar(ws, operacion, nro, xml):
+    "Procesar la respuesta grabada y devolver los valores que obtiene la interfaz"
+    ws.LoadTestXML(xml)
+    if operacion == "FECAESolicitar":
+        crear_factura(ws, nro)
+        ws.CAESolicitar()
+    else:
+        ws.CompConsultar(TIPO_CBTE, PUNTO_VTA, nro)
+    return [ws.Resultado, ws.CAE, ws.Vencimiento, ws.Obs, ws.ErrCode, ws.ErrMsg,
+            ws.CbteNro, ws.ImpTotal]
+
+
+def test_analisis_incremental_igual_generico(simulador, crear_ws):
+    "El análisis incremental devuelve lo mismo que unmarshall (con o sin plantilla)"
+    ws = crear_ws()
+    utils_ws = __import__(type(ws.client).__module__)
+    grabadas = grabar_respuestas(simulador, ws)
+    soap_ns = list(utils_ws.soap_namespaces.values())
+    for operacion, nro, xml in grabadas:
+        tipos = ws.client.get_operation(operacion)['output']
+        analizador = utils_ws.AnalizadorRespuesta(operacion, tipos)
+        valor = analizador.analizar(xml)
+        body = utils_ws.SimpleXMLElement(xml, namespace=ws.client.namespace)('Body', ns=soap_ns)
+        assert valor == body.children().unmarshall(tipos)
+        resultado = valor[operacion + "Response"][operacion + "Result"]
+        assert isinstance(resultado, utils_ws.RegistroSOAP)
+        analizador.verificar(valor, body.children())
+        assert analizador.valida
+        # la interfaz obtiene los mismos valores sin análisis incremental, con él
+        # (primera respuesta verificada y siguientes) y con o sin plantilla
+        ws.client.respuestas, ws.client.plantillas = (), ()
+        esperado = procesar(ws, operacion, nro, xml)
+        for plantillas in ((), (operacion, )):
+            utils_ws._analizadores.clear()
+            ws.client.respuestas, ws.client.plantillas = (operacion, ), plantillas
+            assert procesar(ws, operacion, nro, xml) == esperado
+            analizador = utils_ws.obtener_analizador(ws.client, operacion)
+            assert analizador.verificada and analizador.valida
+            assert procesar(ws, operacion, nro, xml) == esperado
+        assert esperado[0] or esperado[4]
+
+
+def test_wsdl_analizado_una_vez(simulador, tmp_path):
+    "Las conexiones siguientes reutilizan el WSDL ya analizado (sin descargarlo)"
+    wsdl = simulador.url + RUTA + "?WSDL"
+    utils_ws = __import__(benchmark.wsfev1.BaseWS.__module__)
+    utils_ws.limpiar_cache_wsdl()
+    clientes = [benchmark.wsfev1.WSFEv1() for i in range(3)]
+    for ws in clientes:
+        ws.LanzarExcepciones = False
+    assert clientes[0].Conectar(str(tmp_path), wsdl)
+    simulador.Detener()
+    assert clientes[1].Conectar(str(tmp_path), wsdl)
+    [servicio] = list(clientes[0].client.services)
+    puerto = list(clientes[0].client.services[servicio]['ports'])[0]
+    puertos = [ws.client.services[servicio]['ports'][puerto] for ws in clientes[:2]]
+    # cada instancia tiene su copia del puerto (las subclases cambian el location)
+    assert puertos[0] is not puertos[1]
+    assert puertos[0]['operations'] is puertos[1]['operations']
+    puertos[1]['location'] = "https://otro/servicio"
+    assert puertos[0]['location'] != puertos[1]['location']
+    utils_ws.limpiar_cache_wsdl()
+    assert not clientes[2].Conectar(str(tmp_path / "vacio"), wsdl)
+
+
+FORMATO_FIJO = [
+    ('tipo_reg', 1, utils.N), ('fecha_cbte', 8, utils.A), ('cbte_nro', 8, utils.N),
+    ('imp_total', 15, utils.I), ('cotizacion', 10, utils.I, 6), ('desc', 10, utils.A),
+]
+
+
+def test_formato_fijo_leer_escribir():
+    "Las líneas de ancho fijo se escriben y leen igual que antes (importes, fechas y nulos)"
+    dic = {'tipo_reg': 0, 'fecha_cbte': "2026-10-18", 'Cbte_nro': 12,
+           'imp_total': "-121.5", 'cotizacion': 1.5, 'desc': "a\nb"}
+    linea = utils.escribir(dic, FORMATO_FIJO, contraer_fechas=True)
+    assert linea == "02026101800000012-000000000121500001500000a\vb       \n"
+    assert utils.leer(linea, FORMATO_FIJO, expandir_fechas=True) == {
+        'tipo_reg': 0, 'fecha_cbte': "2026-10-18", 'cbte_nro': 12, 'imp_total': -121.5,
+        'cotizacion': 1.5, 'desc': "a\vb"}
+    # campos vacíos, nulos y líneas de versiones anteriores (más cortas)
+    assert utils.leer("0" + " " * 8 + "\x7f" * 8, FORMATO_FIJO) == {
+        'tipo_reg': 0, 'fecha_cbte': "", 'cbte_nro': None, 'imp_total': 0.0,
+        'cotizacion': 0.0, 'desc': ""}
+    # un valor más largo que el campo desplaza la línea (como las versiones previas)
+    formato = [('a', 3, utils.A), ('b', 2, utils.N)]
+    assert utils.escribir({'a': "abcde", 'b': 7}, formato) == "abc07  \n"
+
+
+def test_formato_fijo_compilado():
+    "El formato se analiza una vez y se vuelve a compilar si la lista cambia"
+    formato = list(FORMATO_FIJO)
+    compilado = utils.compilar_formato(formato)
+    assert utils.compilar_formato(formato) is compilado
+    assert compilado.longitud == 52
+    formato.append(('obs', 5, utils.A))
+    assert utils.compilar_formato(formato) is not compilado
+    dics = [{'tipo_reg': 1, 'cbte_nro': i, 'obs': "x"} for i in (1, 2)]
+    lineas = utils.compilar_formato(formato).escribir_lineas(dics)
+    assert [d['cbte_nro'] for d in
+            utils.compilar_formato(formato).leer_lineas(lineas.splitlines())] == [1, 2]
+
+
+class TablasPrueba(utils.BaseWS):
+    "Servicio con una tabla de parámetros que cuenta las consultas"
+    WSDL = "http://localhost/tablas?wsdl"
+    llamadas = 0
+    falla = False
+
+    @utils.cache_parametros
+    @utils.inicializar_y_capturar_excepciones
+    def ParamGetTiposIva(self, sep="|"):
+        TablasPrueba.llamadas += 1
+        if self.falla:
+            raise RuntimeError("sin conexion")
+        return ["3|0%|20090220|NULL", "5|21%|20090220|NULL", "9|2,5%|20140101|20141231"]
+
+
+def tablas(tmp_path, **kwargs):
+    ws = TablasPrueba()
+    ws.cache, ws.Cuit, ws.LanzarExcepciones = str(tmp_path), "20267565393", False
+    ws.__dict__.update(kwargs)
+    return ws
+
+
+def test_parametros_cache(tmp_path):
+    "La tabla se consulta una vez (memoria y disco) y se busca por código"
+    utils.limpiar_cache_parametros()
+    TablasPrueba.llamadas = 0
+    ws = tablas(tmp_path)
+    tabla = ws.ParamGetTiposIva()
+    assert ws.ParamGetTiposIva() is tabla and TablasPrueba.llamadas == 1
+    assert [p.name for p in tmp_path.iterdir()] == [os.path.basename(utils.archivo_parametros(ws))]
+    # otro proceso (sin tablas en memoria) la lee del archivo
+    utils.limpiar_cache_parametros()
+    ws = tablas(tmp_path)
+    assert ws.ParamGetTiposIva() == tabla and TablasPrueba.llamadas == 1
+    assert ws.BuscarParametro("ParamGetTiposIva", 5) == "21%"
+    assert ws.BuscarParametro("ParamGetTiposIva", 4) == ""
+    assert ws.ValidarParametro("ParamGetTiposIva", "5", "20240101")
+    assert not ws.ValidarParametro("ParamGetTiposIva", "5", "20080101")
+    assert not ws.ValidarParametro("ParamGetTiposIva", "9", "2015-01-01")
+    assert not ws.ValidarParametro("ParamGetTiposIva", "4", "20240101")
+    assert TablasPrueba.llamadas == 1
+    # sin TTL no se usa la cache
+    ws = tablas(tmp_path, ParametrosTTL=0)
+    ws.ParamGetTiposIva()
+    assert TablasPrueba.llamadas == 2
+
+
+def test_parametros_vencidos(tmp_path):
+    "Vencida la tabla se vuelve a consultar; si la consulta falla se usa la anterior"
+    utils.limpiar_cache_parametros()
+    TablasPrueba.llamadas = 0
+    ws = tablas(tmp_path, ParametrosTTL=0.1)
+    tabla = ws.ParamGetTiposIva()
+    time.sleep(0.2)
+    assert ws.ParamGetTiposIva() == tabla and TablasPrueba.llamadas == 2
+    time.sleep(0.2)
+    ws.falla = True
+    assert ws.ParamGetTiposIva() == tabla and TablasPrueba.llamadas == 3
+    assert "sin conexion" in ws.Excepcion and "vencidos" in ws.Log.getvalue()
+    # el refresco fuerza la consulta aunque la tabla esté vigente
+    ws = tablas(tmp_path)
+    assert ws.RefrescarParametros() == 1 and TablasPrueba.llamadas == 4
+    assert ws.RefrescarParametros(antiguedad=60) == 0 and TablasPrueba.llamadas == 4
@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la firma del TRA, la cache de tickets de acceso y el servicio local de TA"
+
+import base64
+import datetime
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+from pysimplesoap.client import SoapFault
+
+from pyafipws import utils, wsaa
+
+
+@pytest.fixture
+def credenciales(tmp_path):
+    crt, key = tmp_path / "prueba.crt", tmp_path / "prueba.key"
+    crt.write_text("certificado")
+    key.write_text("clave")
+    wsaa.limpiar_cache_ta()
+    yield str(crt), str(key), str(tmp_path)
+    wsaa.limpiar_cache_ta()
+
+
+def entrada_ta(expiracion, token="token"):
+    return {'ta': "<ta/>", 'xml': None, 'token': token, 'sign': "sign",
+            'expiration_time': "", 'expiracion': expiracion}
+
+
+@pytest.fixture
+def login(monkeypatch):
+    "Reemplazar el TRA, la firma y la llamada a WSAA (contando las solicitudes)"
+    llamadas = []
+
+    def LoginCMS(self, cms):
+        llamadas.append(cms)
+        raise SoapFault("ns1:coe.alreadyAuthenticated",
+                        "El CEE ya posee un TA valido para el acceso al WSN solicitado")
+
+    monkeypatch.setattr(wsaa.WSAA, "CreateTRA", lambda self, service, ttl: "<tra/>")
+    monkeypatch.setattr(wsaa.WSAA, "SignTRA", lambda self, tra, crt, key, passphrase="": "cms")
+    monkeypatch.setattr(wsaa.WSAA, "Conectar", lambda self, *args, **kwargs: True)
+    monkeypatch.setattr(wsaa.WSAA, "LoginCMS", LoginCMS)
+    return llamadas
+
+
+def test_renovacion_fallida_no_se_reintenta(credenciales, login):
+    "alreadyAuthenticated: usar el TA vigente sin volver a llamar a WSAA hasta que expire"
+    crt, key, cache = credenciales
+    wsaa._ta_cache[("wsfe", crt, key)] = entrada_ta(time.time() + 120)
+    for i in range(5):
+        assert wsaa.WSAA().Autenticar("wsfe", crt, key, cache=cache)
+    assert len(login) == 1
+
+
+def test_renovacion_fallida_espera(credenciales, login, monkeypatch):
+    "Otros errores: esperar DEFAULT_REINTENTO antes de volver a intentar"
+    crt, key, cache = credenciales
+    monkeypatch.setattr(wsaa.WSAA, "LoginCMS", lambda self, cms: login.append(cms) or "")
+    wsaa._ta_cache[("wsfe", crt, key)] = entrada_ta(time.time() + 120)
+    ws = wsaa.WSAA()
+    assert ws.Autenticar("wsfe", crt, key, cache=cache)
+    assert ws.Autenticar("wsfe", crt, key, cache=cache)
+    assert len(login) == 1
+    entrada = wsaa._ta_cache[("wsfe", crt, key)]
+    monkeypatch.setitem(entrada, 'reintento', time.time() - 1)
+    assert ws.Autenticar("wsfe", crt, key, cache=cache)
+    assert len(login) == 2
+
+
+def test_ta_expirado_se_solicita(credenciales, login):
+    crt, key, cache = credenciales
+    wsaa._ta_cache[("wsfe", crt, key)] = dict(entrada_ta(time.time() - 1), reintento=time.time() + 60)
+    assert not wsaa.WSAA().Autenticar("wsfe", crt, key, cache=cache)
+    assert len(login) == 1
+
+
+@pytest.fixture
+def broker(credenciales):
+    crt, key, cache = credenciales
+    broker = wsaa.BrokerTA(cache=cache, intervalo=3600)
+    broker.Agregar("20267565393", crt, key, "wsfe")
+    wsaa._ta_cache[("wsfe", crt, key)] = entrada_ta(time.time() + 3600)
+    yield broker
+    broker.Detener()
+
+
+@pytest.mark.skipif(wsaa.ServidorTAUnix is None, reason="sin sockets de dominio Unix")
+def test_broker_unix_permisos(broker, tmp_path):
+    "El socket se crea solo accesible por el usuario del servicio"
+    ruta = str(tmp_path / "wsaa.sock")
+    broker.Iniciar("unix:" + ruta)
+    assert os.stat(ruta).st_mode & 0o777 == 0o600
+    ta = utils.consultar_broker("unix:" + ruta, "/ta?servicio=wsfe")
+    assert ta['token'] == "token"
+
+
+def test_broker_http_requiere_clave(broker):
+    with pytest.raises(ValueError):
+        broker.Iniciar("http://127.0.0.1:0")
+    servidor = broker.Iniciar("http://:secreto@127.0.0.1:0")
+    direccion = "127.0.0.1:%d" % servidor.server_address[1]
+    for clave in ("", ":otra@"):
+        with pytest.raises(RuntimeError) as error:
+            utils.consultar_broker("http://%s%s" % (clave, direccion), "/ta?servicio=wsfe")
+        assert "Clave incorrecta" in str(error.value)
+    ta = utils.consultar_broker("http://:secreto@" + direccion, "/ta?servicio=wsfe")
+    assert ta['token'] == "token"
+
+
+@pytest.fixture
+def certificado(tmp_path):
+    "Clave RSA y certificado autofirmado (PEM) para probar la firma del TRA"
+    x509 = pytest.importorskip("cryptography.x509")
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    clave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nombre = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, "pyafipws")])
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(nombre).issuer_name(nombre)
+            .public_key(clave.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(ahora).not_valid_after(ahora + datetime.timedelta(days=1))
+            .sign(clave, hashes.SHA256()))
+    crt, key, key_enc = tmp_path / "prueba.crt", tmp_path / "prueba.key", tmp_path / "encriptada.key"
+    crt.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key.write_bytes(clave.private_bytes(serialization.Encoding.PEM,
+                                        serialization.PrivateFormat.TraditionalOpenSSL,
+                                        serialization.NoEncryption()))
+    key_enc.write_bytes(clave.private_bytes(serialization.Encoding.PEM,
+                                            serialization.PrivateFormat.PKCS8,
+                                            serialization.BestAvailableEncryption(b"secreto")))
+    wsaa.limpiar_firmantes()
+    yield str(crt), str(key), str(key_enc)
+    wsaa.limpiar_firmantes()
+
+
+def verificar_cms(cms, crt):
+    "Devolver el contenido firmado, verificando la firma con openssl"
+    proceso = subprocess.run(["openssl", "cms", "-verify", "-inform", "DER",
+                              "-CAfile", crt, "-purpose", "any"],
+                             input=base64.b64decode(cms), capture_output=True)
+    assert proceso.returncode == 0, proceso.stderr
+    return proceso.stdout
+
+
+@pytest.mark.skipif(not shutil.which("openssl"), reason="sin ejecutable openssl")
+@pytest.mark.parametrize("backend", ["cryptography", "python", "openssl"])
+def test_firma_backends(certificado, backend):
+    "Todas las implementaciones generan un CMS válido con el TRA"
+    crt, key, key_enc = certificado
+    tra = b"<loginTicketRequest version=\"1.0\"><service>wsfe</service></loginTicketRequest>"
+    firmante = wsaa.Firmante(crt, key, backend=backend)
+    assert verificar_cms(firmante.firmar(tra), crt) == tra
+    if backend != "python":
+        firmante = wsaa.Firmante(crt, key_enc, "secreto", backend=backend)
+        assert verificar_cms(firmante.firmar(tra), crt) == tra
+    else:
+        with pytest.raises(RuntimeError):
+            wsaa.Firmante(crt, key_enc, "secreto", backend=backend)
+
+
+def test_firmantes_en_cache(certificado, monkeypatch):
+    "El firmante se reutiliza hasta que cambian los archivos (con límite LRU)"
+    crt, key, key_enc = certificado
+    firmante = wsaa.obtener_firmante(crt, key)
+    assert wsaa.obtener_firmante(crt, key) is firmante
+    with open(crt) as f:
+        pem = f.read()
+    assert wsaa.obtener_firmante(pem, key) is not firmante
+    assert wsaa.obtener_firmante(pem, key) is wsaa.obtener_firmante(pem, key)
+    assert wsaa.obtener_firmante(crt, key_enc, "secreto") is not firmante
+    # archivo renovado: se vuelve a cargar
+    os.utime(key, (0, os.path.getmtime(key) + 10))
+    renovado = wsaa.obtener_firmante(crt, key)
+    assert renovado is not firmante
+    monkeypatch.setattr(wsaa, "FIRMANTES_MAX", 2)
+    wsaa.obtener_firmante(crt, key_enc, "secreto")
+    wsaa.obtener_firmante(pem, key)
+    assert len(wsaa._firmantes) == 2 and renovado not in wsaa._firmantes.values()
+    with pytest.raises(RuntimeError):
+        wsaa.obtener_firmante(crt + ".no", key)
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la constatación por lotes de WSCDC (hilos, repetidos y diario)"
+
+import pytest
+
+from pyafipws import lote, wscdc
+
+
+def comprobantes(cantidad, leidos):
+    for nro in range(1, cantidad + 1):
+        leidos.append(nro)
+        yield {'cbte_modo': "CAE", 'cuit_emisor': "20267565393", 'pto_vta': 4002,
+               'cbte_tipo': 1, 'cbte_nro': nro, 'cbte_fch': "20260101",
+               'imp_total': "121.00", 'cod_autorizacion': "61123022925855",
+               'doc_tipo_receptor': 80, 'doc_nro_receptor': "30628789661"}
+
+
+def test_constatar_lote_repetidos(tmp_path):
+    "Los resultados se devuelven en el orden de entrada y los repetidos se consultan una vez"
+    diario = lote.Diario(str(tmp_path / "diario.jsonl"))
+    leidos = []
+    cbtes = list(comprobantes(5, leidos))
+    resultados, estadisticas = wscdc.constatar_lote(wscdc.WSCDC, cbtes + cbtes[:2],
+                                                    hilos=2, diario=diario)
+    assert [r['cbte_nro'] for r in resultados] == [1, 2, 3, 4, 5, 1, 2]
+    assert all([r['resultado'] == "" and r['err_msg'] for r in resultados])
+    assert estadisticas.leidos == 7 and estadisticas.duplicados == 2
+    assert len(diario.entradas) == 5
+
+
+def test_constatar_lote_error_en_hilo(tmp_path, monkeypatch):
+    "Si un hilo falla (ej. al grabar el diario) se deja de leer y se relanza el error"
+    monkeypatch.setattr(wscdc, "COLA_MAX", 2)
+    diario = lote.Diario(str(tmp_path / "diario.jsonl"))
+    diario._f.close()
+    leidos = []
+    with pytest.raises(ValueError):
+        wscdc.constatar_lote(wscdc.WSCDC, comprobantes(1000, leidos), hilos=2, diario=diario)
+    assert len(leidos) < 1000
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de autorización en lotes de WSFEv1 contra el simulador"
+
+import datetime
+
+from pyafipws import benchmark
+from pyafipws.benchmark import TIPO_CBTE, PUNTO_VTA
+
+
+def agregar_facturas(ws, cantidad):
+    fecha = datetime.date.today().strftime("%Y%m%d")
+    ws.IniciarFacturasX()
+    for i in range(cantidad):
+        benchmark.rece1.crear_factura(ws, benchmark.factura(PUNTO_VTA, 0, fecha))
+        ws.AgregarFacturaX()
+
+
+def test_lote(simulador, crear_ws):
+    ws = crear_ws()
+    agregar_facturas(ws, 12)
+    assert ws.CAESolicitarLote(cant_max=5) == 12
+    assert [f['cbt_desde'] for f in ws.facturas] == list(range(1, 13))
+    assert simulador.Estado()["FECAESolicitar"] == 3
+
+
+def test_lote_sin_respuesta_reconciliado(simulador, crear_ws):
+    "El lote autorizado sin respuesta se verifica antes de numerar el siguiente"
+    ws = crear_ws()
+    agregar_facturas(ws, 12)
+    simulador.Programar("FECAESolicitar", "perdida")
+    assert ws.CAESolicitarLote(cant_max=5) == 12
+    assert [f['cbt_desde'] for f in ws.facturas] == list(range(1, 13))
+    assert all([f['resultado'] == 'A' and f['cae'] for f in ws.facturas])
+    assert simulador.Estado()["FECAESolicitar"] == 3
+    assert simulador.Ultimo('wsfev1', benchmark.CUIT, TIPO_CBTE, PUNTO_VTA) == 12
+
+
+def test_lote_no_autorizado_renumera(simulador, crear_ws):
+    "Un lote que no llegó a procesarse no deja huecos en la numeración"
+    ws = crear_ws()
+    agregar_facturas(ws, 12)
+    simulador.Programar("FECAESolicitar", None, "timeout")
+    assert ws.CAESolicitarLote(cant_max=5) == 7
+    assert [bool(f['cae']) for f in ws.facturas] == [True] * 5 + [False] * 5 + [True] * 2
+    assert [f['cbt_desde'] for f in ws.facturas][10:] == [6, 7]
+
+
+def test_lote_resultado_desconocido(simulador, crear_ws):
+    "Si no se puede verificar el lote sin respuesta, no se envían los siguientes"
+    ws = crear_ws()
+    agregar_facturas(ws, 12)
+    simulador.Programar("FECAESolicitar", "perdida")
+    simulador.Programar("FECompUltimoAutorizado", None, "http")
+    assert ws.CAESolicitarLote(cant_max=5) == 0
+    assert "Resultado desconocido" in ws.Excepcion
+    assert simulador.Estado()["FECAESolicitar"] == 1
+    assert all([f['resultado'] == "" for f in ws.facturas])
@@ -17,21 +17,37 @@ __copyright__ = "Copyright (C) 2013 Mariano Reingart"
 __license__ = "GPL 3.0"
 
 from io import IOBase
+import asyncio
+import base64
+import collections
+import collections.abc
+import copy
 import datetime
 import functools
+import hashlib
 import inspect
 import locale
+import pickle
+import re
+import select
 import socket
+import ssl
 import sys
 import os
 import stat
+import tempfile
+import threading
 import time
 import traceback
+import types
 import warnings
+import xml.dom.minidom
+import xml.parsers.expat
 from io import StringIO
 from decimal import Decimal
 from urllib.parse import urlencode
 from urllib.parse import urlparse
+import http.client
 import unicodedata
 import mimetypes
 from email.generator import _make_boundary
@@ -39,9 +55,18 @@ from html.parser import HTMLParser
 from http.cookies import SimpleCookie
 from configparser import SafeConfigParser
 
+import pysimplesoap
+import pysimplesoap.transport
 from pysimplesoap.client import SimpleXMLElement, SoapClient, SoapFault, parse_proxy, set_http_wrapper
+from pysimplesoap.client import soap_namespaces
+from pysimplesoap.helpers import TYPE_MARSHAL_FN, TYPE_UNMARSHAL_FN
 from pkg_resources import parse_version
 
+try:
+    from .comprobante import Registro, a_dict
+except ImportError:
+    from comprobante import Registro, a_dict
+
 try:
     import json
 except ImportError:
@@ -55,6 +80,10 @@ import httplib2
 
 DEBUG = False
 
+# Parámetros del transporte HTTP con conexiones persistentes (wrapper="pool")
+HTTP_POOL_MAX = 4       # conexiones inactivas a conservar por servidor
+HTTP_POOL_IDLE = 60     # segundos de inactividad antes de descartarlas
+
 
 # Funciones para manejo de errores:
 
@@ -184,9 +213,809 @@ def inicializar_y_capturar_excepciones_simple(func):
     return capturar_errores_wrapper
 
 
+# Registro de descripciones de servicios (WSDL) analizadas y corregidas,
+# compartido por todas las instancias del proceso (ver BaseWS.Conectar)
+_wsdl_cache = {}
+_wsdl_cache_lock = threading.Lock()
+
+
+def obtener_wsdl(wsdl, cache=None, ns=None, proxy=None, cacert=None, timeout=30):
+    "Devolver la descripción del servicio (analizándola solo la primera vez)"
+    clave = (wsdl, ns, getattr(pysimplesoap, "__version__", ""))
+    wsdl_desc = _wsdl_cache.get(clave)
+    if wsdl_desc is None:
+        with _wsdl_cache_lock:
+            wsdl_desc = _wsdl_cache.get(clave)
+            if wsdl_desc is None:
+                client = SoapClient(wsdl=wsdl, cache=cache, proxy=proxy,
+                                    cacert=cacert, timeout=timeout, ns=ns)
+                corregir_ubicacion(client.services, wsdl)
+                wsdl_desc = _wsdl_cache[clave] = {
+                    'services': client.services,
+                    'namespace': client.namespace,
+                    'documentation': getattr(client, "documentation", {}),
+                    'wsdl_basedir': client.wsdl_basedir,
+                    }
+    return wsdl_desc
+
+
+def corregir_ubicacion(services, wsdl):
+    "Corregir ubicación del servidor (puerto http 80 en el WSDL AFIP)"
+    for service in list(services.values()):
+        for port in list(service['ports'].values()):
+            location = port['location']
+            if location and location.startswith("http://"):
+                warnings.warn("Corrigiendo WSDL ... %s" % location)
+                location = location.replace("http://", "https://").replace(":80", ":443")
+                # usar servidor real si en el WSDL figura "localhost"
+                localhost = 'https://localhost:'
+                if location.startswith(localhost):
+                    url = urlparse(wsdl)
+                    location = location.replace("localhost", url.hostname)
+                    location = location.replace(":9051", ":443")
+                port['location'] = location
+
+
+def copiar_servicios(services):
+    "Copiar servicios y puertos (las subclases pueden modificar el location)"
+    copia = {}
+    for nombre, service in services.items():
+        ports = dict([(puerto, dict(port)) for puerto, port in service['ports'].items()])
+        copia[nombre] = dict(service, ports=ports)
+    return copia
+
+
+def limpiar_cache_wsdl():
+    "Descartar las descripciones de servicios analizadas (ej. cambio de WSDL)"
+    with _wsdl_cache_lock:
+        _wsdl_cache.clear()
+
+
+# Plantillas precompiladas de los requerimientos SOAP más frecuentes (ej.
+# FECAESolicitar): el sobre y las etiquetas de cada elemento se obtienen del
+# XML generado por pysimplesoap (la primera vez que aparece cada elemento) y
+# luego solo se completan los valores escapados, sin armar el árbol DOM.
+# Cada vez que se aprende un elemento nuevo se compara la plantilla contra el
+# XML genérico: si no coinciden exactamente, se usa siempre el camino genérico
+
+PLANTILLAS_SOAP = True
+ANALISIS_INCREMENTAL = True     # ver AnalizadorRespuesta
+_plantillas_soap = {}
+_analizadores = {}
+_registros_soap = {}        # id(tipos): (tipos, clase del registro)
+_plantillas_soap_lock = threading.Lock()
+
+
+def escapar_xml(texto):
+    "Escapar el texto igual que minidom (&, <, comillas y >)"
+    return texto.replace("&", "&amp;").replace("<", "&lt;"). \
+        replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def forma_soap(valor):
+    "Estructura de los parámetros: claves (en orden), elementos vacíos y tipos"
+    if isinstance(valor, dict):
+        return tuple([(k, forma_soap(v)) for k, v in valor.items()])
+    elif isinstance(valor, list):
+        # los ítems repetidos con la misma estructura no generan una forma nueva
+        return (list, tuple(dict.fromkeys([forma_soap(item) for item in valor])))
+    return type(valor).__name__
+
+
+class PlantillaSOAP:
+    "Sobre SOAP precompilado para un método (etiquetas por ruta de elementos)"
+
+    # cada forma de los parámetros (ver forma_soap) se arma con la plantilla
+    # solo si al aprenderla coincidió con el camino genérico: el marshall puede
+    # reordenar u omitir elementos según el WSDL, por lo que una estructura
+    # distinta (otro orden de claves, elementos ausentes) usa el genérico
+
+    def __init__(self, metodo):
+        self.metodo = metodo
+        self.prefijo = self.sufijo = None
+        self.etiquetas = {}         # ruta: (apertura, cierre, vacía)
+        self.formas = {}            # forma de los parámetros: válida (bool)
+        self._lock = threading.Lock()
+
+    def armar(self, parametros, forma=None):
+        "Devolver el XML del requerimiento (None si la forma no fue verificada)"
+        if self.prefijo is None or not self.formas.get(forma):
+            return None
+        return self._armar_sobre(parametros)
+
+    def _armar_sobre(self, parametros):
+        partes = [self.prefijo]
+        for clave, valor in parametros:
+            if not self._armar(partes, (clave, ), valor):
+                return None
+        partes.append(self.sufijo)
+        return "".join(partes).encode("utf8")
+
+    def _armar(self, partes, ruta, valor):
+        etiquetas = self.etiquetas.get(ruta)
+        if etiquetas is None:
+            return False
+        apertura, cierre, vacia = etiquetas
+        if isinstance(valor, dict):
+            if not valor:
+                partes.append(vacia)
+                return True
+            partes.append(apertura)
+            for clave, v in valor.items():
+                if not self._armar(partes, ruta + (clave, ), v):
+                    return False
+        elif isinstance(valor, list):
+            if not valor:
+                partes.append(vacia)
+                return True
+            partes.append(apertura)
+            for item in valor:
+                # solo listas de {etiqueta: valor} (no arreglos "jetty")
+                if not isinstance(item, dict) or len(item) != 1:
+                    return False
+                for clave, v in item.items():
+                    if not self._armar(partes, ruta + (clave, ), v):
+                        return False
+        elif valor is None:
+            partes.append(vacia)
+            return True
+        elif isinstance(valor, str):
+            partes.append(apertura)
+            partes.append(escapar_xml(valor))
+        elif isinstance(valor, (tuple, type, xml.dom.minidom.Node)):
+            return False
+        else:
+            partes.append(apertura)
+            partes.append(escapar_xml(TYPE_MARSHAL_FN.get(type(valor), str)(valor)))
+        partes.append(cierre)
+        return True
+
+    def aprender(self, parametros, xml_request, forma=None):
+        "Incorporar las etiquetas del XML generado por el camino genérico"
+        with self._lock:
+            if forma in self.formas:
+                return
+            valida = False
+            try:
+                dom = xml.dom.minidom.parseString(xml_request)
+                body = [nodo for nodo in self._hijos(dom.documentElement)
+                        if nodo.localName == "Body"][0]
+                nodo_metodo = self._hijos(body)[0]
+                hijos = self._hijos(nodo_metodo)
+                parametros = list(parametros)
+                if len(hijos) != len(parametros):
+                    raise ValueError("Cantidad de parametros no coincide")
+                for nodo, (clave, valor) in zip(hijos, parametros):
+                    self._aprender(nodo, (clave, ), valor)
+                if self.prefijo is None:
+                    # reemplazar los parámetros por una marca para separar el sobre
+                    for nodo in hijos:
+                        nodo_metodo.removeChild(nodo)
+                    nodo_metodo.appendChild(dom.createTextNode("\0"))
+                    sobre = dom.toxml("UTF-8").decode("utf8")
+                    self.prefijo, self.sufijo = sobre.split("\0")
+                valida = self._armar_sobre(parametros) == xml_request
+            except Exception:
+                valida = False
+            self.formas[forma] = valida
+            if not valida:
+                warnings.warn("Plantilla SOAP deshabilitada para %s (estructura de "
+                              "parametros no soportada)" % self.metodo)
+
+    def _aprender(self, nodo, ruta, valor):
+        nombre = nodo.tagName
+        atributos = "".join([' %s="%s"' % (k, escapar_xml(v))
+                             for k, v in nodo.attributes.items()])
+        etiquetas = ("<%s%s>" % (nombre, atributos), "</%s>" % nombre,
+                     "<%s%s/>" % (nombre, atributos))
+        if self.etiquetas.setdefault(ruta, etiquetas) != etiquetas:
+            # no modificar las etiquetas de las formas ya verificadas
+            raise ValueError("Etiqueta distinta en %s" % nombre)
+        if isinstance(valor, dict):
+            items = list(valor.items())
+        elif isinstance(valor, list):
+            items = [list(item.items())[0] for item in valor
+                     if isinstance(item, dict) and len(item) == 1]
+        else:
+            return
+        hijos = self._hijos(nodo)
+        if len(hijos) != len(items):
+            raise ValueError("Estructura no soportada en %s" % nombre)
+        for hijo, (clave, v) in zip(hijos, items):
+            self._aprender(hijo, ruta + (clave, ), v)
+
+    @staticmethod
+    def _hijos(nodo):
+        return [hijo for hijo in nodo.childNodes
+                if hijo.nodeType == hijo.ELEMENT_NODE]
+
+
+def obtener_plantilla(client, metodo):
+    "Devolver la plantilla del método para el espacio de nombres del cliente"
+    clave = (client.namespace, metodo, client.qualified,
+             client._SoapClient__soap_ns, client._SoapClient__ns,
+             client._SoapClient__soap_server)
+    plantilla = _plantillas_soap.get(clave)
+    if plantilla is None:
+        with _plantillas_soap_lock:
+            plantilla = _plantillas_soap.setdefault(clave, PlantillaSOAP(metodo))
+    return plantilla
+
+
+def limpiar_plantillas_soap():
+    "Descartar las plantillas aprendidas (ej. actualización de pysimplesoap)"
+    with _plantillas_soap_lock:
+        _plantillas_soap.clear()
+
+
+class SobreArmado(BaseException):
+    "Requerimiento armado por el camino genérico (interrumpe el envío)"
+
+
+class NoSoportado(Exception):
+    "Estructura de la respuesta no contemplada por el análisis incremental"
+
+
+class RegistroSOAP(Registro):
+    "Registro de un tipo complejo de la respuesta (campos según el WSDL)"
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        # las clases se crean al vuelo: se serializa como diccionario
+        return (dict, (a_dict(self), ))
+
+
+def registro_soap(tipos, nombre="Registro"):
+    "Devolver la clase (con __slots__) para los elementos de un tipo complejo"
+    try:
+        tipos_, clase = _registros_soap[id(tipos)]
+        if tipos_ is tipos:
+            return clase
+    except KeyError:
+        pass
+    slots = tuple([k for k in tipos if isinstance(k, str) and k.isidentifier()
+                   and not hasattr(RegistroSOAP, k)])
+    clase = type(str(nombre), (RegistroSOAP, ), {"__slots__": slots})
+    with _plantillas_soap_lock:
+        _registros_soap[id(tipos)] = (tipos, clase)
+    return clase
+
+
+class AnalizadorRespuesta:
+    "Análisis incremental (expat) de la respuesta SOAP según los tipos del WSDL"
+
+    # Convierte el XML directamente en los valores y listas que devuelve
+    # SimpleXMLElement.unmarshall (mismas reglas y conversiones de tipos), sin
+    # armar el árbol DOM; los tipos complejos se guardan en registros compactos
+    # (__slots__ por tipo del WSDL) que se comparan igual que un dict. Ante cualquier estructura no contemplada (SOAP Fault,
+    # multiRef, arreglos codificados, etc.) se usa el camino genérico. La
+    # primera respuesta de cada operación se compara contra el camino genérico
+
+    def __init__(self, operacion, tipos):
+        self.operacion = operacion
+        self.tipos = tipos
+        self.valida = True
+        self.verificada = False
+
+    def analizar(self, xml_response, strict=True):
+        "Devolver el valor (como unmarshall del Body) o None si no está soportado"
+        if not self.valida:
+            return None
+        analisis = _Analisis(self.tipos)
+        parser = xml.parsers.expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = analisis.inicio
+        parser.EndElementHandler = analisis.fin
+        parser.CharacterDataHandler = analisis.texto
+        try:
+            parser.Parse(xml_response, True)
+        except Exception:
+            return None
+        return analisis.body or None
+
+    def verificar(self, valor, body, strict=True):
+        "Comparar el valor contra el camino genérico (unmarshall del Body)"
+        try:
+            self.valida = valor == body.unmarshall(self.tipos, strict=strict)
+        except Exception:
+            self.valida = False
+        self.verificada = True
+        if not self.valida:
+            warnings.warn("Analisis incremental deshabilitado para %s" % self.operacion)
+
+
+class _Analisis:
+    "Estado del análisis de una respuesta (marcos: tipo, tipos, destino, clave, texto)"
+
+    def __init__(self, tipos):
+        self.tipos = tipos
+        self.pila = []
+        self.body = None
+
+    def inicio(self, nombre, atributos):
+        nombre = nombre.rpartition(":")[2]
+        for atributo in atributos:
+            if not atributo.startswith("xmlns") and atributo != "xsi:nil":
+                raise NoSoportado(atributo)
+        pila = self.pila
+        if not pila:
+            if self.body is not None:
+                raise NoSoportado(nombre)
+            if nombre == "Body":
+                # marco inicial: los hijos del Body se analizan con los tipos del WSDL
+                self.body = {}
+                pila.append(["dict", self.tipos, self.body, None, None])
+            return
+        tipo, tipos, destino = pila[-1][:3]
+        if tipo == "simple" or nombre == "Fault":
+            raise NoSoportado(nombre)
+        if tipo == "simples":
+            # arreglo de valores simples: cada hijo es un valor
+            pila[-1][3] = True
+            pila.append(["simple", tipos, destino, nombre, []])
+            return
+        if tipo == "lista":
+            # arreglo: cada hijo es un ítem {etiqueta: valor}
+            pila[-1][3] = True
+            item = registro_soap(tipos, "Item")()
+            destino.append(item)
+            destino = item
+        try:
+            fn = tipos[nombre]
+        except (KeyError, TypeError):
+            fn = NoSoportado        # etiqueta desconocida (xsi:type, any, etc.)
+        if isinstance(fn, list) and fn:
+            valor = destino.setdefault(nombre, [])
+            if not isinstance(valor, list):
+                raise NoSoportado(nombre)
+            if not isinstance(fn[0], dict):
+                pila.append(["simples", fn[0], valor, False, None])
+            elif len(fn[0]) > 1:
+                # arreglo estilo "jetty": cada elemento es un ítem
+                item = registro_soap(fn[0], nombre)()
+                valor.append(item)
+                pila.append(["dict", fn[0], item, None, None])
+            else:
+                pila.append(["lista", fn[0], valor, False, None])
+        elif isinstance(fn, dict):
+            pila.append(["dict", fn, registro_soap(fn, nombre)(), (destino, nombre), None])
+        elif fn is NoSoportado or fn is None or isinstance(fn, (list, tuple)):
+            raise NoSoportado(nombre)
+        else:
+            pila.append(["simple", fn, destino, nombre, []])
+
+    def texto(self, datos):
+        if self.pila and self.pila[-1][0] == "simple":
+            self.pila[-1][4].append(datos)
+
+    def fin(self, nombre):
+        if not self.pila:
+            return
+        tipo, fn, destino, clave, texto = self.pila.pop()
+        if tipo == "simple":
+            texto = "".join(texto)
+            if texto:
+                fn = TYPE_UNMARSHAL_FN.get(fn, fn)
+                valor = texto if fn == str else fn(texto)
+            else:
+                valor = None
+            if isinstance(destino, list):
+                destino.append(valor)
+            else:
+                destino[clave] = valor
+        elif tipo == "dict" and clave:
+            # sin elementos hijos unmarshall devuelve None (no un dict vacío)
+            clave[0][clave[1]] = destino or None
+        elif tipo in ("lista", "simples") and not clave:
+            raise NoSoportado(nombre)       # arreglo vacío (unmarshall lo trata distinto)
+
+
+class RespuestaAnalizada:
+    "Respuesta ya analizada (mismo uso que SimpleXMLElement en wsdl_call_with_args)"
+
+    def __init__(self, valor):
+        self.valor = valor
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def children(self):
+        return self
+
+    def unmarshall(self, types, strict=True):
+        return self.valor
+
+
+def obtener_analizador(client, operacion):
+    "Devolver el analizador de la respuesta de la operación (según el WSDL)"
+    tipos = client.get_operation(operacion)['output']
+    clave = (client.namespace, operacion)
+    analizador = _analizadores.get(clave)
+    if analizador is None or analizador.tipos is not tipos:
+        with _plantillas_soap_lock:
+            analizador = _analizadores[clave] = AnalizadorRespuesta(operacion, tipos)
+    return analizador
+
+
+class SoapClientPlantillas(SoapClient):
+    "Cliente SOAP que arma las operaciones frecuentes con plantillas precompiladas"
+
+    plantillas = ()         # operaciones habilitadas (ver BaseWS.PlantillasSOAP)
+    respuestas = ()         # análisis incremental (ver BaseWS.RespuestasSOAP)
+    operacion = None
+    _solo_armar = False     # camino genérico solo para armar el requerimiento
+
+    def wsdl_call_with_args(self, method, args, kwargs):
+        self.operacion = method
+        try:
+            return SoapClient.wsdl_call_with_args(self, method, args, kwargs)
+        finally:
+            self.operacion = None
+
+    def send(self, method, xml):
+        if self._solo_armar:
+            raise SobreArmado()
+        return SoapClient.send(self, method, xml)
+
+    def _armar_generico(self, method, args):
+        "Armar el requerimiento con el camino genérico (marshall) sin enviarlo"
+        self._solo_armar = True
+        try:
+            SoapClient.call(self, method, *args)
+        except SobreArmado:
+            return self.xml_request
+        finally:
+            self._solo_armar = False
+
+    def call(self, method, *args, **kwargs):
+        plantilla = PLANTILLAS_SOAP and self.operacion in self.plantillas
+        analisis = ANALISIS_INCREMENTAL and self.operacion in self.respuestas
+        if not (plantilla or analisis) or kwargs or \
+           self.plugins or self._SoapClient__call_headers or \
+           self._SoapClient__headers or not self.services or \
+           (args and isinstance(args[0], SimpleXMLElement)):
+            return SoapClient.call(self, method, *args, **kwargs)
+        xml_request = None
+        if plantilla:
+            plantilla = obtener_plantilla(self, method)
+            forma = forma_soap(dict(args))
+            xml_request = plantilla.armar(args, forma)
+        if xml_request is None:
+            # camino genérico (marshall), aprendiendo la nueva forma de los parámetros
+            # (la respuesta se procesa igual, con o sin plantilla)
+            xml_request = self._armar_generico(method, args)
+            if plantilla and forma not in plantilla.formas:
+                plantilla.aprender(args, xml_request, forma)
+        self.xml_request = xml_request
+        self.xml_response = self.send(method, xml_request)
+        analizador = valor = None
+        if analisis:
+            analizador = obtener_analizador(self, self.operacion)
+            valor = analizador.analizar(self.xml_response, self.strict)
+            if valor is not None and analizador.verificada:
+                return RespuestaAnalizada(valor)
+        # mismo procesamiento de la respuesta que SoapClient.call
+        soap_ns = list(soap_namespaces.values())
+        response = SimpleXMLElement(self.xml_response, namespace=self.namespace,
+                                    jetty=self._SoapClient__soap_server in ('jetty',))
+        if self.exceptions and response("Fault", ns=soap_ns, error=False):
+            detail_xml = response("detail", ns=soap_ns, error=False)
+            detail = None
+            if detail_xml and detail_xml.children():
+                operation = self.get_operation(method)
+                fault_name = detail_xml.children()[0].get_name()
+                fault = operation['faults'].get(fault_name) or str
+                detail = detail_xml.children()[0].unmarshall(fault, strict=False)
+            raise SoapFault(str(response.faultcode), str(response.faultstring), detail)
+        if valor is not None:
+            # primera respuesta: comparar contra el camino genérico
+            body = response('Body', ns=soap_namespaces[self._SoapClient__soap_ns])
+            analizador.verificar(valor, body.children(), self.strict)
+        return response
+
+
+def benchmark_plantillas(ws, metodo, cantidad=1000, **kwargs):
+    "Comparar sobres por segundo armados con la plantilla y con el camino genérico"
+    ret = {"metodo": metodo, "cantidad": cantidad}
+    http = ws.client.http
+    plantillas = ws.client.plantillas
+    try:
+        for nombre, habilitadas in (("generico", ()), ("plantilla", (metodo, ))):
+            ws.client.plantillas = habilitadas
+            xmls = set()
+            t0 = time.time()
+            for i in range(cantidad + 1):
+                if i == 1:
+                    t0 = time.time()    # excluir el primer armado (aprendizaje)
+                ws.client.http = TransporteDiferido([])
+                try:
+                    getattr(ws.client, metodo)(**kwargs)
+                except SolicitudDiferida as e:
+                    xmls.add(e.args[2])
+            segundos = time.time() - t0
+            ret[nombre] = {"segundos": segundos,
+                           "sobres_por_segundo": cantidad / segundos if segundos else 0}
+            ret[nombre + "_xml"] = xmls.pop() if len(xmls) == 1 else None
+    finally:
+        ws.client.http = http
+        ws.client.plantillas = plantillas
+    generico, plantilla = ret.pop("generico_xml"), ret.pop("plantilla_xml")
+    ret["identicos"] = generico is not None and generico == plantilla
+    ret["aceleracion"] = ret["generico"]["segundos"] / (ret["plantilla"]["segundos"] or 1e-9)
+    return ret
+
+
+def benchmark_respuestas(ws, metodo, xml, cantidad=100, **kwargs):
+    "Comparar el análisis incremental contra el genérico con una respuesta grabada"
+    import tracemalloc
+    ret = {"metodo": metodo, "cantidad": cantidad}
+    client = ws.client
+    anterior = client.http, client.plantillas, client.respuestas, ws.transporte_async
+    valores = {}
+    ws.LoadTestXML(xml)
+    try:
+        client.plantillas = (metodo, )
+        for nombre, habilitadas in (("generico", ()), ("incremental", (metodo, ))):
+            client.respuestas = habilitadas
+            # las primeras llamadas aprenden la plantilla y verifican el análisis
+            for i in range(2):
+                valores[nombre] = getattr(client, metodo)(**kwargs)
+            t0 = time.time()
+            for i in range(cantidad):
+                getattr(client, metodo)(**kwargs)
+            segundos = time.time() - t0
+            tracemalloc.start()
+            getattr(client, metodo)(**kwargs)
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            ret[nombre] = {"segundos": segundos, "memoria_pico": pico,
+                           "respuestas_por_segundo": cantidad / segundos if segundos else 0}
+    finally:
+        client.http, client.plantillas, client.respuestas, ws.transporte_async = anterior
+    analizador = _analizadores.get((client.namespace, metodo))
+    ret["verificado"] = bool(analizador and analizador.verificada and analizador.valida)
+    ret["identicos"] = valores["generico"] == valores["incremental"]
+    ret["aceleracion"] = ret["generico"]["segundos"] / (ret["incremental"]["segundos"] or 1e-9)
+    return ret
+
+
+# Tablas de parámetros (ParamGet*, Consultar*) compartidas por el proceso y
+# persistidas en la carpeta cache (por servicio, ambiente y CUIT)
+PARAMETROS_TTL = 86400      # vigencia predeterminada en segundos (1 día)
+PARAMETROS_VERSION = 1      # formato del archivo (descarta caches anteriores)
+_parametros = {}            # archivo: {(metodo, args, kwargs): [fecha, valor, indice]}
+_parametros_mtime = {}
+_parametros_lock = threading.RLock()
+
+
+def url_servicio(ws):
+    "Devolver la dirección del servicio efectivamente conectado (o su WSDL)"
+    client = getattr(ws, "client", None)
+    if client is not None:
+        if getattr(client, "location", None):
+            return str(client.location)
+        for servicio in (getattr(client, "services", None) or {}).values():
+            for port in servicio.get('ports', {}).values():
+                if port.get('location'):
+                    return str(port['location'])
+    return getattr(ws, "wsdl", None) or ws.WSDL
+
+
+def archivo_parametros(ws):
+    "Devolver la ruta del archivo de parámetros del servicio, servidor y CUIT"
+    cache = getattr(ws, "cache", None) or os.path.join(ws.InstallDir, "cache")
+    cuit = re.sub(r"\D", "", str(getattr(ws, "Cuit", "") or "")) or "0"
+    # el ambiente se identifica por la dirección conectada (no por HOMO, que
+    # es un atributo de clase y no refleja el wsdl pasado a Conectar)
+    servidor = hashlib.md5(url_servicio(ws).encode("utf8")).hexdigest()[:12]
+    return os.path.join(cache, "parametros-%s-%s-%s.pkl" % (
+        ws.__class__.__name__.lower(), servidor, cuit))
+
+
+def leer_parametros(archivo, recargar=False):
+    "Devolver las tablas en memoria (leyendo el archivo la primera vez o si cambió)"
+    with _parametros_lock:
+        tablas = _parametros.get(archivo)
+        if tablas is not None and not recargar:
+            return tablas
+        try:
+            mtime = os.path.getmtime(archivo)
+        except OSError:
+            mtime = None
+        if tablas is None or mtime != _parametros_mtime.get(archivo):
+            tablas = _parametros.setdefault(archivo, {})
+            try:
+                with open(archivo, "rb") as f:
+                    datos = pickle.load(f)
+                if datos.get("version") == PARAMETROS_VERSION:
+                    for clave, (fecha, valor) in datos["tablas"].items():
+                        if clave not in tablas or tablas[clave][0] < fecha:
+                            tablas[clave] = [fecha, valor, None]
+            except (IOError, OSError, EOFError, ValueError, TypeError,
+                    KeyError, AttributeError, pickle.PickleError):
+                pass    # no existe, es de otra versión o está dañado
+            _parametros_mtime[archivo] = mtime
+        return tablas
+
+
+def grabar_parametros(archivo, tablas):
+    "Grabar las tablas en disco (reemplazando el archivo en forma atómica)"
+    datos = {"version": PARAMETROS_VERSION,
+             "tablas": dict([(clave, (fecha, valor))
+                             for clave, (fecha, valor, indice) in tablas.items()])}
+    directorio = os.path.dirname(archivo) or "."
+    fd, tmp = tempfile.mkstemp(prefix=".parametros-", dir=directorio)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(datos, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, archivo)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    _parametros_mtime[archivo] = os.path.getmtime(archivo)
+
+
+def limpiar_cache_parametros():
+    "Descartar las tablas de parámetros en memoria (no borra los archivos)"
+    with _parametros_lock:
+        _parametros.clear()
+        _parametros_mtime.clear()
+
+
+def cache_parametros(func):
+    "Decorador para reutilizar las tablas de parámetros durante ParametrosTTL"
+    @functools.wraps(func)
+    def cache_parametros_wrapper(self, *args, **kwargs):
+        ttl = getattr(self, "ParametrosTTL", PARAMETROS_TTL)
+        if not ttl:
+            return func(self, *args, **kwargs)
+        archivo = archivo_parametros(self)
+        clave = (func.__name__, args, tuple(sorted(kwargs.items())))
+        forzar = getattr(self, "_parametros_forzar", False)
+        entrada = leer_parametros(archivo).get(clave)
+        if not forzar and (not entrada or time.time() - entrada[0] >= ttl):
+            # puede haber sido actualizada por otro proceso
+            entrada = leer_parametros(archivo, recargar=True).get(clave)
+        if not forzar and entrada and time.time() - entrada[0] < ttl:
+            return entrada[1]
+        fecha = time.time()
+        # limpiar errores de llamadas anteriores (no todos los métodos están
+        # decorados con inicializar_y_capturar_excepciones)
+        self.Excepcion = self.Traceback = ""
+        self.Errores = []
+        valor = func(self, *args, **kwargs)
+        if valor is None or valor == ["ERROR"] or self.Excepcion or getattr(self, "Errores", None):
+            if entrada:
+                # falla de conexión o de AFIP: usar la tabla anterior (vencida)
+                self.log("Usando parametros vencidos de %s: %s" % (clave[0], self.Excepcion))
+                return entrada[1]
+            return valor
+        with _parametros_lock:
+            tablas = leer_parametros(archivo)
+            tablas[clave] = [fecha, valor, None]
+            try:
+                grabar_parametros(archivo, tablas)
+            except (IOError, OSError) as e:
+                self.log("No se pudo grabar la cache de parametros: %s" % e)
+        return valor
+    return cache_parametros_wrapper
+
+
+def separar_parametro(fila):
+    "Dividir una fila de parámetros (ej. '5|21%|20090220|NULL', '5: 21%')"
+    if not isinstance(fila, str):
+        return None
+    for sep in ("||", "|", "\t", ":"):
+        if sep in fila:
+            campos = [campo.strip() for campo in fila.split(sep, 1 if sep == ":" else -1)]
+            # quitar los separadores de los extremos (ej. '|| 1 || Soja ||')
+            while campos and not campos[0]:
+                del campos[0]
+            while campos and not campos[-1]:
+                del campos[-1]
+            return campos
+    return [fila.strip()]
+
+
+def indexar_parametros(valor):
+    "Armar un diccionario código: campos para búsquedas en O(1)"
+    if isinstance(valor, dict):
+        return dict([(str(k), [str(k), v]) for k, v in valor.items()])
+    indice = {}
+    for fila in valor or []:
+        campos = separar_parametro(fila)
+        if campos:
+            indice[campos[0]] = campos
+    return indice
+
+
+# Cliente del servicio local de tickets de acceso (ver wsaa.BrokerTA): los TA
+# obtenidos se conservan en memoria del proceso hasta su renovación
+BROKER_TIMEOUT = 5          # segundos de espera para consultar al servicio
+BROKER_RENOVACION = 60 * 5  # volver a consultar el TA cinco minutos antes de expirar
+_ta_broker = {}             # (dirección, servicio, cuit): datos del TA
+_ta_broker_lock = threading.Lock()
+
+
+class ConexionUnix(http.client.HTTPConnection):
+    "Conexión HTTP sobre un socket de dominio Unix (servicio local de TA)"
+
+    def __init__(self, path, timeout=None):
+        http.client.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def es_broker(direccion):
+    "Verificar si es la dirección de un servicio local de TA (y no un XML)"
+    return isinstance(direccion, str) and direccion.startswith(("http://", "unix:"))
+
+
+def consultar_broker(direccion, ruta, timeout=BROKER_TIMEOUT):
+    "Realizar una consulta al servicio local de TA y devolver la respuesta JSON"
+    headers = {}
+    if direccion.startswith("unix:"):
+        conn = ConexionUnix(direccion[5:], timeout=timeout)
+        base = ""
+    else:
+        url = urlparse(direccion)
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+        base = url.path.rstrip("/")
+        if url.password:
+            # clave compartida con el servicio: http://:clave@127.0.0.1:8765
+            auth = "%s:%s" % (url.username or "", url.password)
+            headers['Authorization'] = "Basic %s" % base64.b64encode(
+                auth.encode("utf8")).decode("ascii")
+    try:
+        conn.request("GET", base + ruta, headers=headers)
+        resp = conn.getresponse()
+        datos = json.loads(resp.read().decode("utf8"))
+    finally:
+        conn.close()
+    if resp.status != 200:
+        raise RuntimeError("Servicio de TA: %s" % datos.get("error", resp.reason))
+    return datos
+
+
+def obtener_ta_broker(direccion, servicio, cuit="", recargar=False, timeout=BROKER_TIMEOUT):
+    "Obtener el TA del servicio local (cacheado en memoria hasta su renovación)"
+    clave = (direccion, servicio, str(cuit or ""))
+    ta = _ta_broker.get(clave)
+    if recargar or ta is None or ta['expiracion'] - BROKER_RENOVACION <= time.time():
+        ruta = "/ta?" + urlencode({'servicio': servicio, 'cuit': clave[2]})
+        ta = consultar_broker(direccion, ruta, timeout)
+        with _ta_broker_lock:
+            _ta_broker[clave] = ta
+    return ta
+
+
+def limpiar_cache_broker():
+    "Descartar los tickets de acceso obtenidos del servicio local"
+    with _ta_broker_lock:
+        _ta_broker.clear()
+
+
 class BaseWS:
     "Infraestructura basica para interfaces webservices de AFIP"
 
+    ParametrosTTL = PARAMETROS_TTL
+    # operaciones frecuentes armadas con plantillas precompiladas (ver PlantillaSOAP)
+    PlantillasSOAP = ()
+    # operaciones cuya respuesta se analiza en forma incremental (ver AnalizadorRespuesta)
+    RespuestasSOAP = ()
+    # atributos copiados al resultado (inmutable) de las llamadas asincrónicas
+    _resultado_async_ = ('Excepcion', 'Traceback', 'ErrCode', 'ErrMsg', 'Obs',
+                         'Errores', 'Observaciones', 'Eventos', 'errores',
+                         'observaciones', 'params_out', 'XmlRequest', 'XmlResponse')
+    transporte_async = None
+
     def __init__(self, reintentos=1):
         self.reintentos = reintentos
         self.xml = self.client = self.Log = None
@@ -245,30 +1074,27 @@ class BaseWS:
             self.log("Conectando a wsdl=%s cache=%s proxy=%s" % (wsdl, cache, proxy_dict))
             # analizar espacio de nombres (axis vs .net):
             ns = 'ser' if self.WSDL[-5:] == "?wsdl" else None
-            self.client = SoapClient(
-                wsdl=wsdl,
+            self.client = SoapClientPlantillas(
+                wsdl=None,
                 cache=cache,
                 proxy=proxy_dict,
                 cacert=cacert,
                 timeout=timeout,
                 ns=ns, soap_server=soap_server,
                 trace="--trace" in sys.argv)
+            # reutilizar la descripción del servicio ya analizada (y corregida)
+            wsdl_desc = obtener_wsdl(wsdl, cache, ns, proxy_dict, cacert, timeout)
+            self.client.services = copiar_servicios(wsdl_desc['services'])
+            self.client.namespace = wsdl_desc['namespace']
+            self.client.documentation = wsdl_desc['documentation']
+            self.client.wsdl_basedir = wsdl_desc['wsdl_basedir']
+            self.client.plantillas = self.PlantillasSOAP
+            self.client.respuestas = self.RespuestasSOAP
             self.cache = cache  # utilizado por WSLPG y WSAA (Ticket de Acceso)
             self.wsdl = wsdl    # utilizado por TrazaMed (para corregir el location)
-            # corrijo ubicación del servidor (puerto http 80 en el WSDL AFIP)
-            for service in list(self.client.services.values()):
-                for port in list(service['ports'].values()):
-                    location = port['location']
-                    if location and location.startswith("http://"):
-                        warnings.warn("Corrigiendo WSDL ... %s" % location)
-                        location = location.replace("http://", "https://").replace(":80", ":443")
-                        # usar servidor real si en el WSDL figura "localhost"
-                        localhost = 'https://localhost:'
-                        if location.startswith(localhost):
-                            url = urlparse(wsdl)
-                            location = location.replace("localhost", url.hostname)
-                            location = location.replace(":9051", ":443")
-                        port['location'] = location
+            # parámetros para el transporte no bloqueante (ver llamar_async)
+            self.transporte_async = None
+            self._opciones_async = {'proxy': proxy_dict, 'cacert': cacert, 'timeout': timeout}
             return True
         except BaseException:
             ex = traceback.format_exception(sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2])
@@ -281,6 +1107,111 @@ class BaseWS:
                 raise
             return False
 
+    def BuscarParametro(self, metodo, codigo):
+        "Devolver la descripción de un código de una tabla de parámetros"
+        campos = self._buscar_parametro(metodo, codigo)
+        return campos[1] if campos and len(campos) > 1 else ""
+
+    def ValidarParametro(self, metodo, codigo, fecha=None):
+        "Verificar que el código exista (y esté vigente a la fecha AAAAMMDD)"
+        campos = self._buscar_parametro(metodo, codigo)
+        if not campos:
+            return False
+        # tablas con vigencia: código, descripción, desde, hasta (o NULL)
+        if len(campos) >= 4 and re.match(r"^\d{8}$", str(campos[2])):
+            if not fecha:
+                fecha = datetime.date.today().strftime("%Y%m%d")
+            fecha = str(fecha).replace("-", "")
+            if fecha < campos[2]:
+                return False
+            if re.match(r"^\d{8}$", str(campos[3])) and fecha > campos[3]:
+                return False
+        return True
+
+    def _buscar_parametro(self, metodo, codigo):
+        "Buscar un código en la tabla (consultándola solo si no está en cache)"
+        valor = getattr(self, metodo)()
+        entrada = leer_parametros(archivo_parametros(self)).get((metodo, (), ()))
+        if entrada and entrada[1] is valor:
+            if entrada[2] is None:
+                entrada[2] = indexar_parametros(valor)
+            indice = entrada[2]
+        else:
+            indice = indexar_parametros(valor)
+        return indice.get(str(codigo).strip())
+
+    def RefrescarParametros(self, antiguedad=0):
+        "Volver a consultar las tablas en cache con más de antiguedad segundos"
+        cant = 0
+        ahora = time.time()
+        self._parametros_forzar = True
+        try:
+            tablas = leer_parametros(archivo_parametros(self), recargar=True)
+            for (metodo, args, kwargs), entrada in list(tablas.items()):
+                if ahora - entrada[0] >= antiguedad and hasattr(self, metodo):
+                    getattr(self, metodo)(*args, **dict(kwargs))
+                    cant += 1
+        finally:
+            self._parametros_forzar = False
+        return cant
+
+    def IniciarRefrescoParametros(self, intervalo=None):
+        "Refrescar las tablas en segundo plano (usar una instancia dedicada)"
+        ttl = self.ParametrosTTL or PARAMETROS_TTL
+        intervalo = float(intervalo or ttl / 4.)
+        self._refresco_parametros = evento = threading.Event()
+
+        def refrescar():
+            while not evento.wait(intervalo):
+                try:
+                    self.RefrescarParametros(ttl / 2.)
+                except Exception as e:
+                    self.log("Error al refrescar parametros: %s" % e)
+
+        hilo = threading.Thread(target=refrescar, name="refresco-parametros")
+        hilo.daemon = True
+        hilo.start()
+        return True
+
+    def DetenerRefrescoParametros(self):
+        "Finalizar el refresco de tablas en segundo plano"
+        evento = getattr(self, "_refresco_parametros", None)
+        if evento:
+            evento.set()
+        return True
+
+    async def llamar_async(self, metodo, args=(), kwargs=None, estado=None):
+        "Ejecutar un método del servicio sin bloquear y devolver un resultado inmutable"
+        if not self.client:
+            raise RuntimeError("Debe conectar el cliente antes de llamar a %s" % metodo.__name__)
+        if self.transporte_async is None:
+            self.transporte_async = TransporteAsincronico(**getattr(self, "_opciones_async", {}))
+        # copiar el estado (factura, liquidación, etc.) para que no lo afecten
+        # otras llamadas que se armen mientras se espera la respuesta
+        estado = copy.deepcopy(estado or {})
+        estado['params_in'], self.params_in = self.params_in, {}
+        respuestas = []
+        while True:
+            # cada pasada usa su propia copia de la instancia y del cliente SOAP
+            # (la compartida no se modifica): el método arma el requerimiento y
+            # analiza las respuestas ya obtenidas
+            cliente = copiar_instancia(self.client, http=TransporteDiferido(respuestas))
+            ws = copiar_instancia(self, client=cliente, **copy.deepcopy(estado))
+            try:
+                return ws._resultado_async(metodo.__func__(ws, *args, **(kwargs or {})))
+            except SolicitudDiferida as e:
+                solicitud = e
+            respuestas.append(await self.transporte_async.request(*solicitud.args))
+
+    def _resultado_async(self, valor):
+        "Copiar el valor devuelto y los atributos de la última llamada (método interno)"
+        campos = self._resultado_async_
+        tipo = _resultados_async.get(campos)
+        if tipo is None:
+            tipo = collections.namedtuple("Resultado", ("Valor", ) + campos)
+            _resultados_async[campos] = tipo
+        return tipo(congelar(valor), *[congelar(getattr(self, campo, None)) for campo in campos])
+
     def log(self, msg):
         "Dejar mensaje en bitacora de depuración (método interno)"
         if not isinstance(msg, str):
@@ -316,6 +1247,8 @@ class BaseWS:
             def request(self, location, method, body, headers):
                 return {}, self.xml_response
         self.client.http = DummyHTTP(xml)
+        # las llamadas asincrónicas también usan la respuesta simulada
+        self.transporte_async = TransporteSimulado(self.client.http)
 
     @property
     def xml_request(self):
@@ -360,9 +1293,17 @@ class BaseWS:
         return True
 
     @inicializar_y_capturar_excepciones
-    def SetTicketAcceso(self, ta_string):
-        "Establecer el token y sign desde un ticket de acceso XML"
-        if ta_string:
+    def SetTicketAcceso(self, ta_string, servicio="", cuit=""):
+        "Establecer el token y sign desde un ticket de acceso XML (o servicio local)"
+        if es_broker(ta_string):
+            # dirección del servicio de TA (http://127.0.0.1:puerto o unix:ruta)
+            if not servicio:
+                raise RuntimeError("Debe indicar el servicio para obtener el TA")
+            ta = obtener_ta_broker(ta_string, servicio, cuit or getattr(self, "Cuit", ""))
+            self.Token = ta['token']
+            self.Sign = ta['sign']
+            return True
+        elif ta_string:
             ta = SimpleXMLElement(ta_string)
             self.Token = str(ta.credentials.token)
             self.Sign = str(ta.credentials.sign)
@@ -512,6 +1453,419 @@ class WebClient:
         return content
 
 
+# Transporte HTTP con conexiones persistentes (keep-alive) y sesiones TLS
+# reutilizables, compartido por WSAA y el resto de los servicios web
+
+
+_http_pool = {}             # servidor -> lista de (conexión, último uso, transporte)
+_http_pool_lock = threading.Lock()
+_tls_sessions = {}          # servidor -> sesión TLS (para reanudar handshake)
+_tls_contexts = {}          # cacert -> contexto SSL
+
+
+def contexto_ssl(cacert):
+    "Crear o reutilizar el contexto SSL (verificación según cacert)"
+    with _http_pool_lock:
+        context = _tls_contexts.get(cacert)
+        if context is None:
+            if cacert:
+                context = ssl.create_default_context(cafile=cacert)
+            else:
+                # sin cacert no se verifica el servidor (igual que httplib2)
+                context = ssl.create_default_context()
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            _tls_contexts[cacert] = context
+    return context
+
+
+class ConexionHTTPS(http.client.HTTPConnection):
+    "Conexión HTTPS que reanuda la última sesión TLS negociada con el servidor"
+    # nota: no hereda de HTTPSConnection ya que pysimplesoap puede modificarla
+    default_port = http.client.HTTPS_PORT
+
+    def __init__(self, host, port=None, timeout=None, context=None):
+        http.client.HTTPConnection.__init__(self, host, port, timeout=timeout)
+        self._context = context
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        self.sock = self._context.wrap_socket(self.sock,
+                                              server_hostname=server_hostname,
+                                              session=_tls_sessions.get(server_hostname))
+
+
+class RespuestaHTTP(dict):
+    "Encabezados de la respuesta (compatible con httplib2.Response)"
+
+    def __init__(self, response=None, status=200, reason="OK", headers=()):
+        if response is not None:
+            status, reason, headers = response.status, response.reason, response.getheaders()
+        dict.__init__(self, [(k.lower(), v) for k, v in headers])
+        self.status = status
+        self.reason = reason
+        self['status'] = str(status)
+
+
+class PoolHTTPTransport:
+    "Transporte para SoapClient con pool de conexiones persistentes por servidor"
+    _wrapper_version = "pool (http.client keep-alive)"
+    _wrapper_name = 'pool'
+
+    def __init__(self, timeout=None, proxy=None, cacert=None, sessions=False):
+        self.timeout = timeout
+        self.proxy = proxy or {}
+        self.cacert = cacert
+
+    def _contexto_ssl(self):
+        "Crear o reutilizar el contexto SSL (verificación según cacert)"
+        return contexto_ssl(self.cacert)
+
+    def _conectar(self, scheme, host, port):
+        "Crear una nueva conexión (directa o a través del proxy)"
+        proxy_host = self.proxy.get('proxy_host')
+        if proxy_host:
+            conn_host, conn_port = proxy_host, int(self.proxy.get('proxy_port') or 8080)
+        else:
+            conn_host, conn_port = host, port
+        if scheme == "https":
+            conn = ConexionHTTPS(conn_host, conn_port, timeout=self.timeout,
+                                 context=self._contexto_ssl())
+        else:
+            conn = http.client.HTTPConnection(conn_host, conn_port, timeout=self.timeout)
+        if proxy_host:
+            headers = {}
+            if self.proxy.get('proxy_user'):
+                auth = "%s:%s" % (self.proxy['proxy_user'], self.proxy.get('proxy_pass', ''))
+                headers['Proxy-Authorization'] = "Basic %s" % base64.b64encode(
+                    auth.encode("utf8")).decode("ascii")
+            conn.set_tunnel(host, port, headers)
+        return conn
+
+    def _obtener(self, clave):
+        "Tomar una conexión inactiva del pool (descartando las vencidas)"
+        while True:
+            with _http_pool_lock:
+                conexiones = _http_pool.get(clave, [])
+                if not conexiones:
+                    return None
+                conn, ultimo_uso, transporte = conexiones.pop()
+            if time.time() - ultimo_uso < HTTP_POOL_IDLE and not conexion_cerrada(conn):
+                return conn
+            conn.close()
+
+    def _devolver(self, clave, conn):
+        "Devolver la conexión al pool (si no se superó la cantidad máxima)"
+        sock = getattr(conn, "sock", None)
+        if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+            _tls_sessions[conn._tunnel_host or conn.host] = sock.session
+        with _http_pool_lock:
+            conexiones = _http_pool.setdefault(clave, [])
+            if len(conexiones) < HTTP_POOL_MAX:
+                conexiones.append((conn, time.time(), self))
+                return
+        conn.close()
+
+    def request(self, url, method="GET", body=None, headers={}):
+        "Enviar el requerimiento HTTP y devolver encabezados y contenido"
+        url = urlparse(url)
+        port = url.port or (443 if url.scheme == "https" else 80)
+        path = url.path or "/"
+        if url.query:
+            path += "?" + url.query
+        if isinstance(body, str):
+            body = body.encode("utf8")
+        clave = (url.scheme, url.hostname, port, self.cacert,
+                 tuple(sorted(self.proxy.items())))
+        while True:
+            conn = self._obtener(clave)
+            reutilizada = conn is not None
+            if not reutilizada:
+                conn = self._conectar(url.scheme, url.hostname, port)
+            elif conn.sock is not None:
+                conn.sock.settimeout(self.timeout)
+            try:
+                conn.request(method, path, body, headers)
+            except ConnectionError:
+                conn.close()
+                if reutilizada:
+                    # el servidor cerró la conexión inactiva antes de recibir
+                    # el requerimiento completo (no pudo procesarlo): reintentar
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            try:
+                response = conn.getresponse()
+                content = response.read()
+            except BaseException:
+                # el requerimiento ya fue enviado: no reintentar, ya que el
+                # servidor podría haberlo procesado (ej. FECAESolicitar)
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._devolver(clave, conn)
+            return RespuestaHTTP(response), content
+
+    def close(self):
+        "Cerrar las conexiones inactivas que este transporte devolvió al pool"
+        # (las de otros clientes siguen disponibles, ver limpiar_pool_http)
+        propias = []
+        with _http_pool_lock:
+            for clave, conexiones in list(_http_pool.items()):
+                propias.extend([c for c in conexiones if c[2] is self])
+                conexiones[:] = [c for c in conexiones if c[2] is not self]
+                if not conexiones:
+                    del _http_pool[clave]
+        for conn, ultimo_uso, transporte in propias:
+            conn.close()
+
+
+def conexion_cerrada(conn):
+    "Verificar si el servidor cerró una conexión inactiva (sin enviar datos)"
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        return True
+    try:
+        # una conexión inactiva no debería tener nada para leer: si lo hay,
+        # es el fin de la conexión (o basura) y no puede reutilizarse
+        legible, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(legible)
+
+
+def limpiar_pool_http():
+    "Cerrar todas las conexiones HTTP inactivas y descartar las sesiones TLS"
+    with _http_pool_lock:
+        for conexiones in _http_pool.values():
+            for conn, ultimo_uso, transporte in conexiones:
+                conn.close()
+        _http_pool.clear()
+        _tls_sessions.clear()
+
+
+# registrar el transporte para poder elegirlo con Conectar(wrapper="pool")
+pysimplesoap.transport._http_connectors['pool'] = PoolHTTPTransport
+for feature in ('proxy', 'cacert', 'timeout'):
+    pysimplesoap.transport._http_facilities.setdefault(feature, []).append('pool')
+
+
+# Llamadas asincrónicas (asyncio): el método original del servicio arma el
+# requerimiento y analiza la respuesta, el envío se realiza sin bloquear
+
+
+_resultados_async = {}      # campos: tipo de resultado (namedtuple)
+
+
+class SolicitudDiferida(BaseException):
+    "Requerimiento a enviar en forma asincrónica (interrumpe la llamada)"
+    # nota: hereda de BaseException para no ser capturada como error del servicio
+
+
+class TransporteDiferido:
+    "Transporte que devuelve las respuestas ya obtenidas o difiere el envío"
+
+    def __init__(self, respuestas):
+        self.respuestas = respuestas
+        self.cant = 0
+
+    def request(self, location, method="POST", body=None, headers={}):
+        if self.cant < len(self.respuestas):
+            self.cant += 1
+            return self.respuestas[self.cant - 1]
+        raise SolicitudDiferida(location, method, body, headers)
+
+
+class TransporteSimulado:
+    "Transporte asincrónico para respuestas de prueba (ver LoadTestXML)"
+
+    def __init__(self, http):
+        self.http = http
+
+    async def request(self, location, method="POST", body=None, headers={}):
+        return self.http.request(location, method, body, headers)
+
+
+def copiar_instancia(objeto, **atributos):
+    "Copia superficial de un objeto reemplazando algunos atributos"
+    # nota: no usa copy.copy ya que SoapClient responde cualquier atributo (__getattr__)
+    copia = object.__new__(type(objeto))
+    copia.__dict__.update(objeto.__dict__, **atributos)
+    return copia
+
+
+def congelar(valor):
+    "Copiar el valor en estructuras inmutables (resultado de llamadas asincrónicas)"
+    if isinstance(valor, collections.abc.Mapping):
+        return types.MappingProxyType(dict((k, congelar(v)) for k, v in valor.items()))
+    elif isinstance(valor, (list, tuple)):
+        return tuple([congelar(v) for v in valor])
+    return valor
+
+
+class TransporteAsincronico:
+    "Transporte HTTP no bloqueante (asyncio) con conexiones persistentes por servidor"
+
+    def __init__(self, timeout=None, proxy=None, cacert=None):
+        self.timeout = timeout
+        self.proxy = proxy or {}
+        self.cacert = cacert
+        self._conexiones = {}       # (esquema, servidor, puerto): [(lector, escritor, último uso)]
+        self._loop = None
+
+    async def _conectar(self, scheme, host, port):
+        "Abrir una nueva conexión (directa o a través del proxy)"
+        context = contexto_ssl(self.cacert) if scheme == "https" else None
+        proxy_host = self.proxy.get('proxy_host')
+        if not proxy_host:
+            return await asyncio.open_connection(host, port, ssl=context,
+                                                 server_hostname=context and host or None)
+        reader, writer = await asyncio.open_connection(
+            proxy_host, int(self.proxy.get('proxy_port') or 8080))
+        if context:
+            # establecer el túnel (CONNECT) y luego negociar TLS con el servidor
+            pedido = "CONNECT %s:%s HTTP/1.1\r\nHost: %s:%s\r\n" % (host, port, host, port)
+            pedido += "".join(["%s: %s\r\n" % it for it in self._autenticacion_proxy().items()])
+            writer.write((pedido + "\r\n").encode("latin1"))
+            respuesta, contenido, persistente = await self._leer_respuesta(reader, "CONNECT")
+            if respuesta.status != 200:
+                writer.close()
+                raise RuntimeError("Proxy: %s %s" % (respuesta.status, respuesta.reason))
+            await writer.start_tls(context, server_hostname=host)
+        return reader, writer
+
+    def _autenticacion_proxy(self):
+        if not self.proxy.get('proxy_user'):
+            return {}
+        auth = "%s:%s" % (self.proxy['proxy_user'], self.proxy.get('proxy_pass', ''))
+        return {'Proxy-Authorization': "Basic %s" % base64.b64encode(
+            auth.encode("utf8")).decode("ascii")}
+
+    def _obtener(self, clave):
+        "Tomar una conexión inactiva (descartando las vencidas o cerradas)"
+        conexiones = self._conexiones.get(clave, [])
+        while conexiones:
+            reader, writer, ultimo_uso = conexiones.pop()
+            if time.time() - ultimo_uso < HTTP_POOL_IDLE and not reader.at_eof() \
+                    and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    def _devolver(self, clave, reader, writer):
+        "Conservar la conexión para reutilizarla (si no se superó la cantidad máxima)"
+        conexiones = self._conexiones.setdefault(clave, [])
+        if len(conexiones) < HTTP_POOL_MAX:
+            conexiones.append((reader, writer, time.time()))
+        else:
+            writer.close()
+
+    async def _leer_respuesta(self, reader, method):
+        "Leer la respuesta HTTP/1.1 (encabezados y contenido completo)"
+        linea = await reader.readline()
+        if not linea:
+            raise ConnectionResetError("Conexión cerrada por el servidor")
+        version, status, reason = (linea.decode("latin1").strip().split(" ", 2) + [""])[:3]
+        status = int(status)
+        headers = []
+        while True:
+            linea = await reader.readline()
+            if not linea.strip():
+                break
+            k, v = linea.decode("latin1").split(":", 1)
+            headers.append((k.strip(), v.strip()))
+        respuesta = RespuestaHTTP(status=status, reason=reason, headers=headers)
+        if method in ("HEAD", "CONNECT") or status in (204, 304) or status < 200:
+            contenido = b""
+        elif "chunked" in respuesta.get("transfer-encoding", "").lower():
+            partes = []
+            while True:
+                tam = int((await reader.readline()).split(b";")[0], 16)
+                if not tam:
+                    while (await reader.readline()).strip():
+                        pass        # encabezados finales (trailers)
+                    break
+                partes.append(await reader.readexactly(tam))
+                await reader.readexactly(2)
+            contenido = b"".join(partes)
+        elif "content-length" in respuesta:
+            contenido = await reader.readexactly(int(respuesta["content-length"]))
+        else:
+            contenido = await reader.read()
+            respuesta["connection"] = "close"
+        persistente = version != "HTTP/1.0" and respuesta.get("connection", "").lower() != "close"
+        return respuesta, contenido, persistente
+
+    async def request(self, url, method="GET", body=None, headers={}):
+        "Enviar el requerimiento HTTP y devolver encabezados y contenido (corrutina)"
+        if self.timeout:
+            return await asyncio.wait_for(self._request(url, method, body, headers), self.timeout)
+        return await self._request(url, method, body, headers)
+
+    async def _request(self, url, method, body, headers):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # las conexiones pertenecen al event loop que las creó
+            self._conexiones = {}
+            self._loop = loop
+        location = url
+        url = urlparse(url)
+        port = url.port or (443 if url.scheme == "https" else 80)
+        if self.proxy.get('proxy_host') and url.scheme == "http":
+            path = location     # proxy HTTP sin túnel: URL absoluta
+            headers = dict(headers, **self._autenticacion_proxy())
+        else:
+            path = (url.path or "/") + (url.query and "?" + url.query or "")
+        if isinstance(body, str):
+            body = body.encode("utf8")
+        body = body or b""
+        pedido = "%s %s HTTP/1.1\r\nHost: %s\r\n" % (method, path, url.netloc)
+        pedido += "".join(["%s: %s\r\n" % (k, v) for k, v in headers.items()
+                           if k.lower() not in ("host", "content-length", "connection")])
+        pedido += "Content-Length: %d\r\n\r\n" % len(body)
+        datos = pedido.encode("latin1") + body
+        clave = (url.scheme, url.hostname, port)
+        while True:
+            conexion = self._obtener(clave)
+            reutilizada = conexion is not None
+            if not reutilizada:
+                conexion = await self._conectar(url.scheme, url.hostname, port)
+            reader, writer = conexion
+            writer.write(datos)
+            if writer.is_closing():
+                # el envío falló sin que se aceptara ningún byte (ej. conexión
+                # inactiva cerrada por el servidor): no pudo procesarlo
+                writer.close()
+                if reutilizada:
+                    continue
+                raise ConnectionResetError("Conexión cerrada por el servidor")
+            try:
+                await writer.drain()
+                respuesta, contenido, persistente = await self._leer_respuesta(reader, method)
+            except BaseException:
+                # el requerimiento ya fue (al menos en parte) enviado: no reintentar,
+                # ya que el servidor podría haberlo procesado (ej. FECAESolicitar)
+                writer.close()
+                raise
+            if persistente:
+                self._devolver(clave, reader, writer)
+            else:
+                writer.close()
+            return respuesta, contenido
+
+    def cerrar(self):
+        "Cerrar las conexiones inactivas"
+        for conexiones in self._conexiones.values():
+            for reader, writer, ultimo_uso in conexiones:
+                writer.close()
+        self._conexiones = {}
+
+
 class AttrDict(dict):
     "Custom Dict to hold attributes and items"
 
@@ -543,90 +1897,142 @@ class HTMLFormParser(HTMLParser):
 # Funciones para manejo de archivos de texto de campos de ancho fijo:
 
 
-def leer(linea, formato, expandir_fechas=False):
-    "Analiza una linea de texto dado un formato, devuelve un diccionario"
-    dic = {}
-    comienzo = 1
-    for fmt in formato:
-        clave, longitud, tipo = fmt[0:3]
-        dec = (len(fmt) > 3 and isinstance(fmt[3], int)) and fmt[3] or 2
-        valor = linea[comienzo - 1:comienzo - 1 + longitud].strip()
-        try:
-            if chr(8) in valor or chr(127) in valor or chr(255) in valor:
-                valor = None        # nulo
-            elif tipo == N:
-                if valor:
-                    valor = int(valor)
-                else:
-                    valor = 0
-            elif tipo == I:
-                if valor:
-                    try:
-                        if '.' in valor:
-                            valor = float(valor)
-                        else:
-                            valor = valor.strip(" ")
-                            if valor[0] == "-":
-                                sign = -1
-                                valor = valor[1:]
-                            else:
-                                sign = +1
-                            valor = sign * float(("%%s.%%0%sd" % dec) % (int(valor[:-dec] or '0'), int(valor[-dec:] or '0')))
-                    except ValueError:
-                        raise ValueError("Campo invalido: %s = '%s'" % (clave, valor))
+class FormatoFijo:
+    "Formato de campos de ancho fijo precompilado (posiciones y conversiones)"
+
+    def __init__(self, formato):
+        self.formato = formato
+        self.campos = []
+        comienzo = 0
+        for fmt in formato:
+            clave, longitud, tipo = fmt[0:3]
+            if isinstance(longitud, tuple):
+                longitud, dec = longitud
+            else:
+                dec = (len(fmt) > 3 and isinstance(fmt[3], int)) and fmt[3] or 2
+            fecha = clave.lower().startswith("fec") and longitud <= 8
+            self.campos.append((clave, comienzo, comienzo + longitud, longitud,
+                                tipo, dec, fecha, clave.capitalize()))
+            comienzo += longitud
+        self.longitud = comienzo
+
+    def leer(self, linea, expandir_fechas=False):
+        "Analiza una linea de texto, devuelve un diccionario"
+        dic = {}
+        largo = len(linea)
+        for clave, inicio, fin, longitud, tipo, dec, fecha, capitalizada in self.campos:
+            valor = linea[inicio:fin].strip()
+            try:
+                if "\x08" in valor or "\x7f" in valor or "\xff" in valor:
+                    valor = None        # nulo
+                elif tipo == N:
+                    valor = int(valor) if valor else 0
+                elif tipo == I:
+                    valor = leer_importe(clave, valor, dec) if valor else 0.00
+                elif expandir_fechas and fecha:
+                    valor = "%s-%s-%s" % (valor[0:4], valor[4:6], valor[6:8]) if valor else None
+                elif isinstance(valor, bytes):
+                    valor = valor.decode("ascii", "ignore")
+            except Exception as e:
+                raise ValueError("Error al leer campo %s pos %s val '%s': %s" % (
+                    clave, inicio + 1, valor, str(e)))
+            if not valor and clave in dic and largo <= inicio + 1:
+                continue    # ignorar - compatibilidad hacia atrás (cambios tamaño)
+            dic[clave] = valor
+        return dic
+
+    def leer_lineas(self, lineas, expandir_fechas=False):
+        "Analiza un lote de lineas, devuelve una lista de diccionarios"
+        leer = self.leer
+        return [leer(linea, expandir_fechas) for linea in lineas]
+
+    def escribir(self, dic, contraer_fechas=False):
+        "Genera una cadena dado un diccionario de claves/valores"
+        partes = []
+        exacto = True
+        for clave, inicio, fin, longitud, tipo, dec, fecha, capitalizada in self.campos:
+            valor = None
+            try:
+                if capitalizada in dic:
+                    clave = capitalizada
+                s = dic.get(clave, "")
+                if s is None:
+                    valor = ""
+                elif isinstance(s, bytes):
+                    valor = s.decode("latin1")
                 else:
-                    valor = 0.00
-            elif expandir_fechas and clave.lower().startswith("fec") and longitud <= 8:
-                if valor:
-                    valor = "%s-%s-%s" % (valor[0:4], valor[4:6], valor[6:8])
+                    valor = str(s)
+                # reemplazo saltos de linea por tabulación vertical
+                valor = valor.replace("\n\r", "\v").replace("\n", "\v").replace("\r", "\v")
+                if tipo == N and valor and valor != "NULL":
+                    valor = "%0*d" % (longitud, int(valor))
+                elif tipo == I and valor:
+                    valor = ("%0*.*f" % (longitud + 1, dec, float(valor))).replace(".", "")
+                elif contraer_fechas and fecha and valor:
+                    valor = valor.replace("-", "")
                 else:
-                    valor = None
+                    valor = "%-*s" % (longitud, valor)
+            except Exception as e:
+                warnings.warn("Error al escribir campo %s pos %s val '%s': %s" % (
+                    clave, inicio + 1, valor, str(e)))
+                valor = None
+                exacto = False
             else:
-                valor = valor.decode("ascii", "ignore")
-            if not valor and clave in dic and len(linea) <= comienzo:
-                pass    # ignorar - compatibilidad hacia atrás (cambios tamaño)
-            else:
-                dic[clave] = valor
-            comienzo += longitud
-        except Exception as e:
-            raise ValueError("Error al leer campo %s pos %s val '%s': %s" % (
-                clave, comienzo, valor, str(e)))
-    return dic
+                exacto = exacto and len(valor) == longitud
+            partes.append(valor)
+        if exacto:
+            return "".join(partes) + "\n"
+        # algún valor no coincide con la longitud del campo (o hubo errores):
+        # reemplazar secuencialmente para mantener la salida de versiones previas
+        linea = " " * self.longitud
+        comienzo = 0
+        for campo, valor in zip(self.campos, partes):
+            if valor is not None:
+                linea = linea[:comienzo] + valor + linea[comienzo + campo[3]:]
+                comienzo += campo[3]
+        return linea + "\n"
+
+    def escribir_lineas(self, dics, contraer_fechas=False):
+        "Genera las lineas de texto para un lote de diccionarios"
+        escribir = self.escribir
+        return "".join([escribir(dic, contraer_fechas) for dic in dics])
+
+
+def leer_importe(clave, valor, dec=2):
+    "Convertir un importe (con punto o decimales implícitos) a float"
+    try:
+        if '.' in valor:
+            return float(valor)
+        if valor[0] == "-":
+            sign = -1
+            valor = valor[1:]
+        else:
+            sign = +1
+        return sign * float("%s.%0*d" % (int(valor[:-dec] or '0'), dec, int(valor[-dec:] or '0')))
+    except ValueError:
+        raise ValueError("Campo invalido: %s = '%s'" % (clave, valor))
+
+
+_formatos_compilados = {}
+
+
+def compilar_formato(formato):
+    "Devolver el formato precompilado (se analiza solo la primera vez)"
+    compilado = _formatos_compilados.get(id(formato))
+    if compilado is None or compilado.formato is not formato or \
+       len(compilado.campos) != len(formato):
+        compilado = _formatos_compilados[id(formato)] = FormatoFijo(formato)
+    return compilado
+
+
+def leer(linea, formato, expandir_fechas=False):
+    "Analiza una linea de texto dado un formato, devuelve un diccionario"
+    return compilar_formato(formato).leer(linea, expandir_fechas)
 
 
 def escribir(dic, formato, contraer_fechas=False):
     "Genera una cadena dado un formato y un diccionario de claves/valores"
-    linea = " " * sum([fmt[1] for fmt in formato])
-    comienzo = 1
-    for fmt in formato:
-        clave, longitud, tipo = fmt[0:3]
-        try:
-            dec = (len(fmt) > 3 and isinstance(fmt[3], int)) and fmt[3] or 2
-            if clave.capitalize() in dic:
-                clave = clave.capitalize()
-            s = dic.get(clave, "")
-            if isinstance(s, str):
-                s = s.encode("latin1")
-            if s is None:
-                valor = ""
-            else:
-                valor = str(s)
-            # reemplazo saltos de linea por tabulaci{on vertical
-            valor = valor.replace("\n\r", "\v").replace("\n", "\v").replace("\r", "\v")
-            if tipo == N and valor and valor != "NULL":
-                valor = ("%%0%dd" % longitud) % int(valor)
-            elif tipo == I and valor:
-                valor = ("%%0%d.%df" % (longitud + 1, dec) % float(valor)).replace(".", "")
-            elif contraer_fechas and clave.lower().startswith("fec") and longitud <= 8 and valor:
-                valor = valor.replace("-", "")
-            else:
-                valor = ("%%-0%ds" % longitud) % valor
-            linea = linea[:comienzo - 1] + valor + linea[comienzo - 1 + longitud:]
-            comienzo += longitud
-        except Exception as e:
-            warnings.warn("Error al escribir campo %s pos %s val '%s': %s" % (
-                clave, comienzo, valor, str(e)))
-    return linea + "\n"
+    return compilar_formato(formato).escribir(dic, contraer_fechas)
 
 
 # Tipos de datos (código RG1361)
@@ -29,7 +29,7 @@ import sys
 
 from .utils import inicializar_y_capturar_excepciones, BaseWS, get_install_dir, json_serializer, abrir_conf, norm, SoapFault
 from configparser import SafeConfigParser
-from .padron import TIPO_CLAVE, PROVINCIAS
+from .padron import TIPO_CLAVE, PROVINCIAS, HILOS, datos_consulta
 
 
 HOMO = False
@@ -249,6 +249,21 @@ class WSSrPadronA5(WSSrPadronA4):
         return not self.errores
 
 
+def consultar_persona(padron, id_persona):
+    "Consultar un contribuyente para PadronAFIP.ConsultarLote (None si no existe)"
+    try:
+        padron.Consultar(id_persona)
+    except SoapFault as e:
+        if e.faultstring == "No existe persona con ese Id":
+            return None
+        raise
+    if "No existe persona con ese Id" in padron.Excepcion:
+        return None             # sin lanzar excepciones
+    if not padron.cuit:
+        raise RuntimeError(padron.Excepcion or "no se pudo consultar %s" % id_persona)
+    return datos_consulta(padron)
+
+
 def main():
     "Funcin principal de pruebas (obtener CAE)"
     import os
@@ -297,6 +312,32 @@ def main():
         print("DbServerStatus", wssrpadron4.DbServerStatus)
         print("AuthServerStatus", wssrpadron4.AuthServerStatus)
 
+    if '--lote' in sys.argv:
+        # consultar todos los CUIT (base local y webservice en paralelo)
+        from .padron import PadronAFIP, escribir_resultados
+        hilos = HILOS
+        if '--hilos' in sys.argv:
+            hilos = int(sys.argv[sys.argv.index("--hilos") + 1])
+
+        def crear_cliente():
+            ws = padron.__class__()
+            ws.SetTicketAcceso(ta)
+            ws.Cuit = cuit
+            ws.Conectar(cache, url_ws, cacert="conf/afip_ca_info.crt")
+            return ws
+
+        with open("entrada.csv") as f:
+            cuits = [fila[0].replace("-", "") for fila in csv.reader(f)
+                     if fila and fila[0].replace("-", "").isdigit()]
+        local = PadronAFIP()
+        local.LanzarExcepciones = True
+        local.ConsultarLote(cuits, hilos, crear_cliente=crear_cliente,
+                            consultar=consultar_persona)
+        escribir_resultados(local.resultados, "salida.csv")
+        print("En cache:", local.en_cache, "Consultas:", local.consultas,
+              "Inexistentes:", local.inexistentes, "Fallidos:", local.fallidos)
+        sys.exit(0)
+
     if '--csv' in sys.argv:
         csv_reader = csv.reader(open("entrada.csv", "rU"),
                                 dialect='excel', delimiter=",")
@@ -25,6 +25,7 @@ import decimal
 import os
 import sys
 from .utils import inicializar_y_capturar_excepciones, BaseWS, get_install_dir
+from .comprobante import Factura, CbteAsoc, Item, Opcional
 
 HOMO = False
 LANZAR_EXCEPCIONES = True      # valor por defecto: True
@@ -95,21 +96,21 @@ class WSBFEv1(BaseWS):
         "Creo un objeto factura (interna)"
         # Creo una factura para bonos fiscales electrnicos
 
-        fact = {'tipo_cbte': tipo_cbte, 'punto_vta': punto_vta,
-                'cbte_nro': cbte_nro, 'fecha_cbte': fecha_cbte, 'zona': zona,
-                'tipo_doc': tipo_doc, 'nro_doc': nro_doc,
-                'imp_total': imp_total, 'imp_neto': imp_neto,
-                'impto_liq': impto_liq, 'impto_liq_rni': impto_liq_rni,
-                'imp_op_ex': imp_op_ex, 'imp_tot_conc': imp_tot_conc,
-                'imp_perc': imp_perc, 'imp_perc_mun': imp_perc_mun,
-                'imp_iibb': imp_iibb, 'imp_internos': imp_internos,
-                'imp_moneda_id': imp_moneda_id, 'imp_moneda_ctz': imp_moneda_ctz,
-                'fecha_venc_pago': fecha_venc_pago,
-                'cbtes_asoc': [],
-                'opcionales': [],
-                'iva': [],
-                'detalles': [],
-                }
+        fact = Factura(tipo_cbte=tipo_cbte, punto_vta=punto_vta,
+                       cbte_nro=cbte_nro, fecha_cbte=fecha_cbte, zona=zona,
+                       tipo_doc=tipo_doc, nro_doc=nro_doc,
+                       imp_total=imp_total, imp_neto=imp_neto,
+                       impto_liq=impto_liq, impto_liq_rni=impto_liq_rni,
+                       imp_op_ex=imp_op_ex, imp_tot_conc=imp_tot_conc,
+                       imp_perc=imp_perc, imp_perc_mun=imp_perc_mun,
+                       imp_iibb=imp_iibb, imp_internos=imp_internos,
+                       imp_moneda_id=imp_moneda_id, imp_moneda_ctz=imp_moneda_ctz,
+                       fecha_venc_pago=fecha_venc_pago,
+                       cbtes_asoc=[],
+                       opcionales=[],
+                       iva=[],
+                       detalles=[],
+                       )
         self.factura = fact
         return True
 
@@ -117,21 +118,21 @@ class WSBFEv1(BaseWS):
         "Agrego un item a una factura (interna)"
         # ds = unicode(ds, "latin1") # convierto a latin1
         # Nota: no se calcula neto, iva, etc (deben venir calculados!)
-        self.factura['detalles'].append({
-            'ncm': ncm, 'sec': sec,
-            'ds': ds,
-            'qty': qty,
-            'umed': umed,
-            'precio': precio,
-            'bonif': bonif,
-            'iva_id': iva_id,
-            'imp_total': imp_total,
-        })
+        self.factura['detalles'].append(Item(
+            ncm=ncm, sec=sec,
+            ds=ds,
+            qty=qty,
+            umed=umed,
+            precio=precio,
+            bonif=bonif,
+            iva_id=iva_id,
+            imp_total=imp_total,
+        ))
         return True
 
     def AgregarCmpAsoc(self, tipo=1, pto_vta=0, nro=0, cuit=None, fecha=None, **kwarg):
         "Agrego un comprobante asociado a una factura (interna)"
-        cmp_asoc = {'tipo': tipo, 'pto_vta': pto_vta, 'nro': nro}
+        cmp_asoc = CbteAsoc(tipo=tipo, pto_vta=pto_vta, nro=nro)
         if cuit is not None:
             cmp_asoc['cuit'] = cuit
         if fecha is not None:
@@ -141,7 +142,7 @@ class WSBFEv1(BaseWS):
 
     def AgregarOpcional(self, opcional_id=0, valor="", **kwarg):
         "Agrego un dato opcional a una factura (interna)"
-        op = { 'opcional_id': opcional_id, 'valor': valor }
+        op = Opcional(opcional_id=opcional_id, valor=valor)
         self.factura['opcionales'].append(op)
         return True
 
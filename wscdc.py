@@ -20,10 +20,14 @@ __copyright__ = "Copyright (C) 2013-2015 Mariano Reingart"
 __license__ = "GPL 3.0"
 __version__ = "1.02e"
 
+import csv
 import sys
 import os
+import queue
+import threading
 import time
 from configparser import SafeConfigParser
+from . import lote
 from .utils import inicializar_y_capturar_excepciones, BaseWS, get_install_dir
 from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json
 
@@ -32,6 +36,9 @@ from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json
 WSDL = "https://wswhomo.afip.gov.ar/WSCDC/service.asmx?WSDL"
 HOMO = False
 CONFIG_FILE = "rece.ini"
+HILOS = 4           # constataciones en curso (por lotes)
+COLA_MAX = 100      # comprobantes ledos por adelantado
+DIARIO = "constatados.jsonl"
 
 # No debera ser necesario modificar nada despues de esta linea
 
@@ -95,7 +102,7 @@ class WSCDC(BaseWS):
     def inicializar(self):
         BaseWS.inicializar(self)
         self.AppServerStatus = self.DbServerStatus = self.AuthServerStatus = None
-        self.Resultado = self.EmisionTipo = ""
+        self.Resultado = self.EmisionTipo = self.FchProceso = ""
         self.CAI = self.CAE = self.CAEA = self.Vencimiento = ''
         self.CbteNro = self.PuntoVenta = self.ImpTotal = None
 
@@ -271,6 +278,208 @@ def leer_archivo(nombre_archivo):
     return dic
 
 
+# Constatacin por lotes: los comprobantes se leen de un archivo CSV, JSON o
+# de intercambio (un registro de encabezado por comprobante), los repetidos se
+# consultan una sola vez y cada hilo (con su propia instancia del webservice,
+# el cliente SOAP no es thread-safe) tiene a lo sumo una solicitud en curso.
+# Los resultados confirmados (A / O) se graban en el diario local y no se
+# vuelven a consultar; los rechazados (ej. CAEA an no informado) y los
+# errores se reintentan en la prxima ejecucin.
+
+CAMPOS = [fmt[0] for fmt in ENCABEZADO[1:11]]       # datos de la solicitud
+RESPUESTA = ('resultado', 'fch_proceso', 'observaciones', 'errores', 'err_msg')
+CONFIRMADOS = ('A', 'O')
+
+
+def normalizar(clave, valor):
+    "Llevar el valor a una representacin comparable (ledo de CSV, JSON o texto)"
+    if valor is None:
+        return ""
+    if clave == 'imp_total':
+        return "%.2f" % float(valor or 0)
+    valor = str(valor).strip()
+    return valor.lstrip("0") or valor[:1] if valor.isdigit() else valor
+
+
+def clave_cbte(dic):
+    "Identificacin del comprobante (CUIT emisor, punto de venta, tipo y nmero)"
+    return "-".join([normalizar(k, dic.get(k))
+                     for k in ('cuit_emisor', 'pto_vta', 'cbte_tipo', 'cbte_nro')])
+
+
+def solicitud(dic):
+    "Datos a enviar a AFIP (para detectar cambios en un comprobante ya constatado)"
+    return tuple([normalizar(k, dic.get(k)) for k in CAMPOS])
+
+
+def leer_comprobantes(nombre_archivo):
+    "Leer los comprobantes a constatar (CSV, JSON o archivo de intercambio)"
+    extension = os.path.splitext(nombre_archivo)[1].lower()
+    with open(nombre_archivo, "r", newline="" if extension == ".csv" else None) as archivo:
+        if extension == ".csv":
+            try:
+                dialecto = csv.Sniffer().sniff(archivo.read(4096), delimiters=",;\t|")
+            except csv.Error:
+                dialecto = csv.excel
+            archivo.seek(0)
+            for fila in csv.DictReader(archivo, dialect=dialecto):
+                yield dict([(k.strip(), v.strip() or None if v else None)
+                            for k, v in fila.items() if k])
+        elif extension == ".json":
+            datos = json.load(archivo)
+            for dic in isinstance(datos, dict) and [datos] or datos:
+                yield dic
+        else:
+            for linea in archivo:
+                if str(linea[0]) == '0':
+                    yield leer(linea, ENCABEZADO)
+                elif linea.strip() and linea[0] not in "OVE":
+                    print("Tipo de registro incorrecto:", linea[0])
+
+
+def escribir_resultados(resultados, nombre_archivo):
+    "Grabar los resultados de la constatacin (CSV, JSON o archivo de intercambio)"
+    extension = os.path.splitext(nombre_archivo)[1].lower()
+    with open(nombre_archivo, "w", newline="" if extension == ".csv" else None) as archivo:
+        if extension == ".csv":
+            campos = CAMPOS + ['resultado', 'fch_proceso', 'obs', 'err_msg']
+            escritor = csv.DictWriter(archivo, campos, extrasaction="ignore")
+            escritor.writeheader()
+            for dic in resultados:
+                obs = ["%(code)s: %(msg)s" % obs for obs in dic.get('observaciones') or []]
+                escritor.writerow(dict(dic, obs="; ".join(obs)))
+        elif extension == ".json":
+            json.dump(list(resultados), archivo, sort_keys=True, indent=4)
+        else:
+            for dic in resultados:
+                errores = list(dic.get('errores') or [])
+                if dic.get('err_msg') and not errores:
+                    errores.append({'code': 0, 'msg': dic['err_msg'].replace("\n", " ")})
+                for formato, registros, tipo_reg in [
+                        (ENCABEZADO, [dic], 0),
+                        (OBSERVACION, dic.get('observaciones') or [], 'O'),
+                        (ERROR, errores, 'E')]:
+                    for it in registros:
+                        archivo.write(escribir(dict(it, tipo_reg=tipo_reg), formato))
+
+
+class Estadisticas(lote.Estadisticas):
+    "Totales de la constatacin por lotes (consultas a AFIP, repetidos y diario)"
+
+    def __init__(self):
+        lote.Estadisticas.__init__(self)
+        self.duplicados = self.en_diario = 0
+
+    def resumen(self):
+        ret = lote.Estadisticas.resumen(self)
+        # lote registra el resultado 'O' como omitido (aqu es observado)
+        ret['aprobados'] = ret.pop('autorizados')
+        ret['observados'] = ret.pop('omitidos')
+        ret.update(leidos=self.leidos, duplicados=self.duplicados,
+                   en_diario=self.en_diario)
+        return ret
+
+    def __str__(self):
+        return ("Ledos: %(leidos)d Repetidos: %(duplicados)d En diario: %(en_diario)d "
+                "Consultados: %(llamadas)d (Aprobados: %(aprobados)d "
+                "Observados: %(observados)d Rechazados: %(rechazados)d "
+                "Errores: %(errores)d) en %(duracion).1f s (%(cbtes_por_segundo).2f cbtes/s)"
+                " - Latencia: media %(latencia_media).3f s, p50 %(latencia_p50).3f s, "
+                "p99 %(latencia_p99).3f s, max %(latencia_max).3f s") % self.resumen()
+
+
+def constatar_lote(crear_ws, comprobantes, hilos=HILOS, diario=None):
+    """Constatar los comprobantes en paralelo (hasta hilos solicitudes en curso)
+       y devolver los resultados (en el orden de entrada) y las estadsticas
+
+       Si un hilo termina con una excepcin (ej. al grabar el diario) se deja
+       de leer y se relanza al finalizar"""
+    estadisticas = Estadisticas()
+    respuestas = {}     # solicitud: resultado (compartido por los repetidos)
+    orden = []
+    cola = queue.Queue(COLA_MAX)
+    fin = object()
+    errores = []
+
+    def constatar(ws, clave, dic):
+        ret = dict(dic)
+        t0 = time.time()
+        try:
+            ws.ConstatarComprobante(**dict([(k, dic.get(k)) for k in CAMPOS]))
+            ret.update(resultado=ws.Resultado, fch_proceso=ws.FchProceso,
+                       observaciones=ws.observaciones, errores=ws.errores,
+                       err_msg=ws.Excepcion or ws.ErrMsg)
+        except Exception as e:
+            ret.update(resultado="", fch_proceso="", observaciones=[],
+                       errores=[], err_msg=str(e))
+        estadisticas.registrar(time.time() - t0, ret['resultado'])
+        if diario:
+            diario.registrar(clave, ret['resultado'] or lote.ERROR, ret)
+        return ret
+
+    def trabajar(ws):
+        while True:
+            item = cola.get()
+            if item is fin:
+                break
+            if errores:
+                continue        # descartar los pendientes (se relanza el error)
+            firma, clave, dic = item
+            try:
+                respuestas[firma] = constatar(ws, clave, dic)
+            except BaseException as e:
+                errores.append(e)
+
+    def poner(item):
+        # no esperar indefinidamente si un hilo fall o todos terminaron
+        # (ante un error los hilos descartan lo pendiente y reciben el fin)
+        while True:
+            try:
+                cola.put(item, timeout=1)
+                return True
+            except queue.Full:
+                if (errores and item is not fin) or \
+                        not any([hilo.is_alive() for hilo in hilos_]):
+                    return False
+
+    hilos_ = []
+    for i in range(max(hilos, 1)):
+        hilo = threading.Thread(target=trabajar, args=(crear_ws(), ),
+                                name="wscdc-%d" % i)
+        hilo.daemon = True
+        hilo.start()
+        hilos_.append(hilo)
+    try:
+        for dic in comprobantes:
+            estadisticas.leidos += 1
+            clave = clave_cbte(dic)
+            firma = (clave, solicitud(dic))
+            orden.append(firma)
+            if firma in respuestas:
+                estadisticas.duplicados += 1
+                continue
+            entrada = diario and diario.obtener(clave)
+            if (entrada and entrada['estado'] in CONFIRMADOS and
+                    solicitud(entrada['factura']) == firma[1]):
+                # ya constatado en una ejecucin anterior con los mismos datos
+                estadisticas.en_diario += 1
+                respuestas[firma] = dict(dic, **dict([(k, entrada['factura'].get(k))
+                                                      for k in RESPUESTA]))
+                continue
+            respuestas[firma] = None        # pendiente (para detectar repetidos)
+            if errores or not poner((firma, clave, dic)):
+                break
+    finally:
+        for hilo in hilos_:
+            poner(fin)
+        for hilo in hilos_:
+            hilo.join()
+    estadisticas.fin = time.time()
+    if errores:
+        raise errores[0]
+    return [respuestas[firma] for firma in orden], estadisticas
+
+
 def main():
     "Funcion principal para utilizar la interfaz por linea de comando"
 
@@ -332,6 +541,41 @@ def main():
     wscdc.SetTicketAcceso(ta)
     wscdc.Cuit = cuit
 
+    if "--lote" in sys.argv:
+        # constatar en paralelo los comprobantes del archivo (CSV, JSON o texto)
+        i = sys.argv.index("--lote")
+        if len(sys.argv) > i + 1 and sys.argv[i + 1][0] != "-":
+            ENTRADA = sys.argv[i + 1]
+        if '--salida' in sys.argv:
+            SALIDA = sys.argv[sys.argv.index("--salida") + 1]
+        hilos = HILOS
+        if '--hilos' in sys.argv:
+            hilos = int(sys.argv[sys.argv.index("--hilos") + 1])
+        elif config.has_option('WSCDC', 'HILOS'):
+            hilos = int(config.get('WSCDC', 'HILOS'))
+        if '--diario' in sys.argv:
+            archivo_diario = sys.argv[sys.argv.index("--diario") + 1]
+        elif config.has_option('WSCDC', 'DIARIO'):
+            archivo_diario = config.get('WSCDC', 'DIARIO')
+        else:
+            archivo_diario = DIARIO
+
+        def crear_ws():
+            ws = WSCDC()
+            ws.Conectar("", url_wscdc)
+            ws.SetTicketAcceso(ta)
+            ws.Cuit = cuit
+            return ws
+
+        diario = lote.Diario(archivo_diario)
+        try:
+            resultados, estadisticas = constatar_lote(
+                crear_ws, leer_comprobantes(ENTRADA), hilos, diario)
+        finally:
+            diario.cerrar()
+        escribir_resultados(resultados, SALIDA)
+        print(estadisticas)
+
     if "--constatar" in sys.argv:
         if len(sys.argv) < 8:
             if "--prueba" in sys.argv:
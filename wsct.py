@@ -24,7 +24,8 @@ import datetime
 import decimal
 import os
 import sys
-from .utils import verifica, inicializar_y_capturar_excepciones, BaseWS, get_install_dir
+from .utils import verifica, inicializar_y_capturar_excepciones, cache_parametros, BaseWS, get_install_dir
+from .comprobante import Factura, CbteAsoc, Tributo, Iva, Item, DatoAdicional, FormaPago
 
 HOMO = False
 LANZAR_EXCEPCIONES = True
@@ -119,28 +120,28 @@ class WSCT(BaseWS):
                      ):
         "Creo un objeto factura (interna)"
         # Creo una factura electronica de exportacin
-        fact = {'tipo_doc': tipo_doc, 'nro_doc': nro_doc,
-                'tipo_cbte': tipo_cbte, 'punto_vta': punto_vta,
-                'cbte_nro': cbte_nro,
-                'id_impositivo': id_impositivo,
-                'cod_pais': cod_pais,
-                'domicilio': domicilio,
-                'cod_relacion': cod_relacion,
-                'imp_total': imp_total, 'imp_tot_conc': imp_tot_conc,
-                'imp_neto': imp_neto,
-                'imp_subtotal': imp_subtotal,  # 'imp_iva': imp_iva,
-                'imp_trib': imp_trib, 'imp_op_ex': imp_op_ex,
-                'imp_reintegro': imp_reintegro,
-                'fecha_cbte': fecha_cbte,
-                'moneda_id': moneda_id, 'moneda_ctz': moneda_ctz,
-                'observaciones': observaciones,
-                'cbtes_asoc': [],
-                'tributos': [],
-                'iva': [],
-                'detalles': [],
-                'adicionales': [],
-                'formas_pago': [],
-                }
+        fact = Factura(tipo_doc=tipo_doc, nro_doc=nro_doc,
+                       tipo_cbte=tipo_cbte, punto_vta=punto_vta,
+                       cbte_nro=cbte_nro,
+                       id_impositivo=id_impositivo,
+                       cod_pais=cod_pais,
+                       domicilio=domicilio,
+                       cod_relacion=cod_relacion,
+                       imp_total=imp_total, imp_tot_conc=imp_tot_conc,
+                       imp_neto=imp_neto,
+                       imp_subtotal=imp_subtotal,  # imp_iva=imp_iva,
+                       imp_trib=imp_trib, imp_op_ex=imp_op_ex,
+                       imp_reintegro=imp_reintegro,
+                       fecha_cbte=fecha_cbte,
+                       moneda_id=moneda_id, moneda_ctz=moneda_ctz,
+                       observaciones=observaciones,
+                       cbtes_asoc=[],
+                       tributos=[],
+                       iva=[],
+                       detalles=[],
+                       adicionales=[],
+                       formas_pago=[],
+                       )
 
         self.factura = fact
         return True
@@ -154,10 +155,10 @@ class WSCT(BaseWS):
 
     def AgregarCmpAsoc(self, tipo=1, pto_vta=0, nro=0, cuit=None, **kwargs):
         "Agrego un comprobante asociado a una factura (interna)"
-        cmp_asoc = {
-            'tipo': tipo,
-            'pto_vta': pto_vta,
-            'nro': nro}
+        cmp_asoc = CbteAsoc(
+            tipo=tipo,
+            pto_vta=pto_vta,
+            nro=nro)
         if cuit is not None:
             cmp_asoc['cuit'] = cuit
         self.factura['cbtes_asoc'].append(cmp_asoc)
@@ -165,21 +166,21 @@ class WSCT(BaseWS):
 
     def AgregarTributo(self, tributo_id, desc, base_imp, alic, importe, **kwargs):
         "Agrego un tributo a una factura (interna)"
-        tributo = {
-            'tributo_id': tributo_id,
-            'desc': desc,
-            'base_imp': base_imp,
-            'importe': importe,
-        }
+        tributo = Tributo(
+            tributo_id=tributo_id,
+            desc=desc,
+            base_imp=base_imp,
+            importe=importe,
+        )
         self.factura['tributos'].append(tributo)
         return True
 
     def AgregarIva(self, iva_id, base_imp, importe, **kwargs):
         "Agrego un tributo a una factura (interna)"
-        iva = {
-            'iva_id': iva_id,
-            'importe': importe,
-        }
+        iva = Iva(
+            iva_id=iva_id,
+            importe=importe,
+        )
         self.factura['iva'].append(iva)
         return True
 
@@ -193,22 +194,22 @@ class WSCT(BaseWS):
         if tipo == 99:
             imp_subtotal = -abs(float(imp_subtotal))
             imp_iva = -abs(float(imp_iva))
-        item = {
-            'tipo': tipo,
-            'cod_tur': cod_tur,
-            'codigo': codigo,
-            'ds': ds,
-            'iva_id': iva_id,
-            'imp_iva': imp_iva,
-            'imp_subtotal': imp_subtotal,
-        }
+        item = Item(
+            tipo=tipo,
+            cod_tur=cod_tur,
+            codigo=codigo,
+            ds=ds,
+            iva_id=iva_id,
+            imp_iva=imp_iva,
+            imp_subtotal=imp_subtotal,
+        )
         self.factura['detalles'].append(item)
         return True
 
     def AgregarDatoAdicional(self, t, c1, c2, c3, c4, c5, c6, **kwarg):
         "Agrego un tipo de dato adicional a una factura (interna)"
-        op = {'t': t,
-              'c1': c1, 'c2': c2, 'c3': c3, 'c4': c4, 'c5': c5, 'c6': c6, }
+        op = DatoAdicional(t=t,
+                           c1=c1, c2=c2, c3=c3, c4=c4, c5=c5, c6=c6)
         self.factura['adicionales'].append(op)
         return True
 
@@ -216,9 +217,9 @@ class WSCT(BaseWS):
                          swift_code=None, tipo_cuenta=None, numero_cuenta=None,
                          **kwarg):
         "Agrego una forma de pago a una factura (interna)"
-        fp = {'codigo': codigo, 'tipo_tarjeta': tipo_tarjeta,
-              'numero_tarjeta': numero_tarjeta, 'swift_code': swift_code,
-              'tipo_cuenta': tipo_cuenta, 'numero_cuenta': numero_cuenta}
+        fp = FormaPago(codigo=codigo, tipo_tarjeta=tipo_tarjeta,
+                       numero_tarjeta=numero_tarjeta, swift_code=swift_code,
+                       tipo_cuenta=tipo_cuenta, numero_cuenta=numero_cuenta)
         self.factura['formas_pago'].append(fp)
         return True
 
@@ -445,6 +446,7 @@ class WSCT(BaseWS):
         if not difs:
             return self.CAE
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposComprobante(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -455,6 +457,7 @@ class WSCT(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayTiposComprobantes']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposDocumento(self):
         res = self.client.consultarTiposDocumento(
@@ -464,6 +467,7 @@ class WSCT(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayTiposDocumento']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposIVA(self):
         "Este mtodo permite consultar los tipos de IVA habilitados en este ws"
@@ -474,6 +478,7 @@ class WSCT(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcionString']
                 for p in ret['arrayTiposIVA']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarCondicionesIVA(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -484,6 +489,7 @@ class WSCT(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcionString']
                 for p in ret['arrayCondicionesIVA']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarMonedas(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -494,6 +500,7 @@ class WSCT(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcionString']
                 for p in ret['arrayTiposMoneda']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposItem(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -504,6 +511,7 @@ class WSCT(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayTiposItem']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarCodigosItemTurismo(self):
         "Este mtodo permite consultar los cdigos de los tems de Turismo"
@@ -514,6 +522,7 @@ class WSCT(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayCodigosItem']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposTributo(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -535,6 +544,7 @@ class WSCT(BaseWS):
         if 'cotizacionMoneda' in ret:
             return str(ret['cotizacionMoneda'])
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarPuntosVenta(self, fmt="%(numeroPuntoVenta)s: bloqueado=%(bloqueado)s baja=%(fechaBaja)s"):
         "Este mtodo permite consultar los puntos de venta habilitados para CAE en este WS"
@@ -550,6 +560,7 @@ class WSCT(BaseWS):
             ret.append(fmt % p if fmt else p)
         return ret
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarPaises(self, sep="|"):
         "Recuperador de valores referenciales de cdigos de Pases"
@@ -573,6 +584,7 @@ class WSCT(BaseWS):
         else:
             return ret
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarCUITsPaises(self, sep="|"):
         "Recuperar lista de valores referenciales de CUIT de Pases"
@@ -596,6 +608,7 @@ class WSCT(BaseWS):
         else:
             return ret
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposDatosAdicionales(self, sep="|"):
         "Recuperar lista de los datos adicionales a informar segn RG."
@@ -611,6 +624,7 @@ class WSCT(BaseWS):
         return [("\t%(codigo)s\t%(ds)s\t"
                  % it).replace("\t", sep) for it in ret] if sep else ret
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarFomasPago(self, sep="|"):
         "Recuperar lista de las formas de pago"
@@ -626,6 +640,7 @@ class WSCT(BaseWS):
         return [("\t%(codigo)s\t%(ds)s\t"
                  % it).replace("\t", sep) for it in ret] if sep else ret
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposTarjeta(self, forma_pago=None, sep="|"):
         "Recuperar lista de los tipos de tarjeta habilitados"
@@ -642,6 +657,7 @@ class WSCT(BaseWS):
         return [("\t%(codigo)s\t%(ds)s\t"
                  % it).replace("\t", sep) for it in ret] if sep else ret
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposCuenta(self, sep="|"):
         "Recuperar lista de los tipos de tarjeta habilitados"
@@ -30,7 +30,8 @@ __version__ = "1.22b"
 import datetime
 import os
 import sys
-from utils import verifica, inicializar_y_capturar_excepciones, BaseWS, get_install_dir
+from utils import verifica, inicializar_y_capturar_excepciones, cache_parametros, BaseWS, get_install_dir
+from comprobante import Registro, Factura, CbteAsoc, Tributo, Iva, Opcional, Comprador, convertir
 
 HOMO = False                    # solo homologaci�n
 TYPELIB = False                 # usar librer�a de tipos (TLB)
@@ -40,6 +41,40 @@ LANZAR_EXCEPCIONES = False      # valor por defecto: True
 WSDL = "https://wswhomo.afip.gov.ar/wsfev1/service.asmx?WSDL"
 #WSDL = "file:///home/reingart/tmp/service.asmx.xml"
 
+# estructura de cada comprobante en FECAESolicitar (etiqueta XML, campo factura)
+FECAEDET = (
+    ('Concepto', 'concepto'),
+    ('DocTipo', 'tipo_doc'),
+    ('DocNro', 'nro_doc'),
+    ('CbteDesde', 'cbt_desde'),
+    ('CbteHasta', 'cbt_hasta'),
+    ('CbteFch', 'fecha_cbte'),
+    ('ImpTotal', 'imp_total'),
+    ('ImpTotConc', 'imp_tot_conc'),
+    ('ImpNeto', 'imp_neto'),
+    ('ImpOpEx', 'imp_op_ex'),
+    ('ImpTrib', 'imp_trib'),
+    ('ImpIVA', 'imp_iva'),
+    # Fechas solo se informan si Concepto in (2,3)
+    ('FchServDesde', 'fecha_serv_desde'),
+    ('FchServHasta', 'fecha_serv_hasta'),
+    ('FchVtoPago', 'fecha_venc_pago'),
+    ('MonId', 'moneda_id'),
+    ('MonCotiz', 'moneda_ctz'),
+    ('CbtesAsoc', ('cbtes_asoc', 'CbteAsoc', (
+        ('Tipo', 'tipo'), ('PtoVta', 'pto_vta'), ('Nro', 'nro'),
+        ('Cuit', 'cuit'), ('CbteFch', 'fecha')))),
+    ('Tributos', ('tributos', 'Tributo', (
+        ('Id', 'tributo_id'), ('Desc', 'desc'), ('BaseImp', 'base_imp'),
+        ('Alic', 'alic'), ('Importe', 'importe')))),
+    ('Iva', ('iva', 'AlicIva', (
+        ('Id', 'iva_id'), ('BaseImp', 'base_imp'), ('Importe', 'importe')))),
+    ('Opcionales', ('opcionales', 'Opcional', (
+        ('Id', 'opcional_id'), ('Valor', 'valor')))),
+    ('Compradores', ('compradores', 'Comprador', (
+        ('DocTipo', 'doc_tipo'), ('DocNro', 'doc_nro'), ('Porcentaje', 'porcentaje')))),
+)
+
 
 class WSFEv1(BaseWS):
     "Interfaz para el WebService de Factura Electr�nica Version 1 - 2.12"
@@ -49,7 +84,7 @@ class WSFEv1(BaseWS):
                         'CompUltimoAutorizado', 'CompConsultar',
                         'CAEASolicitar', 'CAEAConsultar', 'CAEARegInformativo',
                         'CAEASinMovimientoInformar',
-                        'CAESolicitarX', 'CompTotXRequest',
+                        'CAESolicitarX', 'CAESolicitarLote', 'CompTotXRequest',
                         'IniciarFacturasX', 'AgregarFacturaX', 'LeerFacturaX',
                         'ParamGetTiposCbte',
                         'ParamGetTiposConcepto',
@@ -61,6 +96,7 @@ class WSFEv1(BaseWS):
                         'ParamGetTiposPaises',
                         'ParamGetCotizacion',
                         'ParamGetPtosVenta',
+                        'BuscarParametro', 'ValidarParametro', 'RefrescarParametros',
                         'AnalizarXml', 'ObtenerTagXml', 'LoadTestXML',
                         'SetParametros', 'SetTicketAcceso', 'GetParametro',
                         'EstablecerCampoFactura', 'ObtenerCampoFactura',
@@ -73,7 +109,8 @@ class WSFEv1(BaseWS):
                       'Reprocesar', 'Reproceso', 'EmisionTipo', 'CAEA',
                       'CbteNro', 'CbtDesde', 'CbtHasta', 'FechaCbte',
                       'ImpTotal', 'ImpNeto', 'ImptoLiq',
-                      'ImpIVA', 'ImpOpEx', 'ImpTrib', 'FchCotiz',]
+                      'ImpIVA', 'ImpOpEx', 'ImpTrib', 'FchCotiz',
+                      'ParametrosTTL',]
 
     _reg_progid_ = "WSFEv1"
     _reg_clsid_ = "{CA0E604D-E3D7-493A-8880-F6CDD604185E}"
@@ -89,9 +126,15 @@ class WSFEv1(BaseWS):
     WSDL = WSDL
     Version = "%s %s" % (__version__, HOMO and 'Homologaci�n' or '')
     Reprocesar = True   # recuperar automaticamente CAE emitidos
+    PlantillasSOAP = ('FECAESolicitar', 'FECompUltimoAutorizado', 'FECompConsultar')
+    RespuestasSOAP = ('FECAESolicitar', 'FECompConsultar')
     LanzarExcepciones = LANZAR_EXCEPCIONES
     factura = None
     facturas = None
+    _resultado_async_ = BaseWS._resultado_async_ + (
+        'Resultado', 'Reproceso', 'CAE', 'CAEA', 'Vencimiento', 'EmisionTipo',
+        'FechaCbte', 'CbteNro', 'PuntoVenta', 'CbtDesde', 'CbtHasta',
+        'ImpTotal', 'ImpIVA', 'ImpOpEx', 'ImpNeto', 'ImptoLiq', 'ImpTrib')
 
     def inicializar(self):
         BaseWS.inicializar(self)
@@ -139,22 +182,22 @@ class WSFEv1(BaseWS):
 
         "Creo un objeto factura (interna)"
         # Creo una factura electronica de exportaci�n
-        fact = {'tipo_doc': tipo_doc, 'nro_doc': nro_doc,
-                'tipo_cbte': tipo_cbte, 'punto_vta': punto_vta,
-                'cbt_desde': cbt_desde, 'cbt_hasta': cbt_hasta,
-                'imp_total': imp_total, 'imp_tot_conc': imp_tot_conc,
-                'imp_neto': imp_neto, 'imp_iva': imp_iva,
-                'imp_trib': imp_trib, 'imp_op_ex': imp_op_ex,
-                'fecha_cbte': fecha_cbte,
-                'fecha_venc_pago': fecha_venc_pago,
-                'moneda_id': moneda_id, 'moneda_ctz': moneda_ctz,
-                'concepto': concepto, 'fecha_hs_gen': fecha_hs_gen,
-                'cbtes_asoc': [],
-                'tributos': [],
-                'iva': [],
-                'opcionales': [],
-                'compradores': [],
-                }
+        fact = Factura(tipo_doc=tipo_doc, nro_doc=nro_doc,
+                       tipo_cbte=tipo_cbte, punto_vta=punto_vta,
+                       cbt_desde=cbt_desde, cbt_hasta=cbt_hasta,
+                       imp_total=imp_total, imp_tot_conc=imp_tot_conc,
+                       imp_neto=imp_neto, imp_iva=imp_iva,
+                       imp_trib=imp_trib, imp_op_ex=imp_op_ex,
+                       fecha_cbte=fecha_cbte,
+                       fecha_venc_pago=fecha_venc_pago,
+                       moneda_id=moneda_id, moneda_ctz=moneda_ctz,
+                       concepto=concepto, fecha_hs_gen=fecha_hs_gen,
+                       cbtes_asoc=[],
+                       tributos=[],
+                       iva=[],
+                       opcionales=[],
+                       compradores=[],
+                       )
         if fecha_serv_desde:
             fact['fecha_serv_desde'] = fecha_serv_desde
         if fecha_serv_hasta:
@@ -174,7 +217,7 @@ class WSFEv1(BaseWS):
 
     def AgregarCmpAsoc(self, tipo=1, pto_vta=0, nro=0, cuit=None, fecha=None, **kwarg):
         "Agrego un comprobante asociado a una factura (interna)"
-        cmp_asoc = {'tipo': tipo, 'pto_vta': pto_vta, 'nro': nro}
+        cmp_asoc = CbteAsoc(tipo=tipo, pto_vta=pto_vta, nro=nro)
         if cuit is not None:
             cmp_asoc['cuit'] = cuit
         if fecha is not None:
@@ -184,27 +227,27 @@ class WSFEv1(BaseWS):
 
     def AgregarTributo(self, tributo_id=0, desc="", base_imp=0.00, alic=0, importe=0.00, **kwarg):
         "Agrego un tributo a una factura (interna)"
-        tributo = {'tributo_id': tributo_id, 'desc': desc, 'base_imp': base_imp,
-                   'alic': alic, 'importe': importe}
+        tributo = Tributo(tributo_id=tributo_id, desc=desc, base_imp=base_imp,
+                          alic=alic, importe=importe)
         self.factura['tributos'].append(tributo)
         return True
 
     def AgregarIva(self, iva_id=0, base_imp=0.0, importe=0.0, **kwarg):
         "Agrego un tributo a una factura (interna)"
-        iva = {'iva_id': iva_id, 'base_imp': base_imp, 'importe': importe}
+        iva = Iva(iva_id=iva_id, base_imp=base_imp, importe=importe)
         self.factura['iva'].append(iva)
         return True
 
     def AgregarOpcional(self, opcional_id=0, valor="", **kwarg):
         "Agrego un dato opcional a una factura (interna)"
-        op = {'opcional_id': opcional_id, 'valor': valor}
+        op = Opcional(opcional_id=opcional_id, valor=valor)
         self.factura['opcionales'].append(op)
         return True
 
     def AgregarComprador(self, doc_tipo=80, doc_nro=0, porcentaje=100.00, **kwarg):
         "Agrego un comprador a una factura (interna) RG 4109-E bienes muebles"
-        comp = {'doc_tipo': doc_tipo, 'doc_nro': doc_nro,
-                'porcentaje': porcentaje}
+        comp = Comprador(doc_tipo=doc_tipo, doc_nro=doc_nro,
+                         porcentaje=porcentaje)
         self.factura['compradores'].append(comp)
         return True
 
@@ -213,7 +256,7 @@ class WSFEv1(BaseWS):
         # cada campo puede ser una clave string (dict) o una posici�n (list)
         ret = self.factura
         for campo in campos:
-            if isinstance(ret, dict) and isinstance(campo, str):
+            if isinstance(ret, (dict, Registro)) and isinstance(campo, str):
                 ret = ret.get(campo)
             elif isinstance(ret, list) and len(ret) > campo:
                 ret = ret[campo]
@@ -235,57 +278,7 @@ class WSFEv1(BaseWS):
                 'FeCabReq': {'CantReg': 1,
                              'PtoVta': f['punto_vta'],
                              'CbteTipo': f['tipo_cbte']},
-                'FeDetReq': [{'FECAEDetRequest': {
-                    'Concepto': f['concepto'],
-                    'DocTipo': f['tipo_doc'],
-                    'DocNro': f['nro_doc'],
-                    'CbteDesde': f['cbt_desde'],
-                    'CbteHasta': f['cbt_hasta'],
-                    'CbteFch': f['fecha_cbte'],
-                    # Fechas solo se informan si Concepto in (2,3)
-                    'FchServDesde': f.get('fecha_serv_desde'),
-                    'FchServHasta': f.get('fecha_serv_hasta'),
-                    'FchVtoPago': f.get('fecha_venc_pago'),
-                    'MonId': f['moneda_id'],
-                    'MonCotiz': f['moneda_ctz'],
-                    'CbtesAsoc': f['cbtes_asoc'] and [
-                        {'CbteAsoc': {
-                            'Tipo': cbte_asoc['tipo'],
-                            'PtoVta': cbte_asoc['pto_vta'],
-                            'Nro': cbte_asoc['nro'],
-                            'Cuit': cbte_asoc.get('cuit'),
-                            'CbteFch': cbte_asoc.get('fecha'),
-                        }}
-                        for cbte_asoc in f['cbtes_asoc']] or None,
-                    'Tributos': f['tributos'] and [
-                        {'Tributo': {
-                            'Id': tributo['tributo_id'],
-                            'Desc': tributo['desc'],
-                            'BaseImp': tributo['base_imp'],
-                            'Alic': tributo['alic'],
-                            'Importe': tributo['importe'],
-                        }}
-                        for tributo in f['tributos']] or None,
-                    'Iva': f['iva'] and [
-                        {'AlicIva': {
-                            'Id': iva['iva_id'],
-                            'BaseImp': iva['base_imp'],
-                            'Importe': iva['importe'],
-                        }}
-                        for iva in f['iva']] or None,
-                    'Opcionales': [
-                        {'Opcional': {
-                            'Id': opcional['opcional_id'],
-                            'Valor': opcional['valor'],
-                        }} for opcional in f['opcionales']] or None,
-                    'Compradores': [
-                        {'Comprador': {
-                            'DocTipo': comprador['doc_tipo'],
-                            'DocNro': comprador['doc_nro'],
-                            'Porcentaje': comprador['porcentaje'],
-                        }} for comprador in f['compradores']] or None,
-                }
-                }]
+                'FeDetReq': [{'FECAEDetRequest': convertir(f, FECAEDET)}]
             })
 
         result = ret['FECAESolicitarResult']
@@ -344,8 +337,9 @@ class WSFEv1(BaseWS):
         )
 
         result = ret['FECompUltimoAutorizadoResult']
-        self.CbteNro = result['CbteNro']
+        # analizar primero los errores (ej. token vencido, sin CbteNro)
         self.__analizar_errores(result)
+        self.CbteNro = result.get('CbteNro')
         return self.CbteNro is not None and str(self.CbteNro) or ''
 
     @inicializar_y_capturar_excepciones
@@ -528,6 +522,19 @@ class WSFEv1(BaseWS):
         else:
             return ''
 
+    async def cae_solicitar(self, factura=None):
+        "Solicitar CAE sin bloquear (CAESolicitar), devuelve un resultado inmutable"
+        return await self.llamar_async(self.CAESolicitar,
+                                       estado={'factura': factura or self.factura})
+
+    async def comp_consultar(self, tipo_cbte, punto_vta, cbte_nro):
+        "Consultar un comprobante sin bloquear (CompConsultar)"
+        return await self.llamar_async(self.CompConsultar, (tipo_cbte, punto_vta, cbte_nro))
+
+    async def comp_ultimo_autorizado(self, tipo_cbte, punto_vta):
+        "Consultar el ultimo numero autorizado sin bloquear (CompUltimoAutorizado)"
+        return await self.llamar_async(self.CompUltimoAutorizado, (tipo_cbte, punto_vta))
+
     @inicializar_y_capturar_excepciones
     def CAESolicitarX(self):
         "Autorizar m�ltiples facturas (CAE) en una �nica solicitud"
@@ -549,52 +556,8 @@ class WSFEv1(BaseWS):
                 'FeCabReq': {'CantReg': len(self.facturas),
                              'PtoVta': puntos_vta.pop(),
                              'CbteTipo': tipos_cbte.pop()},
-                'FeDetReq': [{'FECAEDetRequest': {
-                    'Concepto': f['concepto'],
-                    'DocTipo': f['tipo_doc'],
-                    'DocNro': f['nro_doc'],
-                    'CbteDesde': f['cbt_desde'],
-                    'CbteHasta': f['cbt_hasta'],
-                    'CbteFch': f['fecha_cbte'],
-                
-                    # Fechas solo se informan si Concepto in (2,3)
-                    'FchServDesde': f.get('fecha_serv_desde'),
-                    'FchServHasta': f.get('fecha_serv_hasta'),
-                    'FchVtoPago': f.get('fecha_venc_pago'),
-                    'MonId': f['moneda_id'],
-                    'MonCotiz': f['moneda_ctz'],
-                    'CbtesAsoc': [
-                        {'CbteAsoc': {
-                            'Tipo': cbte_asoc['tipo'],
-                            'PtoVta': cbte_asoc['pto_vta'],
-                            'Nro': cbte_asoc['nro'],
-                            'Cuit': cbte_asoc.get('cuit'),
-                            'CbteFch': cbte_asoc.get('fecha'),
-                        }}
-                        for cbte_asoc in f['cbtes_asoc']] or None,
-                    'Tributos': [
-                        {'Tributo': {
-                            'Id': tributo['tributo_id'],
-                            'Desc': tributo['desc'],
-                            'BaseImp': tributo['base_imp'],
-                            'Alic': tributo['alic'],
-                            'Importe': tributo['importe'],
-                        }}
-                        for tributo in f['tributos']] or None,
-                    'Iva': [
-                        {'AlicIva': {
-                            'Id': iva['iva_id'],
-                            'BaseImp': iva['base_imp'],
-                            'Importe': iva['importe'],
-                        }}
-                        for iva in f['iva']] or None,
-                    'Opcionales': [
-                        {'Opcional': {
-                            'Id': opcional['opcional_id'],
-                            'Valor': opcional['valor'],
-                        }} for opcional in f['opcionales']] or None,
-                }
-                } for f in self.facturas]
+                'FeDetReq': [{'FECAEDetRequest': convertir(f, FECAEDET)}
+                             for f in self.facturas]
             })
 
         result = ret['FECAESolicitarResult']
@@ -621,9 +584,106 @@ class WSFEv1(BaseWS):
                 assert str(f["nro_doc"]) == str(fedetresp['DocNro'])
                 assert str(f["concepto"]) == str(fedetresp['Concepto'])
 
-            self.__analizar_errores(result)
             assert fecabresp['CantReg'] == len(self.facturas)
-        return fecabresp['CantReg']
+        self.__analizar_errores(result)
+        # sin cabecera (ej. solo Errors): ningun comprobante fue procesado
+        return 'FeCabResp' in result and fecabresp['CantReg'] or 0
+
+    @inicializar_y_capturar_excepciones
+    def CAESolicitarLote(self, numerar=True, cant_max=None):
+        "Autorizar facturas de distintos pto_vta/tipo_cbte en varias solicitudes"
+        if not self.facturas:
+            raise RuntimeError("Llamar a IniciarFacturasX y AgregarFacturaX!")
+        # agrupar por punto de venta y tipo de comprobante (orden de aparicion)
+        facturas = self.facturas
+        grupos = {}
+        for f in facturas:
+            grupos.setdefault((f['punto_vta'], f['tipo_cbte']), []).append(f)
+        # cantidad maxima de comprobantes por solicitud (250 en produccion)
+        if not cant_max:
+            cant_max = int(self.CompTotXRequest() or 0)
+            if not cant_max:
+                raise RuntimeError("No se pudo obtener CompTotXRequest: %s" % self.Excepcion)
+        cant_max = int(cant_max)
+        errores = []
+        excepciones = []
+        autorizados = 0
+        factura = self.factura
+        try:
+            for (punto_vta, tipo_cbte), grupo in grupos.items():
+                ultimo = None
+                for i in range(0, len(grupo), cant_max):
+                    lote = grupo[i:i + cant_max]
+                    if numerar:
+                        # numerar a continuacion del ultimo comprobante autorizado
+                        # (solo se vuelve a consultar si hubo rechazos o fallas)
+                        if ultimo is None:
+                            ultimo = self.CompUltimoAutorizado(tipo_cbte, punto_vta)
+                            if not ultimo:
+                                excepciones.append(self.Excepcion or self.ErrMsg)
+                                self.__sin_procesar(grupo[i:])
+                                break
+                            ultimo = int(ultimo)
+                        for f in lote:
+                            cant = int(f['cbt_hasta'] or 0) - int(f['cbt_desde'] or 0)
+                            f['cbt_desde'] = ultimo + 1
+                            f['cbt_hasta'] = ultimo = ultimo + 1 + max(cant, 0)
+                    self.facturas = lote
+                    ok = self.CAESolicitarX()
+                    errores.extend(self.Errores)
+                    if self.Excepcion:
+                        excepciones.append(self.Excepcion)
+                        if not ok and not self.__reconciliar_lote(lote, tipo_cbte, punto_vta):
+                            # sin respuesta y sin poder verificar si AFIP autorizo el
+                            # lote: no continuar numerando el grupo (evitar duplicados)
+                            excepciones.append("Resultado desconocido de %s-%s nro. %s a %s: %s" % (
+                                tipo_cbte, punto_vta, lote[0]['cbt_desde'], lote[-1]['cbt_hasta'],
+                                self.Excepcion or self.ErrMsg))
+                            self.__sin_procesar(grupo[i:])
+                            break
+                    if not ok:
+                        # lote no procesado (completar campos para LeerFacturaX)
+                        self.__sin_procesar(lote)
+                    aprobados = len([f for f in lote if f.get("cae")])
+                    autorizados += aprobados
+                    if aprobados < len(lote):
+                        # renumerar los lotes restantes del grupo
+                        ultimo = None
+        finally:
+            # restablecer la lista completa (resultados en el orden original)
+            self.facturas = facturas
+            self.factura = factura
+        self.Errores = errores
+        self.ErrMsg = '\n'.join(errores)
+        self.Excepcion = '\n'.join([ex for ex in excepciones if ex])
+        return autorizados
+
+    def __reconciliar_lote(self, lote, tipo_cbte, punto_vta):
+        "Verificar si AFIP autorizo un lote sin respuesta (False si no se pudo saber)"
+        ultimo = self.CompUltimoAutorizado(tipo_cbte, punto_vta)
+        if not ultimo:
+            return False
+        for f in lote:
+            if f.get('cae') or int(f['cbt_desde']) > int(ultimo):
+                continue        # ya informado o no llego a autorizarse
+            # comparar lo registrado en AFIP con lo enviado (reproceso)
+            self.factura = f
+            cae = self.CompConsultar(tipo_cbte, punto_vta, f['cbt_desde'], reproceso=True)
+            if not cae:
+                # falla de la consulta o numero autorizado con otros datos
+                return False
+            f.update({'resultado': 'A', 'cae': cae, 'emision_tipo': self.EmisionTipo,
+                      'fch_venc_cae': self.Vencimiento})
+            f.setdefault('obs', [])
+        return True
+
+    @staticmethod
+    def __sin_procesar(facturas):
+        "Completar los campos de los comprobantes no procesados (para LeerFacturaX)"
+        for f in facturas:
+            for campo in ("resultado", "cae", "emision_tipo", "fch_venc_cae"):
+                f.setdefault(campo, "")
+            f.setdefault("obs", [])
 
     # metodos auxiliares para soporte de multiples comprobantes por solicitud:
 
@@ -844,6 +904,7 @@ class WSFEv1(BaseWS):
 
         return self.Resultado or ''
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ParamGetTiposCbte(self, sep="|"):
         "Recuperador de valores referenciales de c�digos de Tipos de Comprobantes"
@@ -854,6 +915,7 @@ class WSFEv1(BaseWS):
         return [("%(Id)s\t%(Desc)s\t%(FchDesde)s\t%(FchHasta)s" % p['CbteTipo']).replace("\t", sep)
                 for p in res['ResultGet']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ParamGetTiposConcepto(self, sep="|"):
         "Recuperador de valores referenciales de c�digos de Tipos de Conceptos"
@@ -864,6 +926,7 @@ class WSFEv1(BaseWS):
         return [("%(Id)s\t%(Desc)s\t%(FchDesde)s\t%(FchHasta)s" % p['ConceptoTipo']).replace("\t", sep)
                 for p in res['ResultGet']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ParamGetTiposDoc(self, sep="|"):
         "Recuperador de valores referenciales de c�digos de Tipos de Documentos"
@@ -874,6 +937,7 @@ class WSFEv1(BaseWS):
         return [("%(Id)s\t%(Desc)s\t%(FchDesde)s\t%(FchHasta)s" % p['DocTipo']).replace("\t", sep)
                 for p in res['ResultGet']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ParamGetTiposIva(self, sep="|"):
         "Recuperador de valores referenciales de c�digos de Tipos de Al�cuotas"
@@ -884,6 +948,7 @@ class WSFEv1(BaseWS):
         return [("%(Id)s\t%(Desc)s\t%(FchDesde)s\t%(FchHasta)s" % p['IvaTipo']).replace("\t", sep)
                 for p in res['ResultGet']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ParamGetTiposMonedas(self, sep="|"):
         "Recuperador de valores referenciales de c�digos de Monedas"
@@ -894,6 +959,7 @@ class WSFEv1(BaseWS):
         return [("%(Id)s\t%(Desc)s\t%(FchDesde)s\t%(FchHasta)s" % p['Moneda']).replace("\t", sep)
                 for p in res['ResultGet']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ParamGetTiposOpcional(self, sep="|"):
         "Recuperador de valores referenciales de c�digos de Tipos de datos opcionales"
@@ -904,6 +970,7 @@ class WSFEv1(BaseWS):
         return [("%(Id)s\t%(Desc)s\t%(FchDesde)s\t%(FchHasta)s" % p['OpcionalTipo']).replace("\t", sep)
                 for p in res.get('ResultGet', [])]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ParamGetTiposTributos(self, sep="|"):
         "Recuperador de valores referenciales de c�digos de Tipos de Tributos"
@@ -915,6 +982,7 @@ class WSFEv1(BaseWS):
         return [("%(Id)s\t%(Desc)s\t%(FchDesde)s\t%(FchHasta)s" % p['TributoTipo']).replace("\t", sep)
                 for p in res['ResultGet']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ParamGetTiposPaises(self, sep="|"):
         "Recuperador de valores referenciales de c�digos de Paises"
@@ -938,6 +1006,7 @@ class WSFEv1(BaseWS):
         self.FchCotiz = res.get("FchCotiz")
         return str(res.get('MonCotiz', ""))
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ParamGetPtosVenta(self, sep="|"):
         "Recuperador de valores referenciales Puntos de Venta registrados"
@@ -992,6 +1061,52 @@ def main():
         print("AuthServerStatus", wsfev1.AuthServerStatus)
         sys.exit(0)
 
+    if "--benchmark-soap" in sys.argv or "--benchmark-respuesta" in sys.argv:
+        # sobres por segundo: plantillas precompiladas vs. camino generico
+        # (o analisis incremental de una respuesta grabada: archivo.xml)
+        import json
+        from utils import benchmark_plantillas, benchmark_respuestas
+        auth = {'Token': "x" * 600, 'Sign': "y" * 172, 'Cuit': "20267565393"}
+        f = Factura(concepto=1, tipo_doc=80, nro_doc="30500010912", tipo_cbte=1,
+                    punto_vta=4000, cbt_desde=1, cbt_hasta=1, imp_total="179.25",
+                    imp_tot_conc="2.00", imp_neto="150.00", imp_iva="26.25",
+                    imp_trib="1.00", imp_op_ex="0.00", fecha_cbte="20190101",
+                    moneda_id="PES", moneda_ctz="1.000", cbtes_asoc=[],
+                    tributos=[Tributo(tributo_id=99, desc="Impuesto Municipal",
+                                      base_imp="100.00", alic="1.00", importe="1.00")],
+                    iva=[Iva(iva_id=5, base_imp="100.00", importe="21.00"),
+                         Iva(iva_id=4, base_imp="50.00", importe="5.25")],
+                    opcionales=[], compradores=[])
+        metodos = [
+            ("FECAESolicitar", {'Auth': auth, 'FeCAEReq': {
+                'FeCabReq': {'CantReg': 1, 'PtoVta': 4000, 'CbteTipo': 1},
+                'FeDetReq': [{'FECAEDetRequest': convertir(f, FECAEDET)}]}}),
+            ("FECompUltimoAutorizado", {'Auth': auth, 'PtoVta': 4000, 'CbteTipo': 1}),
+            ("FECompConsultar", {'Auth': auth, 'FeCompConsReq': {
+                'CbteTipo': 1, 'CbteNro': 1, 'PtoVta': 4000}}),
+        ]
+        if "--benchmark-respuesta" in sys.argv:
+            i = sys.argv.index("--benchmark-respuesta")
+            archivo = sys.argv[i + 1]
+            cantidad = int(sys.argv[i + 2]) if len(sys.argv) > i + 2 and sys.argv[i + 2].isdigit() else 100
+            with open(archivo, "rb") as f:
+                xml = f.read()
+            metodos = [(metodo, kwargs) for metodo, kwargs in metodos
+                       if ("%sResponse" % metodo).encode() in xml]
+        else:
+            i = sys.argv.index("--benchmark-soap")
+            cantidad = int(sys.argv[i + 1]) if len(sys.argv) > i + 1 and sys.argv[i + 1].isdigit() else 1000
+        for metodo, kwargs in metodos:
+            try:
+                if "--benchmark-respuesta" in sys.argv:
+                    ret = benchmark_respuestas(wsfev1, metodo, xml, cantidad, **kwargs)
+                else:
+                    ret = benchmark_plantillas(wsfev1, metodo, cantidad, **kwargs)
+                print(json.dumps(ret))
+            except Exception as e:
+                print(json.dumps({"metodo": metodo, "error": str(e)}))
+        sys.exit(0)
+
     # obteniendo el TA para pruebas
     from .wsaa import WSAA
     ta = WSAA().Autenticar("wsfe", "reingart.crt", "reingart.key", debug=True)
@@ -1126,6 +1241,10 @@ def main():
         if not '--caea' in sys.argv:
             if not "--multiple" in sys.argv:
                 wsfev1.CAESolicitar()
+            elif "--lote" in sys.argv:
+                # agrupar, numerar y dividir automaticamente las solicitudes
+                cant = wsfev1.CAESolicitarLote()
+                print("Cantidad de comprobantes autorizados:", cant)
             else:
                 cant = wsfev1.CAESolicitarX()
                 print("Cantidad de comprobantes procesados:", cant)
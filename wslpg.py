@@ -15,7 +15,7 @@ import sys
 import datetime
 import decimal
 import os
-from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json, BaseWS, inicializar_y_capturar_excepciones, get_install_dir
+from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json, BaseWS, inicializar_y_capturar_excepciones, cache_parametros, get_install_dir
 from . import utils
 from fpdf import Template
 from pysimplesoap.client import SoapFault
@@ -523,6 +523,17 @@ class WSLPG(BaseWS):
     WSDL = WSDL
     LanzarExcepciones = False
     Version = "%s %s" % (__version__, HOMO and 'Homologación' or '')
+    PlantillasSOAP = ('liquidacionAutorizar', )
+    _resultado_async_ = BaseWS._resultado_async_ + (
+        'COE', 'COEAjustado', 'Estado', 'Resultado', 'NroOrden', 'NroContrato',
+        'TotalDeduccion', 'TotalRetencion', 'TotalRetencionAfip',
+        'TotalOtrasRetenciones', 'TotalNetoAPagar', 'TotalIvaRg4310_18',
+        'TotalPagoSegunCondicion', 'Subtotal', 'TotalIva105', 'TotalIva21',
+        'TotalRetencionesGanancias', 'TotalRetencionesIVA', 'TotalPercepcion',
+        'FechaCertificacion')
+    # datos de la liquidación en preparación (copiados por las llamadas asincrónicas)
+    _estado_async_ = ('liquidacion', 'retenciones', 'deducciones', 'percepciones',
+                      'opcionales', 'certificacion')
 
     def inicializar(self):
         BaseWS.inicializar(self)
@@ -924,6 +935,19 @@ class WSLPG(BaseWS):
         self.AnalizarLiquidacion(ret.get('autorizacion'), self.liquidacion)
         return True
 
+    async def autorizar_liquidacion(self):
+        "Autorizar la liquidación preparada sin bloquear (AutorizarLiquidacion)"
+        estado = dict([(k, getattr(self, k, None)) for k in self._estado_async_])
+        return await self.llamar_async(self.AutorizarLiquidacion, estado=estado)
+
+    async def consultar_liquidacion(self, pto_emision=None, nro_orden=None, coe=None):
+        "Consultar una liquidación sin bloquear (ConsultarLiquidacion)"
+        return await self.llamar_async(self.ConsultarLiquidacion, (pto_emision, nro_orden, coe))
+
+    async def consultar_ult_nro_orden(self, pto_emision=1):
+        "Consultar el último número de orden sin bloquear (ConsultarUltNroOrden)"
+        return await self.llamar_async(self.ConsultarUltNroOrden, (pto_emision, ))
+
     @inicializar_y_capturar_excepciones
     def AutorizarLiquidacionSecundaria(self):
         "Autorizar Liquidación Secundaria Electrónica de Granos"
@@ -2397,6 +2421,7 @@ class WSLPG(BaseWS):
         self.Resultado = ret['resultado']
         return self.COE
 
+    @cache_parametros
     def ConsultarCampanias(self, sep="||"):
         ret = self.client.campaniasConsultar(
             auth={
@@ -2410,6 +2435,7 @@ class WSLPG(BaseWS):
                  it['codigoDescripcion']['descripcion'])
                 for it in array]
 
+    @cache_parametros
     def ConsultarTipoGrano(self, sep="||"):
         ret = self.client.tipoGranoConsultar(
             auth={
@@ -2428,6 +2454,7 @@ class WSLPG(BaseWS):
                      it['codigoDescripcion']['descripcion'])
                     for it in array]
 
+    @cache_parametros
     def ConsultarCodigoGradoReferencia(self, sep="||"):
         "Consulta de Grados según Grano."
         ret = self.client.codigoGradoReferenciaConsultar(
@@ -2447,6 +2474,7 @@ class WSLPG(BaseWS):
                      it['codigoDescripcion']['descripcion'])
                     for it in array]
 
+    @cache_parametros
     def ConsultarGradoEntregadoXTipoGrano(self, cod_grano, sep="||"):
         "Consulta de Grado y Valor según Grano Entregado."
         ret = self.client.codigoGradoEntregadoXTipoGranoConsultar(
@@ -2469,6 +2497,7 @@ class WSLPG(BaseWS):
                      )
                     for it in array]
 
+    @cache_parametros
     def ConsultarTipoCertificadoDeposito(self, sep="||"):
         "Consulta de tipos de Certificados de Depósito"
         ret = self.client.tipoCertificadoDepositoConsultar(
@@ -2483,6 +2512,7 @@ class WSLPG(BaseWS):
                  it['codigoDescripcion']['descripcion'])
                 for it in array]
 
+    @cache_parametros
     def ConsultarTipoDeduccion(self, sep="||"):
         "Consulta de tipos de Deducciones"
         ret = self.client.tipoDeduccionConsultar(
@@ -2497,6 +2527,7 @@ class WSLPG(BaseWS):
                  it['codigoDescripcion']['descripcion'])
                 for it in array]
 
+    @cache_parametros
     def ConsultarTipoRetencion(self, sep="||"):
         "Consulta de tipos de Retenciones."
         ret = self.client.tipoRetencionConsultar(
@@ -2511,6 +2542,7 @@ class WSLPG(BaseWS):
                  it['codigoDescripcion']['descripcion'])
                 for it in array]
 
+    @cache_parametros
     def ConsultarPuerto(self, sep="||"):
         "Consulta de Puertos habilitados"
         ret = self.client.puertoConsultar(
@@ -2525,6 +2557,7 @@ class WSLPG(BaseWS):
                  it['codigoDescripcion']['descripcion'])
                 for it in array]
 
+    @cache_parametros
     def ConsultarTipoActividad(self, sep="||"):
         "Consulta de Tipos de Actividad."
         ret = self.client.tipoActividadConsultar(
@@ -2539,6 +2572,7 @@ class WSLPG(BaseWS):
                  it['codigoDescripcion']['descripcion'])
                 for it in array]
 
+    @cache_parametros
     def ConsultarTipoActividadRepresentado(self, sep="||"):
         "Consulta de Tipos de Actividad inscripta en el RUOCA."
         try:
@@ -2561,6 +2595,7 @@ class WSLPG(BaseWS):
             if sep:
                 return ["ERROR"]
 
+    @cache_parametros
     def ConsultarProvincias(self, sep="||"):
         "Consulta las provincias habilitadas"
         ret = self.client.provinciasConsultar(
@@ -2580,6 +2615,7 @@ class WSLPG(BaseWS):
                      it['codigoDescripcion']['descripcion'])
                     for it in array]
 
+    @cache_parametros
     def ConsultarLocalidadesPorProvincia(self, codigo_provincia, sep="||"):
         ret = self.client.localidadXProvinciaConsultar(
             auth={
@@ -2614,6 +2650,7 @@ class WSLPG(BaseWS):
                 datos.LOCALIDADES = d
         return datos.LOCALIDADES.get(str(cod_localidad), "")
 
+    @cache_parametros
     def ConsultarTiposOperacion(self, sep="||"):
         "Consulta tipo de Operación por Actividad."
         ops = []
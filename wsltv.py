@@ -16,7 +16,7 @@ import sys
 import datetime
 import decimal
 import os
-from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json, BaseWS, inicializar_y_capturar_excepciones, get_install_dir
+from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json, BaseWS, inicializar_y_capturar_excepciones, cache_parametros, get_install_dir
 from . import utils
 from fpdf import Template
 from pysimplesoap.client import SoapFault
@@ -545,6 +545,7 @@ class WSLTV(BaseWS):
         self.NroComprobante = ret['nroComprobante']
         return True
 
+    @cache_parametros
     def ConsultarProvincias(self, sep="||"):
         "Consulta las provincias habilitadas"
         ret = self.client.consultarProvincias(
@@ -560,6 +561,7 @@ class WSLTV(BaseWS):
             return [("%s %%s %s %%s %s" % (sep, sep, sep)) %
                     (it['codigo'], it['descripcion']) for it in array]
 
+    @cache_parametros
     def ConsultarCondicionesVenta(self, sep="||"):
         "Retorna un listado de códigos y descripciones de las condiciones de ventas"
         ret = self.client.consultarCondicionesVenta(
@@ -575,6 +577,7 @@ class WSLTV(BaseWS):
             return [("%s %%s %s %%s %s" % (sep, sep, sep)) %
                     (it['codigo'], it['descripcion']) for it in array]
 
+    @cache_parametros
     def ConsultarTributos(self, sep="||"):
         "Retorna un listado de tributos con código, descripción y signo."
         ret = self.client.consultarTributos(
@@ -590,6 +593,7 @@ class WSLTV(BaseWS):
             return [("%s %%s %s %%s %s" % (sep, sep, sep)) %
                     (it['codigo'], it['descripcion']) for it in array]
 
+    @cache_parametros
     def ConsultarVariedadesClasesTabaco(self, sep="||"):
         "Retorna un listado de variedades y clases de tabaco"
         #  El listado es una estructura anidada (varias clases por variedad)
@@ -623,6 +627,7 @@ class WSLTV(BaseWS):
                     )
             return ret
 
+    @cache_parametros
     def ConsultarRetencionesTabacaleras(self, sep="||"):
         "Retorna un listado de retenciones tabacaleras con código y descripción"
         ret = self.client.consultarRetencionesTabacaleras(
@@ -638,6 +643,7 @@ class WSLTV(BaseWS):
             return [("%s %%s %s %%s %s" % (sep, sep, sep)) %
                     (it['codigo'], it['descripcion']) for it in array]
 
+    @cache_parametros
     def ConsultarDepositosAcopio(self, sep="||"):
         "Retorna los depósitos de acopio pertenencientes al contribuyente"
         ret = self.client.consultarDepositosAcopio(
@@ -654,6 +660,7 @@ class WSLTV(BaseWS):
                     (it['codigo'], it['direccion'], it['localidad'], it['codigoPostal'])
                     for it in array]
 
+    @cache_parametros
     def ConsultarPuntosVentas(self, sep="||"):
         "Retorna los puntos de ventas autorizados para la utilizacion de WS"
         ret = self.client.consultarPuntosVentas(
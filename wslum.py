@@ -16,7 +16,7 @@ import sys
 import datetime
 import decimal
 import os
-from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json, BaseWS, inicializar_y_capturar_excepciones, get_install_dir
+from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json, BaseWS, inicializar_y_capturar_excepciones, cache_parametros, get_install_dir
 from . import utils
 from fpdf import Template
 from pysimplesoap.client import SoapFault
@@ -479,6 +479,7 @@ class WSLUM(BaseWS):
         self.NroComprobante = ret['nroComprobante']
         return True
 
+    @cache_parametros
     def ConsultarProvincias(self, sep="||"):
         "Consulta las provincias habilitadas"
         ret = self.client.consultarProvincias(
@@ -494,6 +495,7 @@ class WSLUM(BaseWS):
             return [("%s %%s %s %%s %s" % (sep, sep, sep)) %
                     (it['codigo'], it['descripcion']) for it in array]
 
+    @cache_parametros
     def ConsultarLocalidades(self, cod_provincia, sep="||"):
         "Consulta las localidades habilitadas"
         ret = self.client.consultarLocalidadesPorProvincia(
@@ -510,6 +512,7 @@ class WSLUM(BaseWS):
             return [("%s %%s %s %%s %s" % (sep, sep, sep)) %
                     (it['codigo'], it['descripcion']) for it in array]
 
+    @cache_parametros
     def ConsultarCondicionesVenta(self, sep="||"):
         "Retorna un listado de códigos y descripciones de las condiciones de ventas"
         ret = self.client.consultarCondicionesVenta(
@@ -525,6 +528,7 @@ class WSLUM(BaseWS):
             return [("%s %%s %s %%s %s" % (sep, sep, sep)) %
                     (it['codigo'], it['descripcion']) for it in array]
 
+    @cache_parametros
     def ConsultarOtrosImpuestos(self, sep="||"):
         "Retorna un listado de tributos con código, descripción y signo."
         ret = self.client.consultarOtrosImpuestos(
@@ -540,6 +544,7 @@ class WSLUM(BaseWS):
             return [("%s %%s %s %%s %s" % (sep, sep, sep)) %
                     (it['codigo'], it['descripcion']) for it in array]
 
+    @cache_parametros
     def ConsultarBonificacionesPenalizaciones(self, sep="||"):
         "Retorna un listado de bonificaciones/penalizaciones con código y descripción"
         ret = self.client.consultarBonificacionesPenalizaciones(
@@ -572,6 +577,7 @@ class WSLUM(BaseWS):
                     )
             return ret
 
+    @cache_parametros
     def ConsultarPuntosVentas(self, sep="||"):
         "Retorna los puntos de ventas autorizados para la utilizacion de WS"
         ret = self.client.consultarPuntosVenta(
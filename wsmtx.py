@@ -24,7 +24,8 @@ import datetime
 import decimal
 import os
 import sys
-from .utils import verifica, inicializar_y_capturar_excepciones, BaseWS, get_install_dir
+from .utils import verifica, inicializar_y_capturar_excepciones, cache_parametros, BaseWS, get_install_dir
+from .comprobante import Factura, CbteAsoc, Tributo, Iva, Item, Opcional
 
 HOMO = False
 LANZAR_EXCEPCIONES = True
@@ -72,8 +73,12 @@ class WSMTXCA(BaseWS):
     WSDL = WSDL
     Version = "%s %s" % (__version__, HOMO and 'Homologacin' or '')
     Reprocesar = True  # recuperar automaticamente CAE emitidos
+    PlantillasSOAP = ('autorizarComprobante', )
     LanzarExcepciones = LANZAR_EXCEPCIONES
     factura = None
+    _resultado_async_ = BaseWS._resultado_async_ + (
+        'Resultado', 'Reproceso', 'CAE', 'CAEA', 'Vencimiento', 'EmisionTipo',
+        'FechaCbte', 'CbteNro', 'PuntoVenta', 'ImpTotal')
 
     def inicializar(self):
         BaseWS.inicializar(self)
@@ -116,23 +121,23 @@ class WSMTXCA(BaseWS):
                      ):
         "Creo un objeto factura (interna)"
         # Creo una factura electronica de exportacin
-        fact = {'tipo_doc': tipo_doc, 'nro_doc': nro_doc,
-                'tipo_cbte': tipo_cbte, 'punto_vta': punto_vta,
-                'cbt_desde': cbt_desde, 'cbt_hasta': cbt_hasta,
-                'imp_total': imp_total, 'imp_tot_conc': imp_tot_conc,
-                'imp_neto': imp_neto,
-                'imp_subtotal': imp_subtotal,  # 'imp_iva': imp_iva,
-                'imp_trib': imp_trib, 'imp_op_ex': imp_op_ex,
-                'fecha_cbte': fecha_cbte,
-                'fecha_venc_pago': fecha_venc_pago,
-                'moneda_id': moneda_id, 'moneda_ctz': moneda_ctz,
-                'concepto': concepto,
-                'observaciones': observaciones,
-                'cbtes_asoc': [],
-                'tributos': [],
-                'iva': [],
-                'detalles': [],
-                }
+        fact = Factura(tipo_doc=tipo_doc, nro_doc=nro_doc,
+                       tipo_cbte=tipo_cbte, punto_vta=punto_vta,
+                       cbt_desde=cbt_desde, cbt_hasta=cbt_hasta,
+                       imp_total=imp_total, imp_tot_conc=imp_tot_conc,
+                       imp_neto=imp_neto,
+                       imp_subtotal=imp_subtotal,  # imp_iva=imp_iva,
+                       imp_trib=imp_trib, imp_op_ex=imp_op_ex,
+                       fecha_cbte=fecha_cbte,
+                       fecha_venc_pago=fecha_venc_pago,
+                       moneda_id=moneda_id, moneda_ctz=moneda_ctz,
+                       concepto=concepto,
+                       observaciones=observaciones,
+                       cbtes_asoc=[],
+                       tributos=[],
+                       iva=[],
+                       detalles=[],
+                       )
         if fecha_serv_desde:
             fact['fecha_serv_desde'] = fecha_serv_desde
         if fecha_serv_hasta:
@@ -154,10 +159,10 @@ class WSMTXCA(BaseWS):
 
     def AgregarCmpAsoc(self, tipo=1, pto_vta=0, nro=0, cuit=None, fecha=None, **kwargs):
         "Agrego un comprobante asociado a una factura (interna)"
-        cmp_asoc = {
-            'tipo': tipo,
-            'pto_vta': pto_vta,
-            'nro': nro}
+        cmp_asoc = CbteAsoc(
+            tipo=tipo,
+            pto_vta=pto_vta,
+            nro=nro)
         if cuit is not None:
             cmp_asoc['cuit'] = cuit
         if fecha is not None:
@@ -167,21 +172,21 @@ class WSMTXCA(BaseWS):
 
     def AgregarTributo(self, tributo_id, desc, base_imp, alic, importe, **kwargs):
         "Agrego un tributo a una factura (interna)"
-        tributo = {
-            'tributo_id': tributo_id,
-            'desc': desc,
-            'base_imp': base_imp,
-            'importe': importe,
-        }
+        tributo = Tributo(
+            tributo_id=tributo_id,
+            desc=desc,
+            base_imp=base_imp,
+            importe=importe,
+        )
         self.factura['tributos'].append(tributo)
         return True
 
     def AgregarIva(self, iva_id, base_imp, importe, **kwargs):
         "Agrego un tributo a una factura (interna)"
-        iva = {
-            'iva_id': iva_id,
-            'importe': importe,
-        }
+        iva = Iva(
+            iva_id=iva_id,
+            importe=importe,
+        )
         self.factura['iva'].append(iva)
         return True
 
@@ -194,19 +199,19 @@ class WSMTXCA(BaseWS):
         if umed == 99:
             imp_subtotal = -abs(float(imp_subtotal))
             imp_iva = -abs(float(imp_iva))
-        item = {
-            'u_mtx': u_mtx,
-            'cod_mtx': cod_mtx,
-            'codigo': codigo,
-            'ds': ds,
-            'qty': qty if umed != 99 else None,
-            'umed': umed,
-            'precio': precio if umed != 99 else None,
-            'bonif': bonif if umed != 99 else None,
-            'iva_id': iva_id,
-            'imp_iva': imp_iva,
-            'imp_subtotal': imp_subtotal,
-        }
+        item = Item(
+            u_mtx=u_mtx,
+            cod_mtx=cod_mtx,
+            codigo=codigo,
+            ds=ds,
+            qty=qty if umed != 99 else None,
+            umed=umed,
+            precio=precio if umed != 99 else None,
+            bonif=bonif if umed != 99 else None,
+            iva_id=iva_id,
+            imp_iva=imp_iva,
+            imp_subtotal=imp_subtotal,
+        )
         self.factura['detalles'].append(item)
         return True
 
@@ -221,9 +226,9 @@ class WSMTXCA(BaseWS):
                              valor3=None, valor4=None, valor5=None,
                              valor6=None, **kwarg):
         "Agrego un dato adicional a una factura (interna)"
-        op = { 'opcional_id': opcional_id, 'valor': valor, 'valor2': valor2,
-               'valor3': valor3, 'valor4': valor4, 'valor5': valor5,
-               'valor6': valor6 }
+        op = Opcional(opcional_id=opcional_id, valor=valor, valor2=valor2,
+                      valor3=valor3, valor4=valor4, valor5=valor5,
+                      valor6=valor6)
         self.factura['opcionales'].append(op)
         return True
 
@@ -845,6 +850,21 @@ class WSMTXCA(BaseWS):
         if not difs:
             return self.CAE
 
+    async def autorizar_comprobante(self, factura=None):
+        "Autorizar el comprobante sin bloquear (AutorizarComprobante)"
+        return await self.llamar_async(self.AutorizarComprobante,
+                                       estado={'factura': factura or self.factura})
+
+    async def consultar_comprobante(self, tipo_cbte, punto_vta, cbte_nro):
+        "Consultar un comprobante sin bloquear (ConsultarComprobante)"
+        return await self.llamar_async(self.ConsultarComprobante, (tipo_cbte, punto_vta, cbte_nro))
+
+    async def consultar_ultimo_comprobante_autorizado(self, tipo_cbte, punto_vta):
+        "Consultar el ltimo nmero autorizado sin bloquear"
+        return await self.llamar_async(self.ConsultarUltimoComprobanteAutorizado,
+                                       (tipo_cbte, punto_vta))
+
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposComprobante(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -854,6 +874,7 @@ class WSMTXCA(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayTiposComprobante']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposDocumento(self):
         ret = self.client.consultarTiposDocumento(
@@ -862,6 +883,7 @@ class WSMTXCA(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayTiposDocumento']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarAlicuotasIVA(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -871,6 +893,7 @@ class WSMTXCA(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayAlicuotasIVA']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarCondicionesIVA(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -880,6 +903,7 @@ class WSMTXCA(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayCondicionesIVA']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarMonedas(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -889,6 +913,7 @@ class WSMTXCA(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayMonedas']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarUnidadesMedida(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -898,6 +923,7 @@ class WSMTXCA(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayUnidadesMedida']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposTributo(self):
         "Este mtodo permite consultar los tipos de comprobantes habilitados en este WS"
@@ -907,6 +933,7 @@ class WSMTXCA(BaseWS):
         return ["%(codigo)s: %(descripcion)s" % p['codigoDescripcion']
                 for p in ret['arrayTiposTributo']]
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarTiposDatosAdicionales(self):
         "Este mtodo permite consultar los tipos de datos adicionales."
@@ -927,6 +954,7 @@ class WSMTXCA(BaseWS):
         if 'cotizacionMoneda' in ret:
             return str(ret['cotizacionMoneda'])
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarPuntosVentaCAE(self, fmt="%(numeroPuntoVenta)s: bloqueado=%(bloqueado)s baja=%(fechaBaja)s"):
         "Este mtodo permite consultar los puntos de venta habilitados para CAE en este WS"
@@ -941,6 +969,7 @@ class WSMTXCA(BaseWS):
             ret.append(fmt % p if fmt else p)
         return ret
 
+    @cache_parametros
     @inicializar_y_capturar_excepciones
     def ConsultarPuntosVentaCAEA(self, fmt="%(numeroPuntoVenta)s: bloqueado=%(bloqueado)s baja=%(fechaBaja)s"):
         "Este mtodo permite consultar los puntos de venta habilitados para CAEA en este WS"